@@ -0,0 +1,133 @@
+"""
+Tokens and latency of Donut decoding with and without early exit on requested fields.
+
+Builds synthetic receipts (2 to 24 line items, random merchants, totals
+and dates) and payments, turns each into the Donut token sequence the
+model would generate for it (``result_tokens``), and replays it through
+the decoder the way the service's mock model does. For each field
+selection it compares:
+
+- full:        every field, decoding until the end token;
+- early exit:  the requested fields, stopping once they are all valid;
+- constrained: early exit plus the schema grammar, so tags of fields
+               that were not requested are masked out.
+
+Per request it reports tokens generated, decoder (parser and grammar)
+latency, and latency projected at ``--step-ms`` per generated token,
+which stands in for the model's per-token decoder cost (no model is
+loaded here). With ``--batch-size`` it also reports decoder steps per
+batch: a batch steps until its longest document finishes, so early exit
+helps batches only when every document in them stops early.
+
+    python benchmarks/bench_constrained_decoding.py --documents 1000 --step-ms 25
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+SERVICE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_ROOT)
+
+from src.services.donut_decoding import ScriptedDecoder, result_tokens, select_fields  # noqa: E402
+
+WORDS = ["Golden", "Dragon", "Lucky", "Star", "Jade", "Garden", "Noodle", "Tea", "Harbour", "Pearl", "Bamboo",
+         "Lotus", "Market", "Cafe", "Bakery", "Kitchen", "Express", "Mart", "Grill", "Dumpling", "Rice", "Soup"]
+METHODS = ["WeChat Pay", "Alipay", "UnionPay", "Cash"]
+SELECTIONS = {
+    "receipt": ["extracted_amount", "extracted_amount,extracted_date", "merchant",
+                "extracted_amount,extracted_date,merchant"],
+    "payment": ["extracted_amount", "extracted_amount,extracted_date", "payer", "transaction_id"],
+}
+MODES = [
+    ("early exit", False),
+    ("constrained", True),
+]
+
+
+def words(rng, count):
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+
+def random_document(rng, document_type):
+    date = (datetime(2025, 1, 1) + timedelta(minutes=rng.randrange(525600))).strftime("%Y-%m-%dT%H:%M:00Z")
+    amount = round(rng.uniform(1, 2000), 2)
+    if document_type == "payment":
+        return {
+            "extracted_amount": amount,
+            "extracted_date": date,
+            "payment_method": rng.choice(METHODS),
+            "payer": words(rng, 2),
+            "receiver": words(rng, rng.randint(2, 4)),
+            "transaction_id": "".join(rng.choice("0123456789") for _ in range(22)),
+        }
+    items = [f"{words(rng, rng.randint(1, 3))} - ${rng.uniform(1, 200):.2f}" for _ in range(rng.randint(2, 24))]
+    return {
+        "extracted_amount": amount,
+        "extracted_date": date,
+        "merchant": words(rng, rng.randint(2, 4)),
+        "extracted_description": words(rng, rng.randint(2, 6)),
+        "extracted_items": items,
+    }
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run(document_type, documents, fields, early_exit, constrain, batch_size):
+    """Decode every document one by one and in batches; returns per-request stats and batch steps"""
+    scripts = [result_tokens(document_type, document) for document in documents]
+    tokens, latencies, correct = [], [], 0
+    for document, script in zip(documents, scripts):
+        started = time.perf_counter()
+        decoder = ScriptedDecoder([script], constrain=constrain)
+        state = decoder.decode([document_type], [fields], early_exit=early_exit)[0]
+        latencies.append((time.perf_counter() - started) * 1000)
+        tokens.append(state.tokens)
+        correct += all(document[name] == value for name, value in state.result().items())
+    steps = []
+    for start in range(0, len(scripts), batch_size):
+        batch = scripts[start:start + batch_size]
+        states = ScriptedDecoder(batch, constrain=constrain).decode([document_type] * len(batch),
+                                                                    [fields] * len(batch), early_exit=early_exit)
+        steps.append(max(state.tokens for state in states))
+    return tokens, latencies, correct, steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=500, help="documents per document type")
+    parser.add_argument("--step-ms", type=float, default=25.0,
+                        help="model decoder cost per generated token, for the projected latency")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{args.documents} documents per type; projected latency at {args.step_ms:g}ms per token\n")
+    print(f"{'fields':<50} {'mode':<12} {'tokens':>7} {'p99':>5} {'decoder ms':>11} {'projected ms':>13} "
+          f"{'batch steps':>12} {'correct':>8}")
+    for document_type, selections in SELECTIONS.items():
+        documents = [random_document(rng, document_type) for _ in range(args.documents)]
+        rows = [("all", "full", None, False, False)]
+        for selection in selections:
+            fields = select_fields(document_type, selection)
+            rows.extend((selection, mode, fields, True, constrain) for mode, constrain in MODES)
+        for selection, mode, fields, early_exit, constrain in rows:
+            tokens, latencies, correct, steps = run(document_type, documents, fields, early_exit, constrain,
+                                                    args.batch_size)
+            mean_tokens = sum(tokens) / len(tokens)
+            mean_latency = sum(latencies) / len(latencies)
+            label = f"{document_type}: {selection}"
+            print(f"{label:<50} {mode:<12} {mean_tokens:>7.1f} {percentile(tokens, 0.99):>5} "
+                  f"{mean_latency:>11.3f} {mean_latency + mean_tokens * args.step_ms:>13.0f} "
+                  f"{sum(steps) / len(steps):>12.1f} {correct / len(documents):>8.1%}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Load time, memory and throughput of the Donut model runtime, fp32 against int8.
+
+Without ``--model-dir`` a randomly initialized Donut of the ``--preset``
+size (DonutSwin encoder, MBart decoder; "base" has donut-base's shapes)
+is written to a temporary directory, so no weights are downloaded. Each
+mode runs in a fresh interpreter that loads the model the way the
+service does with recognition workers: memory-mapped, quantized in the
+parent for int8, warmed up, then forked into ``--workers`` processes.
+
+Reports, per mode:
+- load and warm-up seconds in the parent;
+- RSS and PSS of the parent and of each worker (PSS divides shared
+  pages among the processes mapping them, so the PSS total is the real
+  footprint while the RSS total counts shared weights once per process);
+- images/s and tokens per image with every worker busy.
+
+A random model's output is noise, so it mostly decodes until
+``--max-tokens``; set it to the length of a typical real result.
+
+    pip install torch transformers
+    python benchmarks/bench_model_runtime.py --preset base --workers 4 --images 64
+    python benchmarks/bench_model_runtime.py --model-dir /models/donut-receipts
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageDraw
+
+SERVICE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_ROOT)
+
+from src.services import image_preprocessing  # noqa: E402
+from src.services.model_runtime import DonutRuntime, build_random_model, process_memory  # noqa: E402
+from src.services.recognition_workers import RecognitionWorkerPool  # noqa: E402
+
+# Loaded before the workers fork; they use it through load_recognizer
+RUNTIME = None
+
+
+def load_recognizer():
+    """Worker model factory: the parent's runtime, shared through fork"""
+    RUNTIME.configure_threads()
+
+    def recognize(images, document_types, fields=None):
+        return [dict(state.stats(), confidence=confidence)
+                for state, confidence in RUNTIME.decode(images, document_types, fields)]
+
+    return recognize
+
+
+def receipt_image(rng):
+    """A model-input-sized page of receipt-like text lines"""
+    image = Image.new(image_preprocessing.TARGET_MODE, image_preprocessing.TARGET_SIZE, 255)
+    draw = ImageDraw.Draw(image)
+    width, height = image.size
+    for line in range(rng.randint(10, 30)):
+        y = 40 + line * (height - 80) // 30
+        draw.text((40, y), f"Item {rng.randint(1, 99)} ........ {rng.uniform(1, 200):.2f}", fill=0)
+    return image
+
+
+def wait_ready(pool, timeout=600):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        workers = pool.stats()["workers"]
+        if workers and all(worker["ready"] for worker in workers):
+            return
+        time.sleep(0.1)
+    raise RuntimeError("Recognition workers did not load the model in time")
+
+
+def run_mode(args):
+    """Child interpreter: measure one mode and print its report as JSON"""
+    global RUNTIME
+    RUNTIME = DonutRuntime(args.model_dir, quantize=args.mode == "int8", threads=args.threads,
+                           max_tokens=args.max_tokens)
+    RUNTIME.load()
+
+    pool = RecognitionWorkerPool(args.workers, "__main__:load_recognizer", start_method="fork",
+                                 task_timeout=3600)
+    pool.start()
+    wait_ready(pool)
+
+    rng = random.Random(args.seed)
+    images = [receipt_image(rng) for _ in range(args.images)]
+    document_types = [rng.choice(["receipt", "payment"]) for _ in images]
+    batches = [(images[start:start + args.batch_size], document_types[start:start + args.batch_size])
+               for start in range(0, len(images), args.batch_size)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.workers) as executor:
+        results = [result for batch in executor.map(lambda batch: pool.recognize_batch(*batch), batches)
+                   for result in batch]
+    elapsed = time.perf_counter() - started
+
+    workers = [process_memory(worker["pid"]) for worker in pool.stats()["workers"]]
+    pool.shutdown()
+    print(json.dumps({
+        "mode": args.mode,
+        "stats": {key: value for key, value in RUNTIME.stats().items() if key != "memory"},
+        "parent": process_memory(),
+        "workers": workers,
+        "images_per_second": len(images) / elapsed,
+        "tokens_per_image": sum(result["tokens"] for result in results) / len(results),
+    }))
+
+
+def megabytes(value):
+    return f"{value / (1024 * 1024):.0f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-dir", help="model written by model_runtime.export_model (default: a random one)")
+    parser.add_argument("--preset", choices=["tiny", "base"], default="tiny")
+    parser.add_argument("--modes", default="fp32,int8")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, help="torch threads per process (default: cores / workers)")
+    parser.add_argument("--images", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--max-tokens", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=3)
+    parser.add_argument("--mode", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.threads = args.threads or max(1, (os.cpu_count() or 1) // args.workers)
+    if args.mode:
+        run_mode(args)
+        return
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if not args.model_dir:
+            args.model_dir = os.path.join(temp_dir, f"donut-random-{args.preset}")
+            width, height = image_preprocessing.TARGET_SIZE
+            channels = 3 if image_preprocessing.TARGET_MODE == "RGB" else 1
+            build_random_model(args.model_dir, args.preset, (width, height), channels, args.max_tokens)
+        reports = []
+        for mode in args.modes.split(","):
+            command = [sys.executable, os.path.abspath(__file__), "--mode", mode, "--model-dir", args.model_dir,
+                       "--workers", str(args.workers), "--threads", str(args.threads), "--images", str(args.images),
+                       "--batch-size", str(args.batch_size), "--max-tokens", str(args.max_tokens),
+                       "--seed", str(args.seed)]
+            output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+            reports.append(json.loads(output.strip().splitlines()[-1]))
+
+    stats = reports[0]["stats"]
+    print(f"model {args.model_dir}: {stats['parameters'] / 1e6:.1f}M parameters, weights file "
+          f"{megabytes(stats['weights_bytes'])}MB; {args.workers} workers x {args.threads} threads, "
+          f"batches of {args.batch_size}\n")
+    print(f"{'mode':<6} {'load s':>7} {'warm-up s':>10} {'parent RSS/PSS MB':>18} {'worker RSS/PSS MB':>18} "
+          f"{'worker private MB':>18} {'total PSS MB':>13} {'images/s':>9} {'tokens/img':>11}")
+    for report in reports:
+        parent, workers = report["parent"], report["workers"]
+        worker_rss = sum(worker["rss"] for worker in workers) / len(workers)
+        worker_pss = sum(worker["pss"] for worker in workers) / len(workers)
+        worker_private = sum(worker["private"] for worker in workers) / len(workers)
+        total_pss = parent["pss"] + sum(worker["pss"] for worker in workers)
+        print(f"{report['mode']:<6} {report['stats']['load_seconds']:>7.2f} {report['stats']['warmup_seconds']:>10.2f} "
+              f"{megabytes(parent['rss']) + '/' + megabytes(parent['pss']):>18} "
+              f"{megabytes(worker_rss) + '/' + megabytes(worker_pss):>18} {megabytes(worker_private):>18} "
+              f"{megabytes(total_pss):>13} {report['images_per_second']:>9.2f} {report['tokens_per_image']:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Scaling of receipt-to-payment matching with the number of indexed receipts.
+
+For each size it indexes that many synthetic receipts (amounts skewed
+towards small round sums, dates over a year, merchants from a fixed pool),
+then matches payments made from a sample of them, with the date shifted
+by up to a few hours and the receiver name abbreviated or re-cased. It
+reports index build time, peak RSS, match latency percentiles, how often
+the true receipt ranks first, and the latency of a linear scan filtering
+every receipt by amount and date window for comparison.
+
+Each size runs in its own subprocess so peak RSS is not shared between runs.
+
+It then times candidate lookups by payment amount, from one unit to a
+million, with the tolerance at 1% of the amount and not capped, against
+an index of ``--wide-receipts`` receipts whose amounts spread over the
+same range: the cost should follow the receipts found, not the tolerance.
+
+    python benchmarks/bench_reconciliation.py
+    python benchmarks/bench_reconciliation.py --sizes 1000000 --queries 5000 --store
+    python benchmarks/bench_reconciliation.py --sizes 10000 --wide-receipts 100000 --wide-amounts 50000000
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+SERVICE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_ROOT)
+
+MERCHANT_WORDS = ["Golden", "Dragon", "Lucky", "Star", "Jade", "Garden", "Noodle", "Tea", "Harbour", "Pearl",
+                  "Bamboo", "Lotus", "Market", "Cafe", "Bakery", "Kitchen", "House", "Express", "Mart", "Grill"]
+MERCHANT_KINDS = ["Restaurant", "Store", "Co. Ltd", "Supermarket", "Pharmacy", "Canteen"]
+YEAR = 365 * 86400
+START = 1735689600  # 2025-01-01T00:00:00Z
+
+
+def make_merchants(count, rng):
+    return [f"{rng.choice(MERCHANT_WORDS)} {rng.choice(MERCHANT_WORDS)} {index} {rng.choice(MERCHANT_KINDS)}"
+            for index in range(count)]
+
+
+def make_receipt(index, merchants, rng):
+    # Mostly small everyday sums, often whole or half units, with a long tail
+    amount = round(min(rng.lognormvariate(3.5, 1.0), 20000), 2)
+    if rng.random() < 0.3:
+        amount = round(amount * 2) / 2
+    return f"receipt-{index}", {
+        "extracted_amount": amount,
+        "extracted_date": START + rng.randrange(YEAR),
+        "merchant": rng.choice(merchants),
+    }
+
+
+def make_payment(receipt, rng):
+    receiver = receipt["merchant"]
+    if rng.random() < 0.5:
+        receiver = receiver.rsplit(" ", 1)[0].upper()
+    return {
+        "extracted_amount": receipt["extracted_amount"],
+        "extracted_date": receipt["extracted_date"] + rng.randrange(-6 * 3600, 6 * 3600),
+        "receiver": receiver,
+    }
+
+
+def linear_scan(receipts, payment, service):
+    """Candidates by checking every receipt against the amount tolerance and date window"""
+    from src.services.reconciliation import to_cents
+
+    cents = to_cents(payment["extracted_amount"])
+    tolerance = service.tolerance(cents)
+    timestamp = payment["extracted_date"]
+    return [receipt_id for receipt_id, receipt_cents, receipt_time in receipts
+            if abs(receipt_cents - cents) <= tolerance and abs(receipt_time - timestamp) <= service.time_window]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_size(size, queries, linear_queries, use_store, seed):
+    from src.services.reconciliation import ReconciliationService, ReconciliationStore, normalize_name, to_cents
+
+    rng = random.Random(seed)
+    merchants = make_merchants(5000, rng)
+    receipts = [make_receipt(index, merchants, rng) for index in range(size)]
+    service = ReconciliationService()
+
+    started = time.perf_counter()
+    if use_store:
+        store = ReconciliationStore(":memory:")
+        for receipt_id, receipt in receipts:
+            store.save_receipt(receipt_id, to_cents(receipt["extracted_amount"]), receipt["extracted_date"],
+                               normalize_name(receipt["merchant"]))
+        saved = time.perf_counter()
+        service.start(store)
+        load_seconds = time.perf_counter() - saved
+    else:
+        for receipt_id, receipt in receipts:
+            service.add_receipt(receipt_id, receipt)
+        load_seconds = None
+    build_seconds = time.perf_counter() - started
+
+    sample = rng.sample(receipts, min(queries, size))
+    latencies, top_hits, candidate_counts = [], 0, []
+    for receipt_id, receipt in sample:
+        payment = make_payment(receipt, rng)
+        started = time.perf_counter()
+        candidates = service.match(payment)
+        latencies.append(time.perf_counter() - started)
+        candidate_counts.append(len(candidates))
+        top_hits += bool(candidates) and candidates[0]["receipt_id"] == receipt_id
+
+    flat = [(receipt_id, to_cents(receipt["extracted_amount"]), receipt["extracted_date"])
+            for receipt_id, receipt in receipts]
+    linear = []
+    for receipt_id, receipt in sample[:linear_queries]:
+        started = time.perf_counter()
+        linear_scan(flat, make_payment(receipt, rng), service)
+        linear.append(time.perf_counter() - started)
+
+    return {
+        "size": size,
+        "build_seconds": build_seconds,
+        "load_seconds": load_seconds,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "mean_candidates": sum(candidate_counts) / len(candidate_counts),
+        "top1": top_hits / len(sample),
+        "linear_ms": sum(linear) / len(linear) * 1000 if linear else None,
+    }
+
+
+def run_wide(count, amounts, queries, seed):
+    """Lookup latency by payment amount with a 1% tolerance over receipts of every size"""
+    from src.services.reconciliation import ReceiptIndex
+
+    rng = random.Random(seed)
+    index = ReceiptIndex()
+    for number in range(count):
+        index.add(f"receipt-{number}", int(10 ** rng.uniform(0, 10)), START + rng.randrange(YEAR), "")
+    rows = []
+    for cents in amounts:
+        latencies, found = [], 0
+        for _ in range(queries):
+            started = time.perf_counter()
+            found += len(index.candidates(cents, START + rng.randrange(YEAR), cents // 100, 172800, count))
+            latencies.append(time.perf_counter() - started)
+        rows.append((cents, cents // 100, percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000,
+                     found / queries))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--linear-queries", type=int, default=20, help="payments also matched by linear scan")
+    parser.add_argument("--store", action="store_true", help="load the index from an SQLite store")
+    parser.add_argument("--wide-receipts", type=int, default=1000000)
+    parser.add_argument("--wide-amounts", type=int, nargs="+", default=[100, 10000, 1000000, 100000000],
+                        help="payment amounts in cents looked up with a 1%% tolerance")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.size:
+        print(json.dumps(run_size(args.size, args.queries, args.linear_queries, args.store, args.seed)))
+        return
+
+    print(f"{'receipts':>9} {'build s':>8} {'load s':>7} {'rss MB':>7} {'p50 ms':>7} {'p99 ms':>7} "
+          f"{'cands':>6} {'top-1':>6} {'linear ms':>10}")
+    for size in args.sizes:
+        command = [sys.executable, __file__, "--size", str(size), "--queries", str(args.queries),
+                   "--linear-queries", str(args.linear_queries), "--seed", str(args.seed)]
+        if args.store:
+            command.append("--store")
+        result = json.loads(subprocess.run(command, check=True, capture_output=True, text=True).stdout)
+        load = f"{result['load_seconds']:.1f}" if result["load_seconds"] is not None else "-"
+        linear = f"{result['linear_ms']:.1f}" if result["linear_ms"] is not None else "-"
+        print(f"{result['size']:>9} {result['build_seconds']:>8.1f} {load:>7} {result['peak_rss_mb']:>7.0f} "
+              f"{result['p50_ms']:>7.3f} {result['p99_ms']:>7.3f} {result['mean_candidates']:>6.1f} "
+              f"{result['top1']:>6.1%} {linear:>10}")
+
+    print(f"\n{args.wide_receipts} receipts from 1 to 10^10 cents, 1% tolerance")
+    print(f"{'cents':>11} {'tolerance':>10} {'p50 ms':>7} {'p99 ms':>7} {'found':>7}")
+    for cents, tolerance, p50, p99, found in run_wide(args.wide_receipts, args.wide_amounts, 200, args.seed):
+        print(f"{cents:>11} {tolerance:>10} {p50:>7.3f} {p99:>7.3f} {found:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
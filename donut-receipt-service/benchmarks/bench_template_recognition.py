@@ -0,0 +1,293 @@
+"""
+Accuracy and throughput of the screenshot template fast path on a synthetic corpus.
+
+Renders WeChat Pay style "payment successful" screenshots (grey page,
+green check, large amount, payee/payer/time rows) with random values,
+device widths, JPEG quality, brightness and small layout shifts, plus
+negatives of other layouts (an Alipay style page, a chat screenshot and
+receipt photos). Twelve clean screenshots and a template definition are
+written to a temporary directory and loaded the way the service loads
+DONUT_TEMPLATE_DIR.
+
+Reports, per corpus:
+- how often the template path answered;
+- field accuracy of its answers;
+- layout false accepts on the negatives;
+- fast path latency on its own and after decoding, against decode plus
+  model preprocessing (the mock model itself costs nothing, so a real
+  model's inference time comes on top of the latter).
+
+The fonts are DejaVu (``fonts-dejavu``); real WeChat screenshots need
+their own template definition and reference screenshots.
+
+    python benchmarks/bench_template_recognition.py --screenshots 500 --negatives 200
+"""
+import argparse
+import io
+import json
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from PIL import Image, ImageDraw, ImageEnhance, ImageFont
+
+SERVICE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_ROOT)
+
+FONT_DIR = "/usr/share/fonts/truetype/dejavu"
+BASE_WIDTH, BASE_HEIGHT = 1080, 2340
+WIDTHS = [720, 828, 1080, 1170, 1242, 1440]
+REFERENCE_WIDTHS = [828, 1080, 1242]
+NAME_WORDS = ["Golden", "Dragon", "Lucky", "Star", "Jade", "Garden", "Noodle", "Tea", "Harbour", "Pearl",
+              "Bamboo", "Lotus", "Market", "Cafe", "Bakery", "Kitchen", "Express", "Mart", "Grill", "Wang", "Li",
+              "Zhang", "Chen", "Liu", "Yang", "Huang", "Zhao", "Wu", "Zhou", "Xu"]
+
+# (left, top, right, bottom) fractions of the screenshot
+FIELDS = {
+    "amount": {"box": [0.08, 0.285, 0.92, 0.345], "kind": "amount"},
+    "receiver": {"box": [0.34, 0.440, 0.96, 0.475], "glyphs": "names"},
+    "payer": {"box": [0.34, 0.500, 0.96, 0.535], "glyphs": "names"},
+    "time": {"box": [0.34, 0.560, 0.96, 0.595], "kind": "datetime", "format": "%Y-%m-%d %H:%M:%S",
+             "timezone": "+08:00"},
+}
+TEMPLATE = {
+    "name": "wechat_pay_success",
+    "document_type": "payment",
+    "payment_method": "WeChat Pay",
+    "fields": FIELDS,
+    "ignore": [[0, 0, 1, 0.04]],
+}
+
+
+def font(size, bold=False):
+    return ImageFont.truetype(os.path.join(FONT_DIR, "DejaVuSans-Bold.ttf" if bold else "DejaVuSans.ttf"), size)
+
+
+def draw_row(draw, width, height, top, label, value, shift):
+    size = int(0.034 * width)
+    y = int((top + shift) * height) + int(0.003 * height)
+    draw.text((int(0.06 * width), y), label, fill=(128, 128, 128), font=font(size))
+    value_font = font(size)
+    value_width = draw.textlength(value, font=value_font)
+    draw.text((int(0.94 * width - value_width), y), value, fill=(25, 25, 25), font=value_font)
+
+
+def render_wechat(values, width, rng, jitter=True):
+    """A WeChat Pay style payment result page showing ``values``"""
+    height = int(width * BASE_HEIGHT / BASE_WIDTH * (1 + rng.uniform(-0.02, 0.02) if jitter else 1))
+    shift = rng.uniform(-0.004, 0.004) if jitter else 0
+    image = Image.new("RGB", (width, height), (237, 237, 237))
+    draw = ImageDraw.Draw(image)
+    draw.text((int(0.05 * width), int(0.01 * height)), f"{rng.randrange(24):02d}:{rng.randrange(60):02d}",
+              fill=(0, 0, 0), font=font(int(0.03 * width), bold=True))
+    centre, radius = (width // 2, int((0.13 + shift) * height)), int(0.075 * width)
+    draw.ellipse((centre[0] - radius, centre[1] - radius, centre[0] + radius, centre[1] + radius), fill=(7, 193, 96))
+    draw.line([(centre[0] - radius // 2, centre[1]), (centre[0] - radius // 8, centre[1] + radius // 3),
+               (centre[0] + radius // 2, centre[1] - radius // 3)], fill=(255, 255, 255), width=max(3, radius // 6))
+    title_font = font(int(0.045 * width))
+    title = "Payment successful"
+    draw.text(((width - draw.textlength(title, font=title_font)) / 2, int((0.22 + shift) * height)), title,
+              fill=(30, 30, 30), font=title_font)
+    amount_font = font(int(0.085 * width), bold=True)
+    draw.text(((width - draw.textlength(values["amount"], font=amount_font)) / 2, int((0.29 + shift) * height)),
+              values["amount"], fill=(0, 0, 0), font=amount_font)
+    draw.rectangle((0, int((0.42 + shift) * height), width, int((0.62 + shift) * height)), fill=(255, 255, 255))
+    for top, label, key in ((0.44, "Payee", "receiver"), (0.50, "Payer", "payer"), (0.56, "Time", "time")):
+        draw_row(draw, width, height, top, label, values[key], shift)
+    button = (int(0.3 * width), int((0.84 + shift) * height), int(0.7 * width), int((0.88 + shift) * height))
+    draw.rounded_rectangle(button, radius=int(0.01 * width), fill=(7, 193, 96))
+    done_font = font(int(0.04 * width))
+    draw.text(((width - draw.textlength("Done", font=done_font)) / 2, button[1] + int(0.007 * height)), "Done",
+              fill=(255, 255, 255), font=done_font)
+    return image
+
+
+def render_alipay(values, width, rng):
+    height = int(width * BASE_HEIGHT / BASE_WIDTH)
+    image = Image.new("RGB", (width, height), (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, width, int(0.18 * height)), fill=(22, 119, 255))
+    draw.text((int(0.06 * width), int(0.08 * height)), "Transfer details", fill=(255, 255, 255),
+              font=font(int(0.05 * width)))
+    draw.text((int(0.06 * width), int(0.22 * height)), values["receiver"], fill=(0, 0, 0),
+              font=font(int(0.04 * width)))
+    draw.text((int(0.06 * width), int(0.27 * height)), values["amount"], fill=(0, 0, 0),
+              font=font(int(0.08 * width), bold=True))
+    for index, (label, key) in enumerate((("Status", None), ("Time", "time"), ("Payer", "payer"))):
+        y = int((0.4 + 0.05 * index) * height)
+        draw.line((0, y - 10, width, y - 10), fill=(230, 230, 230), width=2)
+        draw.text((int(0.06 * width), y), label, fill=(150, 150, 150), font=font(int(0.035 * width)))
+        draw.text((int(0.4 * width), y), values[key] if key else "Completed", fill=(0, 0, 0),
+                  font=font(int(0.035 * width)))
+    return image
+
+
+def render_chat(width, rng):
+    height = int(width * BASE_HEIGHT / BASE_WIDTH)
+    image = Image.new("RGB", (width, height), (237, 237, 237))
+    draw = ImageDraw.Draw(image)
+    y = int(0.08 * height)
+    while y < 0.9 * height:
+        mine = rng.random() < 0.5
+        text = " ".join(rng.choice(NAME_WORDS) for _ in range(rng.randint(1, 4)))
+        text_font = font(int(0.04 * width))
+        text_width = draw.textlength(text, font=text_font)
+        left = int(0.9 * width - text_width) if mine else int(0.15 * width)
+        draw.rounded_rectangle((left - 20, y - 15, left + text_width + 20, y + int(0.05 * width) + 15), radius=12,
+                               fill=(149, 236, 105) if mine else (255, 255, 255))
+        draw.text((left, y), text, fill=(0, 0, 0), font=text_font)
+        y += int(rng.uniform(0.06, 0.1) * height)
+    return image
+
+
+def render_receipt(values, width, rng):
+    height = int(width * rng.uniform(1.6, 2.4))
+    image = Image.new("RGB", (width, height), (250, 248, 240))
+    draw = ImageDraw.Draw(image)
+    line_font = font(int(0.035 * width))
+    y = int(0.05 * height)
+    draw.text((int(0.2 * width), y), values["receiver"], fill=(0, 0, 0), font=font(int(0.05 * width), bold=True))
+    while y < 0.85 * height:
+        y += int(0.045 * width)
+        draw.text((int(0.08 * width), y), rng.choice(NAME_WORDS), fill=(20, 20, 20), font=line_font)
+        draw.text((int(0.7 * width), y), f"{rng.uniform(1, 99):.2f}", fill=(20, 20, 20), font=line_font)
+    return image
+
+
+def random_values(rng):
+    amount = round(min(rng.lognormvariate(3.5, 1.0), 20000), 2)
+    moment = datetime(2025, 1, 1) + timedelta(seconds=rng.randrange(365 * 86400))
+    receiver = " ".join(rng.choice(NAME_WORDS) for _ in range(rng.randint(1, 3)))
+    if rng.random() < 0.3:
+        receiver += f" {rng.randrange(1, 100)}"
+    return {
+        "amount": f"-{amount:.2f}",
+        "receiver": receiver,
+        "payer": f"{rng.choice(NAME_WORDS)} {rng.choice(string.ascii_uppercase)}.",
+        "time": moment.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def reference_values():
+    """Values that between them show every character the fields can contain"""
+    return [
+        {"amount": "-1234.56", "receiver": "ABCDEFGHIJKLM", "payer": "NOPQRSTUVWXYZ.", "time": "2025-01-23 04:56:17"},
+        {"amount": "-7890.00", "receiver": "abcdefghijklm", "payer": "nopqrstuvwxyz", "time": "2025-12-30 18:29:48"},
+        {"amount": "-50.75", "receiver": "Golden Dragon 0123456789", "payer": "Wang L.", "time": "2025-06-09 23:59:00"},
+        # Word gaps next to overhanging letters, which are narrower than most
+        {"amount": "-6.80", "receiver": "Bakery Tea Star Yang", "payer": "Harbour J.", "time": "2025-11-11 11:11:11"},
+    ]
+
+
+def encode(image, rng):
+    """Re-encode as a phone or chat app might: PNG or JPEG of varying quality, brightness shifted"""
+    image = ImageEnhance.Brightness(image).enhance(rng.uniform(0.92, 1.06))
+    buffer = io.BytesIO()
+    if rng.random() < 0.3:
+        image.save(buffer, format="PNG")
+    else:
+        image.save(buffer, format="JPEG", quality=rng.randint(70, 95))
+    return buffer.getvalue()
+
+
+def expected_fields(values):
+    return {
+        "extracted_amount": float(values["amount"].lstrip("-")),
+        "receiver": values["receiver"],
+        "payer": values["payer"],
+        "extracted_date": values["time"].replace(" ", "T") + "+08:00",
+    }
+
+
+def write_template_dir(directory, rng):
+    """Template definition plus clean references, each set of values taken on a small, medium and large phone"""
+    references = []
+    for index, values in enumerate(reference_values()):
+        for width in REFERENCE_WIDTHS:
+            name = f"wechat_pay_success_{index}_{width}.png"
+            render_wechat(values, width, rng, jitter=False).save(os.path.join(directory, name))
+            references.append({"image": name, "values": values})
+    with open(os.path.join(directory, "wechat_pay_success.json"), "w") as f:
+        json.dump(dict(TEMPLATE, references=references), f, indent=2)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--screenshots", type=int, default=300)
+    parser.add_argument("--negatives", type=int, default=150)
+    parser.add_argument("--min-layout-score", type=float, default=0.9)
+    parser.add_argument("--min-glyph-score", type=float, default=0.75)
+    parser.add_argument("--min-glyph-margin", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    from src.services import image_preprocessing
+    from src.services.template_recognition import TemplateRecognizer
+
+    rng = random.Random(args.seed)
+    recognizer = TemplateRecognizer(args.min_layout_score, args.min_glyph_score, args.min_glyph_margin)
+    with tempfile.TemporaryDirectory() as directory:
+        write_template_dir(directory, rng)
+        started = time.perf_counter()
+        recognizer.load_directory(directory)
+        load_ms = (time.perf_counter() - started) * 1000
+    template = recognizer.templates[0]
+    classes = ", ".join(f"{name} {len(bank)}" for name, bank in template.glyphs.items())
+    print(f"template {template.name}: glyph classes {classes}; loaded in {load_ms:.0f}ms")
+
+    corpus = []
+    for _ in range(args.screenshots):
+        values = random_values(rng)
+        corpus.append(("wechat", encode(render_wechat(values, rng.choice(WIDTHS), rng), rng), values))
+    for index in range(args.negatives):
+        values, width = random_values(rng), rng.choice(WIDTHS)
+        kind = ("alipay", "chat", "receipt")[index % 3]
+        image = (render_alipay(values, width, rng) if kind == "alipay" else
+                 render_chat(width, rng) if kind == "chat" else render_receipt(values, width, rng))
+        corpus.append((kind, encode(image, rng), None))
+
+    counts, field_hits, fast_ms, match_ms, model_ms = {}, {}, [], [], []
+    for kind, data, values in corpus:
+        started = time.perf_counter()
+        image = image_preprocessing.decode_image(Image.open(io.BytesIO(data)))
+        decoded = time.perf_counter()
+        result = recognizer.recognize(image, "payment")
+        fast_ms.append((time.perf_counter() - started) * 1000)
+        match_ms.append((time.perf_counter() - decoded) * 1000)
+
+        started = time.perf_counter()
+        image_preprocessing.preprocess_image(Image.open(io.BytesIO(data)))
+        model_ms.append((time.perf_counter() - started) * 1000)
+
+        served, total = counts.get(kind, (0, 0))
+        counts[kind] = (served + (result is not None), total + 1)
+        if result is not None and values is not None:
+            for field, expected in expected_fields(values).items():
+                field_hits[field] = field_hits.get(field, 0) + (result.get(field) == expected)
+
+    served, total = counts["wechat"]
+    print(f"\n{'corpus':<10} {'images':>7} {'template path':>14}")
+    for kind, (served_kind, total_kind) in counts.items():
+        print(f"{kind:<10} {total_kind:>7} {served_kind / total_kind:>14.1%}")
+    print(f"\nfield accuracy of template answers ({served} screenshots)")
+    for field, hits in field_hits.items():
+        print(f"  {field:<18} {hits / served:.1%}")
+    print(f"\n{'path':<34} {'p50 ms':>7} {'p99 ms':>7} {'images/s':>9}")
+    for label, timings in (("template match/read", match_ms), ("decode + template match/read", fast_ms),
+                           ("decode + model preprocessing", model_ms)):
+        print(f"{label:<34} {percentile(timings, 0.5):>7.2f} {percentile(timings, 0.99):>7.2f} "
+              f"{1000 * len(timings) / sum(timings):>9.1f}")
+    print(f"\n{json.dumps(recognizer.stats())}")
+
+
+if __name__ == "__main__":
+    main()
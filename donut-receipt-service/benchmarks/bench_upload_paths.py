@@ -0,0 +1,110 @@
+"""
+Compare the JSON+base64 upload path with the multipart and raw image paths
+of /api/recognize/receipt.
+
+Each path runs in its own subprocess so peak RSS is not shared between runs.
+
+    python benchmarks/bench_upload_paths.py --size-mb 8 --requests 50
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+SERVICE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_ROOT)
+
+MODES = ["json", "multipart", "raw"]
+
+
+def make_image_bytes(size_mb):
+    """Build an incompressible PNG of roughly size_mb megabytes"""
+    from PIL import Image
+
+    side = int((size_mb * 1024 * 1024 / 3) ** 0.5)
+    image = Image.frombytes("RGB", (side, side), os.urandom(side * side * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", compress_level=0)
+    return buffer.getvalue()
+
+
+def make_app():
+    from flask import Flask
+    from src.routes.donut_recognition import donut_bp
+
+    app = Flask(__name__)
+    app.register_blueprint(donut_bp, url_prefix='/api')
+    return app
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_mode(mode, size_mb, requests):
+    image_bytes = make_image_bytes(size_mb)
+    client = make_app().test_client()
+
+    if mode == "json":
+        body = json.dumps({"image": "data:image/png;base64," + base64.b64encode(image_bytes).decode()})
+
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        if mode == "json":
+            response = client.post('/api/recognize/receipt', data=body, content_type='application/json')
+        elif mode == "multipart":
+            response = client.post(
+                '/api/recognize/receipt',
+                data={"image": (io.BytesIO(image_bytes), "receipt.png")},
+                content_type='multipart/form-data',
+            )
+        else:
+            response = client.post('/api/recognize/receipt', data=image_bytes, content_type='image/png')
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.get_data(as_text=True)
+
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "mode": mode,
+        "payload_mb": round(len(image_bytes) / 1024 / 1024, 2),
+        "requests": requests,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "peak_rss_mb": round(peak_kb / 1024, 1),
+        "peak_rss_growth_mb": round((peak_kb - baseline_kb) / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=float, default=8)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.size_mb, args.requests)))
+        return
+
+    print(f"{'mode':<10} {'payload':>8} {'p50 ms':>9} {'p99 ms':>9} {'peak RSS':>9} {'growth':>8}")
+    for mode in MODES:
+        output = subprocess.check_output([
+            sys.executable, os.path.abspath(__file__),
+            "--mode", mode, "--size-mb", str(args.size_mb), "--requests", str(args.requests),
+        ])
+        row = json.loads(output)
+        print(f"{row['mode']:<10} {row['payload_mb']:>6}MB {row['p50_ms']:>9} {row['p99_ms']:>9} "
+              f"{row['peak_rss_mb']:>7}MB {row['peak_rss_growth_mb']:>6}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Correctness checks of the Donut model runtime on a small randomly initialized model.
+
+Writes a "tiny" random Donut with build_random_model, loads it with
+DonutRuntime, fp32 and int8, and decodes receipts and payments with and
+without requested fields, checking that:
+
+- the model loads from the memory-mapped weights and warms up;
+- every generated token is one the grammar allowed at that step;
+- a full decode stops on the end token or after ``max_tokens``, never
+  early, and a decode of requested fields returns only those fields;
+- a document decodes to the same tokens alone as in a batch where the
+  others finish at different steps.
+
+Exits non-zero on the first check that fails.
+
+    pip install torch transformers
+    python benchmarks/check_model_runtime.py --max-tokens 48
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+from PIL import Image, ImageDraw
+
+SERVICE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_ROOT)
+
+from src.services import model_runtime  # noqa: E402
+from src.services.donut_decoding import DecodingState, allows  # noqa: E402
+from src.services.model_runtime import DonutRuntime, build_random_model  # noqa: E402
+
+
+class RecordingState(DecodingState):
+    """A decoding state that keeps each token it is fed and whether the grammar allowed it"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fed = []
+
+    def feed(self, token):
+        if not self.finished:
+            self.fed.append((token, allows(self.allowed(), token)))
+        super().feed(token)
+
+
+def check(description, condition):
+    if not condition:
+        raise SystemExit(f"FAIL: {description}")
+    print(f"ok   {description}")
+
+
+def document_image(rng, size):
+    image = Image.new("L", size, 255)
+    draw = ImageDraw.Draw(image)
+    for line in range(rng.randint(3, 8)):
+        draw.text((8, 8 + line * 16), f"Item {rng.randint(1, 99)} .. {rng.uniform(1, 200):.2f}", fill=0)
+    return image
+
+
+def check_decode(runtime, label, rng, size):
+    requests = [("receipt", None), ("receipt", ("extracted_amount", "extracted_date")), ("payment", None),
+                ("payment", ("receiver",)), ("receipt", ("extracted_items",))]
+    images = [document_image(rng, size) for _ in requests]
+    document_types = [document_type for document_type, _ in requests]
+    decoded = runtime.decode(images, document_types, [fields for _, fields in requests])
+
+    check(f"{label}: every generated token was allowed by the grammar",
+          all(allowed for state, _ in decoded for _, allowed in state.fed))
+    full = [state for (state, _), (_, fields) in zip(decoded, requests) if fields is None]
+    check(f"{label}: full decodes stop on the end token or max_tokens ({[state.stopped for state in full]})",
+          all(state.stopped in ("end", "max_tokens") for state in full))
+    selected = [(state, fields) for (state, _), (_, fields) in zip(decoded, requests) if fields is not None]
+    check(f"{label}: decodes of requested fields stop in time ({[state.stopped for state, _ in selected]})",
+          all(state.stopped in ("end", "max_tokens", "early_exit") for state, _ in selected))
+    check(f"{label}: they return only the requested fields",
+          all(tuple(state.result()) == fields for state, fields in selected))
+    check(f"{label}: no document ran past max_tokens",
+          all(0 < state.tokens <= runtime.max_tokens for state, _ in decoded))
+    check(f"{label}: confidences are probabilities", all(0 < confidence <= 1 for _, confidence in decoded))
+
+    alone = [runtime.decode([image], [document_type], [fields])[0][0]
+             for image, (document_type, fields) in zip(images, requests)]
+    check(f"{label}: each document decodes alone to the same tokens as in the batch",
+          all([token for token, _ in single.fed] == [token for token, _ in state.fed]
+              for single, (state, _) in zip(alone, decoded)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--image-size", type=int, nargs=2, default=[320, 320], metavar=("WIDTH", "HEIGHT"),
+                        help="multiples of 320, so the last encoder stage is as wide as its attention window")
+    parser.add_argument("--max-tokens", type=int, default=48)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    model_runtime.DecodingState = RecordingState
+    size = tuple(args.image_size)
+    with tempfile.TemporaryDirectory() as model_dir:
+        build_random_model(model_dir, "tiny", size, max_tokens=args.max_tokens, seed=args.seed)
+        for quantize in (False, True):
+            label = "int8" if quantize else "fp32"
+            runtime = DonutRuntime(model_dir, quantize=quantize, max_tokens=args.max_tokens)
+            runtime.load()
+            stats = runtime.stats()
+            check(f"{label}: loads {stats['parameters']} parameters and warms up",
+                  stats["loaded"] and stats["parameters"] > 0 and stats["warmup_seconds"] is not None)
+            check_decode(runtime, label, random.Random(args.seed), size)
+
+
+if __name__ == "__main__":
+    main()
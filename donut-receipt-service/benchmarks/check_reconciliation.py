@@ -0,0 +1,201 @@
+"""
+Correctness checks of receipt-to-payment candidate matching against a linear scan.
+
+Fills a ReceiptIndex with random receipts crowded into a narrow range of
+amounts and dates, some undated, then removes and re-adds some of them,
+and checks that:
+
+- every lookup finds exactly the receipts a linear scan over all receipts
+  finds within the amount tolerance and date window;
+- a lookup cut short by its limit keeps the receipts of the closest
+  amounts;
+- with amounts up to millions and tolerances just as wide, lookups
+  still agree with a linear scan, take time in proportion to what they
+  find rather than to the tolerance, and a huge payment is matched with
+  a capped tolerance;
+- ReconciliationService.match returns the same receipts, scored and
+  sorted best first;
+- a receipt linked to a payment by one process leaves the index of
+  another process sharing the store once it syncs.
+
+Exits non-zero on the first check that fails.
+
+    python benchmarks/check_reconciliation.py --receipts 5000 --queries 500
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+SERVICE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_ROOT)
+
+from src.services.reconciliation import ReceiptIndex, ReconciliationService, ReconciliationStore  # noqa: E402
+
+START = 1735689600  # 2025-01-01T00:00:00Z
+DAY = 86400
+MERCHANTS = ["golden dragon", "jade garden", "lucky star", "pearl tea", "金龙餐厅"]
+
+
+def check(description, condition):
+    if not condition:
+        raise SystemExit(f"FAIL: {description}")
+    print(f"ok   {description}")
+
+
+def failed(queries):
+    return f" (failed for {queries[:5]})" if queries else ""
+
+
+def random_receipt(rng):
+    # Few distinct amounts and a month of dates, so buckets hold many receipts and windows overlap
+    cents = rng.randrange(1000, 1200)
+    timestamp = START + rng.randrange(30 * DAY) if rng.random() < 0.9 else None
+    return cents, timestamp, rng.choice(MERCHANTS)
+
+
+def linear_scan(receipts, cents, timestamp, cents_tolerance, time_window):
+    return {
+        receipt_id for receipt_id, (receipt_cents, receipt_time, _) in receipts.items()
+        if abs(receipt_cents - cents) <= cents_tolerance
+        and (timestamp is None or receipt_time is None or abs(receipt_time - timestamp) <= time_window)
+    }
+
+
+def random_query(rng):
+    timestamp = START + rng.randrange(-DAY, 31 * DAY) if rng.random() < 0.9 else None
+    return rng.randrange(990, 1210), timestamp, rng.randrange(0, 8), rng.choice([0, 3600, DAY, 3 * DAY])
+
+
+def check_index(rng, count, queries):
+    index, receipts = ReceiptIndex(), {}
+    for number in range(count):
+        receipts[f"receipt-{number}"] = random_receipt(rng)
+        index.add(f"receipt-{number}", *receipts[f"receipt-{number}"])
+    # Removed receipts, and re-added ones that moved to another bucket or date
+    for receipt_id in rng.sample(sorted(receipts), count // 5):
+        index.remove(receipt_id)
+        if rng.random() < 0.5:
+            del receipts[receipt_id]
+        else:
+            receipts[receipt_id] = random_receipt(rng)
+            index.add(receipt_id, *receipts[receipt_id])
+    check(f"the index holds {len(receipts)} receipts after removals and re-adds", len(index) == len(receipts))
+
+    mismatches, truncated = [], 0
+    for _ in range(queries):
+        cents, timestamp, cents_tolerance, time_window = random_query(rng)
+        expected = linear_scan(receipts, cents, timestamp, cents_tolerance, time_window)
+        found = index.candidates(cents, timestamp, cents_tolerance, time_window, limit=count + 1)
+        found_ids = [candidate[0] for candidate in found]
+        if len(found_ids) != len(set(found_ids)) or set(found_ids) != expected:
+            mismatches.append((cents, timestamp, cents_tolerance, time_window))
+            continue
+        if any(candidate[1:] != receipts[candidate[0]] for candidate in found):
+            mismatches.append((cents, timestamp, cents_tolerance, time_window))
+            continue
+        if len(found) > 1:
+            limit = rng.randrange(1, len(found))
+            kept = index.candidates(cents, timestamp, cents_tolerance, time_window, limit=limit)
+            farthest = max(abs(candidate[1] - cents) for candidate in kept)
+            left_out = expected - {candidate[0] for candidate in kept}
+            left = [abs(receipts[receipt_id][0] - cents) for receipt_id in left_out]
+            if len(kept) != limit or min(left) < farthest:
+                mismatches.append((cents, timestamp, cents_tolerance, time_window, limit))
+            truncated += 1
+    check(f"{queries} lookups find the same receipts as a linear scan{failed(mismatches)}", not mismatches)
+    check(f"{truncated} limited lookups keep the closest amounts", truncated > 0)
+
+
+def check_service(rng, count, queries):
+    service = ReconciliationService(max_candidates=count, min_score=0.0, max_scan=count + 1)
+    receipts = {}
+    for number in range(count):
+        cents, timestamp, merchant = random_receipt(rng)
+        receipts[f"receipt-{number}"] = (cents, timestamp, merchant.replace(" ", ""))
+        service.add_receipt(f"receipt-{number}", {
+            "extracted_amount": f"{cents / 100:.2f}", "extracted_date": timestamp, "merchant": merchant,
+        })
+
+    mismatches = []
+    for _ in range(queries):
+        cents, timestamp, _, _ = random_query(rng)
+        candidates = service.match({
+            "extracted_amount": cents / 100, "extracted_date": timestamp, "receiver": rng.choice(MERCHANTS),
+        })
+        expected = linear_scan(receipts, cents, timestamp, service.tolerance(cents), service.time_window)
+        scores = [candidate["score"] for candidate in candidates]
+        if {candidate["receipt_id"] for candidate in candidates} != expected or scores != sorted(scores, reverse=True):
+            mismatches.append((cents, timestamp))
+    check(f"{queries} matches return the linear scan's receipts, best first{failed(mismatches)}", not mismatches)
+
+
+def check_large_amounts(rng, count, queries):
+    index, receipts = ReceiptIndex(), {}
+    for number in range(count):
+        # Amounts spread from cents to a hundred million units
+        receipts[f"large-{number}"] = (int(10 ** rng.uniform(0, 10)), START + rng.randrange(30 * DAY), "")
+        index.add(f"large-{number}", *receipts[f"large-{number}"])
+
+    mismatches, slowest = [], 0.0
+    for _ in range(queries):
+        cents = int(10 ** rng.uniform(0, 12))
+        cents_tolerance = rng.choice([cents // 100, cents, 10 ** 12])
+        timestamp = START + rng.randrange(30 * DAY)
+        started = time.perf_counter()
+        found = index.candidates(cents, timestamp, cents_tolerance, DAY, limit=count + 1)
+        slowest = max(slowest, time.perf_counter() - started)
+        if {candidate[0] for candidate in found} != linear_scan(receipts, cents, timestamp, cents_tolerance, DAY):
+            mismatches.append((cents, timestamp, cents_tolerance))
+    check(f"{queries} lookups of amounts up to 10^12 cents with tolerances up to 10^12 agree with a linear scan"
+          f"{failed(mismatches)}", not mismatches)
+    # Walking every cent of such a tolerance would take hours; visiting the buckets in it takes milliseconds
+    check(f"the slowest of them took {slowest * 1000:.1f} ms for {count} receipts", slowest < 0.5)
+
+    service = ReconciliationService()
+    service.add_receipt("huge", {"extracted_amount": 500000, "extracted_date": START, "merchant": "golden dragon"})
+    started = time.perf_counter()
+    candidates = service.match({"extracted_amount": 500000.5, "extracted_date": START, "receiver": "golden dragon"})
+    elapsed = time.perf_counter() - started
+    check(f"a payment of 50,000,000 cents is matched in {elapsed * 1000:.2f} ms with a tolerance capped at "
+          f"{service.tolerance(50000050)} cents",
+          [candidate["receipt_id"] for candidate in candidates] == ["huge"]
+          and service.tolerance(50000050) == service.max_tolerance_cents and elapsed < 0.1)
+
+
+def check_shared_store(rng):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "reconciliation.db")
+        first, second = ReconciliationService(), ReconciliationService()
+        first.start(ReconciliationStore(path))
+        second.start(ReconciliationStore(path))
+        for number in range(50):
+            cents, timestamp, merchant = random_receipt(rng)
+            first.add_receipt(f"receipt-{number}", {
+                "extracted_amount": cents / 100, "extracted_date": timestamp, "merchant": merchant,
+            })
+        second.sync()
+        check("receipts added by one process reach another's index", len(second.index) == 50)
+        check("a receipt links to one payment", first.link("receipt-7", "payment-1"))
+        check("and cannot be linked again, even from another process", not second.link("receipt-7", "payment-2"))
+        check("the linked receipt left both indexes", len(first.index) == len(second.index) == 49)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--receipts", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    check_index(rng, args.receipts, args.queries)
+    check_service(rng, args.receipts, args.queries)
+    check_large_amounts(rng, args.receipts, args.queries)
+    check_shared_store(rng)
+
+
+if __name__ == "__main__":
+    main()
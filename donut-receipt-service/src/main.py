@@ -1,11 +1,13 @@
 import os
 import sys
+import threading
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from flask import Flask, send_from_directory
 from flask_cors import CORS
 from src.models.user import db
+from src.services.serving import add_serving_hook
 from src.routes.user import user_bp
 from src.routes.donut_recognition import donut_bp
 
@@ -22,8 +24,29 @@ app.register_blueprint(donut_bp, url_prefix='/api')
 app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db.init_app(app)
-with app.app_context():
-    db.create_all()
+
+# Tables are created on first use, not at import, so importing the app opens no database
+# connection; a preloading master creates them once before forking (see scripts/serve.py)
+tables_created = False
+tables_lock = threading.Lock()
+
+def create_tables():
+    global tables_created
+    with tables_lock:
+        if tables_created:
+            return
+        with app.app_context():
+            db.create_all()
+            # Forked server workers must open their own connections rather than share these
+            db.engine.dispose()
+        tables_created = True
+
+@app.before_request
+def ensure_tables():
+    if not tables_created:
+        create_tables()
+
+add_serving_hook(app, 'warmup', create_tables)
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -1,40 +1,184 @@
 import base64
 import json
 import io
+import multiprocessing
+import os
+import tempfile
+import threading
 from PIL import Image
-from flask import Blueprint, request, jsonify
+from urllib.parse import urlparse
+from flask import Blueprint, request, jsonify, url_for
 from flask_cors import cross_origin
 import logging
+from src.services.recognition_batcher import RecognitionBatcher, RecognitionQueueFull
+from src.services.recognition_workers import RecognitionWorkerPool
+from src.services.recognition_jobs import RecognitionJobRunner, RecognitionJobStore
+from src.services.recognition_cache import RecognitionCache, sha256_bytes, sha256_stream
+from src.services import image_preprocessing
+from src.services.reconciliation import ReconciliationService, ReconciliationStore
+from src.services.duplicate_detection import DuplicateDetector
+from src.services.template_recognition import TemplateRecognizer
+from src.services.donut_decoding import (DOCUMENT_SCHEMAS, FieldSelectionError, ScriptedDecoder, result_tokens,
+                                          select_fields, select_result)
+from src.services.model_runtime import DonutRuntime
+from src.services.instrumentation import instrument_blueprint, metrics, metrics_response, stage
+from src.services.serving import add_serving_hook, run_after_fork
 
 # Create blueprint
 donut_bp = Blueprint('donut', __name__)
+instrument_blueprint(donut_bp)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def decode_base64_image(base64_string):
-    """Decode base64 string to PIL Image"""
+# Donut checkpoint converted with model_runtime.export_model; without one the mock model answers
+MODEL_DIR = os.getenv('DONUT_MODEL_DIR')
+model_runtime = DonutRuntime(
+    MODEL_DIR,
+    quantize=os.getenv('DONUT_MODEL_QUANTIZE', '').lower() == 'int8',
+    threads=int(os.getenv('DONUT_TORCH_THREADS', '0')) or None,
+    max_tokens=int(os.getenv('DONUT_MAX_TOKENS', '512')),
+) if MODEL_DIR else None
+MODEL_VERSION = model_runtime.version if model_runtime else "mock-1.0.0"
+
+def decode_base64_upload(base64_string):
+    """
+    Decode base64 string to a PIL Image and the SHA-256 of its bytes.
+    Returns a tuple of (image, image_hash, error).
+    """
     try:
         # Remove data URL prefix if present
         if base64_string.startswith('data:image'):
             base64_string = base64_string.split(',')[1]
         
+        # Reject oversized payloads before decoding them
+        error = image_preprocessing.check_byte_size(len(base64_string) * 3 // 4)
+        if error:
+            return None, None, error
+        
         # Decode base64
-        image_data = base64.b64decode(base64_string)
-        image = Image.open(io.BytesIO(image_data))
-        return image
+        with stage("base64_decode"):
+            image_data = base64.b64decode(base64_string)
+        with stage("image_open"):
+            image = Image.open(io.BytesIO(image_data))
+            error = image_preprocessing.validate_image(image)
+        if error:
+            return None, None, error
+        with stage("hash"):
+            image_hash = sha256_bytes(image_data)
+        return image, image_hash, None
     except Exception as e:
         logger.error(f"Error decoding base64 image: {str(e)}")
-        return None
+        return None, None, "Invalid image data"
+
+def decode_base64_image(base64_string):
+    """Decode base64 string to PIL Image"""
+    image, _, _ = decode_base64_upload(base64_string)
+    return image
 
-def mock_donut_recognition(image, document_type="receipt"):
+# Raw uploads larger than this spill from memory to a temporary file
+UPLOAD_SPOOL_MAX_SIZE = 1024 * 1024
+
+def open_image_stream(stream):
+    """
+    Open a seekable binary stream as a PIL Image and the SHA-256 of its bytes.
+    Returns a tuple of (image, image_hash, error).
+    """
+    try:
+        start = stream.tell()
+        size = stream.seek(0, io.SEEK_END) - start
+        stream.seek(start)
+        if size == 0:
+            return None, None, "No image data provided"
+        error = image_preprocessing.check_byte_size(size)
+        if error:
+            return None, None, error
+        
+        with stage("hash"):
+            image_hash = sha256_stream(stream)
+        with stage("image_open"):
+            image = Image.open(stream)
+            error = image_preprocessing.validate_image(image)
+        if error:
+            return None, None, error
+        return image, image_hash, None
+    except Exception as e:
+        logger.error(f"Error opening image stream: {str(e)}")
+        return None, None, "Invalid image data"
+
+def spool_request_body():
+    """
+    Copy the raw request body into a spooled temporary file.
+    Returns a tuple of (stream, error); stops reading once the size limit is exceeded.
+    """
+    error = image_preprocessing.check_byte_size(request.content_length)
+    if error:
+        return None, error
+    
+    spooled = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_SIZE)
+    limit = image_preprocessing.MAX_IMAGE_BYTES + 1
+    while spooled.tell() < limit:
+        chunk = request.stream.read(min(64 * 1024, limit - spooled.tell()))
+        if not chunk:
+            break
+        spooled.write(chunk)
+    
+    error = image_preprocessing.check_byte_size(spooled.tell())
+    if error:
+        spooled.close()
+        return None, error
+    spooled.seek(0)
+    return spooled, None
+
+def load_request_image():
+    """
+    Read the uploaded image from the current request.
+
+    Accepts multipart/form-data (file field ``image``), a raw ``image/*``
+    body, or the original JSON body with a base64 ``image`` string.
+    Returns a tuple of (image, image_hash, params, error) where params
+    holds the remaining request fields such as ``document_type``.
+    """
+    content_type = request.mimetype or ""
+
+    if content_type == "multipart/form-data":
+        upload = request.files.get("image")
+        if upload is None:
+            return None, None, request.form, "No image data provided"
+        # Werkzeug has already spooled the file part to disk for large uploads
+        image, image_hash, error = open_image_stream(upload.stream)
+        return image, image_hash, request.form, error
+
+    if content_type.startswith("image/"):
+        spooled, error = spool_request_body()
+        if error:
+            return None, None, request.args, error
+        image, image_hash, error = open_image_stream(spooled)
+        return image, image_hash, request.args, error
+
+    data = request.get_json(silent=True)
+    if not data or 'image' not in data:
+        return None, None, data or {}, "No image data provided"
+
+    image, image_hash, error = decode_base64_upload(data['image'])
+    return image, image_hash, data, error
+
+def mock_donut_recognition(image, document_type="receipt", fields=None):
     """
     Mock Donut recognition function
     In a real implementation, this would use the actual Donut model
+
+    A request for some ``fields`` (see donut_decoding.select_fields) is
+    decoded from MOCK_DOCUMENTS through the constrained decoder, which
+    stops early the way it stops a real model.
     """
     try:
         # Simulate processing time and return mock data
+        if fields and document_type in MOCK_DOCUMENTS:
+            decoder = ScriptedDecoder([result_tokens(document_type, MOCK_DOCUMENTS[document_type])])
+            state = decoder.decode([document_type], [fields])[0]
+            return decoded_result(state, MOCK_CONFIDENCE[document_type])
         if document_type == "receipt":
             return {
                 "extracted_amount": 128.50,
@@ -72,13 +216,7 @@ def mock_donut_recognition(image, document_type="receipt"):
                 })
             }
         else:
-            return {
-                "extracted_amount": None,
-                "extracted_date": None,
-                "extracted_description": "Unknown document type",
-                "confidence": 0.0,
-                "raw_data": json.dumps({"error": "Unsupported document type"})
-            }
+            return unsupported_result()
     except Exception as e:
         logger.error(f"Error in mock recognition: {str(e)}")
         return {
@@ -89,35 +227,594 @@ def mock_donut_recognition(image, document_type="receipt"):
             "raw_data": json.dumps({"error": str(e)})
         }
 
+# What the mock model reads off each document when asked for some fields
+MOCK_DOCUMENTS = {
+    "receipt": {
+        "extracted_amount": 128.50,
+        "extracted_date": "2025-01-19T10:30:00Z",
+        "merchant": "Golden Dragon Restaurant",
+        "extracted_description": "Restaurant meal",
+        "extracted_items": ["Beef noodles - $45.00", "Iced tea - $8.50", "Service charge - $5.00", "Tax - $10.00"],
+    },
+    "payment": {
+        "extracted_amount": 128.50,
+        "extracted_date": "2025-01-19T10:35:00Z",
+        "payment_method": "WeChat Pay",
+        "payer": "John Doe",
+        "receiver": "Golden Dragon Restaurant",
+        "transaction_id": "WX20250119103500123456",
+    },
+}
+MOCK_CONFIDENCE = {"receipt": 0.92, "payment": 0.89}
+
+def decoded_result(state, confidence):
+    """Recognition result of a finished decoding state: its fields, raw Donut keys and decoding stats"""
+    result = state.result()
+    schema = DOCUMENT_SCHEMAS[state.document_type]
+    return dict(
+        result,
+        confidence=confidence,
+        raw_data=json.dumps({schema[name]["key"]: value for name, value in result.items() if value is not None}),
+        decoding=state.stats()
+    )
+
+def recognize_batch(images, document_types, fields=None):
+    """
+    Recognize a batch of images in one model call.
+
+    This is the pluggable model entry point used by the batch scheduler; a
+    real Donut model should replace it via ``set_batch_recognizer`` and
+    return one result dict per image, in input order. ``fields``, when
+    given, holds the fields requested of each image (None for all of them)
+    and is only passed when some image asks for a subset.
+    """
+    fields = fields or [None] * len(images)
+    return [mock_donut_recognition(image, doc_type, image_fields)
+            for image, doc_type, image_fields in zip(images, document_types, fields)]
+
+def unsupported_result():
+    return {
+        "extracted_amount": None,
+        "extracted_date": None,
+        "extracted_description": "Unknown document type",
+        "confidence": 0.0,
+        "raw_data": json.dumps({"error": "Unsupported document type"})
+    }
+
+def model_recognize_batch(images, document_types, fields=None):
+    """recognize_batch with the Donut model in DONUT_MODEL_DIR, loaded on first use"""
+    fields = fields or [None] * len(images)
+    known = [index for index, doc_type in enumerate(document_types) if doc_type in DOCUMENT_SCHEMAS]
+    decoded = model_runtime.decode(
+        [images[index] for index in known],
+        [document_types[index] for index in known],
+        [fields[index] for index in known]
+    ) if known else []
+    results = [unsupported_result() for _ in images]
+    for index, (state, confidence) in zip(known, decoded):
+        results[index] = decoded_result(state, confidence)
+    return results
+
+def load_batch_recognizer():
+    """Model factory called once in each recognition worker process"""
+    if model_runtime is None:
+        return recognize_batch
+    # A no-op in workers forked from a process that loaded the model: they share its weights
+    model_runtime.load()
+    model_runtime.configure_threads()
+    return model_recognize_batch
+
+def load_model_runtime():
+    """Load the Donut model in this process, so the processes forked from it share its weights"""
+    try:
+        model_runtime.load()
+    except Exception as e:
+        logger.error(f"Error loading Donut model: {str(e)}")
+
+# Micro-batching scheduler shared by all recognition endpoints
+MAX_BATCH_SIZE = int(os.getenv('DONUT_MAX_BATCH_SIZE', '8'))
+MAX_BATCH_WAIT_MS = float(os.getenv('DONUT_MAX_BATCH_WAIT_MS', '10'))
+MAX_BATCH_REQUEST_IMAGES = int(os.getenv('DONUT_MAX_BATCH_REQUEST_IMAGES', '32'))
+MAX_QUEUE_SIZE = int(os.getenv('DONUT_MAX_QUEUE_SIZE', '64'))
+RETRY_AFTER_SECONDS = int(os.getenv('DONUT_RETRY_AFTER_SECONDS', '1'))
+
+# Worker processes for CPU-bound recognition; 0 keeps recognition in-process
+RECOGNITION_WORKERS = int(os.getenv('DONUT_RECOGNITION_WORKERS', '0'))
+
+batcher = RecognitionBatcher(
+    model_recognize_batch if model_runtime else recognize_batch,
+    max_batch_size=MAX_BATCH_SIZE,
+    max_wait_ms=MAX_BATCH_WAIT_MS,
+    max_queue_size=MAX_QUEUE_SIZE,
+    concurrency=max(1, RECOGNITION_WORKERS),
+)
+worker_pool = None
+
+def start_worker_pool():
+    """Start the recognition worker processes before any request threads exist"""
+    global worker_pool
+    if worker_pool is not None:
+        return
+    start_method = os.getenv('DONUT_WORKER_START_METHOD') or None
+    if model_runtime is not None and (start_method or multiprocessing.get_start_method()) == 'fork':
+        # Loaded before forking so the workers share the (quantized) weights instead of loading their own
+        load_model_runtime()
+    worker_pool = RecognitionWorkerPool(
+        RECOGNITION_WORKERS,
+        f"{__name__}:load_batch_recognizer",
+        start_method=start_method,
+        task_timeout=float(os.getenv('DONUT_WORKER_TASK_TIMEOUT', '60')),
+        max_load_failures=int(os.getenv('DONUT_WORKER_MAX_LOAD_FAILURES', '5')),
+        max_restart_backoff=float(os.getenv('DONUT_WORKER_MAX_RESTART_BACKOFF', '60')),
+    )
+    worker_pool.start()
+    set_batch_recognizer(worker_pool.recognize_batch)
+    logger.info(f"Started {RECOGNITION_WORKERS} recognition worker processes")
+
+def stop_worker_pool():
+    if worker_pool is not None:
+        worker_pool.shutdown()
+
+@donut_bp.record_once
+def setup_model_runtime(state):
+    # The preloading master loads the model before forking its server workers
+    if model_runtime is not None:
+        add_serving_hook(state.app, 'warmup', load_model_runtime)
+
+@donut_bp.record_once
+def setup_worker_pool(state):
+    if RECOGNITION_WORKERS < 1:
+        return
+    run_after_fork(state, start_worker_pool)
+    add_serving_hook(state.app, 'shutdown', stop_worker_pool)
+
+# Set once the model has answered its first (blank) image; reported by /ready
+model_ready = threading.Event()
+model_warmup_error = None
+
+def warm_up_model():
+    """
+    Run one blank image through the recognizer in use (the worker pool when
+    it is started) so the first request does not pay for loading the model
+    """
+    global model_warmup_error
+    try:
+        blank = Image.new(image_preprocessing.TARGET_MODE, image_preprocessing.TARGET_SIZE, 255)
+        batcher.recognize_batch([blank], ["receipt"])
+    except Exception as e:
+        model_warmup_error = str(e)
+        logger.error(f"Error warming up recognition model: {str(e)}")
+        return
+    model_warmup_error = None
+    model_ready.set()
+
+@donut_bp.record_once
+def setup_warmup(state):
+    # In the background so /health answers while the model loads; readiness waits for it
+    run_after_fork(state, lambda: threading.Thread(target=warm_up_model, name='model-warmup', daemon=True).start())
+
+def queue_full_response(error):
+    """429 response asking the caller to retry once the recognition queue drains"""
+    response = jsonify({
+        "success": False,
+        "error": str(error)
+    })
+    response.headers['Retry-After'] = str(RETRY_AFTER_SECONDS)
+    return response, 429
+
+# Content-addressed result cache; the SQLite tier is opt-in via DONUT_CACHE_PERSIST
+cache = RecognitionCache(
+    max_entries=int(os.getenv('DONUT_CACHE_MAX_ENTRIES', '1024')),
+    ttl_seconds=float(os.getenv('DONUT_CACHE_TTL_SECONDS', '3600')),
+)
+
+def sqlite_database_path(app):
+    """File path of the app's SQLite database, or None if it uses another backend"""
+    database_uri = app.config.get('SQLALCHEMY_DATABASE_URI', '')
+    if not database_uri.startswith('sqlite:///'):
+        return None
+    return database_uri[len('sqlite:///'):]
+
+@donut_bp.record_once
+def configure_cache_persistence(state):
+    """Store cache entries in the app's SQLite database when enabled"""
+    if os.getenv('DONUT_CACHE_PERSIST', 'false').lower() not in ('1', 'true', 'yes'):
+        return
+    db_path = sqlite_database_path(state.app)
+    if not db_path:
+        logger.warning("Recognition cache persistence requires a SQLite database, staying in memory")
+        return
+    try:
+        cache.enable_persistence(db_path)
+    except Exception as e:
+        logger.error(f"Error enabling recognition cache persistence: {str(e)}")
+
+# Near-duplicate uploads by perceptual hash, recorded in the app's SQLite database
+DUPLICATE_DETECTION = os.getenv('DONUT_DUPLICATE_DETECTION', 'true').lower() in ('1', 'true', 'yes')
+# Callers can skip recognition of a duplicate; that trusts the hash alone, so it takes a much closer match
+SKIP_DUPLICATE_MAX_DISTANCE = int(os.getenv('DONUT_DUPLICATE_SKIP_DISTANCE', '4'))
+duplicates = DuplicateDetector(
+    hash_size=int(os.getenv('DONUT_DUPLICATE_HASH_SIZE', '16')),
+    max_distance=int(os.environ['DONUT_DUPLICATE_MAX_DISTANCE']) if os.getenv('DONUT_DUPLICATE_MAX_DISTANCE') else None,
+)
+
+@donut_bp.record_once
+def setup_duplicate_detection(state):
+    """Open the fingerprint table and index earlier uploads in the background"""
+    if not DUPLICATE_DETECTION:
+        return
+    db_path = sqlite_database_path(state.app)
+    if not db_path:
+        logger.warning("Duplicate detection requires a SQLite database for persistence, keeping fingerprints in memory")
+
+    def start_duplicate_detection():
+        try:
+            duplicates.start(db_path or ":memory:")
+        except Exception as e:
+            logger.error(f"Error loading image fingerprints: {str(e)}")
+
+    run_after_fork(state, lambda: threading.Thread(target=start_duplicate_detection, name='fingerprint-load', daemon=True).start())
+
+def find_duplicate(image_hash, fingerprint=None, document_type=None, result=None, max_distance=None):
+    """Earlier upload this one duplicates (see DuplicateDetector.find), or None"""
+    if not DUPLICATE_DETECTION or not image_hash or not duplicates.ready.is_set():
+        return None
+    try:
+        with stage("duplicate_lookup"):
+            return duplicates.find(image_hash, fingerprint, document_type, result, max_distance)
+    except Exception as e:
+        logger.error(f"Error looking up duplicate images: {str(e)}")
+        return None
+
+def remember_upload(image_hash, fingerprint, document_type, result):
+    """Record a recognized upload so later copies of it are found"""
+    if fingerprint is None or not image_hash or not duplicates.ready.is_set():
+        return
+    try:
+        duplicates.record(image_hash, fingerprint, document_type, result)
+    except Exception as e:
+        logger.error(f"Error recording image fingerprint: {str(e)}")
+
+def duplicate_report(duplicate, skipped=False, new_upload=True):
+    """
+    The duplicate as returned to callers: the earlier upload without its
+    result. Duplicates found for a new upload, not a cache hit, are counted.
+    """
+    if duplicate is None:
+        return None
+    if new_upload:
+        duplicates.count_duplicate()
+    report = {key: value for key, value in duplicate.items() if key != "result"}
+    report["recognition_skipped"] = skipped
+    return report
+
+def skippable_duplicate(image_hash, fingerprint, document_type):
+    """An earlier upload close enough to reuse its result instead of recognizing this one, or None"""
+    duplicate = find_duplicate(image_hash, fingerprint, document_type, max_distance=SKIP_DUPLICATE_MAX_DISTANCE)
+    if duplicate and duplicate["result"] is not None and duplicate["document_type"] == document_type:
+        return duplicate
+    return None
+
+def requested_fields(params, document_type):
+    """
+    Fields the request asked for (``fields``: a list, comma separated
+    names, or a repeated form field), or None for the whole result.
+    Raises FieldSelectionError for fields the document type lacks.
+    """
+    value = params.get('fields') if params else None
+    if hasattr(params, 'getlist') and len(params.getlist('fields')) > 1:
+        value = params.getlist('fields')
+    return select_fields(document_type, value)
+
+def wants_skip_duplicates(params):
+    """Whether the request opted in to skipping recognition of duplicates (``skip_duplicates``)"""
+    value = params.get('skip_duplicates', False) if params else False
+    if isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes')
+    return bool(value)
+
+# Screenshots of fixed layouts (e.g. WeChat Pay results) read from template regions
+# without the model; templates are built from DONUT_TEMPLATE_DIR if it exists
+TEMPLATE_DIR = os.getenv('DONUT_TEMPLATE_DIR', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'templates'))
+templates = TemplateRecognizer(
+    min_layout_score=float(os.getenv('DONUT_TEMPLATE_MIN_SCORE', '0.9')),
+    min_glyph_score=float(os.getenv('DONUT_TEMPLATE_MIN_GLYPH_SCORE', '0.75')),
+    min_glyph_margin=float(os.getenv('DONUT_TEMPLATE_MIN_GLYPH_MARGIN', '0.05')),
+)
+
+@donut_bp.record_once
+def setup_templates(state):
+    """Build the screenshot templates in the background; until then every image goes to the model"""
+    if not os.path.isdir(TEMPLATE_DIR):
+        return
+
+    def load_templates():
+        try:
+            loaded = templates.load_directory(TEMPLATE_DIR)
+            logger.info(f"Loaded {loaded} screenshot templates from {TEMPLATE_DIR}")
+        except Exception as e:
+            logger.error(f"Error loading screenshot templates: {str(e)}")
+
+    run_after_fork(state, lambda: threading.Thread(target=load_templates, name='template-load', daemon=True).start())
+
+def preprocess_with_fingerprint(image, document_type=None):
+    """
+    Decode an image, taking its perceptual hash on the way, and try the
+    screenshot templates of ``document_type`` on it before preparing it
+    for the model. Returns (image, preprocessing, fingerprint, result):
+    result is the template path's result, or None when the image, then
+    ready for the model, still needs recognizing.
+    """
+    fingerprints = []
+    on_decoded = (lambda decoded: fingerprints.append(duplicates.fingerprint(decoded))) if DUPLICATE_DETECTION else None
+    timings, original_size = {}, image.size
+    with stage("preprocess"):
+        image = image_preprocessing.decode_image(image, timings=timings, on_decoded=on_decoded)
+    fingerprint = fingerprints[0] if fingerprints else None
+    if document_type and templates.templates:
+        with stage("template_match"):
+            result = templates.recognize(image, document_type)
+        if result is not None:
+            return (image, image_preprocessing.preprocessing_report(original_size, image, timings), fingerprint,
+                    served_by("template", document_type, result))
+    with stage("preprocess"):
+        image, preprocessing = image_preprocessing.fit_image(image, original_size, timings)
+    return image, preprocessing, fingerprint, None
+
+metrics.describe('recognition_path_total', 'counter', 'Recognized images by document type and the path that served them')
+metrics.describe('decodings_total', 'counter', 'Model decodings by document type and why they stopped')
+metrics.describe('decoded_tokens_total', 'counter',
+                 'Tokens the model generated, by document type and why decoding stopped')
+
+def served_by(path, document_type, result):
+    """
+    Count a freshly recognized image by path, template or model, and the
+    tokens the model decoded for it. Only results decoded for some fields
+    keep their decoding report; full results keep their usual shape.
+    """
+    metrics.inc('recognition_path_total', {'path': path, 'document_type': document_type})
+    decoding = result.get("decoding")
+    if decoding:
+        labels = {'document_type': document_type, 'stopped': str(decoding["stopped"])}
+        metrics.inc('decodings_total', labels)
+        metrics.inc('decoded_tokens_total', labels, decoding["tokens"])
+        if not decoding["fields"]:
+            result = {key: value for key, value in result.items() if key != "decoding"}
+    return result
+
+def set_batch_recognizer(recognize_fn):
+    """Replace the batch recognition function, e.g. with a real Donut model"""
+    batcher.recognize_batch = recognize_fn
+
+def cached_result(image_hash, document_type, fields=None):
+    """Cached result of an image: its full result, else one holding exactly ``fields``"""
+    with stage("cache_lookup"):
+        result = cache.get(RecognitionCache.make_key(image_hash, document_type, MODEL_VERSION))
+        if result is None and fields:
+            result = cache.get(RecognitionCache.make_key(image_hash, document_type, MODEL_VERSION, fields))
+    return select_result(document_type, result, fields) if result is not None else None
+
+def store_result(image_hash, fingerprint, document_type, result, fields=None):
+    """
+    Cache a freshly recognized result and record the upload; returns the
+    duplicate report. A result the model decoded for some ``fields`` only
+    is cached under those fields and not kept as the upload's result.
+    """
+    if image_hash:
+        cache.set(RecognitionCache.make_key(image_hash, document_type, MODEL_VERSION, fields), result)
+    duplicate = find_duplicate(image_hash, fingerprint, document_type, result)
+    remember_upload(image_hash, fingerprint, document_type, None if fields else result)
+    return duplicate_report(duplicate)
+
+def recognize_image(image, document_type="receipt", image_hash=None, skip_duplicates=False, fields=None):
+    """
+    Recognize one image through the result cache, preprocessing, the
+    screenshot templates and the micro-batching scheduler.
+    Returns a tuple of (result, cached, preprocessing, duplicate) where
+    preprocessing is the stage report, or None for a cache hit, and
+    duplicate describes the earlier upload this image likely repeats, or
+    is None. With ``skip_duplicates`` a close enough duplicate's result is
+    returned without recognizing the image. ``fields`` (see
+    select_fields) limits the result to those fields, and lets the model
+    stop decoding once it has read them.
+    """
+    if image_hash:
+        result = cached_result(image_hash, document_type, fields)
+        if result is not None:
+            return result, True, None, duplicate_report(find_duplicate(image_hash), new_upload=False)
+
+    image, preprocessing, fingerprint, result = preprocess_with_fingerprint(image, document_type)
+    if skip_duplicates and result is None:
+        duplicate = skippable_duplicate(image_hash, fingerprint, document_type)
+        if duplicate:
+            result = select_result(document_type, duplicate["result"], fields)
+            return result, False, preprocessing, duplicate_report(duplicate, skipped=True)
+    if result is not None:
+        duplicate = store_result(image_hash, fingerprint, document_type, result)
+        return select_result(document_type, result, fields), False, preprocessing, duplicate
+    with stage("recognize"):
+        result = served_by("model", document_type, batcher.recognize(image, document_type, fields=fields))
+    duplicate = store_result(image_hash, fingerprint, document_type, result, fields)
+    return result, False, preprocessing, duplicate
+
+def run_recognition_job(image_bytes, document_type, image_hash, options):
+    """
+    Recognize a stored job image; used by the async job runner. ``options``
+    holds the ``fields`` and ``skip_duplicates`` the job was submitted with.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    fields = tuple(options["fields"]) if options.get("fields") else None
+    result, cached, preprocessing, duplicate = recognize_image(
+        image, document_type, image_hash, options.get("skip_duplicates", False), fields
+    )
+    return {
+        "extracted_data": result,
+        "image_hash": image_hash,
+        "cached": cached,
+        "preprocessing": preprocessing,
+        "duplicate": duplicate,
+        "reconciliation": reconcile_result(document_type, result, image_hash, duplicate)
+    }
+
+def read_image_bytes(image):
+    """Encoded bytes behind an image opened from an upload, before it is decoded"""
+    fp = getattr(image, 'fp', None)
+    if fp is not None:
+        fp.seek(0)
+        return fp.read()
+    buffer = io.BytesIO()
+    image.save(buffer, format=image.format)
+    return buffer.getvalue()
+
+# Asynchronous recognition jobs, stored in the app's SQLite database
+job_runner = RecognitionJobRunner(
+    run_recognition_job,
+    max_workers=int(os.getenv('DONUT_JOB_WORKERS', '4')),
+    retention_seconds=float(os.getenv('DONUT_JOB_RETENTION_SECONDS', '86400')),
+    retry_delay=RETRY_AFTER_SECONDS,
+    retryable=(RecognitionQueueFull,),
+    stale_after=float(os.getenv('DONUT_JOB_STALE_SECONDS', '60')),
+    retry_timeout=float(os.getenv('DONUT_JOB_RETRY_TIMEOUT', '600')),
+)
+
+@donut_bp.record_once
+def setup_job_runner(state):
+    """Open the job table and resume jobs left unfinished by a previous run"""
+    db_path = sqlite_database_path(state.app)
+    if not db_path:
+        logger.warning("Recognition jobs require a SQLite database for persistence, keeping them in memory")
+
+    def start_job_runner():
+        try:
+            job_runner.start(RecognitionJobStore(db_path or ":memory:"))
+        except Exception as e:
+            logger.error(f"Error starting recognition job runner: {str(e)}")
+
+    run_after_fork(state, start_job_runner)
+    add_serving_hook(state.app, 'shutdown', job_runner.shutdown)
+
+# Receipt-to-payment matching; recognized receipts are indexed as they come in
+reconciliation = ReconciliationService(
+    amount_tolerance=float(os.getenv('DONUT_RECONCILE_AMOUNT_TOLERANCE', '0.01')),
+    max_tolerance_cents=int(os.getenv('DONUT_RECONCILE_MAX_TOLERANCE_CENTS', '10000')),
+    time_window=float(os.getenv('DONUT_RECONCILE_TIME_WINDOW_HOURS', '48')) * 3600,
+    max_candidates=int(os.getenv('DONUT_RECONCILE_MAX_CANDIDATES', '10')),
+    min_score=float(os.getenv('DONUT_RECONCILE_MIN_SCORE', '0.3')),
+)
+RECONCILE_AUTO_INDEX = os.getenv('DONUT_RECONCILE_AUTO_INDEX', 'true').lower() in ('1', 'true', 'yes')
+
+@donut_bp.record_once
+def setup_reconciliation(state):
+    """Open the reconciliation table and load its receipts into the index in the background"""
+    db_path = sqlite_database_path(state.app)
+    if not db_path:
+        logger.warning("Reconciliation requires a SQLite database for persistence, keeping receipts in memory")
+
+    def start_reconciliation():
+        try:
+            reconciliation.start(ReconciliationStore(db_path or ":memory:"))
+        except Exception as e:
+            logger.error(f"Error loading reconciliation index: {str(e)}")
+
+    run_after_fork(state, lambda: threading.Thread(target=start_reconciliation, name='reconciliation-load', daemon=True).start())
+
+# Receipt fields the reconciliation index matches payments on
+RECONCILE_RECEIPT_FIELDS = ("extracted_amount", "extracted_date", "merchant")
+
+def reconcile_result(document_type, result, image_hash, duplicate=None):
+    """
+    Reconciliation for a recognition result: a receipt is indexed under its
+    image hash, unless it is a new copy of an earlier receipt or was read
+    without the fields the index matches on, and a payment gets its ranked
+    receipt candidates. Returns None for other documents or when
+    reconciliation is unavailable.
+    """
+    if not RECONCILE_AUTO_INDEX or not image_hash or not reconciliation.ready.is_set():
+        return None
+    try:
+        with stage("reconcile"):
+            if document_type == "receipt" and duplicate and not duplicate["exact"]:
+                return {"indexed": False, "duplicate_of": duplicate["image_hash"]}
+            missing = [field for field in RECONCILE_RECEIPT_FIELDS if field not in result]
+            if document_type == "receipt" and missing:
+                return {"indexed": False, "missing_fields": missing}
+            if document_type == "receipt":
+                return {"indexed": reconciliation.add_receipt(image_hash, result)}
+            if document_type == "payment" and result.get("extracted_amount") is not None:
+                return {"candidates": reconciliation.match(result)}
+    except Exception as e:
+        logger.error(f"Error in reconciliation: {str(e)}")
+    return None
+
+def load_batch_request_images():
+    """
+    Read the images of a batch request.
+
+    Accepts a JSON body ``{"images": [{"image": <base64>, "document_type": ...,
+    "fields": ...}]}`` or multipart/form-data with repeated ``image`` files
+    and an optional repeated ``document_type`` field matching them by
+    position. Returns a tuple of (entries, error) where each entry is
+    (image, image_hash, document_type, fields, error); fields is the
+    item's own ``fields`` value, if any.
+    """
+    if request.mimetype == "multipart/form-data":
+        uploads = request.files.getlist("image")
+        types = request.form.getlist("document_type")
+        default_type = types[0] if len(types) == 1 else "receipt"
+        entries = []
+        for index, upload in enumerate(uploads):
+            doc_type = types[index] if len(types) == len(uploads) else default_type
+            image, image_hash, error = open_image_stream(upload.stream)
+            entries.append((image, image_hash, doc_type, None, error))
+        return entries, None if entries else "No image data provided"
+
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data.get('images'), list) or not data['images']:
+        return [], "No image data provided"
+
+    entries = []
+    for item in data['images']:
+        if not isinstance(item, dict) or 'image' not in item:
+            entries.append((None, None, None, None, "No image data provided"))
+            continue
+        image, image_hash, error = decode_base64_upload(item['image'])
+        entries.append((image, image_hash, item.get('document_type', 'receipt'), item.get('fields'), error))
+    return entries, None
+
 @donut_bp.route('/recognize/receipt', methods=['POST'])
 @cross_origin()
 def recognize_receipt():
     """Receipt recognition endpoint"""
     try:
-        data = request.get_json()
-        
-        if not data or 'image' not in data:
+        image, image_hash, data, error = load_request_image()
+        if error:
             return jsonify({
                 "success": False,
-                "error": "No image data provided"
-            }), 400
-        
-        # Decode image
-        image = decode_base64_image(data['image'])
-        if image is None:
-            return jsonify({
-                "success": False,
-                "error": "Invalid image data"
+                "error": error
             }), 400
         
         # Perform recognition
-        result = mock_donut_recognition(image, "receipt")
+        result, cached, preprocessing, duplicate = recognize_image(
+            image, "receipt", image_hash, wants_skip_duplicates(data), requested_fields(data, "receipt")
+        )
         
         return jsonify({
             "success": True,
-            "extracted_data": result
+            "extracted_data": result,
+            "image_hash": image_hash,
+            "cached": cached,
+            "preprocessing": preprocessing,
+            "duplicate": duplicate,
+            "reconciliation": reconcile_result("receipt", result, image_hash, duplicate)
         })
         
+    except FieldSelectionError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+    except RecognitionQueueFull as e:
+        return queue_full_response(e)
     except Exception as e:
         logger.error(f"Error in receipt recognition: {str(e)}")
         return jsonify({
@@ -130,30 +827,35 @@ def recognize_receipt():
 def recognize_payment():
     """Payment record recognition endpoint"""
     try:
-        data = request.get_json()
-        
-        if not data or 'image' not in data:
-            return jsonify({
-                "success": False,
-                "error": "No image data provided"
-            }), 400
-        
-        # Decode image
-        image = decode_base64_image(data['image'])
-        if image is None:
+        image, image_hash, data, error = load_request_image()
+        if error:
             return jsonify({
                 "success": False,
-                "error": "Invalid image data"
+                "error": error
             }), 400
         
         # Perform recognition
-        result = mock_donut_recognition(image, "payment")
+        result, cached, preprocessing, duplicate = recognize_image(
+            image, "payment", image_hash, wants_skip_duplicates(data), requested_fields(data, "payment")
+        )
         
         return jsonify({
             "success": True,
-            "extracted_data": result
+            "extracted_data": result,
+            "image_hash": image_hash,
+            "cached": cached,
+            "preprocessing": preprocessing,
+            "duplicate": duplicate,
+            "reconciliation": reconcile_result("payment", result, image_hash, duplicate)
         })
         
+    except FieldSelectionError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+    except RecognitionQueueFull as e:
+        return queue_full_response(e)
     except Exception as e:
         logger.error(f"Error in payment recognition: {str(e)}")
         return jsonify({
@@ -166,34 +868,323 @@ def recognize_payment():
 def recognize_document():
     """Generic document recognition endpoint"""
     try:
-        data = request.get_json()
+        image, image_hash, data, error = load_request_image()
+        if error:
+            return jsonify({
+                "success": False,
+                "error": error
+            }), 400
+        
+        document_type = data.get('document_type', 'receipt')
+        
+        # Perform recognition
+        result, cached, preprocessing, duplicate = recognize_image(
+            image, document_type, image_hash, wants_skip_duplicates(data), requested_fields(data, document_type)
+        )
+        
+        return jsonify({
+            "success": True,
+            "extracted_data": result,
+            "image_hash": image_hash,
+            "cached": cached,
+            "preprocessing": preprocessing,
+            "duplicate": duplicate,
+            "reconciliation": reconcile_result(document_type, result, image_hash, duplicate)
+        })
+        
+    except FieldSelectionError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+    except RecognitionQueueFull as e:
+        return queue_full_response(e)
+    except Exception as e:
+        logger.error(f"Error in document recognition: {str(e)}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+@donut_bp.route('/recognize/batch', methods=['POST'])
+@cross_origin()
+def recognize_batch_endpoint():
+    """Recognize several images of mixed document types in one request"""
+    try:
+        entries, error = load_batch_request_images()
+        if error:
+            return jsonify({
+                "success": False,
+                "error": error
+            }), 400
+        
+        if len(entries) > MAX_BATCH_REQUEST_IMAGES:
+            return jsonify({
+                "success": False,
+                "error": f"Too many images, at most {MAX_BATCH_REQUEST_IMAGES} per request"
+            }), 400
+        
+        params = request.form if request.mimetype == "multipart/form-data" else request.get_json(silent=True)
+        skip_duplicates = wants_skip_duplicates(params)
+        
+        # Answer cache hits and skipped duplicates directly and submit every
+        # miss before waiting, so the scheduler can batch them together
+        pending = []
+        for index, (image, image_hash, doc_type, item_fields, item_error) in enumerate(entries):
+            if item_error:
+                pending.append(None)
+                continue
+            try:
+                fields = select_fields(doc_type, item_fields) if item_fields else requested_fields(params, doc_type)
+            except FieldSelectionError as e:
+                entries[index] = (image, image_hash, doc_type, item_fields, str(e))
+                pending.append(None)
+                continue
+            result = cached_result(image_hash, doc_type, fields)
+            if result is not None:
+                duplicate = duplicate_report(find_duplicate(image_hash), new_upload=False)
+                pending.append((result, True, None, None, None, fields, duplicate))
+                continue
+            image, preprocessing, fingerprint, result = preprocess_with_fingerprint(image, doc_type)
+            duplicate = skippable_duplicate(image_hash, fingerprint, doc_type) if skip_duplicates and result is None else None
+            if duplicate:
+                report = duplicate_report(duplicate, skipped=True)
+                result = select_result(doc_type, duplicate["result"], fields)
+                pending.append((result, False, preprocessing, None, None, fields, report))
+            elif result is not None:
+                duplicate = store_result(image_hash, fingerprint, doc_type, result)
+                pending.append((select_result(doc_type, result, fields), False, preprocessing, None, None, fields,
+                                duplicate))
+            else:
+                future = batcher.submit(image, doc_type, fields)
+                pending.append((None, False, preprocessing, fingerprint, future, fields, None))
+        
+        results = []
+        for (image, image_hash, doc_type, item_fields, item_error), item in zip(entries, pending):
+            if item_error:
+                results.append({"success": False, "error": item_error})
+                continue
+            result, cached, preprocessing, fingerprint, future, fields, duplicate = item
+            if future is not None:
+                with stage("recognize"):
+                    result = served_by("model", doc_type, future.result())
+                duplicate = store_result(image_hash, fingerprint, doc_type, result, fields)
+            results.append({
+                "success": True,
+                "document_type": doc_type,
+                "extracted_data": result,
+                "image_hash": image_hash,
+                "cached": cached,
+                "preprocessing": preprocessing,
+                "duplicate": duplicate,
+                "reconciliation": reconcile_result(doc_type, result, image_hash, duplicate)
+            })
+        
+        return jsonify({
+            "success": True,
+            "results": results
+        })
         
-        if not data or 'image' not in data:
+    except RecognitionQueueFull as e:
+        return queue_full_response(e)
+    except Exception as e:
+        logger.error(f"Error in batch recognition: {str(e)}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+@donut_bp.route('/recognize/jobs', methods=['POST'])
+@cross_origin()
+def submit_recognition_job():
+    """Queue a recognition job and return its id without waiting for the result"""
+    try:
+        if not job_runner.started:
             return jsonify({
                 "success": False,
-                "error": "No image data provided"
+                "error": "Recognition jobs are not available"
+            }), 503
+        
+        image, image_hash, data, error = load_request_image()
+        if error:
+            return jsonify({
+                "success": False,
+                "error": error
             }), 400
         
         document_type = data.get('document_type', 'receipt')
+        callback_url = data.get('callback_url')
+        if callback_url and urlparse(callback_url).scheme not in ('http', 'https'):
+            return jsonify({
+                "success": False,
+                "error": "callback_url must be an http or https URL"
+            }), 400
+        
+        # Checked now so a bad selection is a 400 here, not a failed job later
+        fields = requested_fields(data, document_type)
+        options = {"fields": list(fields) if fields else None, "skip_duplicates": wants_skip_duplicates(data)}
+        job_id = job_runner.submit(read_image_bytes(image), document_type, image_hash, callback_url, options)
         
-        # Decode image
-        image = decode_base64_image(data['image'])
-        if image is None:
+        return jsonify({
+            "success": True,
+            "job_id": job_id,
+            "status": "queued",
+            "image_hash": image_hash,
+            "status_url": url_for('donut.get_recognition_job', job_id=job_id)
+        }), 202
+        
+    except FieldSelectionError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error submitting recognition job: {str(e)}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+@donut_bp.route('/recognize/jobs/<job_id>', methods=['GET'])
+@cross_origin()
+def get_recognition_job(job_id):
+    """Poll the status and result of a recognition job"""
+    try:
+        job = job_runner.store.get(job_id) if job_runner.started else None
+        if job is None:
             return jsonify({
                 "success": False,
-                "error": "Invalid image data"
+                "error": "Job not found"
+            }), 404
+        
+        return jsonify({
+            "success": True,
+            "data": job
+        })
+        
+    except Exception as e:
+        logger.error(f"Error getting recognition job: {str(e)}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+def reconciliation_unavailable():
+    return jsonify({
+        "success": False,
+        "error": "Reconciliation index is loading"
+    }), 503
+
+@donut_bp.route('/reconcile/receipts', methods=['POST'])
+@cross_origin()
+def index_reconciliation_receipts():
+    """
+    Index receipt extractions for matching, e.g. receipts recognized before
+    reconciliation was enabled. Body: ``{"receipts": [{"receipt_id": ...,
+    "extracted_amount": ..., "extracted_date": ..., "merchant": ...}]}``.
+    """
+    try:
+        if not reconciliation.ready.is_set():
+            return reconciliation_unavailable()
+        
+        data = request.get_json(silent=True)
+        if not data or not isinstance(data.get('receipts'), list):
+            return jsonify({
+                "success": False,
+                "error": "receipts must be a list"
             }), 400
         
-        # Perform recognition
-        result = mock_donut_recognition(image, document_type)
+        indexed, skipped = [], []
+        for receipt in data['receipts']:
+            receipt_id = receipt.get('receipt_id') if isinstance(receipt, dict) else None
+            if receipt_id and reconciliation.add_receipt(str(receipt_id), receipt):
+                indexed.append(receipt_id)
+            else:
+                skipped.append(receipt_id)
         
         return jsonify({
             "success": True,
-            "extracted_data": result
+            "indexed": indexed,
+            "skipped": skipped
         })
         
     except Exception as e:
-        logger.error(f"Error in document recognition: {str(e)}")
+        logger.error(f"Error indexing reconciliation receipts: {str(e)}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+@donut_bp.route('/reconcile/match', methods=['POST'])
+@cross_origin()
+def match_payment():
+    """
+    Ranked receipt candidates for a payment extraction. Body: the payment's
+    ``extracted_amount``, ``extracted_date`` and ``receiver``, either at the
+    top level or under ``payment`` (as /recognize/payment returns them).
+    """
+    try:
+        if not reconciliation.ready.is_set():
+            return reconciliation_unavailable()
+        
+        data = request.get_json(silent=True) or {}
+        payment = data.get('payment', data)
+        if not isinstance(payment, dict):
+            return jsonify({
+                "success": False,
+                "error": "payment must be an object"
+            }), 400
+        
+        with stage("reconcile"):
+            candidates = reconciliation.match(payment)
+        
+        return jsonify({
+            "success": True,
+            "candidates": candidates
+        })
+        
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error matching payment: {str(e)}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+@donut_bp.route('/reconcile/link', methods=['POST'])
+@cross_origin()
+def link_payment():
+    """Record that a payment settles a receipt; the receipt stops being a candidate"""
+    try:
+        if not reconciliation.ready.is_set():
+            return reconciliation_unavailable()
+        
+        data = request.get_json(silent=True) or {}
+        receipt_id, payment_id = data.get('receipt_id'), data.get('payment_id')
+        if not receipt_id or not payment_id:
+            return jsonify({
+                "success": False,
+                "error": "receipt_id and payment_id are required"
+            }), 400
+        
+        if not reconciliation.link(str(receipt_id), str(payment_id)):
+            return jsonify({
+                "success": False,
+                "error": "Receipt not found or already linked"
+            }), 409
+        
+        return jsonify({
+            "success": True,
+            "receipt_id": receipt_id,
+            "payment_id": payment_id
+        })
+        
+    except Exception as e:
+        logger.error(f"Error linking payment: {str(e)}")
         return jsonify({
             "success": False,
             "error": str(e)
@@ -202,21 +1193,96 @@ def recognize_document():
 @donut_bp.route('/health', methods=['GET'])
 @cross_origin()
 def health_check():
-    """Health check endpoint"""
+    """Liveness check; answers while the model is still warming up (see /ready)"""
     return jsonify({
-        "status": "healthy",
+        # Degraded when every recognition worker failed to load the model and was given up
+        "status": "degraded" if worker_pool is not None and worker_pool.failed else "healthy",
         "service": "donut-recognition",
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "model_ready": model_ready.is_set(),
+        "queue": {
+            "queued": batcher.stats()["queued"],
+            "max_queue_size": MAX_QUEUE_SIZE
+        },
+        "recognition_workers": worker_pool.stats() if worker_pool else {"num_workers": 0, "workers": []},
+        "reconciliation": reconciliation.stats(),
+        # In-memory counters only, so the probe never waits on the store; /duplicates/stats syncs first
+        "duplicate_detection": duplicates.stats() if DUPLICATE_DETECTION else None
     })
 
+@donut_bp.route('/ready', methods=['GET'])
+@cross_origin()
+def readiness_check():
+    """Readiness check: 200 once the model is warmed up and recognition workers are running"""
+    checks = {
+        "model": model_ready.is_set(),
+        "recognition_workers": (
+            any(worker["alive"] and worker["ready"] for worker in worker_pool.stats()["workers"])
+            if worker_pool else RECOGNITION_WORKERS < 1
+        ),
+        "reconciliation_index": reconciliation.ready.is_set(),
+        "duplicate_index": duplicates.ready.is_set() or not DUPLICATE_DETECTION
+    }
+    if all(checks.values()):
+        return jsonify({
+            "status": "ready",
+            "checks": checks
+        })
+    error = model_warmup_error or (worker_pool.error if worker_pool is not None else None)
+    return jsonify({
+        "status": "starting" if error is None else "unavailable",
+        "checks": checks,
+        "error": error or ("Recognition model is loading" if not checks["model"] else "Service is starting")
+    }), 503
+
+@donut_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Request and stage latency metrics in Prometheus text format"""
+    return metrics_response()
+
 @donut_bp.route('/config', methods=['GET'])
 @cross_origin()
 def get_config():
     """Get service configuration"""
     return jsonify({
-        "supported_formats": ["jpg", "jpeg", "png", "gif", "bmp"],
-        "max_image_size": "10MB",
+        "supported_formats": image_preprocessing.supported_extensions(),
+        "max_image_size": f"{image_preprocessing.MAX_IMAGE_BYTES // (1024 * 1024)}MB",
+        "max_image_bytes": image_preprocessing.MAX_IMAGE_BYTES,
+        "max_image_pixels": image_preprocessing.MAX_IMAGE_PIXELS,
+        "model_input_size": list(image_preprocessing.TARGET_SIZE),
+        "model_input_mode": image_preprocessing.TARGET_MODE,
+        "upload_content_types": ["application/json", "multipart/form-data", "image/*"],
         "supported_document_types": ["receipt", "payment"],
-        "model_version": "mock-1.0.0"
+        "model_version": MODEL_VERSION,
+        "model_runtime": model_runtime.stats() if model_runtime else None,
+        "max_batch_request_images": MAX_BATCH_REQUEST_IMAGES,
+        "selectable_fields": {doc_type: list(schema) for doc_type, schema in DOCUMENT_SCHEMAS.items()},
+        "batching": batcher.stats(),
+        "cache": cache.stats(),
+        "templates": templates.stats()
+    })
+
+@donut_bp.route('/cache/stats', methods=['GET'])
+@cross_origin()
+def get_cache_stats():
+    """Recognition result cache counters"""
+    return jsonify({
+        "success": True,
+        "data": cache.stats()
+    })
+
+@donut_bp.route('/duplicates/stats', methods=['GET'])
+@cross_origin()
+def get_duplicate_stats():
+    """Duplicate detection counters, after indexing fingerprints recorded by other processes"""
+    if not DUPLICATE_DETECTION:
+        return jsonify({
+            "success": False,
+            "error": "Duplicate detection is disabled"
+        }), 404
+    duplicates.sync()
+    return jsonify({
+        "success": True,
+        "data": duplicates.stats()
     })
 
@@ -0,0 +1,334 @@
+import json
+import re
+import time
+from datetime import datetime
+
+# Donut writes a result as tag tokens around value tokens, e.g.
+# <s_total>128.50</s_total><s_items><s_nm>Tea</s_nm><sep/><s_nm>...</s_nm></s_items></s>
+END_TOKEN = "</s>"
+SEPARATOR = "<sep/>"
+
+# Value tokens each field kind can generate; other fields take any text
+ANY_TEXT = re.compile(r"(?s).+")
+KIND_PATTERNS = {
+    "amount": re.compile(r"[\s\d.,$¥€£+-]+"),
+    "datetime": re.compile(r"[\s\d:.+/TZ-]+"),
+}
+AMOUNT_PATTERN = re.compile(r"\d+(?:\.\d+)?")
+
+# Result fields of each document type, in the order the model writes them,
+# with the Donut key each is decoded from and its kind
+DOCUMENT_SCHEMAS = {
+    "receipt": {
+        "extracted_amount": {"key": "total", "kind": "amount"},
+        "extracted_date": {"key": "date", "kind": "datetime"},
+        "merchant": {"key": "merchant"},
+        "extracted_description": {"key": "description"},
+        "extracted_items": {"key": "items", "kind": "list", "item_keys": ["nm", "price"]},
+    },
+    "payment": {
+        "extracted_amount": {"key": "amount", "kind": "amount"},
+        "extracted_date": {"key": "date", "kind": "datetime"},
+        "payment_method": {"key": "method"},
+        "payer": {"key": "payer"},
+        "receiver": {"key": "receiver"},
+        "transaction_id": {"key": "transaction_id"},
+    },
+}
+# List items are returned as their values joined by this
+ITEM_SEPARATOR = " - "
+
+
+class FieldSelectionError(ValueError):
+    """Requested fields the document type's schema does not have"""
+
+
+def open_tag(key):
+    return f"<s_{key}>"
+
+
+def close_tag(key):
+    return f"</s_{key}>"
+
+
+def is_tag(token):
+    return token in (END_TOKEN, SEPARATOR) or token.startswith("<s_") or token.startswith("</s_")
+
+
+def select_fields(document_type, fields):
+    """
+    Requested fields as a tuple in schema order, or None for the whole
+    result. ``fields`` is a list or a comma separated string.
+    """
+    if isinstance(fields, str):
+        fields = [name.strip() for name in fields.split(",") if name.strip()]
+    if not fields:
+        return None
+    schema = DOCUMENT_SCHEMAS.get(document_type)
+    if schema is None:
+        raise FieldSelectionError(f"Document type {document_type} does not support selecting fields")
+    unknown = [name for name in fields if name not in schema]
+    if unknown:
+        raise FieldSelectionError(f"Unknown {document_type} fields: {', '.join(map(str, unknown))}; "
+                                  f"expected some of {', '.join(schema)}")
+    return tuple(name for name in schema if name in fields)
+
+
+def select_result(document_type, result, fields):
+    """
+    A result cut down to the requested ``fields``. Its other keys
+    (confidence...) are kept, raw_data loses what it holds of the other
+    fields, and a decoding report of another selection is dropped.
+    """
+    if not fields or document_type not in DOCUMENT_SCHEMAS:
+        return result
+    schema = DOCUMENT_SCHEMAS[document_type]
+    selected = {key: value for key, value in result.items() if key in fields or key not in schema}
+    if selected.get("raw_data"):
+        selected["raw_data"] = select_raw_data(document_type, selected["raw_data"], fields)
+    decoding = selected.get("decoding")
+    if decoding and tuple(decoding.get("fields") or ()) != tuple(fields):
+        del selected["decoding"]
+    return selected
+
+
+def select_raw_data(document_type, raw_data, fields):
+    """
+    raw_data JSON without the Donut keys of fields that were not requested,
+    nor their texts in a template read's ``fields``; other JSON is kept
+    """
+    try:
+        raw = json.loads(raw_data)
+    except (TypeError, ValueError):
+        return raw_data
+    if not isinstance(raw, dict):
+        return raw_data
+    dropped = {field["key"] for name, field in DOCUMENT_SCHEMAS[document_type].items() if name not in fields}
+    raw = {key: value for key, value in raw.items() if key not in dropped}
+    if isinstance(raw.get("fields"), dict):
+        raw["fields"] = {name: text for name, text in raw["fields"].items() if name in fields}
+    return json.dumps(raw)
+
+
+def parse_value(kind, text):
+    """Value of a decoded field, or None when its text is not a valid value of its kind"""
+    text = text.strip()
+    if kind == "amount":
+        match = AMOUNT_PATTERN.search(text.replace(",", ""))
+        return float(match.group()) if match else None
+    if kind == "datetime":
+        try:
+            datetime.fromisoformat(text.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    return text or None
+
+
+def allows(allowed, token):
+    """Whether ``token`` is one of the ``allowed()`` tokens of a decoding state"""
+    tags, text = allowed
+    if is_tag(token):
+        return token in tags
+    return text is not None and text.fullmatch(token) is not None
+
+
+def result_tokens(document_type, result):
+    """
+    Donut tokens of a result, the inverse of decoding it: tags plus value
+    text split before each space, as a sentencepiece tokenizer would.
+    """
+    tokens = []
+    for name, field in DOCUMENT_SCHEMAS[document_type].items():
+        value = result.get(name)
+        if value is None:
+            continue
+        tokens.append(open_tag(field["key"]))
+        if field.get("kind") == "list":
+            for index, item in enumerate(value):
+                if index:
+                    tokens.append(SEPARATOR)
+                for key, part in zip(field["item_keys"], str(item).split(ITEM_SEPARATOR)):
+                    tokens.extend([open_tag(key)] + re.findall(r"\s*\S+", part) + [close_tag(key)])
+        else:
+            tokens.extend(re.findall(r"\s*\S+", str(value)))
+        tokens.append(close_tag(field["key"]))
+    tokens.append(END_TOKEN)
+    return tokens
+
+
+class DecodingState:
+    """
+    One document being decoded: an incremental parser of the Donut tokens
+    generated so far, and the schema grammar the next token must follow.
+
+    The grammar only opens the requested ``fields`` (the whole schema when
+    None), limits amounts and dates to the characters they are written
+    with, and lets list fields open each item key once per item. A field
+    whose value does not parse can be opened again. Decoding stops
+    (``stopped``) on the end token, after ``max_tokens``, or, with
+    ``early_exit`` and some ``fields`` requested, as soon as every one of
+    them holds a valid value, so a caller after the total and date does
+    not wait for the item list. A full decode runs to the end token.
+    """
+
+    def __init__(self, document_type, fields=None, max_tokens=512, early_exit=True):
+        self.document_type = document_type
+        self.schema = DOCUMENT_SCHEMAS[document_type]
+        self.requested = fields
+        self.fields = fields or tuple(self.schema)
+        self.max_tokens = max_tokens
+        self.early_exit = early_exit
+        self.names = {field["key"]: name for name, field in self.schema.items()}
+        self.values = {}
+        self.tokens = 0
+        self.stopped = None
+        self._stack = []
+        self._text = []
+        self._items = []
+        self._item = {}
+        self._started = time.perf_counter()
+        self._elapsed = None
+
+    @property
+    def finished(self):
+        return self.stopped is not None
+
+    def allowed(self):
+        """
+        (tags, text) the next token must be: one of the tags, or value text
+        the ``text`` pattern fully matches (no text when it is None)
+        """
+        if not self._stack:
+            keys = [self.schema[name]["key"] for name in self.fields if name not in self.values]
+            return frozenset([open_tag(key) for key in keys] + [END_TOKEN]), None
+        key = self._stack[-1]
+        if len(self._stack) > 1 or key not in self.names:
+            return frozenset([close_tag(key)]), ANY_TEXT
+        field = self.schema[self.names[key]]
+        if field.get("kind") != "list":
+            return frozenset([close_tag(key)]), KIND_PATTERNS.get(field.get("kind"), ANY_TEXT)
+        tags = [open_tag(item_key) for item_key in field["item_keys"] if item_key not in self._item]
+        if self._item:
+            tags.append(SEPARATOR)
+        return frozenset(tags + [close_tag(key)]), None
+
+    def feed(self, token):
+        """Parse the next generated token; tags out of place are ignored"""
+        if self.finished:
+            return
+        self.tokens += 1
+        if token == END_TOKEN:
+            self._stop("end")
+            return
+        if token == SEPARATOR:
+            if len(self._stack) == 1 and self._item:
+                self._items.append(self._item)
+                self._item = {}
+        elif token.startswith("</s_"):
+            self._close(token[4:-1])
+        elif token.startswith("<s_"):
+            self._open(token[3:-1])
+        elif self._stack:
+            self._text.append(token)
+
+        if (self.early_exit and self.requested and not self._stack
+                and all(name in self.values for name in self.fields)):
+            self._stop("early_exit")
+        elif self.tokens >= self.max_tokens:
+            self._stop("max_tokens")
+
+    def _open(self, key):
+        # Fields that were not asked for, generated without the grammar, are read past
+        if not self._stack:
+            self._items, self._item = [], {}
+        if len(self._stack) < 2:
+            self._stack.append(key)
+        self._text = []
+
+    def _close(self, key):
+        if not self._stack or self._stack[-1] != key:
+            return
+        self._stack.pop()
+        text, self._text = "".join(self._text), []
+        if self._stack:
+            self._item[key] = text.strip()
+            return
+        name = self.names.get(key)
+        if name not in self.fields:
+            return
+        field = self.schema[name]
+        if field.get("kind") == "list":
+            items = self._items + ([self._item] if self._item else [])
+            value = [ITEM_SEPARATOR.join(item[item_key] for item_key in field["item_keys"] if item.get(item_key))
+                     for item in items] or None
+        else:
+            value = parse_value(field.get("kind"), text)
+        if value is not None:
+            self.values[name] = value
+
+    def _stop(self, reason):
+        self.stopped = reason
+        self._elapsed = time.perf_counter() - self._started
+
+    def result(self):
+        """Decoded value of each requested field, None for fields the model did not produce"""
+        return {name: self.values.get(name) for name in self.fields}
+
+    def stats(self):
+        elapsed = self._elapsed if self._elapsed is not None else time.perf_counter() - self._started
+        return {
+            "fields": list(self.requested) if self.requested else None,
+            "tokens": self.tokens,
+            "stopped": self.stopped,
+            "elapsed_ms": round(elapsed * 1000, 3),
+        }
+
+
+def decode_batch(step, states):
+    """
+    Greedy constrained decoding of a batch of documents. ``step`` is given
+    the unfinished states and returns the next token of each, chosen among
+    its ``allowed()`` tokens; finished documents drop out of the batch.
+    """
+    active = [state for state in states if not state.finished]
+    while active:
+        for state, token in zip(active, step(active)):
+            state.feed(token)
+        active = [state for state in active if not state.finished]
+    return states
+
+
+class ScriptedDecoder:
+    """
+    Stands in for the model: replays a fixed token sequence per document.
+    With ``constrain`` it takes the next token of it the grammar allows, as
+    a model whose best token is masked out moves on to its next best;
+    without, it replays every token in order. Documents without a token
+    left end.
+    """
+
+    def __init__(self, scripts, constrain=True):
+        self.scripts = scripts
+        self.constrain = constrain
+        self._positions = [0] * len(scripts)
+
+    def states(self, document_types, fields=None, **options):
+        return [DecodingState(document_type, fields[index] if fields else None, **options)
+                for index, document_type in enumerate(document_types)]
+
+    def step(self, states, indexes):
+        tokens = []
+        for state, index in zip(states, indexes):
+            script, allowed = self.scripts[index], state.allowed()
+            position = self._positions[index]
+            while self.constrain and position < len(script) and not allows(allowed, script[position]):
+                position += 1
+            self._positions[index] = position + 1
+            tokens.append(script[position] if position < len(script) else END_TOKEN)
+        return tokens
+
+    def decode(self, document_types, fields=None, **options):
+        """Decode every script, returning the finished states"""
+        states = self.states(document_types, fields, **options)
+        index_of = {id(state): index for index, state in enumerate(states)}
+        return decode_batch(lambda active: self.step(active, [index_of[id(state)] for state in active]), states)
@@ -0,0 +1,242 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from array import array
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+def dhash(image, hash_size=16):
+    """
+    Difference hash of an image as an int of ``hash_size ** 2`` bits.
+
+    The image is reduced to a ``hash_size + 1`` by ``hash_size`` grayscale
+    grid by area averaging and each bit records whether a cell is brighter
+    than its right neighbour. Re-encoding, rescaling and mild brightness
+    changes leave most bits alone, so copies of one picture hash a few bits
+    apart. Documents sharing a layout (payment screenshots of one app) can
+    hash nearly as close, which is why matches are confirmed against the
+    extracted fields where possible.
+    """
+    width = hash_size + 1
+    grid = image.convert("L").resize((width, hash_size), Image.Resampling.BOX)
+    pixels = list(grid.tobytes())
+    value = 0
+    for row in range(hash_size):
+        offset = row * width
+        for column in range(hash_size):
+            value = (value << 1) | (pixels[offset + column] > pixels[offset + column + 1])
+    return value
+
+
+# Fields that differ between two documents of the same layout
+IDENTIFYING_FIELDS = ("extracted_amount", "extracted_date")
+
+
+def fields_agree(result, stored_result):
+    """False when both results have an identifying field and its values differ"""
+    earlier = (json.loads(stored_result) if stored_result else None) or {}
+    for field in IDENTIFYING_FIELDS:
+        if result.get(field) is not None and earlier.get(field) is not None and result[field] != earlier[field]:
+            return False
+    return True
+
+
+class HammingIndex:
+    """
+    Multi-index hashing for fingerprints within ``max_distance`` bits.
+
+    Each fingerprint is cut into ``max_distance + 1`` chunks and filed
+    under every chunk value. Two fingerprints at most ``max_distance`` bits
+    apart cannot differ in all chunks (pigeonhole), so exact lookups of the
+    query's chunks find every near match; only those candidates are
+    compared in full.
+    """
+
+    def __init__(self, bits, max_distance):
+        self.bits = bits
+        self.max_distance = max_distance
+        chunks = max_distance + 1
+        widths = [bits // chunks + (index < bits % chunks) for index in range(chunks)]
+        self._chunks = []
+        shift = bits
+        for width in widths:
+            shift -= width
+            self._chunks.append((shift, (1 << width) - 1))
+        self._tables = [{} for _ in self._chunks]
+        self._fingerprints = []
+        self._ids = array("q")
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, item_id, fingerprint):
+        position = len(self._ids)
+        self._fingerprints.append(fingerprint)
+        self._ids.append(item_id)
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            key = (fingerprint >> shift) & mask
+            positions = table.get(key)
+            if positions is None:
+                table[key] = positions = array("I")
+            positions.append(position)
+
+    def search(self, fingerprint):
+        """(item id, distance) of indexed fingerprints within ``max_distance``, nearest first"""
+        seen = set()
+        found = []
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            for position in table.get((fingerprint >> shift) & mask, ()):
+                if position in seen:
+                    continue
+                seen.add(position)
+                distance = (self._fingerprints[position] ^ fingerprint).bit_count()
+                if distance <= self.max_distance:
+                    found.append((self._ids[position], distance))
+        found.sort(key=lambda match: (match[1], match[0]))
+        return found
+
+
+class DuplicateDetector:
+    """
+    Finds earlier uploads of the same document by perceptual hash.
+
+    Every recognized image is recorded in a SQLite table with its dHash,
+    document type and recognition result; the hashes are also kept in a
+    HammingIndex. An upload whose hash is within ``max_distance`` bits of
+    an earlier one (or whose SHA-256 matches one exactly) is reported as a
+    likely duplicate of it. Rows are only ever inserted (a row's result
+    may be filled in later, but not its fingerprint), so each server
+    process picks up the others' uploads by reading rows past the last id
+    it has seen.
+    """
+
+    TABLE = "image_fingerprints"
+
+    def __init__(self, hash_size=16, max_distance=None):
+        self.hash_size = hash_size
+        self.bits = hash_size * hash_size
+        # One bit in 16 by default; a wider radius means shorter index chunks
+        # and more candidates to compare per lookup
+        self.max_distance = max_distance if max_distance is not None else self.bits // 16
+        self.index = HammingIndex(self.bits, self.max_distance)
+        self._conn = None
+        self._lock = threading.Lock()
+        self._synced_id = 0
+        self.ready = threading.Event()
+        self.duplicates_found = 0
+
+    def start(self, db_path=":memory:"):
+        """Open the fingerprint table and index the fingerprints already in it"""
+        conn = sqlite3.connect(db_path, timeout=5, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.TABLE} ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, image_hash TEXT NOT NULL UNIQUE, fingerprint TEXT NOT NULL, "
+            "document_type TEXT, result TEXT, created_at REAL NOT NULL)"
+        )
+        with self._lock:
+            self._conn = conn
+        started = time.perf_counter()
+        self.sync()
+        self.ready.set()
+        logger.info(f"Indexed {len(self.index)} image fingerprints in {time.perf_counter() - started:.1f}s")
+
+    def fingerprint(self, image):
+        return dhash(image, self.hash_size)
+
+    def sync(self):
+        """Index fingerprints recorded since the last sync, including by other processes"""
+        with self._lock:
+            if self._conn is None:
+                return
+            while True:
+                rows = self._conn.execute(
+                    f"SELECT id, fingerprint FROM {self.TABLE} WHERE id > ? ORDER BY id LIMIT 50000",
+                    (self._synced_id,)
+                ).fetchall()
+                if not rows:
+                    return
+                for row in rows:
+                    # Fingerprints from another hash size are not comparable
+                    if len(row["fingerprint"]) * 4 == self.bits:
+                        self.index.add(row["id"], int(row["fingerprint"], 16))
+                self._synced_id = rows[-1]["id"]
+
+    def record(self, image_hash, fingerprint, document_type, result):
+        """
+        Remember a recognized upload. The first upload of an image is the one
+        kept, but a full ``result`` replaces a stored one that is missing
+        (None, as recorded for uploads read for some fields only) or partial.
+        """
+        with self._lock:
+            if self._conn is None:
+                return
+            self._conn.execute(
+                f"INSERT INTO {self.TABLE} (image_hash, fingerprint, document_type, result, created_at) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT (image_hash) DO UPDATE SET "
+                "document_type = excluded.document_type, result = excluded.result "
+                "WHERE excluded.result != 'null' AND (result IS NULL OR result = 'null' "
+                "OR json_extract(result, '$.decoding.fields') IS NOT NULL)",
+                (image_hash, f"{fingerprint:0{self.bits // 4}x}", document_type, json.dumps(result), time.time()),
+            )
+
+    def _get(self, column, value):
+        with self._lock:
+            if self._conn is None:
+                return None
+            return self._conn.execute(f"SELECT * FROM {self.TABLE} WHERE {column} = ?", (value,)).fetchone()
+
+    def find(self, image_hash, fingerprint=None, document_type=None, result=None, max_distance=None):
+        """
+        The earlier upload this one most likely duplicates, or None: the same
+        bytes uploaded before, else the nearest fingerprint within
+        ``max_distance`` (default: the index radius), preferring the same
+        document type. Given this upload's recognition ``result``, a near
+        match only counts when the fields both extracted agree, which keeps
+        different documents of one template (payment screenshots) apart.
+        """
+        row = self._get("image_hash", image_hash)
+        distance = 0
+        if row is None and fingerprint is not None:
+            limit = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+            self.sync()
+            matches = [(item_id, match_distance) for item_id, match_distance in self.index.search(fingerprint)
+                       if match_distance <= limit]
+            candidates = [(self._get("id", item_id), match_distance) for item_id, match_distance in matches[:16]]
+            candidates.sort(key=lambda match: (match[0] is None or match[0]["document_type"] != document_type,
+                                               match[1]))
+            for candidate, match_distance in candidates:
+                if candidate is not None and (result is None or fields_agree(result, candidate["result"])):
+                    row, distance = candidate, match_distance
+                    break
+        if row is None:
+            return None
+        return {
+            "image_hash": row["image_hash"],
+            "exact": row["image_hash"] == image_hash,
+            "distance": distance,
+            "similarity": round(1 - distance / self.bits, 4),
+            "document_type": row["document_type"],
+            "first_seen": row["created_at"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+        }
+
+    def count_duplicate(self):
+        """Count an upload reported as a duplicate of an earlier one"""
+        with self._lock:
+            self.duplicates_found += 1
+
+    def stats(self):
+        """Counters of this process's index, without reading the store; call sync() first to catch up"""
+        return {
+            "fingerprints": len(self.index),
+            "hash_bits": self.bits,
+            "max_distance": self.max_distance,
+            "ready": self.ready.is_set(),
+            "duplicates_found": self.duplicates_found,
+        }
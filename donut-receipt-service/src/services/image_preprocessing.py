@@ -0,0 +1,161 @@
+import logging
+import os
+import time
+
+from PIL import Image, ImageChops, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Limits advertised on /api/config
+MAX_IMAGE_BYTES = int(os.getenv('DONUT_MAX_IMAGE_BYTES', str(10 * 1024 * 1024)))
+MAX_IMAGE_PIXELS = int(os.getenv('DONUT_MAX_IMAGE_PIXELS', str(50_000_000)))
+SUPPORTED_FORMATS = {"JPEG": ["jpg", "jpeg"], "PNG": ["png"], "GIF": ["gif"], "BMP": ["bmp"]}
+
+# Model input geometry
+TARGET_SIZE = (
+    int(os.getenv('DONUT_INPUT_WIDTH', '960')),
+    int(os.getenv('DONUT_INPUT_HEIGHT', '1280')),
+)
+TARGET_MODE = os.getenv('DONUT_INPUT_MODE', 'L')
+
+# Document crop: pixels differing from the border colour by more than this
+# threshold count as document content
+CROP_THRESHOLD = 24
+CROP_MARGIN = 0.02
+# Modes the crop probe is downscaled in before its greyscale conversion
+REDUCE_FIRST_MODES = ("RGB", "L", "CMYK", "I", "F")
+
+# EXIF orientations that swap width and height
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+EXIF_ORIENTATION_TAG = 0x0112
+
+
+def supported_extensions():
+    return [ext for extensions in SUPPORTED_FORMATS.values() for ext in extensions]
+
+
+def check_byte_size(size):
+    """Return an error message if an encoded image of this many bytes is too large"""
+    if size is not None and size > MAX_IMAGE_BYTES:
+        return f"Image exceeds maximum size of {MAX_IMAGE_BYTES // (1024 * 1024)}MB"
+    return None
+
+
+def validate_image(image):
+    """Check format and pixel count from the image header, before any pixels are decoded"""
+    if image.format not in SUPPORTED_FORMATS:
+        return f"Unsupported image format: {image.format or 'unknown'}"
+    width, height = image.size
+    if width * height > MAX_IMAGE_PIXELS:
+        return f"Image dimensions {width}x{height} exceed the maximum of {MAX_IMAGE_PIXELS} pixels"
+    return None
+
+
+def _draft_size(image, target_size):
+    """Target size in stored (pre-EXIF-rotation) orientation"""
+    try:
+        orientation = image.getexif().get(EXIF_ORIENTATION_TAG)
+    except Exception:
+        orientation = None
+    if orientation in TRANSPOSED_ORIENTATIONS:
+        return target_size[1], target_size[0]
+    return target_size
+
+
+def _document_bounds(image):
+    """Bounding box of the content that differs from the border colour, or None"""
+    # Reduced before converting where reduce is fast (not with alpha, palettes or 16-bit
+    # levels), so only an image near the probe size is converted instead of the full one
+    factor = max(1, max(image.size) // 256)
+    probe = image.reduce(factor) if factor > 1 and image.mode in REDUCE_FIRST_MODES else image
+    probe = probe.convert("L")
+    probe.thumbnail((256, 256))
+    background = Image.new("L", probe.size, probe.getpixel((0, 0)))
+    mask = ImageChops.difference(probe, background).point(lambda v: 255 if v > CROP_THRESHOLD else 0)
+    bbox = mask.getbbox()
+    if bbox is None:
+        return None
+
+    scale_x = image.width / probe.width
+    scale_y = image.height / probe.height
+    margin_x = int(image.width * CROP_MARGIN)
+    margin_y = int(image.height * CROP_MARGIN)
+    left = max(0, int(bbox[0] * scale_x) - margin_x)
+    top = max(0, int(bbox[1] * scale_y) - margin_y)
+    right = min(image.width, int(bbox[2] * scale_x) + margin_x)
+    bottom = min(image.height, int(bbox[3] * scale_y) + margin_y)
+
+    # Not worth a crop when the document already fills the frame
+    if (right - left) * (bottom - top) > 0.9 * image.width * image.height:
+        return None
+    return left, top, right, bottom
+
+
+def _timed(timings, stage, func):
+    start = time.perf_counter()
+    value = func()
+    timings[stage] = round((time.perf_counter() - start) * 1000, 3)
+    return value
+
+
+def decode_image(image, target_size=TARGET_SIZE, mode=TARGET_MODE, timings=None, on_decoded=None):
+    """
+    Decode an uploaded image, DCT-downscaling JPEGs towards ``target_size``
+    via ``Image.draft``, and apply its EXIF orientation. Stage timings in
+    ms are added to ``timings`` if given; ``on_decoded``, if given, is
+    called with the decoded and oriented image.
+    """
+    timings = timings if timings is not None else {}
+    if image.format == "JPEG":
+        draft_mode = "L" if mode == "L" else "RGB"
+        _timed(timings, "draft", lambda: image.draft(draft_mode, _draft_size(image, target_size)))
+    _timed(timings, "decode", image.load)
+    image = _timed(timings, "exif_transpose", lambda: ImageOps.exif_transpose(image))
+    if on_decoded is not None:
+        _timed(timings, "on_decoded", lambda: on_decoded(image))
+    return image
+
+
+def fit_image(image, original_size, timings, target_size=TARGET_SIZE, mode=TARGET_MODE):
+    """
+    Crop a decoded image to the document bounds and fit it into
+    ``target_size`` in ``mode``. Returns the image and the preprocessing
+    report, with ``timings`` (ms per stage so far) completed.
+    """
+    bounds = _timed(timings, "detect_bounds", lambda: _document_bounds(image))
+    if bounds:
+        image = _timed(timings, "crop", lambda: image.crop(bounds))
+
+    if image.mode != mode:
+        image = _timed(timings, "convert", lambda: image.convert(mode))
+
+    _timed(timings, "resize", lambda: image.thumbnail(target_size, Image.Resampling.LANCZOS, reducing_gap=2.0))
+    return image, preprocessing_report(original_size, image, timings, cropped=bounds is not None)
+
+
+def preprocessing_report(original_size, image, timings, cropped=False):
+    """Report of the sizes and stage ``timings`` (ms) that turned an upload into ``image``"""
+    timings["total"] = round(sum(timings.values()), 3)
+    return {
+        "original_size": list(original_size),
+        "output_size": list(image.size),
+        "cropped": cropped,
+        "timings_ms": timings,
+    }
+
+
+def preprocess_image(image, target_size=TARGET_SIZE, mode=TARGET_MODE, on_decoded=None):
+    """
+    Prepare an uploaded image for the model.
+
+    JPEGs are DCT-downscaled while decoding via ``Image.draft``, then the
+    image is EXIF-oriented, cropped to the document bounds and fitted into
+    ``target_size`` in ``mode``. Returns the processed image and a report
+    with the original and output sizes and per-stage timings in ms.
+    ``on_decoded``, if given, is called with the decoded and oriented image
+    before it is cropped.
+    """
+    timings = {}
+    original_size = image.size
+    image = decode_image(image, target_size, mode, timings, on_decoded)
+    return fit_image(image, original_size, timings, target_size, mode)
@@ -0,0 +1,360 @@
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+
+from PIL import Image
+
+from src.services.donut_decoding import (DOCUMENT_SCHEMAS, END_TOKEN, SEPARATOR, DecodingState, close_tag, is_tag,
+                                          open_tag)
+
+logger = logging.getLogger(__name__)
+
+# Every tensor of the model in one torch.save file, which torch.load can memory-map
+WEIGHTS_FILE = "weights.pt"
+# Donut normalizes pixels to [-1, 1]
+PIXEL_MEAN = 0.5
+PIXEL_STD = 0.5
+SENTENCEPIECE_SPACE = "▁"
+
+# Sizes of randomly initialized models; "base" matches donut-base
+MODEL_PRESETS = {
+    "tiny": {"embed_dim": 32, "depths": [2, 2, 2, 2], "num_heads": [1, 2, 4, 8], "decoder_layers": 2,
+             "decoder_heads": 4, "decoder_ffn_dim": 1024, "vocab_size": 512},
+    "base": {"embed_dim": 128, "depths": [2, 2, 14, 2], "num_heads": [4, 8, 16, 32], "decoder_layers": 4,
+             "decoder_heads": 16, "decoder_ffn_dim": 4096, "vocab_size": 57525},
+}
+
+
+class ModelRuntimeError(RuntimeError):
+    """Raised when a model directory cannot be loaded"""
+
+
+def require_torch():
+    """torch and transformers, imported on first use so the mock model runs without them"""
+    try:
+        import torch
+        import transformers
+    except ImportError as e:
+        raise ModelRuntimeError(f"The Donut model runtime requires torch and transformers "
+                                f"(pip install torch transformers): {str(e)}")
+    return torch, transformers
+
+
+def task_prompt(document_type):
+    """Token the decoder starts from to read a document of this type"""
+    return open_tag(document_type)
+
+
+def donut_tags():
+    """Tokens a Donut checkpoint for this service must have: task prompts, field tags and the separator"""
+    tags = [SEPARATOR]
+    for document_type, schema in DOCUMENT_SCHEMAS.items():
+        tags.append(task_prompt(document_type))
+        for field in schema.values():
+            for key in [field["key"]] + field.get("item_keys", []):
+                tags.extend([open_tag(key), close_tag(key)])
+    return list(dict.fromkeys(tags))
+
+
+def process_memory(pid="self"):
+    """
+    Resident memory of a process from /proc/<pid>/smaps_rollup, in bytes:
+    rss, pss (shared pages divided among the processes mapping them),
+    shared and private. None where it cannot be read (not Linux).
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            lines = f.readlines()
+    except OSError:
+        return None
+    sizes = {}
+    for line in lines:
+        name, _, value = line.partition(":")
+        parts = value.split()
+        if len(parts) == 2 and parts[1] == "kB":
+            sizes[name] = int(parts[0]) * 1024
+    return {
+        "rss": sizes.get("Rss", 0),
+        "pss": sizes.get("Pss", 0),
+        "shared": sizes.get("Shared_Clean", 0) + sizes.get("Shared_Dirty", 0),
+        "private": sizes.get("Private_Clean", 0) + sizes.get("Private_Dirty", 0),
+    }
+
+
+def reorder_cache(past, index):
+    """Keep the rows of a decoder key/value cache at ``index``"""
+    if hasattr(past, "reorder_cache"):
+        past.reorder_cache(index)
+        return past
+    return tuple(tuple(tensor.index_select(0, index) for tensor in layer) for layer in past)
+
+
+def export_model(model, tokenizer, model_dir):
+    """
+    Write a VisionEncoderDecoder Donut model in the layout DonutRuntime
+    loads: its config and tokenizer, and every tensor in WEIGHTS_FILE.
+    A downloaded checkpoint is converted once, e.g.
+
+        export_model(VisionEncoderDecoderModel.from_pretrained(path),
+                     DonutProcessor.from_pretrained(path).tokenizer, model_dir)
+    """
+    torch, _ = require_torch()
+    os.makedirs(model_dir, exist_ok=True)
+    model.config.save_pretrained(model_dir)
+    tokenizer.save_pretrained(model_dir)
+    tensors = dict(model.state_dict())
+    # Non-persistent buffers too: the runtime builds the model without allocating any tensor
+    tensors.update((name, buffer) for name, buffer in model.named_buffers() if name not in tensors)
+    torch.save({name: tensor.contiguous() for name, tensor in tensors.items()}, os.path.join(model_dir, WEIGHTS_FILE))
+    return model_dir
+
+
+def build_random_model(model_dir, preset="tiny", image_size=(960, 1280), num_channels=1, max_tokens=512, seed=0):
+    """
+    Write a randomly initialized Donut (DonutSwin encoder, MBart decoder)
+    of a MODEL_PRESETS size with export_model, for tests and benchmarks
+    that should not download weights. ``image_size`` is (width, height).
+    Its tokenizer holds the Donut tags and printable characters, padded
+    with unused tokens to the preset's vocabulary size; its output is
+    noise, but decodes under the grammar like a trained model's.
+    """
+    torch, transformers = require_torch()
+    from tokenizers import Tokenizer
+    from tokenizers.models import WordLevel
+
+    sizes = MODEL_PRESETS[preset]
+    torch.manual_seed(seed)
+    special = ["<s>", "<pad>", END_TOKEN, "<unk>"]
+    tokens = special + donut_tags() + [chr(code) for code in range(32, 127)] + ["¥", "€", "£"]
+    tokens += [f"<unused{index}>" for index in range(max(0, sizes["vocab_size"] - len(tokens)))]
+    tokenizer = transformers.PreTrainedTokenizerFast(
+        tokenizer_object=Tokenizer(WordLevel({token: index for index, token in enumerate(tokens)}, unk_token="<unk>")),
+        bos_token="<s>", eos_token=END_TOKEN, pad_token="<pad>", unk_token="<unk>",
+        additional_special_tokens=donut_tags(),
+    )
+
+    width, height = image_size
+    encoder = transformers.DonutSwinConfig(
+        image_size=[height, width], patch_size=4, num_channels=num_channels, embed_dim=sizes["embed_dim"],
+        depths=sizes["depths"], num_heads=sizes["num_heads"], window_size=10,
+    )
+    decoder = transformers.MBartConfig(
+        vocab_size=len(tokens), d_model=encoder.hidden_size, decoder_layers=sizes["decoder_layers"],
+        decoder_attention_heads=sizes["decoder_heads"], decoder_ffn_dim=sizes["decoder_ffn_dim"],
+        max_position_embeddings=max_tokens + 8, is_decoder=True, add_cross_attention=True, scale_embedding=True,
+        add_final_layer_norm=True, bos_token_id=0, pad_token_id=1, eos_token_id=2, decoder_start_token_id=0,
+    )
+    config = transformers.VisionEncoderDecoderConfig.from_encoder_decoder_configs(encoder, decoder)
+    config.decoder_start_token_id = 0
+    config.pad_token_id = 1
+    config.eos_token_id = 2
+    model = transformers.VisionEncoderDecoderModel(config=config).eval()
+    return export_model(model, tokenizer, model_dir)
+
+
+class DonutRuntime:
+    """
+    Donut inference on CPU from a directory written by export_model.
+
+    The model is built on the meta device and its tensors are assigned
+    straight from a memory-mapped WEIGHTS_FILE, so loading copies no
+    weights and every process mapping the file shares its page cache:
+    forked recognition workers, gunicorn workers and separate servers.
+    With ``quantize`` the Linear layers become int8 dynamically quantized
+    ones; those live in process memory, so load in the parent before
+    forking for the workers to share them copy-on-write. ``load`` ends
+    with a warm-up decode that pages in the weights and prepares the
+    kernels before the first request.
+
+    Decoding is greedy under donut_decoding's grammar: each step masks
+    the logits to the tokens ``DecodingState.allowed`` permits.
+    """
+
+    def __init__(self, model_dir, quantize=False, threads=None, max_tokens=512):
+        self.model_dir = model_dir
+        self.quantize = quantize
+        self.threads = threads
+        self.max_tokens = max_tokens
+        self.weights_path = os.path.join(model_dir, WEIGHTS_FILE)
+        self.model = None
+        self.parameters = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self._torch = None
+        self._token_ids = {}
+        self._pieces = []
+        self._text_ids = []
+        self._vocab_size = None
+        self._text_masks = {}
+        self._masks = {}
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        """Model version for result cache keys"""
+        return f"donut:{os.path.basename(os.path.normpath(self.model_dir))}{'-int8' if self.quantize else ''}"
+
+    def configure_threads(self):
+        """Apply ``threads`` to torch in this process; forked workers call it again for their own pool"""
+        if self.threads:
+            require_torch()[0].set_num_threads(self.threads)
+
+    def load(self):
+        """Map the weights, quantize them if asked and warm up; does nothing once loaded"""
+        with self._lock:
+            if self.model is not None:
+                return
+            torch, transformers = require_torch()
+            self._torch = torch
+            self.configure_threads()
+            started = time.perf_counter()
+            config = transformers.VisionEncoderDecoderConfig.from_pretrained(self.model_dir)
+            with torch.device("meta"):
+                model = transformers.VisionEncoderDecoderModel(config=config)
+            tensors = torch.load(self.weights_path, map_location="cpu", mmap=True, weights_only=True)
+            _, unexpected = model.load_state_dict(tensors, strict=False, assign=True)
+            for name in unexpected:
+                module_name, _, buffer_name = name.rpartition(".")
+                module = model.get_submodule(module_name)
+                if buffer_name not in module._buffers:
+                    raise ModelRuntimeError(f"Unexpected tensor {name} in {self.weights_path}")
+                module._buffers[buffer_name] = tensors[name]
+            missing = [name for name, tensor in itertools.chain(model.named_parameters(), model.named_buffers())
+                       if tensor.is_meta]
+            if missing:
+                raise ModelRuntimeError(f"{self.weights_path} lacks {len(missing)} tensors, e.g. {missing[0]}")
+            del tensors
+            model.eval()
+            self.parameters = sum(parameter.numel() for parameter in model.parameters())
+            if self.quantize:
+                torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+            self.max_tokens = min(self.max_tokens, config.decoder.max_position_embeddings - 1)
+            self._prepare_vocabulary(transformers.AutoTokenizer.from_pretrained(self.model_dir), config)
+            self.model = model
+            self.load_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            self.warm_up()
+            self.warmup_seconds = time.perf_counter() - started
+            logger.info(f"Loaded Donut model {self.version} in {self.load_seconds:.1f}s, "
+                        f"warmed up in {self.warmup_seconds:.1f}s")
+
+    def _prepare_vocabulary(self, tokenizer, config):
+        tokens = tokenizer.convert_ids_to_tokens(list(range(len(tokenizer))))
+        ids = {token: index for index, token in enumerate(tokens)}
+        missing = [tag for tag in donut_tags() + [END_TOKEN] if tag not in ids]
+        if missing:
+            raise ModelRuntimeError(f"Tokenizer in {self.model_dir} lacks Donut tags {', '.join(missing)}; "
+                                    "the checkpoint must be fine-tuned with them as special tokens")
+        special = set(tokenizer.all_special_tokens)
+        self._token_ids = {tag: ids[tag] for tag in donut_tags() + [END_TOKEN]}
+        self._pieces = [token if token in special or is_tag(token) else token.replace(SENTENCEPIECE_SPACE, " ")
+                        for token in tokens]
+        self._text_ids = [index for index, token in enumerate(tokens) if token not in special and not is_tag(token)]
+        self._vocab_size = config.decoder.vocab_size
+        self._text_masks, self._masks = {}, {}
+
+    def _mask(self, allowed):
+        """Vocabulary mask of the tokens a decoding state allows next"""
+        mask = self._masks.get(allowed)
+        if mask is not None:
+            return mask
+        tags, text = allowed
+        mask = self._torch.zeros(self._vocab_size, dtype=self._torch.bool)
+        if text is not None:
+            text_mask = self._text_masks.get(text)
+            if text_mask is None:
+                text_mask = self._torch.zeros(self._vocab_size, dtype=self._torch.bool)
+                text_mask[[index for index in self._text_ids if text.fullmatch(self._pieces[index])]] = True
+                self._text_masks[text] = text_mask
+            mask |= text_mask
+        mask[[self._token_ids[tag] for tag in tags]] = True
+        self._masks[allowed] = mask
+        return mask
+
+    def pixel_values(self, images):
+        """Images as the encoder's normalized input batch, resized to its input size if they differ"""
+        torch = self._torch
+        size = self.model.config.encoder.image_size
+        height, width = (size, size) if isinstance(size, int) else size
+        channels = self.model.config.encoder.num_channels
+        tensors = []
+        for image in images:
+            image = image.convert("RGB" if channels == 3 else "L")
+            if image.size != (width, height):
+                image = image.resize((width, height), Image.Resampling.BILINEAR)
+            data = torch.frombuffer(bytearray(image.tobytes()), dtype=torch.uint8)
+            tensors.append(data.view(height, width, channels).permute(2, 0, 1))
+        return torch.stack(tensors).float().div_(255).sub_(PIXEL_MEAN).div_(PIXEL_STD)
+
+    def decode(self, images, document_types, fields=None):
+        """
+        Read a batch of images of DOCUMENT_SCHEMAS types. Returns one
+        (DecodingState, confidence) per image, confidence being the mean
+        probability the model gave the tokens it generated.
+        """
+        if self.model is None:
+            self.load()
+        return self._decode(images, document_types, fields or [None] * len(images), self.max_tokens)
+
+    def _decode(self, images, document_types, fields, max_tokens):
+        torch, model = self._torch, self.model
+        states = [DecodingState(document_type, selected, max_tokens)
+                  for document_type, selected in zip(document_types, fields)]
+        log_probs = [0.0] * len(states)
+        with torch.inference_mode():
+            hidden = model.encoder(pixel_values=self.pixel_values(images)).last_hidden_state
+            if (model.encoder.config.hidden_size != model.decoder.config.hidden_size
+                    and model.decoder.config.cross_attention_hidden_size is None):
+                hidden = model.enc_to_dec_proj(hidden)
+            rows = list(range(len(states)))
+            prompts = [self._token_ids[task_prompt(document_type)] for document_type in document_types]
+            input_ids = torch.tensor(prompts)[:, None]
+            past = None
+            while rows:
+                output = model.decoder(input_ids=input_ids, encoder_hidden_states=hidden, past_key_values=past,
+                                       use_cache=True, return_dict=True)
+                logits = output.logits[:, -1, :]
+                masks = torch.stack([self._mask(states[row].allowed()) for row in rows])
+                chosen = logits.masked_fill(~masks, float("-inf")).argmax(dim=-1)
+                chosen_log_probs = logits.log_softmax(dim=-1).gather(1, chosen[:, None])[:, 0]
+                for row, token_id, log_prob in zip(rows, chosen.tolist(), chosen_log_probs.tolist()):
+                    states[row].feed(self._pieces[token_id])
+                    log_probs[row] += log_prob
+                keep = [position for position, row in enumerate(rows) if not states[row].finished]
+                if not keep:
+                    break
+                past = output.past_key_values
+                if len(keep) < len(rows):
+                    # Finished documents leave the batch so later steps only compute the rest
+                    index = torch.tensor(keep, dtype=torch.long)
+                    hidden = hidden.index_select(0, index)
+                    past = reorder_cache(past, index)
+                    chosen = chosen.index_select(0, index)
+                    rows = [rows[position] for position in keep]
+                input_ids = chosen[:, None]
+        return [(state, round(math.exp(log_prob / max(1, state.tokens)), 4))
+                for state, log_prob in zip(states, log_probs)]
+
+    def warm_up(self):
+        """Decode a few tokens of a blank image of every document type"""
+        blank = Image.new("L", (8, 8), 255)
+        self._decode([blank] * len(DOCUMENT_SCHEMAS), list(DOCUMENT_SCHEMAS), [None] * len(DOCUMENT_SCHEMAS), 8)
+
+    def stats(self):
+        return {
+            "model_dir": self.model_dir,
+            "version": self.version,
+            "quantize": "int8" if self.quantize else None,
+            "loaded": self.model is not None,
+            "load_seconds": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+            "warmup_seconds": round(self.warmup_seconds, 3) if self.warmup_seconds is not None else None,
+            "parameters": self.parameters,
+            "weights_bytes": os.path.getsize(self.weights_path) if os.path.exists(self.weights_path) else None,
+            "threads": self.threads,
+            "max_tokens": self.max_tokens,
+            "memory": process_memory(),
+        }
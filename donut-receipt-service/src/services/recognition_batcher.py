@@ -0,0 +1,134 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class RecognitionQueueFull(Exception):
+    """Raised when the recognition queue is at capacity"""
+
+
+class RecognitionBatcher:
+    """
+    Micro-batching scheduler in front of the recognition model.
+
+    Concurrent callers submit single images; a background thread groups them
+    into batches of at most ``max_batch_size`` images, waiting at most
+    ``max_wait_ms`` after the first image arrives, and hands each batch to
+    ``recognize_batch(images, document_types)`` in one call. When some
+    image asks for a subset of its fields, the call also gets
+    ``fields=``, one tuple of field names (or None) per image.
+
+    The queue holds at most ``max_queue_size`` images (0 for unbounded);
+    ``submit`` raises RecognitionQueueFull beyond that. ``concurrency``
+    batches may be in flight at once, for a recognizer backed by several
+    worker processes.
+    """
+
+    def __init__(self, recognize_batch, max_batch_size=8, max_wait_ms=10, max_queue_size=0, concurrency=1):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        self.recognize_batch = recognize_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue_size = max_queue_size
+        self.concurrency = concurrency
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._collect_lock = threading.Lock()
+        self._workers = []
+        self._stats = {"batches": 0, "images": 0, "largest_batch": 0, "rejected": 0}
+
+    def submit(self, image, document_type="receipt", fields=None):
+        """Queue one image and return a Future resolving to its recognition result"""
+        future = Future()
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((image, document_type, fields, future))
+        except queue.Full:
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise RecognitionQueueFull(f"Recognition queue is full ({self.max_queue_size} images)")
+        return future
+
+    def recognize(self, image, document_type="receipt", timeout=None, fields=None):
+        """Recognize one image, blocking until its batch has been processed"""
+        return self.submit(image, document_type, fields).result(timeout=timeout)
+
+    def recognize_many(self, images, document_types, timeout=None):
+        """Recognize several images, letting the scheduler batch them together"""
+        futures = [self.submit(image, doc_type) for image, doc_type in zip(images, document_types)]
+        return [future.result(timeout=timeout) for future in futures]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["average_batch_size"] = round(stats["images"] / stats["batches"], 2) if stats["batches"] else 0
+        stats["max_batch_size"] = self.max_batch_size
+        stats["max_wait_ms"] = self.max_wait * 1000
+        stats["max_queue_size"] = self.max_queue_size
+        stats["concurrency"] = self.concurrency
+        stats["queued"] = self._queue.qsize()
+        return stats
+
+    def _ensure_worker(self):
+        # Started lazily so a pre-fork server does not inherit dead threads
+        if len(self._workers) == self.concurrency and all(worker.is_alive() for worker in self._workers):
+            return
+        with self._lock:
+            self._workers = [worker for worker in self._workers if worker.is_alive()]
+            while len(self._workers) < self.concurrency:
+                worker = threading.Thread(
+                    target=self._run, name=f"recognition-batcher-{len(self._workers)}", daemon=True
+                )
+                worker.start()
+                self._workers.append(worker)
+
+    def _collect_batch(self):
+        # One collector at a time, so concurrent batches fill up instead of splitting
+        with self._collect_lock:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            images = [item[0] for item in batch]
+            document_types = [item[1] for item in batch]
+            fields = [item[2] for item in batch]
+            futures = [item[3] for item in batch]
+
+            try:
+                if any(fields):
+                    results = self.recognize_batch(images, document_types, fields=fields)
+                else:
+                    results = self.recognize_batch(images, document_types)
+                if len(results) != len(batch):
+                    raise RuntimeError(f"recognize_batch returned {len(results)} results for {len(batch)} images")
+            except Exception as e:
+                logger.error(f"Error in batch recognition: {str(e)}")
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            for future, result in zip(futures, results):
+                future.set_result(result)
+
+            with self._lock:
+                self._stats["batches"] += 1
+                self._stats["images"] += len(batch)
+                self._stats["largest_batch"] = max(self._stats["largest_batch"], len(batch))
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def sha256_bytes(data):
+    """SHA-256 hex digest of an in-memory image"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def sha256_stream(stream):
+    """SHA-256 hex digest of a seekable stream, rewound afterwards"""
+    digest = hashlib.sha256()
+    start = stream.tell()
+    for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    stream.seek(start)
+    return digest.hexdigest()
+
+
+class RecognitionCache:
+    """
+    Content-addressed cache of recognition results.
+
+    Entries are keyed by (image SHA-256, document type, model version) and
+    held in an in-memory LRU bounded by ``max_entries`` with a ``ttl_seconds``
+    lifetime. When ``db_path`` is set, entries are also written to a SQLite
+    table so they survive restarts; a memory miss falls back to that tier.
+    """
+
+    TABLE = "recognition_cache"
+
+    def __init__(self, max_entries=1024, ttl_seconds=3600, db_path=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "persistent_hits": 0}
+        if db_path:
+            self.enable_persistence(db_path)
+
+    @staticmethod
+    def make_key(image_hash, document_type, model_version, fields=None):
+        """Key of a result; ``fields`` marks a result holding only those fields"""
+        key = f"{image_hash}:{document_type}:{model_version}"
+        return f"{key}:{','.join(fields)}" if fields else key
+
+    def enable_persistence(self, db_path):
+        """Turn on the SQLite tier, creating its table if needed"""
+        with self._connect(db_path) as conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.TABLE} ("
+                "cache_key TEXT PRIMARY KEY, result TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{self.TABLE}_created_at ON {self.TABLE} (created_at)")
+        self.db_path = db_path
+
+    def get(self, key):
+        """Return a copy of the cached result for key, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                result, created_at = entry
+                if now - created_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return json.loads(result)
+                del self._entries[key]
+                self._stats["expirations"] += 1
+
+        result = self._load_persistent(key, now)
+        with self._lock:
+            if result is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+            self._stats["persistent_hits"] += 1
+            self._store_memory(key, result[0], result[1])
+        return json.loads(result[0])
+
+    def set(self, key, value):
+        """Cache a recognition result"""
+        payload = json.dumps(value)
+        created_at = time.time()
+        with self._lock:
+            self._store_memory(key, payload, created_at)
+        self._save_persistent(key, payload, created_at)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.db_path:
+            with self._connect(self.db_path) as conn:
+                conn.execute(f"DELETE FROM {self.TABLE}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["max_entries"] = self.max_entries
+        stats["ttl_seconds"] = self.ttl_seconds
+        stats["persistent"] = self.db_path is not None
+        return stats
+
+    def _store_memory(self, key, payload, created_at):
+        self._entries[key] = (payload, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    @staticmethod
+    @contextmanager
+    def _connect(db_path):
+        conn = sqlite3.connect(db_path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _load_persistent(self, key, now):
+        if not self.db_path:
+            return None
+        try:
+            with self._connect(self.db_path) as conn:
+                row = conn.execute(
+                    f"SELECT result, created_at FROM {self.TABLE} WHERE cache_key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                if now - row[1] > self.ttl_seconds:
+                    conn.execute(f"DELETE FROM {self.TABLE} WHERE cache_key = ?", (key,))
+                    with self._lock:
+                        self._stats["expirations"] += 1
+                    return None
+                return row
+        except sqlite3.Error as e:
+            logger.error(f"Error reading recognition cache: {str(e)}")
+            return None
+
+    def _save_persistent(self, key, payload, created_at):
+        if not self.db_path:
+            return
+        try:
+            with self._connect(self.db_path) as conn:
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {self.TABLE} (cache_key, result, created_at) VALUES (?, ?, ?)",
+                    (key, payload, created_at),
+                )
+                conn.execute(f"DELETE FROM {self.TABLE} WHERE created_at < ?", (created_at - self.ttl_seconds,))
+        except sqlite3.Error as e:
+            logger.error(f"Error writing recognition cache: {str(e)}")
@@ -0,0 +1,277 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+CALLBACK_ATTEMPTS = 3
+CALLBACK_TIMEOUT = 10
+
+
+class RecognitionJobStore:
+    """
+    SQLite table of asynchronous recognition jobs.
+
+    The uploaded image is kept with the job until it finishes, so queued and
+    running jobs can be resumed after a restart. ``options`` holds the
+    recognition options the job was submitted with, as JSON.
+    """
+
+    TABLE = "recognition_jobs"
+
+    def __init__(self, db_path=":memory:"):
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path, timeout=5, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.TABLE} ("
+                "job_id TEXT PRIMARY KEY, status TEXT NOT NULL, document_type TEXT NOT NULL, "
+                "image BLOB, image_hash TEXT, callback_url TEXT, options TEXT, result TEXT, error TEXT, "
+                "callback_status TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            # Tables created before jobs kept their options
+            columns = {row["name"] for row in self._conn.execute(f"PRAGMA table_info({self.TABLE})")}
+            if "options" not in columns:
+                self._conn.execute(f"ALTER TABLE {self.TABLE} ADD COLUMN options TEXT")
+            self._conn.execute(
+                f"CREATE INDEX IF NOT EXISTS ix_{self.TABLE}_status_updated ON {self.TABLE} (status, updated_at)"
+            )
+
+    def create(self, image_bytes, document_type, image_hash=None, callback_url=None, options=None):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT INTO {self.TABLE} (job_id, status, document_type, image, image_hash, callback_url, "
+                "options, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, JOB_QUEUED, document_type, image_bytes, image_hash, callback_url,
+                 json.dumps(options) if options else None, now, now),
+            )
+        return job_id
+
+    def get(self, job_id, include_image=False):
+        columns = "*" if include_image else (
+            "job_id, status, document_type, image_hash, callback_url, options, result, error, "
+            "callback_status, created_at, updated_at"
+        )
+        with self._lock:
+            row = self._conn.execute(f"SELECT {columns} FROM {self.TABLE} WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["options"] = json.loads(job["options"]) if job["options"] else {}
+        return job
+
+    def update(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        if "result" in fields and fields["result"] is not None:
+            fields["result"] = json.dumps(fields["result"])
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE {self.TABLE} SET {assignments} WHERE job_id = ?", (*fields.values(), job_id)
+            )
+
+    def claim(self, job_id, status, updated_at=None):
+        """
+        Atomically mark a job as running if it is still in the given state.
+        Several server processes may share the table; only one wins the claim.
+        """
+        query = f"UPDATE {self.TABLE} SET status = ?, updated_at = ? WHERE job_id = ? AND status = ?"
+        params = [JOB_RUNNING, time.time(), job_id, status]
+        if updated_at is not None:
+            query += " AND updated_at = ?"
+            params.append(updated_at)
+        with self._lock, self._conn:
+            return self._conn.execute(query, params).rowcount == 1
+
+    def unfinished_jobs(self, stale_before=None, queued_before=None):
+        """
+        (job_id, status, updated_at) of queued and running jobs, oldest first.
+        Running jobs are only listed once not updated since ``stale_before``,
+        and queued ones since ``queued_before`` when it is given: a live
+        runner keeps its running jobs fresh with ``touch``.
+        """
+        stale_before = time.time() if stale_before is None else stale_before
+        query = (f"SELECT job_id, status, updated_at FROM {self.TABLE} "
+                 "WHERE (status = ? AND updated_at < ?) OR (status = ?")
+        params = [JOB_RUNNING, stale_before, JOB_QUEUED]
+        if queued_before is not None:
+            query += " AND updated_at < ?"
+            params.append(queued_before)
+        with self._lock:
+            rows = self._conn.execute(query + ") ORDER BY created_at", params).fetchall()
+        return [(row["job_id"], row["status"], row["updated_at"]) for row in rows]
+
+    def touch(self, job_ids):
+        """Mark running jobs as still alive"""
+        if not job_ids:
+            return
+        placeholders = ", ".join("?" * len(job_ids))
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE {self.TABLE} SET updated_at = ? WHERE status = ? AND job_id IN ({placeholders})",
+                (time.time(), JOB_RUNNING, *job_ids),
+            )
+
+    def purge(self, older_than):
+        """Delete finished jobs last updated before the given timestamp"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"DELETE FROM {self.TABLE} WHERE status IN (?, ?) AND updated_at < ?",
+                (JOB_COMPLETED, JOB_FAILED, older_than),
+            )
+
+    def counts(self):
+        with self._lock:
+            rows = self._conn.execute(f"SELECT status, COUNT(*) AS n FROM {self.TABLE} GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+
+class RecognitionJobRunner:
+    """
+    Runs stored recognition jobs on a thread pool.
+
+    ``process(image_bytes, document_type, image_hash, options)`` returns
+    the recognition result dict; ``options`` is the dict the job was
+    submitted with, empty when none were given. When a job has a
+    ``callback_url``, the final job state is POSTed there as JSON once it
+    finishes.
+
+    Several server processes may share the job table. Each one refreshes
+    the ``updated_at`` of the jobs it is running every ``stale_after / 4``
+    seconds, and takes over running jobs left without a refresh for
+    ``stale_after`` seconds (their process died) and queued jobs waiting
+    that long. A job whose ``retryable`` errors last ``retry_timeout``
+    seconds fails.
+    """
+
+    def __init__(self, process, max_workers=4, retention_seconds=86400, retry_delay=1.0, retryable=(),
+                 stale_after=60.0, retry_timeout=600.0):
+        self.process = process
+        self.max_workers = max_workers
+        self.retention_seconds = retention_seconds
+        self.retry_delay = retry_delay
+        self.retryable = retryable
+        self.stale_after = stale_after
+        self.retry_timeout = retry_timeout
+        self.store = None
+        self._executor = None
+        # Jobs submitted to this runner's pool and not finished yet
+        self._jobs = set()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._heartbeat = None
+
+    def start(self, store):
+        """Attach the store and resume jobs left unfinished by a previous run"""
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="recognition-job")
+        self.store.purge(time.time() - self.retention_seconds)
+        # Jobs running in a live sibling process are fresh and left alone
+        resumed = self._resume(time.time() - self.stale_after)
+        if resumed:
+            logger.info(f"Resuming {resumed} unfinished recognition jobs")
+        self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="recognition-job-heartbeat",
+                                           daemon=True)
+        self._heartbeat.start()
+
+    def shutdown(self):
+        """Finish running jobs; jobs still queued stay in the table for the next start"""
+        self._stopping.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+
+    @property
+    def started(self):
+        return self.store is not None
+
+    def submit(self, image_bytes, document_type, image_hash=None, callback_url=None, options=None):
+        job_id = self.store.create(image_bytes, document_type, image_hash, callback_url, options)
+        with self._lock:
+            self._jobs.add(job_id)
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    def _resume(self, stale_before, queued_before=None):
+        with self._lock:
+            jobs = [job for job in self.store.unfinished_jobs(stale_before, queued_before) if job[0] not in self._jobs]
+            self._jobs.update(job_id for job_id, _, _ in jobs)
+        for job_id, status, updated_at in jobs:
+            self._executor.submit(self._run, job_id, status, updated_at)
+        return len(jobs)
+
+    def _heartbeat_loop(self):
+        interval = self.stale_after / 4
+        while not self._stopping.wait(interval):
+            try:
+                with self._lock:
+                    jobs = list(self._jobs)
+                self.store.touch(jobs)
+                stale_before = time.time() - self.stale_after
+                taken = self._resume(stale_before, stale_before)
+                if taken:
+                    logger.info(f"Taking over {taken} stale recognition jobs")
+            except Exception as e:
+                logger.error(f"Error refreshing recognition jobs: {str(e)}")
+
+    def _run(self, job_id, status=JOB_QUEUED, updated_at=None):
+        try:
+            if not self.store.claim(job_id, status, updated_at):
+                return
+            job = self.store.get(job_id, include_image=True)
+            self._process(job_id, job)
+        finally:
+            with self._lock:
+                self._jobs.discard(job_id)
+
+        if job["callback_url"]:
+            self._send_callback(job_id, job["callback_url"])
+
+    def _process(self, job_id, job):
+        deadline = time.monotonic() + self.retry_timeout
+        while True:
+            try:
+                result = self.process(job["image"], job["document_type"], job["image_hash"], job["options"])
+                self.store.update(job_id, status=JOB_COMPLETED, result=result, image=None)
+                return
+            except self.retryable as e:
+                if time.monotonic() + self.retry_delay < deadline:
+                    time.sleep(self.retry_delay)
+                    continue
+                error = f"Gave up after {self.retry_timeout:g}s of retries: {str(e)}"
+            except Exception as e:
+                error = str(e)
+            logger.error(f"Error in recognition job {job_id}: {error}")
+            self.store.update(job_id, status=JOB_FAILED, error=error, image=None)
+            return
+
+    def _send_callback(self, job_id, callback_url):
+        body = json.dumps(self.store.get(job_id)).encode()
+        status = "failed"
+        for attempt in range(CALLBACK_ATTEMPTS):
+            try:
+                request = urllib.request.Request(
+                    callback_url, data=body, headers={"Content-Type": "application/json"}, method="POST"
+                )
+                with urllib.request.urlopen(request, timeout=CALLBACK_TIMEOUT) as response:
+                    status = f"delivered ({response.status})"
+                break
+            except Exception as e:
+                logger.warning(f"Callback for recognition job {job_id} failed (attempt {attempt + 1}): {str(e)}")
+                if attempt + 1 < CALLBACK_ATTEMPTS:
+                    time.sleep(self.retry_delay * (2 ** attempt))
+        self.store.update(job_id, callback_status=status)
@@ -0,0 +1,338 @@
+import importlib
+import itertools
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import resource_tracker, shared_memory
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Modes that round-trip through tobytes()/frombuffer() without extra data
+SHAREABLE_MODES = {"1", "L", "RGB", "RGBA", "I", "F"}
+
+
+class RecognitionWorkerError(Exception):
+    """Raised when a worker process fails or dies while recognizing a batch"""
+
+
+def load_callable(path):
+    """Resolve a ``module:attribute`` path"""
+    module_name, _, attribute = path.partition(":")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def _attach_block(name):
+    """Attach to a block the parent owns without tracking it in this process"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 attaching registers the block with the resource
+        # tracker, which would unlink it when this worker exits
+        block = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(block._name, "shared_memory")
+        return block
+
+
+def _attach_images(payloads):
+    """Rebuild images from shared memory blocks written by the parent"""
+    blocks, images = [], []
+    for name, mode, size in payloads:
+        block = _attach_block(name)
+        blocks.append(block)
+        images.append(Image.frombuffer(mode, size, block.buf, "raw", mode, 0, 1))
+    return blocks, images
+
+
+def _worker_main(worker_id, loader_path, task_queue, result_queue, current_task):
+    """
+    Worker process: load the model once, then recognize batches until told
+    to stop. ``current_task`` is shared memory holding the id of the last
+    batch taken, which the parent reads if the worker dies before its
+    queued messages are sent.
+    """
+    try:
+        recognize_batch = load_callable(loader_path)()
+    except Exception as e:
+        result_queue.put(("failed", worker_id, None, f"Model load failed: {e}"))
+        return
+    result_queue.put(("ready", worker_id, None, None))
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        task_id, payloads, document_types, fields = task
+        current_task.value = task_id
+        result_queue.put(("started", worker_id, task_id, None))
+        start = time.perf_counter()
+        blocks, images = [], []
+        try:
+            blocks, images = _attach_images(payloads)
+            if fields:
+                results = recognize_batch(images, document_types, fields=fields)
+            else:
+                results = recognize_batch(images, document_types)
+            message = ("done", worker_id, task_id, results)
+        except Exception as e:
+            message = ("error", worker_id, task_id, str(e))
+        finally:
+            # Images view the shared buffers and must go before the blocks close
+            del images
+            for block in blocks:
+                try:
+                    block.close()
+                except BufferError:
+                    logger.warning(f"Worker {worker_id} could not release a shared image buffer")
+        result_queue.put(message + (time.perf_counter() - start,))
+
+
+class RecognitionWorkerPool:
+    """
+    Pool of recognition worker processes.
+
+    Each worker calls the ``module:attribute`` factory ``loader_path`` once
+    at startup to obtain a ``recognize_batch(images, document_types)``
+    function, which also takes ``fields=`` if callers select fields.
+    Batches are sent over a shared task queue with pixel data placed in
+    shared memory, so images are never pickled.
+
+    Every ``reap_interval`` seconds, busy or not, workers that died are
+    replaced and the batch they were running fails. A worker that dies
+    before it is ready, e.g. because the model fails to load, is restarted
+    after a backoff doubling from ``restart_backoff`` up to
+    ``max_restart_backoff`` seconds, and given up after
+    ``max_load_failures`` such deaths in a row; once every worker is
+    given up the pool is ``failed`` and batches fail at once.
+    """
+
+    def __init__(self, num_workers, loader_path, start_method=None, task_timeout=60, reap_interval=1.0,
+                 max_load_failures=5, restart_backoff=1.0, max_restart_backoff=60.0):
+        if num_workers < 1:
+            raise ValueError("num_workers must be at least 1")
+        self.num_workers = num_workers
+        self.loader_path = loader_path
+        self.task_timeout = task_timeout
+        self.reap_interval = reap_interval
+        self.max_load_failures = max_load_failures
+        self.restart_backoff = restart_backoff
+        self.max_restart_backoff = max_restart_backoff
+        self._context = multiprocessing.get_context(start_method)
+        self._task_queue = self._context.Queue()
+        self._result_queue = self._context.Queue()
+        self._task_ids = itertools.count()
+        self._pending = {}
+        self._workers = {}
+        self._lock = threading.Lock()
+        self._dispatcher = None
+        self._stopping = False
+        self.error = None
+
+    def start(self):
+        """Start the worker processes and the result dispatcher"""
+        for worker_id in range(self.num_workers):
+            self._spawn(worker_id)
+        self._dispatcher = threading.Thread(target=self._dispatch, name="recognition-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+    def shutdown(self, timeout=5):
+        """Ask every worker to exit after its current batch"""
+        self._stopping = True
+        for _ in self._workers:
+            self._task_queue.put(None)
+        for worker in self._workers.values():
+            worker["process"].join(timeout)
+            if worker["process"].is_alive():
+                worker["process"].terminate()
+
+    @property
+    def failed(self):
+        """Whether every worker was given up, so no batch can run"""
+        return self.error is not None
+
+    def recognize_batch(self, images, document_types, fields=None):
+        """Recognize a batch in a worker process, blocking until it finishes"""
+        if self.failed:
+            raise RecognitionWorkerError(self.error)
+        blocks, payloads = [], []
+        try:
+            for image in images:
+                if image.mode not in SHAREABLE_MODES:
+                    image = image.convert("RGB")
+                data = image.tobytes()
+                block = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+                block.buf[:len(data)] = data
+                blocks.append(block)
+                payloads.append((block.name, image.mode, image.size))
+
+            task_id = next(self._task_ids)
+            future = Future()
+            with self._lock:
+                self._pending[task_id] = {"future": future, "worker_id": None}
+            self._task_queue.put((task_id, payloads, list(document_types), list(fields) if fields else None))
+            try:
+                return future.result(timeout=self.task_timeout)
+            finally:
+                with self._lock:
+                    self._pending.pop(task_id, None)
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+    def stats(self):
+        """Per-worker liveness and utilization since the worker started"""
+        now = time.monotonic()
+        with self._lock:
+            workers = []
+            for worker_id, worker in sorted(self._workers.items()):
+                busy = worker["busy_seconds"]
+                if worker["current_task"] is not None:
+                    busy += now - worker["task_started"]
+                uptime = now - worker["started_at"]
+                workers.append({
+                    "worker_id": worker_id,
+                    "pid": worker["process"].pid,
+                    "alive": worker["process"].is_alive(),
+                    "ready": worker["ready"],
+                    "busy": worker["current_task"] is not None,
+                    "batches": worker["batches"],
+                    "errors": worker["errors"],
+                    "restarts": worker["restarts"],
+                    "load_failures": worker["load_failures"],
+                    "last_error": worker["last_error"],
+                    "given_up": worker["given_up"],
+                    "restart_in": (round(max(0.0, worker["restart_at"] - now), 3)
+                                   if worker["restart_at"] is not None else None),
+                    "busy_seconds": round(busy, 3),
+                    "utilization": round(busy / uptime, 4) if uptime > 0 else 0.0,
+                })
+            pending = len(self._pending)
+        return {"num_workers": self.num_workers, "pending_batches": pending, "failed": self.failed,
+                "error": self.error, "workers": workers}
+
+    def _spawn(self, worker_id, restarts=0, load_failures=0, last_error=None):
+        current_task = self._context.Value("q", -1, lock=False)
+        process = self._context.Process(
+            target=_worker_main,
+            args=(worker_id, self.loader_path, self._task_queue, self._result_queue, current_task),
+            name=f"recognition-worker-{worker_id}",
+            daemon=True,
+        )
+        process.start()
+        with self._lock:
+            self._workers[worker_id] = {
+                "process": process,
+                "last_task": current_task,
+                "ready": False,
+                "current_task": None,
+                "task_started": None,
+                "busy_seconds": 0.0,
+                "batches": 0,
+                "errors": 0,
+                "restarts": restarts,
+                "load_failures": load_failures,
+                "last_error": last_error,
+                "exited": False,
+                "given_up": False,
+                "restart_at": None,
+                "started_at": time.monotonic(),
+            }
+
+    def _dispatch(self):
+        # Reaped on a timer rather than when idle: under steady load results never stop arriving
+        next_reap = time.monotonic() + self.reap_interval
+        while not self._stopping:
+            try:
+                message = self._result_queue.get(timeout=max(0.0, next_reap - time.monotonic()))
+            except queue.Empty:
+                message = None
+            if message is not None:
+                self._handle(message)
+            if time.monotonic() >= next_reap:
+                self._reap_dead_workers()
+                next_reap = time.monotonic() + self.reap_interval
+
+    def _handle(self, message):
+        kind, worker_id, task_id, payload = message[:4]
+        with self._lock:
+            worker = self._workers.get(worker_id)
+            pending = self._pending.get(task_id) if task_id is not None else None
+            if kind == "ready":
+                worker["ready"] = True
+                worker["load_failures"] = 0
+            elif kind == "failed":
+                worker["last_error"] = payload
+                logger.error(f"Recognition worker {worker_id}: {payload}")
+            elif kind == "started":
+                worker["current_task"] = task_id
+                worker["task_started"] = time.monotonic()
+                if pending:
+                    pending["worker_id"] = worker_id
+            else:
+                worker["current_task"] = None
+                worker["busy_seconds"] += message[4]
+                worker["batches"] += 1
+                if kind == "error":
+                    worker["errors"] += 1
+
+        if pending is None or kind not in ("done", "error") or pending["future"].done():
+            return
+        if kind == "done":
+            pending["future"].set_result(payload)
+        else:
+            pending["future"].set_exception(RecognitionWorkerError(payload))
+
+    def _reap_dead_workers(self):
+        """
+        Fail the batch a newly dead worker was running and schedule its
+        replacement, then start the replacements that are due
+        """
+        if self._stopping:
+            return
+        now = time.monotonic()
+        with self._lock:
+            dead = [(worker_id, worker) for worker_id, worker in self._workers.items()
+                    if not worker["exited"] and not worker["process"].is_alive()]
+            for worker_id, worker in dead:
+                worker["exited"] = True
+                worker["current_task"] = None
+                if worker["ready"]:
+                    # It ran batches before, so it is restarted right away
+                    worker["restart_at"] = now
+                    continue
+                worker["load_failures"] += 1
+                if worker["load_failures"] >= self.max_load_failures:
+                    worker["given_up"] = True
+                else:
+                    worker["restart_at"] = now + min(self.max_restart_backoff,
+                                                     self.restart_backoff * 2 ** (worker["load_failures"] - 1))
+            # Its last batch, whether or not its messages about it got out before it died
+            pending = [self._pending.get(worker["last_task"].value) for _, worker in dead]
+            due = [(worker_id, worker) for worker_id, worker in self._workers.items()
+                   if worker["exited"] and worker["restart_at"] is not None and worker["restart_at"] <= now]
+            given_up = all(worker["given_up"] for worker in self._workers.values())
+            errors = [worker["last_error"] for worker in self._workers.values() if worker["last_error"]]
+        for (worker_id, worker), task in zip(dead, pending):
+            if worker["given_up"]:
+                logger.error(f"Recognition worker {worker_id} failed to start {worker['load_failures']} times in a "
+                             f"row, giving up: {worker['last_error']}")
+            else:
+                logger.error(f"Recognition worker {worker_id} exited with code {worker['process'].exitcode}, "
+                             f"restarting in {max(0.0, worker['restart_at'] - now):.1f}s")
+            if task and not task["future"].done():
+                task["future"].set_exception(RecognitionWorkerError(f"Worker {worker_id} died"))
+        if given_up and self.error is None:
+            self.error = f"All recognition workers failed to start: {errors[-1] if errors else 'exited before ready'}"
+            with self._lock:
+                waiting = list(self._pending.values())
+            for task in waiting:
+                if not task["future"].done():
+                    task["future"].set_exception(RecognitionWorkerError(self.error))
+        for worker_id, worker in due:
+            self._spawn(worker_id, restarts=worker["restarts"] + 1, load_failures=worker["load_failures"],
+                        last_error=worker["last_error"])
@@ -0,0 +1,374 @@
+import bisect
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+logger = logging.getLogger(__name__)
+
+# Share of the score from amount closeness, date closeness and name similarity;
+# the name share is dropped when either side has no merchant name
+AMOUNT_WEIGHT = 0.5
+TIME_WEIGHT = 0.2
+MERCHANT_WEIGHT = 0.3
+# Date score given when the receipt or the payment has no date
+UNDATED_TIME_SCORE = 0.5
+
+NAME_NOISE = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def to_cents(amount):
+    """Amount in the smallest currency unit, or None if it is missing or not a number"""
+    if amount is None or isinstance(amount, bool):
+        return None
+    try:
+        value = Decimal(str(amount).replace(",", "").strip())
+    except InvalidOperation:
+        return None
+    if not value.is_finite() or value < 0:
+        return None
+    return int((value * 100).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def parse_timestamp(value):
+    """Unix seconds from epoch numbers or ISO 8601 dates; dates without a zone are read as UTC"""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    try:
+        parsed = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def normalize_name(name):
+    """Merchant name reduced for comparison: NFKC, case-folded, without punctuation or spaces"""
+    if not name:
+        return ""
+    return NAME_NOISE.sub("", unicodedata.normalize("NFKC", str(name)).casefold())
+
+
+def name_bigrams(normalized):
+    if len(normalized) < 2:
+        return {normalized} if normalized else set()
+    return {normalized[index:index + 2] for index in range(len(normalized) - 1)}
+
+
+def name_similarity(first, second):
+    """
+    Similarity of two normalized names from 0 to 1: the Dice coefficient of
+    their character bigrams, which works for Latin and CJK names alike, or
+    0.9 when one name contains the other ("Golden Dragon" in "Golden Dragon
+    Restaurant").
+    """
+    if not first or not second:
+        return None
+    if first == second:
+        return 1.0
+    first_grams, second_grams = name_bigrams(first), name_bigrams(second)
+    dice = 2 * len(first_grams & second_grams) / (len(first_grams) + len(second_grams))
+    if first in second or second in first:
+        return max(dice, 0.9)
+    return dice
+
+
+class ReceiptIndex:
+    """
+    In-memory candidate index of receipts by amount and date.
+
+    Receipts are bucketed by amount in cents and each bucket keeps its dated
+    receipts sorted by timestamp; the amounts that have a bucket are kept
+    sorted too. A lookup bisects them to the amount tolerance, visits the
+    buckets in it nearest amount first and bisects each one to the date
+    window, so its cost grows with the number of buckets and matches it
+    visits, not with the tolerance or the number of receipts stored.
+    """
+
+    def __init__(self):
+        # cents -> [sorted timestamps, receipt ids in the same order, undated receipt ids]
+        self._buckets = {}
+        # Sorted amounts of the buckets
+        self._amounts = []
+        # receipt id -> (cents, timestamp, normalized merchant name)
+        self._receipts = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._receipts)
+
+    def add(self, receipt_id, cents, timestamp, merchant):
+        with self._lock:
+            self._remove(receipt_id)
+            if cents not in self._buckets:
+                bisect.insort(self._amounts, cents)
+            times, ids, undated = self._buckets.setdefault(cents, ([], [], []))
+            if timestamp is None:
+                undated.append(receipt_id)
+            else:
+                position = bisect.bisect_right(times, timestamp)
+                times.insert(position, timestamp)
+                ids.insert(position, receipt_id)
+            self._receipts[receipt_id] = (cents, timestamp, merchant)
+
+    def remove(self, receipt_id):
+        with self._lock:
+            self._remove(receipt_id)
+
+    def _remove(self, receipt_id):
+        entry = self._receipts.pop(receipt_id, None)
+        if entry is None:
+            return
+        cents, timestamp, _ = entry
+        times, ids, undated = self._buckets[cents]
+        if timestamp is None:
+            undated.remove(receipt_id)
+        else:
+            position = bisect.bisect_left(times, timestamp)
+            while ids[position] != receipt_id:
+                position += 1
+            del times[position]
+            del ids[position]
+        if not times and not undated:
+            del self._buckets[cents]
+            del self._amounts[bisect.bisect_left(self._amounts, cents)]
+
+    def candidates(self, cents, timestamp, cents_tolerance, time_window, limit):
+        """
+        Receipts within ``cents_tolerance`` of the amount and, when the
+        payment has a date, ``time_window`` seconds of it, as (receipt id,
+        cents, timestamp, merchant); at most ``limit`` of them, closest
+        amounts first.
+        """
+        found = []
+        with self._lock:
+            amounts = self._amounts
+            lowest = bisect.bisect_left(amounts, cents - cents_tolerance)
+            highest = bisect.bisect_right(amounts, cents + cents_tolerance)
+            below = bisect.bisect_left(amounts, cents, lowest, highest) - 1
+            above = below + 1
+            while below >= lowest or above < highest:
+                # Nearest amount first; of two as near, the lower one
+                if above >= highest or (below >= lowest and cents - amounts[below] <= amounts[above] - cents):
+                    times, ids, undated = self._buckets[amounts[below]]
+                    below -= 1
+                else:
+                    times, ids, undated = self._buckets[amounts[above]]
+                    above += 1
+                if timestamp is None:
+                    start, end = 0, len(ids)
+                else:
+                    start = bisect.bisect_left(times, timestamp - time_window)
+                    end = bisect.bisect_right(times, timestamp + time_window)
+                for receipt_id in ids[start:end] + undated:
+                    found.append((receipt_id,) + self._receipts[receipt_id])
+                    if len(found) >= limit:
+                        return found
+        return found
+
+
+class ReconciliationStore:
+    """
+    SQLite table of recognized receipts and the payments linked to them.
+
+    Every write stamps the row with the next sequence number, so each
+    server process can bring its in-memory index up to date by reading only
+    the rows changed since its last sync.
+    """
+
+    TABLE = "reconciliation_receipts"
+
+    def __init__(self, db_path=":memory:"):
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.TABLE} ("
+                "receipt_id TEXT PRIMARY KEY, amount_cents INTEGER NOT NULL, timestamp INTEGER, merchant TEXT, "
+                "payment_id TEXT, linked_at REAL, seq INTEGER NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{self.TABLE}_seq ON {self.TABLE} (seq)")
+
+    def _write(self, sql, params):
+        """Run one write stamped with the next sequence number as ``:seq``; returns the rows changed"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                seq = self._conn.execute(f"SELECT COALESCE(MAX(seq), 0) + 1 FROM {self.TABLE}").fetchone()[0]
+                cursor = self._conn.execute(sql, dict(params, seq=seq))
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return cursor.rowcount
+
+    def save_receipt(self, receipt_id, cents, timestamp, merchant):
+        """Insert or update a receipt; a receipt already linked to a payment is left as it is"""
+        self._write(
+            f"INSERT INTO {self.TABLE} (receipt_id, amount_cents, timestamp, merchant, created_at, seq) "
+            "VALUES (:receipt_id, :cents, :timestamp, :merchant, :now, :seq) "
+            "ON CONFLICT (receipt_id) DO UPDATE SET amount_cents = excluded.amount_cents, "
+            "timestamp = excluded.timestamp, merchant = excluded.merchant, seq = excluded.seq "
+            "WHERE payment_id IS NULL",
+            {"receipt_id": receipt_id, "cents": cents, "timestamp": timestamp, "merchant": merchant,
+             "now": time.time()},
+        )
+
+    def link(self, receipt_id, payment_id):
+        """Record the payment for a receipt; False if the receipt is unknown or already linked"""
+        return self._write(
+            f"UPDATE {self.TABLE} SET payment_id = :payment_id, linked_at = :now, seq = :seq "
+            "WHERE receipt_id = :receipt_id AND payment_id IS NULL",
+            {"receipt_id": receipt_id, "payment_id": payment_id, "now": time.time()},
+        ) == 1
+
+    def get(self, receipt_id):
+        with self._lock:
+            row = self._conn.execute(f"SELECT * FROM {self.TABLE} WHERE receipt_id = ?", (receipt_id,)).fetchone()
+        return dict(row) if row else None
+
+    def changes_since(self, seq, batch_size=50000):
+        """Rows written after ``seq``, oldest first, fetched ``batch_size`` at a time"""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT receipt_id, amount_cents, timestamp, merchant, payment_id, seq FROM {self.TABLE} "
+                    "WHERE seq > ? ORDER BY seq LIMIT ?", (seq, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            yield from rows
+            seq = rows[-1]["seq"]
+
+
+class ReconciliationService:
+    """
+    Matches recognized payments to the recognized receipts they paid for.
+
+    Receipts are persisted in a ReconciliationStore and indexed in memory.
+    A payment's candidates are receipts whose amount is within
+    ``amount_tolerance`` (a fraction of the payment, at least
+    ``min_tolerance_cents`` and at most ``max_tolerance_cents``) and whose
+    date is within ``time_window`` seconds. Each is scored from amount and date closeness and the
+    similarity of the merchant to the payment's receiver, and the best
+    ``max_candidates`` scoring at least ``min_score`` are returned. Linked
+    receipts leave the index.
+    """
+
+    def __init__(self, amount_tolerance=0.01, min_tolerance_cents=1, max_tolerance_cents=10000, time_window=172800,
+                 max_candidates=10, min_score=0.3, max_scan=5000):
+        self.amount_tolerance = amount_tolerance
+        self.min_tolerance_cents = min_tolerance_cents
+        self.max_tolerance_cents = max_tolerance_cents
+        self.time_window = time_window
+        self.max_candidates = max_candidates
+        self.min_score = min_score
+        self.max_scan = max_scan
+        self.index = ReceiptIndex()
+        self.store = None
+        self._synced_seq = 0
+        self._sync_lock = threading.Lock()
+        self.ready = threading.Event()
+        self.matches = 0
+
+    def start(self, store):
+        """Attach the store and load its receipts into the index"""
+        self.store = store
+        started = time.perf_counter()
+        self.sync()
+        self.ready.set()
+        logger.info(f"Loaded {len(self.index)} receipts for reconciliation in {time.perf_counter() - started:.1f}s")
+
+    def sync(self):
+        """Apply receipts added or linked since the last sync, including by other processes"""
+        if self.store is None:
+            return
+        with self._sync_lock:
+            for row in self.store.changes_since(self._synced_seq):
+                if row["payment_id"] is None:
+                    self.index.add(row["receipt_id"], row["amount_cents"], row["timestamp"], row["merchant"])
+                else:
+                    self.index.remove(row["receipt_id"])
+                self._synced_seq = row["seq"]
+
+    def add_receipt(self, receipt_id, extraction):
+        """
+        Index a receipt extraction (``extracted_amount``, ``extracted_date``,
+        ``merchant``). Returns False when it has no usable amount.
+        """
+        cents = to_cents(extraction.get("extracted_amount"))
+        if cents is None:
+            return False
+        timestamp = parse_timestamp(extraction.get("extracted_date"))
+        merchant = normalize_name(extraction.get("merchant"))
+        if self.store is not None:
+            self.store.save_receipt(receipt_id, cents, timestamp, merchant)
+            self.sync()
+        else:
+            self.index.add(receipt_id, cents, timestamp, merchant)
+        return True
+
+    def link(self, receipt_id, payment_id):
+        if self.store is None:
+            raise RuntimeError("Reconciliation store is not started")
+        linked = self.store.link(receipt_id, payment_id)
+        self.sync()
+        return linked
+
+    def tolerance(self, cents):
+        """Amount tolerance in cents of a payment of ``cents``"""
+        return min(self.max_tolerance_cents, max(self.min_tolerance_cents, int(cents * self.amount_tolerance)))
+
+    def match(self, payment):
+        """
+        Ranked receipt candidates for a payment extraction (``extracted_amount``,
+        ``extracted_date``, ``receiver``). Raises ValueError without an amount.
+        """
+        cents = to_cents(payment.get("extracted_amount"))
+        if cents is None:
+            raise ValueError("Payment has no usable extracted_amount")
+        timestamp = parse_timestamp(payment.get("extracted_date"))
+        receiver = normalize_name(payment.get("receiver"))
+        tolerance = self.tolerance(cents)
+
+        self.sync()
+        self.matches += 1
+        scored = []
+        for receipt_id, receipt_cents, receipt_time, merchant in self.index.candidates(
+                cents, timestamp, tolerance, self.time_window, self.max_scan):
+            amount_score = 1 - abs(receipt_cents - cents) / (tolerance + 1)
+            if timestamp is None or receipt_time is None:
+                time_score = UNDATED_TIME_SCORE
+            else:
+                time_score = 1 - abs(receipt_time - timestamp) / (self.time_window + 1)
+            similarity = name_similarity(receiver, merchant)
+            if similarity is None:
+                score = (AMOUNT_WEIGHT * amount_score + TIME_WEIGHT * time_score) / (AMOUNT_WEIGHT + TIME_WEIGHT)
+            else:
+                score = AMOUNT_WEIGHT * amount_score + TIME_WEIGHT * time_score + MERCHANT_WEIGHT * similarity
+            if score < self.min_score:
+                continue
+            scored.append({
+                "receipt_id": receipt_id,
+                "score": round(score, 4),
+                "amount": receipt_cents / 100,
+                "amount_difference": (receipt_cents - cents) / 100,
+                "timestamp": receipt_time,
+                "time_difference_seconds": receipt_time - timestamp if None not in (receipt_time, timestamp) else None,
+                "merchant": merchant or None,
+                "merchant_similarity": round(similarity, 4) if similarity is not None else None,
+            })
+        scored.sort(key=lambda candidate: (-candidate["score"], abs(candidate["time_difference_seconds"] or 0)))
+        return scored[:self.max_candidates]
+
+    def stats(self):
+        return {"receipts": len(self.index), "ready": self.ready.is_set(), "matches": self.matches}
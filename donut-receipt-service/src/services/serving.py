@@ -0,0 +1,27 @@
+# Vendored by donut-receipt-service and web3-service: keep both copies of this
+# file byte-identical (python scripts/check_vendored.py compares them).
+import os
+
+
+def add_serving_hook(app, stage, func):
+    """Register a hook for scripts/serve.py: 'warmup', 'post_fork' or 'shutdown'"""
+    app.extensions.setdefault('serving_hooks', {}).setdefault(stage, []).append(func)
+
+
+def limit_serving_workers(app, count, reason):
+    """Cap the number of server workers scripts/serve.py starts"""
+    current = app.extensions.get('serving_max_workers')
+    if current is None or count < current[0]:
+        app.extensions['serving_max_workers'] = (count, reason)
+
+
+def run_after_fork(state, func):
+    """
+    Run a startup step that owns threads, processes or connections.
+    When the production launcher preloads the app before forking its
+    workers, the step is deferred to each server worker instead.
+    """
+    if os.getenv('SERVICE_PRELOAD_APP'):
+        add_serving_hook(state.app, 'post_fork', func)
+    else:
+        func()
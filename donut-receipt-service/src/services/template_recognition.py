@@ -0,0 +1,445 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Downscaled grayscale grid compared against each template's layout
+LAYOUT_SIZE = (36, 72)
+# Glyph shapes are compared as GLYPH_SIZE-square bitmaps stretched to the glyph's
+# bounds; its size and height above the baseline are compared separately
+GLYPH_SIZE = 16
+GEOMETRY_WEIGHT = 1.0
+# Size differences are relative to the larger glyph, but at least this fraction of
+# the region height, so a pixel more or less of a '.' does not count for much
+MIN_GLYPH_EXTENT = 0.25
+# Stretched glyph pixels at least this inked count as ink
+SHAPE_THRESHOLD = [255 if value >= 96 else 0 for value in range(256)]
+# A reference glyph this close to a kept sample of its character adds nothing
+DUPLICATE_SAMPLE_DISTANCE = 0.05
+# Screenshots whose aspect ratio differs from a template's by more than this are not compared
+MAX_ASPECT_DIFFERENCE = 0.12
+# Word gap, as a fraction of the box height, for fields whose references show no spaces
+DEFAULT_SPACE_GAP = 0.25
+
+# Result keys of the field kinds; text fields keep their own name
+RESULT_KEYS = {"amount": "extracted_amount", "datetime": "extracted_date"}
+AMOUNT_PATTERN = re.compile(r"\d+(?:\.\d+)?")
+
+
+class TemplateError(ValueError):
+    """A template definition that cannot be built"""
+
+
+def layout_cells(image):
+    """Brightness of the ``LAYOUT_SIZE`` grid cells of an image, row by row"""
+    return list(image.convert("L").resize(LAYOUT_SIZE, Image.Resampling.BOX).tobytes())
+
+
+def box_cells(box):
+    """Indexes of the layout cells overlapped by a relative (left, top, right, bottom) box"""
+    width, height = LAYOUT_SIZE
+    left, top = int(box[0] * width), int(box[1] * height)
+    right, bottom = min(width, int(box[2] * width + 0.999)), min(height, int(box[3] * height + 0.999))
+    return {row * width + column for row in range(top, bottom) for column in range(left, right)}
+
+
+def normalized(values):
+    """Zero-mean, unit-length copy of ``values``, so comparisons ignore brightness and contrast"""
+    mean = sum(values) / len(values)
+    centered = [value - mean for value in values]
+    norm = sum(value * value for value in centered) ** 0.5 or 1.0
+    return [value / norm for value in centered]
+
+
+def ink_mask(region):
+    """
+    Text pixels of a single-line region as a 0/255 image. The background
+    is the region's most common shade; ink is whatever differs from it by
+    at least half the region's contrast, so dark-on-light and light-on-dark
+    text both work.
+    """
+    histogram = region.histogram()
+    background = histogram.index(max(histogram))
+    darkest = next(value for value in range(256) if histogram[value])
+    lightest = next(value for value in range(255, -1, -1) if histogram[value])
+    contrast = max(background - darkest, lightest - background)
+    if contrast < 48:
+        return None
+    threshold = contrast // 2
+    return region.point([255 if abs(value - background) > threshold else 0 for value in range(256)])
+
+
+def ink_runs(profile):
+    """(start, end) of the runs of non-zero values in a projection profile"""
+    runs, start = [], None
+    for index, value in enumerate(profile):
+        if value and start is None:
+            start = index
+        elif not value and start is not None:
+            runs.append((start, index))
+            start = None
+    if start is not None:
+        runs.append((start, len(profile)))
+    return runs
+
+
+def segment_line(region):
+    """
+    Glyphs of a single line of text as (left, right, top, bottom) boxes,
+    left to right, and the region's ink mask. Glyphs are separated by blank
+    columns, so characters that touch come out as one glyph.
+    """
+    mask = ink_mask(region)
+    if mask is None or mask.getbbox() is None:
+        return [], mask
+    columns = list(mask.resize((mask.width, 1), Image.Resampling.BOX).tobytes())
+    boxes = []
+    for left, right in ink_runs(columns):
+        _, top, _, bottom = mask.crop((left, 0, right, mask.height)).getbbox()
+        boxes.append((left, right, top, bottom))
+    return boxes, mask
+
+
+def glyph_features(mask, box, baseline):
+    """
+    (shape, width, height, drop, gap) of one glyph. The shape is its bitmap
+    stretched to ``GLYPH_SIZE`` square, as an int of ``GLYPH_SIZE ** 2``
+    bits; the width, height and drop below the baseline are fractions of
+    the region height, so the shapes of '.' and '-' or 'o' and 'O' can
+    match while the glyphs still keep apart. The gap is the fraction of
+    blank rows between its top and bottom, which stretching blurs but
+    which is all that keeps 'i' from 'l'.
+    """
+    left, right, top, bottom = box
+    glyph = mask.crop((left, top, right, bottom))
+    shape = glyph.resize((GLYPH_SIZE, GLYPH_SIZE), Image.Resampling.BOX)
+    bits = int.from_bytes(shape.point(SHAPE_THRESHOLD).convert("1").tobytes(), "big")
+    rows = glyph.resize((1, glyph.height), Image.Resampling.BOX).tobytes()
+    return (bits, (right - left) / mask.height, (bottom - top) / mask.height, (bottom - baseline) / mask.height,
+            rows.count(0) / len(rows))
+
+
+def line_glyphs(region):
+    """
+    Glyph features of a line of text and the blank gap before each glyph,
+    as a fraction of the region height. The baseline is the median glyph
+    bottom.
+    """
+    boxes, mask = segment_line(region)
+    if not boxes:
+        return [], []
+    baseline = sorted(box[3] for box in boxes)[len(boxes) // 2]
+    gaps = [0.0] + [(box[0] - previous[1]) / mask.height for previous, box in zip(boxes, boxes[1:])]
+    return [glyph_features(mask, box, baseline) for box in boxes], gaps
+
+
+def geometry_distance(first, second):
+    """Size and baseline differences of two glyphs relative to the larger one, plus their gap difference"""
+    extent = max(first[1], first[2], second[1], second[2], MIN_GLYPH_EXTENT)
+    size = abs(first[1] - second[1]) + abs(first[2] - second[2]) + abs(first[3] - second[3])
+    return GEOMETRY_WEIGHT * (size / extent + abs(first[4] - second[4]))
+
+
+def glyph_distance(first, second):
+    """
+    Distance of two glyphs' features; 0 for identical glyphs. The shape
+    part is the differing pixels over the inked pixels, to which the
+    geometry distance is added.
+    """
+    shape = (first[0] ^ second[0]).bit_count() / max(1, first[0].bit_count() + second[0].bit_count())
+    return shape + geometry_distance(first, second)
+
+
+class GlyphBank:
+    """Glyph bitmaps seen in reference screenshots, by the character they showed"""
+
+    def __init__(self, max_samples=8):
+        self.max_samples = max_samples
+        self.samples = {}
+
+    def __len__(self):
+        return len(self.samples)
+
+    def add(self, glyph, char):
+        samples = self.samples.setdefault(char, [])
+        if len(samples) < self.max_samples and all(glyph_distance(glyph, sample) > DUPLICATE_SAMPLE_DISTANCE
+                                                   for sample in samples):
+            samples.append(glyph)
+
+    def read(self, glyph):
+        """
+        (character, score, margin) of the closest known glyph: score 1.0 is
+        an exact match, and the margin is how much better it scores than
+        the closest other character. Samples are tried by geometry, which
+        bounds the distance from below, so most shapes are never compared.
+        """
+        candidates = sorted((geometry_distance(glyph, sample), char, sample)
+                            for char, samples in self.samples.items() for sample in samples)
+        distances = {}
+        for geometry, char, sample in candidates:
+            if len(distances) >= 2 and geometry >= sorted(distances.values())[1]:
+                break
+            distance = glyph_distance(glyph, sample)
+            if distance < distances.get(char, float("inf")):
+                distances[char] = distance
+        if not distances:
+            return None, 0.0, 0.0
+        ranked = sorted(distances, key=distances.get)
+        margin = distances[ranked[1]] - distances[ranked[0]] if len(ranked) > 1 else 1.0
+        return ranked[0], max(0.0, 1.0 - distances[ranked[0]]), margin
+
+
+class ScreenshotTemplate:
+    """
+    One fixed screenshot layout: where its fields are and how they read.
+
+    Built from a definition and one or more reference screenshots with the
+    values they show. The layout signature is the references' mean layout
+    grid without the field (and ``ignore``, e.g. status bar) cells, which
+    change from one screenshot to the next. Each field's glyph bank and
+    word gap are learnt from its reference values, so a field can only
+    read characters that appear in it in some reference.
+    """
+
+    def __init__(self, definition, references):
+        self.name = definition["name"]
+        self.document_type = definition.get("document_type", "payment")
+        self.payment_method = definition.get("payment_method")
+        self.fields = definition["fields"]
+        if not references:
+            raise TemplateError(f"Template {self.name} has no reference screenshots")
+
+        masked = set()
+        for box in [field["box"] for field in self.fields.values()] + definition.get("ignore", []):
+            masked |= box_cells(box)
+        self.cells = [index for index in range(LAYOUT_SIZE[0] * LAYOUT_SIZE[1]) if index not in masked]
+        self.aspect = references[0][0].height / references[0][0].width
+
+        totals = [0] * len(self.cells)
+        self.glyphs = {self._bank_name(field_name): GlyphBank() for field_name in self.fields}
+        gaps = {field_name: ([], []) for field_name in self.fields}
+        for image, values in references:
+            grid = layout_cells(image)
+            for position, index in enumerate(self.cells):
+                totals[position] += grid[index]
+            for field_name, value in values.items():
+                self._learn(image, field_name, value, gaps)
+        self.signature = normalized([total / len(references) for total in totals])
+        self.space_gaps = {field_name: self._space_gap(*field_gaps) for field_name, field_gaps in gaps.items()
+                           if self.fields[field_name].get("kind", "text") == "text"}
+
+    def _bank_name(self, field_name):
+        """Fields in the same font can share a glyph bank by naming it in ``glyphs``"""
+        return self.fields[field_name].get("glyphs", field_name)
+
+    def _region(self, image, field_name):
+        left, top, right, bottom = self.fields[field_name]["box"]
+        return image.crop((round(left * image.width), round(top * image.height),
+                           round(right * image.width), round(bottom * image.height))).convert("L")
+
+    def _learn(self, image, field_name, value, gaps):
+        glyphs, glyph_gaps = line_glyphs(self._region(image, field_name))
+        chars = [(char, index > 0 and value[index - 1].isspace())
+                 for index, char in enumerate(value) if not char.isspace()]
+        if len(glyphs) != len(chars):
+            raise TemplateError(f"Template {self.name}: field {field_name} shows {len(glyphs)} glyphs "
+                                f"but its reference value {value!r} has {len(chars)} characters")
+        for glyph, gap, (char, spaced) in zip(glyphs, glyph_gaps, chars):
+            self.glyphs[self._bank_name(field_name)].add(glyph, char)
+            gaps[field_name][spaced].append(gap)
+
+    def _space_gap(self, letter_gaps, word_gaps):
+        """
+        (widest letter gap, narrowest word gap) of a field's references. A
+        gap between the two could be either, so it is read as uncertain.
+        """
+        widest = max(letter_gaps, default=0.0)
+        if not word_gaps:
+            threshold = max(DEFAULT_SPACE_GAP, widest * 1.5)
+            return threshold, threshold
+        if min(word_gaps) <= widest:
+            raise TemplateError(f"Template {self.name}: word and letter gaps of its references overlap")
+        return widest, min(word_gaps)
+
+    def layout_score(self, image, grid=None):
+        """Correlation of an image's layout with the template's, from -1 to 1; None if the aspect differs"""
+        if abs(image.height / image.width - self.aspect) > MAX_ASPECT_DIFFERENCE * self.aspect:
+            return None
+        grid = grid if grid is not None else layout_cells(image)
+        values = normalized([grid[index] for index in self.cells])
+        return sum(value * reference for value, reference in zip(values, self.signature))
+
+    def read_field(self, image, field_name):
+        """
+        (text, score, margin) of a field, the score and margin being its
+        worst glyph's. Only text fields read word gaps, amounts and dates
+        parse without them; a gap that may or may not be a word gap,
+        allowing a pixel for rounding, zeroes the margin.
+        """
+        text, score, margin = [], 1.0, 1.0
+        region = self._region(image, field_name)
+        letter_gap, word_gap = self.space_gaps.get(field_name, (None, None))
+        glyphs, gaps = line_glyphs(region)
+        for glyph, gap in zip(glyphs, gaps):
+            if word_gap is not None and gap >= word_gap + 1 / region.height:
+                text.append(" ")
+            elif word_gap is not None and gap > letter_gap:
+                margin = 0.0
+            char, glyph_score, glyph_margin = self.glyphs[self._bank_name(field_name)].read(glyph)
+            text.append(char or "?")
+            score, margin = min(score, glyph_score), min(margin, glyph_margin)
+        if not glyphs:
+            return "", 0.0, 0.0
+        return "".join(text), score, margin
+
+    def parse(self, field_name, text):
+        """Field value from its text, or None if the text does not parse"""
+        field = self.fields[field_name]
+        kind = field.get("kind", "text")
+        if kind == "amount":
+            match = AMOUNT_PATTERN.search(text.replace(",", ""))
+            return float(match.group()) if match else None
+        if kind == "datetime":
+            try:
+                parsed = datetime.strptime(text, field.get("format", "%Y-%m-%d %H:%M:%S").replace(" ", ""))
+            except ValueError:
+                return None
+            return parsed.isoformat() + field.get("timezone", "Z")
+        return text.strip() or None
+
+
+class TemplateRecognizer:
+    """
+    Fast path for screenshots of known fixed layouts.
+
+    A screenshot is compared with every template of its document type on a
+    ``LAYOUT_SIZE`` grayscale grid; when the best layout correlation reaches
+    ``min_layout_score``, its fields are cut from the template's regions and
+    read glyph by glyph against the template's glyph banks. The result is
+    returned only if every field parses, its least certain glyph scores at
+    least ``min_glyph_score`` and no glyph is within ``min_glyph_margin`` of
+    reading as another character (as 'l' and 'I' often are); otherwise the
+    caller runs the full model.
+
+    Templates are loaded from ``*.json`` definitions in a directory:
+
+        {"name": "wechat_pay_success", "document_type": "payment",
+         "payment_method": "WeChat Pay",
+         "fields": {"amount": {"box": [0.1, 0.31, 0.9, 0.36], "kind": "amount"},
+                    "time": {"box": [...], "kind": "datetime",
+                             "format": "%Y-%m-%d %H:%M:%S", "timezone": "+08:00"},
+                    "payer": {"box": [...], "glyphs": "names"},
+                    "receiver": {"box": [...], "glyphs": "names"}},
+         "ignore": [[0, 0, 1, 0.04]],
+         "references": [{"image": "wechat_1.png",
+                         "values": {"amount": "-128.50", "time": "2025-01-19 10:35:00", ...}}]}
+
+    Boxes are (left, top, right, bottom) fractions of the screenshot and
+    hold one line of text each. References should show every character the
+    fields can contain between them.
+    """
+
+    def __init__(self, min_layout_score=0.9, min_glyph_score=0.75, min_glyph_margin=0.05):
+        self.min_layout_score = min_layout_score
+        self.min_glyph_score = min_glyph_score
+        self.min_glyph_margin = min_glyph_margin
+        self.templates = []
+        self._lock = threading.Lock()
+        self.paths = {"template": 0, "model": 0}
+        self.fallbacks = {"no_template": 0, "layout": 0, "fields": 0}
+
+    def load_directory(self, directory):
+        """Build every template defined in ``directory``; returns the number loaded"""
+        loaded = 0
+        for file_name in sorted(os.listdir(directory)):
+            if not file_name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(directory, file_name)) as f:
+                    definition = json.load(f)
+                references = []
+                for reference in definition.get("references", []):
+                    with Image.open(os.path.join(directory, reference["image"])) as image:
+                        references.append((image.convert("L"), reference["values"]))
+                self.add(ScreenshotTemplate(definition, references))
+                loaded += 1
+            except Exception as e:
+                logger.error(f"Error loading screenshot template {file_name}: {str(e)}")
+        return loaded
+
+    def add(self, template):
+        with self._lock:
+            self.templates = [existing for existing in self.templates if existing.name != template.name]
+            self.templates.append(template)
+
+    def match(self, image, document_type):
+        """(template, layout score) of the best matching template of a document type, or (None, None)"""
+        best, best_score = None, None
+        grid = None
+        for template in self.templates:
+            if template.document_type != document_type:
+                continue
+            grid = grid if grid is not None else layout_cells(image)
+            score = template.layout_score(image, grid)
+            if score is not None and (best_score is None or score > best_score):
+                best, best_score = template, score
+        return best, best_score
+
+    def recognize(self, image, document_type):
+        """
+        Result dict for a screenshot of a known template, or None when the
+        full model should recognize it. Also counts which path served it.
+        """
+        started = time.perf_counter()
+        template, layout_score = self.match(image, document_type)
+        if template is None or layout_score < self.min_layout_score:
+            self._count("model", "no_template" if template is None else "layout")
+            return None
+
+        result = {"payment_method": template.payment_method} if template.payment_method else {}
+        texts, glyph_score = {}, 1.0
+        for field_name, field in template.fields.items():
+            text, score, margin = template.read_field(image, field_name)
+            value = template.parse(field_name, text)
+            if value is None or score < self.min_glyph_score or margin < self.min_glyph_margin:
+                self._count("model", "fields")
+                return None
+            key = RESULT_KEYS.get(field.get("kind", "text"), field_name)
+            texts[key] = text
+            glyph_score = min(glyph_score, score)
+            result[key] = value
+        self._count("template")
+        result.update({
+            "confidence": round(min(layout_score, glyph_score), 4),
+            "raw_data": json.dumps({
+                "template": template.name,
+                "layout_score": round(layout_score, 4),
+                "fields": texts,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+            }),
+        })
+        return result
+
+    def _count(self, path, reason=None):
+        with self._lock:
+            self.paths[path] += 1
+            if reason is not None:
+                self.fallbacks[reason] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "templates": [template.name for template in self.templates],
+                "min_layout_score": self.min_layout_score,
+                "min_glyph_score": self.min_glyph_score,
+                "min_glyph_margin": self.min_glyph_margin,
+                "paths": dict(self.paths),
+                "fallbacks": dict(self.fallbacks),
+            }
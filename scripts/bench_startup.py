@@ -0,0 +1,133 @@
+"""
+Cold-start benchmark for the Python services.
+
+For each service it measures, over ``--runs`` fresh interpreters:
+
+- import: seconds to ``import src.main`` (the app and its blueprints)
+- live: seconds from launching scripts/serve.py until the liveness
+  endpoint (``/health``) first answers 200
+- ready: seconds until the readiness endpoint (``/ready``) answers 200,
+  i.e. heavy modules, the model and the chain connection are loaded
+
+A service that fails to import is reported with its error instead. The
+web3 service only becomes ready with a reachable node (WEB3_PROVIDER_URL).
+
+    python scripts/bench_startup.py
+    python scripts/bench_startup.py web3-service --runs 5 --mode production --workers 2
+"""
+import argparse
+import http.client
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(SCRIPTS_DIR)
+
+SERVICES = {
+    'donut-receipt-service': {'port': 8000, 'live': '/api/health', 'ready': '/api/ready'},
+    'donut-payment-service': {'port': 8001, 'live': '/api/health', 'ready': '/api/ready'},
+    'web3-service': {'port': 5002, 'live': '/api/web3/health', 'ready': '/api/web3/ready'},
+}
+
+IMPORT_SNIPPET = """
+import sys, time
+sys.path.insert(0, sys.argv[1])
+started = time.perf_counter()
+import src.main
+print(time.perf_counter() - started)
+"""
+
+
+def measure_import(service):
+    """Seconds to import the service's app in a fresh interpreter; raises RuntimeError on failure"""
+    result = subprocess.run(
+        [sys.executable, '-c', IMPORT_SNIPPET, os.path.join(REPO_ROOT, service)],
+        capture_output=True, text=True, timeout=120,
+    )
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        raise RuntimeError(lines[-1] if lines else f"exit status {result.returncode}")
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def get_status(port, path):
+    try:
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+        conn.request('GET', path)
+        status = conn.getresponse().status
+        conn.close()
+        return status
+    except OSError:
+        return None
+
+
+def measure_serving(service, args):
+    """Launch the service and return (seconds until live, seconds until ready or None)"""
+    spec = SERVICES[service]
+    port = args.port or spec['port']
+    command = [sys.executable, os.path.join(SCRIPTS_DIR, 'serve.py'), service,
+               '--mode', args.mode, '--host', '127.0.0.1', '--port', str(port),
+               '--workers', str(args.workers), '--no-reload']
+    started = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    live = ready = None
+    try:
+        deadline = started + args.timeout
+        while time.perf_counter() < deadline and process.poll() is None:
+            if live is None and get_status(port, spec['live']) == 200:
+                live = time.perf_counter() - started
+            if live is not None and get_status(port, spec['ready']) == 200:
+                ready = time.perf_counter() - started
+                break
+            time.sleep(args.poll_interval)
+    finally:
+        if process.poll() is None:
+            os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=60)
+    return live, ready
+
+
+def summarize(samples):
+    samples = [sample for sample in samples if sample is not None]
+    if not samples:
+        return '-'
+    return f"{statistics.median(samples):.3f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('services', nargs='*', metavar='service', help=f"defaults to all of: {', '.join(sorted(SERVICES))}")
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--mode', choices=['dev', 'production'], default='dev')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--port', type=int, help='override the service default port')
+    parser.add_argument('--timeout', type=float, default=30, help='seconds to wait for readiness')
+    parser.add_argument('--poll-interval', type=float, default=0.01)
+    args = parser.parse_args()
+    unknown = [service for service in args.services if service not in SERVICES]
+    if unknown:
+        parser.error(f"unknown service: {', '.join(unknown)}")
+
+    print(f"median of {args.runs} runs, {args.mode} mode, seconds")
+    print(f"{'service':<24} {'import':>8} {'live':>8} {'ready':>8} {'not ready':>10}")
+    for service in args.services or sorted(SERVICES):
+        try:
+            imports = [measure_import(service) for _ in range(args.runs)]
+        except RuntimeError as e:
+            print(f"{service:<24} import failed: {e}")
+            continue
+        lives, readies = [], []
+        for _ in range(args.runs):
+            live, ready = measure_serving(service, args)
+            lives.append(live)
+            readies.append(ready)
+        not_ready = sum(1 for ready in readies if ready is None)
+        print(f"{service:<24} {summarize(imports):>8} {summarize(lives):>8} {summarize(readies):>8} {not_ready:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""
+Check that the modules vendored into several services are still identical.
+
+Each service is deployed from its own directory, so modules they share
+are copied into each one's ``src/services``. Edit one copy, copy it over
+the others, and run this before committing; it exits non-zero and lists
+the copies that differ from the first one.
+
+    python scripts/check_vendored.py
+"""
+import filecmp
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Module path within a service -> services holding a copy
+VENDORED = {
+    'src/services/instrumentation.py': ['donut-receipt-service', 'web3-service'],
+    'src/services/serving.py': ['donut-receipt-service', 'web3-service'],
+}
+
+
+def main():
+    failed = False
+    for module, services in VENDORED.items():
+        first, *others = [os.path.join(REPO_ROOT, service, module) for service in services]
+        differing = [path for path in others if not filecmp.cmp(first, path, shallow=False)]
+        if differing:
+            failed = True
+            print(f"DIFFERS {module}: {', '.join(os.path.relpath(path, REPO_ROOT) for path in differing)} "
+                  f"!= {os.path.relpath(first, REPO_ROOT)}")
+        else:
+            print(f"ok      {module} ({len(services)} copies)")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+"""
+Load-test harness for the Python services.
+
+Drives a closed-loop load of ``--concurrency`` keep-alive clients against one
+endpoint and reports requests/sec and p50/p95/p99 latency.
+
+Against a running service:
+
+    python scripts/loadtest.py recognize --base-url http://localhost:8000
+    python scripts/loadtest.py web3-health --base-url http://localhost:5002
+
+Start the service with scripts/serve.py in dev and then production mode and
+compare the two:
+
+    python scripts/loadtest.py recognize --compare --workers 4
+"""
+import argparse
+import http.client
+import io
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+TARGETS = {
+    'recognize': {'service': 'donut-receipt-service', 'method': 'POST', 'path': '/api/recognize/receipt'},
+    'web3-health': {'service': 'web3-service', 'method': 'GET', 'path': '/api/web3/health'},
+}
+
+
+def make_receipt_image(width=1200, height=1600):
+    """A synthetic receipt photo: a light page with dark text lines on a grey table"""
+    from PIL import Image, ImageDraw
+
+    image = Image.new('RGB', (width, height), (90, 90, 90))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((width // 6, height // 10, width * 5 // 6, height * 9 // 10), fill=(245, 245, 240))
+    for row in range(height // 10 + 40, height * 9 // 10 - 40, 48):
+        draw.rectangle((width // 6 + 40, row, width * 4 // 6, row + 18), fill=(30, 30, 30))
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def percentile(ordered, pct):
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_load(base_url, target, concurrency, duration, warmup, body_factory=None):
+    parsed = urlparse(base_url)
+    spec = TARGETS[target]
+    latencies, errors = [], []
+    lock = threading.Lock()
+    start_at = time.monotonic() + warmup
+    stop_at = start_at + duration
+
+    def client(index):
+        conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=60)
+        local_latencies, local_errors = [], 0
+        sequence = 0
+        while True:
+            body, headers = body_factory(index, sequence) if body_factory else (None, {})
+            sequence += 1
+            started = time.monotonic()
+            if started >= stop_at:
+                break
+            try:
+                conn.request(spec['method'], spec['path'], body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                ok = response.status < 400
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=60)
+                ok = False
+            finished = time.monotonic()
+            if started >= start_at:
+                if ok:
+                    local_latencies.append((finished - started) * 1000)
+                else:
+                    local_errors += 1
+        conn.close()
+        with lock:
+            latencies.extend(local_latencies)
+            errors.append(local_errors)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'rps': round(len(latencies) / duration, 1),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+    }
+
+
+def recognize_body_factory():
+    """Every request uploads distinct bytes so the result cache does not short-circuit recognition"""
+    base = make_receipt_image()
+
+    def factory(index, sequence):
+        # Trailing bytes after the JPEG end marker change the hash, not the pixels
+        return base + index.to_bytes(4, 'big') + sequence.to_bytes(8, 'big'), {'Content-Type': 'image/jpeg'}
+    return factory
+
+
+def wait_until_ready(base_url, path, timeout=60):
+    parsed = urlparse(base_url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=2)
+            conn.request('GET', path)
+            if conn.getresponse().status < 500:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"Service at {base_url} did not become ready")
+
+
+def run_compare(args, body_factory):
+    spec = TARGETS[args.target]
+    health_path = '/api/web3/health' if spec['service'] == 'web3-service' else '/api/health'
+    base_url = f"http://127.0.0.1:{args.port}"
+    rows = []
+    for mode in ('dev', 'production'):
+        command = [sys.executable, os.path.join(SCRIPTS_DIR, 'serve.py'), spec['service'],
+                   '--mode', mode, '--host', '127.0.0.1', '--port', str(args.port),
+                   '--workers', str(args.workers), '--threads', str(args.threads)]
+        env = dict(os.environ, PYTHONUNBUFFERED='1')
+        process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                   start_new_session=True)
+        try:
+            wait_until_ready(base_url, health_path)
+            result = run_load(base_url, args.target, args.concurrency, args.duration, args.warmup, body_factory)
+            rows.append(dict(result, mode=mode))
+        finally:
+            os.killpg(process.pid, signal.SIGTERM)
+            process.wait(timeout=60)
+    return rows
+
+
+def print_rows(rows):
+    print(f"{'mode':<12} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for row in rows:
+        print(f"{row.get('mode', '-'):<12} {row['requests']:>9} {row['errors']:>7} {row['rps']:>9} "
+              f"{row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('target', choices=sorted(TARGETS))
+    parser.add_argument('--base-url', help='load an already running service instead of starting one')
+    parser.add_argument('--compare', action='store_true', help='start the service in dev and production mode')
+    parser.add_argument('--port', type=int, default=18080, help='port used by --compare')
+    parser.add_argument('--workers', type=int, default=4, help='production workers used by --compare')
+    parser.add_argument('--threads', type=int, default=4, help='threads per production worker used by --compare')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--warmup', type=float, default=2)
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    body_factory = recognize_body_factory() if args.target == 'recognize' else None
+    if args.compare:
+        rows = run_compare(args, body_factory)
+    elif args.base_url:
+        rows = [run_load(args.base_url, args.target, args.concurrency, args.duration, args.warmup, body_factory)]
+    else:
+        parser.error('pass --base-url or --compare')
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print_rows(rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""
+Shared launcher for the Python services.
+
+Development mode runs the Flask/Werkzeug server exactly as ``src/main.py``
+does. Production mode serves the same app with gunicorn (``pip install
+gunicorn``): the app is imported and warmed up once in the master, then
+forked into multi-threaded workers that share its memory pages.
+
+    python scripts/serve.py donut-receipt-service
+    python scripts/serve.py web3-service --mode production --workers 4 --threads 8
+
+Services may register hooks in ``app.extensions['serving_hooks']``:
+
+- ``warmup``: run in the master before forking, e.g. to load a model
+- ``post_fork``: run in each worker, for threads, processes and connections
+- ``shutdown``: run in each worker on exit, after in-flight requests drain
+
+and cap the number of workers with ``app.extensions['serving_max_workers']``,
+a ``(count, reason)`` pair, when their state must live in one process.
+"""
+import argparse
+import importlib
+import logging
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_PORTS = {
+    'donut-receipt-service': 8000,
+    'donut-payment-service': 8001,
+    'web3-service': 5002,
+}
+
+LOG_FORMAT = '%(levelname)s:%(name)s:%(request_id)s:%(message)s'
+
+logger = logging.getLogger("serve")
+
+
+def load_app(service):
+    """Import ``src.main`` of a service directory and return its Flask app"""
+    service_dir = os.path.join(REPO_ROOT, service)
+    if not os.path.isdir(os.path.join(service_dir, 'src')):
+        raise SystemExit(f"Unknown service: {service}")
+    sys.path.insert(0, service_dir)
+    return importlib.import_module('src.main').app
+
+
+def run_hooks(app, stage):
+    for hook in app.extensions.get('serving_hooks', {}).get(stage, []):
+        try:
+            hook()
+        except Exception as e:
+            logger.error(f"Error in {stage} hook {getattr(hook, '__name__', hook)}: {str(e)}")
+
+
+def serve_dev(app, host, port, reload=True):
+    app.run(host=host, port=port, debug=True, use_reloader=reload)
+
+
+def limit_workers(app, args):
+    max_workers, reason = app.extensions.get('serving_max_workers', (None, None))
+    if max_workers is not None and args.workers > max_workers:
+        logger.warning(f"Starting {max_workers} worker(s) instead of {args.workers}: {reason}")
+        args.workers = max_workers
+
+
+def serve_production(app, args):
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise SystemExit("Production mode requires gunicorn: pip install gunicorn")
+
+    class ServiceApplication(BaseApplication):
+        def __init__(self, application, options):
+            self.application = application
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+
+    options = {
+        'bind': f"{args.host}:{args.port}",
+        'workers': args.workers,
+        'worker_class': 'gthread',
+        'threads': args.threads,
+        'keepalive': args.keepalive,
+        'timeout': args.timeout,
+        'graceful_timeout': args.graceful_timeout,
+        'backlog': args.backlog,
+        'max_requests': args.max_requests,
+        'max_requests_jitter': args.max_requests // 10 if args.max_requests else 0,
+        'preload_app': True,
+        'accesslog': '-' if args.access_log else None,
+        'post_fork': lambda server, worker: run_hooks(app, 'post_fork'),
+        'worker_exit': lambda server, worker: run_hooks(app, 'shutdown'),
+    }
+    ServiceApplication(app, options).run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('service', choices=sorted(DEFAULT_PORTS))
+    parser.add_argument('--mode', choices=['dev', 'production'], default=os.getenv('SERVICE_MODE', 'dev'))
+    parser.add_argument('--host', default=os.getenv('SERVICE_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int)
+    parser.add_argument('--workers', type=int, default=int(os.getenv('SERVICE_WORKERS', str(os.cpu_count() or 1))))
+    parser.add_argument('--threads', type=int, default=int(os.getenv('SERVICE_THREADS', '4')))
+    parser.add_argument('--keepalive', type=int, default=int(os.getenv('SERVICE_KEEPALIVE', '5')),
+                        help='seconds an idle keep-alive connection is held open')
+    parser.add_argument('--timeout', type=int, default=int(os.getenv('SERVICE_TIMEOUT', '120')),
+                        help='seconds before a silent worker is killed and restarted')
+    parser.add_argument('--graceful-timeout', type=int, default=int(os.getenv('SERVICE_GRACEFUL_TIMEOUT', '30')),
+                        help='seconds in-flight requests get to finish on shutdown')
+    parser.add_argument('--backlog', type=int, default=2048)
+    parser.add_argument('--max-requests', type=int, default=0,
+                        help='recycle a worker after this many requests (0 disables)')
+    parser.add_argument('--access-log', action='store_true')
+    parser.add_argument('--no-reload', action='store_true',
+                        help='dev mode: serve from this process instead of a code-reloading child')
+    args = parser.parse_args()
+    args.port = args.port or DEFAULT_PORTS[args.service]
+
+    # Services tag log records with the X-Request-ID of the request being handled
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT, defaults={'request_id': '-'}))
+    logging.basicConfig(level=logging.INFO, handlers=[handler])
+    if args.mode == 'production':
+        # Tell the services their startup steps must wait for post_fork
+        os.environ['SERVICE_PRELOAD_APP'] = '1'
+
+    app = load_app(args.service)
+    if args.mode == 'dev':
+        serve_dev(app, args.host, args.port, reload=not args.no_reload)
+        return
+
+    limit_workers(app, args)
+    run_hooks(app, 'warmup')
+    serve_production(app, args)
+
+
+if __name__ == '__main__':
+    main()
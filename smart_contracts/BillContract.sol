@@ -34,6 +34,16 @@ contract BillContract {
         mapping(address => uint256) beneficiaryAmounts;
     }
     
+    struct TransactionInput {
+        string transactionId;
+        string billId;
+        uint256 amount;
+        string description;
+        string transactionType;
+        address[] beneficiaries;
+        uint256[] beneficiaryAmounts;
+    }
+    
     mapping(string => Bill) public bills;
     mapping(string => Transaction) public transactions;
     mapping(address => string[]) public userBills;
@@ -123,49 +133,64 @@ contract BillContract {
         string memory transactionType,
         address[] memory beneficiaries,
         uint256[] memory beneficiaryAmounts
-    ) public billExists(billId) {
-        require(bytes(transactions[transactionId].transactionId).length == 0, "Transaction already exists");
-        require(beneficiaries.length == beneficiaryAmounts.length, "Beneficiaries and amounts length mismatch");
+    ) public {
+        _addTransaction(TransactionInput(
+            transactionId, billId, amount, description, transactionType, beneficiaries, beneficiaryAmounts
+        ));
+    }
+    
+    /**
+     * @dev Add several transactions in one transaction; reverts if any of them is invalid
+     */
+    function addTransactions(TransactionInput[] memory inputs) public {
+        for (uint i = 0; i < inputs.length; i++) {
+            _addTransaction(inputs[i]);
+        }
+    }
+    
+    function _addTransaction(TransactionInput memory input) internal billExists(input.billId) {
+        require(bytes(transactions[input.transactionId].transactionId).length == 0, "Transaction already exists");
+        require(input.beneficiaries.length == input.beneficiaryAmounts.length, "Beneficiaries and amounts length mismatch");
         
         // Verify total beneficiary amounts equal transaction amount
         uint256 totalBeneficiaryAmount = 0;
-        for (uint i = 0; i < beneficiaryAmounts.length; i++) {
-            totalBeneficiaryAmount += beneficiaryAmounts[i];
+        for (uint i = 0; i < input.beneficiaryAmounts.length; i++) {
+            totalBeneficiaryAmount += input.beneficiaryAmounts[i];
         }
-        require(totalBeneficiaryAmount == amount, "Total beneficiary amounts must equal transaction amount");
+        require(totalBeneficiaryAmount == input.amount, "Total beneficiary amounts must equal transaction amount");
         
-        Transaction storage newTransaction = transactions[transactionId];
-        newTransaction.transactionId = transactionId;
-        newTransaction.billId = billId;
+        Transaction storage newTransaction = transactions[input.transactionId];
+        newTransaction.transactionId = input.transactionId;
+        newTransaction.billId = input.billId;
         newTransaction.payer = msg.sender;
-        newTransaction.amount = amount;
-        newTransaction.description = description;
-        newTransaction.transactionType = transactionType;
+        newTransaction.amount = input.amount;
+        newTransaction.description = input.description;
+        newTransaction.transactionType = input.transactionType;
         newTransaction.timestamp = block.timestamp;
         newTransaction.isSettled = false;
-        newTransaction.beneficiaries = beneficiaries;
+        newTransaction.beneficiaries = input.beneficiaries;
         
         // Set beneficiary amounts
-        for (uint i = 0; i < beneficiaries.length; i++) {
-            newTransaction.beneficiaryAmounts[beneficiaries[i]] = beneficiaryAmounts[i];
+        for (uint i = 0; i < input.beneficiaries.length; i++) {
+            newTransaction.beneficiaryAmounts[input.beneficiaries[i]] = input.beneficiaryAmounts[i];
         }
         
         // Update bill total amount
-        Bill storage bill = bills[billId];
-        bill.totalAmount += amount;
+        Bill storage bill = bills[input.billId];
+        bill.totalAmount += input.amount;
         
         // Update member shares
-        for (uint i = 0; i < beneficiaries.length; i++) {
-            bill.memberShares[beneficiaries[i]] += beneficiaryAmounts[i];
+        for (uint i = 0; i < input.beneficiaries.length; i++) {
+            bill.memberShares[input.beneficiaries[i]] += input.beneficiaryAmounts[i];
         }
         
         // Update payer's paid amount
-        bill.memberPaid[msg.sender] += amount;
+        bill.memberPaid[msg.sender] += input.amount;
         
-        allTransactionIds.push(transactionId);
-        userTransactions[msg.sender].push(transactionId);
+        allTransactionIds.push(input.transactionId);
+        userTransactions[msg.sender].push(input.transactionId);
         
-        emit TransactionAdded(transactionId, billId, msg.sender, amount);
+        emit TransactionAdded(input.transactionId, input.billId, msg.sender, input.amount);
     }
     
     /**
@@ -24,12 +24,32 @@ contract PaymentContract {
         uint256 verifiedAt;
     }
     
+    struct PaymentInput {
+        string paymentId;
+        string transactionId;
+        address receiver;
+        uint256 amount;
+        string currency;
+        string paymentMethod;
+        uint256 paymentDate;
+        string notes;
+        string imageHash;
+    }
+    
     mapping(string => PaymentRecord) public paymentRecords;
     mapping(address => string[]) public userPayments;
     mapping(address => string[]) public userReceivedPayments;
     
     string[] public allPaymentIds;
     
+    // Merkle roots of batches of (paymentId, imageHash) leaves, anchored in
+    // place of storing each image hash; packed into one storage slot
+    struct RootAnchor {
+        address submitter;
+        uint96 anchoredAt;
+    }
+    mapping(bytes32 => RootAnchor) public rootAnchors;
+    
     event PaymentRecorded(
         string indexed paymentId, 
         address indexed payer, 
@@ -38,6 +58,7 @@ contract PaymentContract {
     );
     event PaymentVerified(string indexed paymentId, address indexed verifier);
     event PaymentStatusUpdated(string indexed paymentId, string status);
+    event RootAnchored(bytes32 indexed root, address indexed submitter, uint256 leafCount);
     
     modifier paymentExists(string memory paymentId) {
         require(bytes(paymentRecords[paymentId].paymentId).length > 0, "Payment record does not exist");
@@ -67,30 +88,81 @@ contract PaymentContract {
         string memory notes,
         string memory imageHash
     ) public {
-        require(bytes(paymentRecords[paymentId].paymentId).length == 0, "Payment record already exists");
-        require(receiver != address(0), "Invalid receiver address");
-        require(amount > 0, "Payment amount must be greater than 0");
+        _recordPayment(PaymentInput(
+            paymentId, transactionId, receiver, amount, currency, paymentMethod, paymentDate, notes, imageHash
+        ));
+    }
+    
+    /**
+     * @dev Record several payments in one transaction; reverts if any of them is invalid
+     */
+    function recordPayments(PaymentInput[] memory payments) public {
+        for (uint i = 0; i < payments.length; i++) {
+            _recordPayment(payments[i]);
+        }
+    }
+    
+    function _recordPayment(PaymentInput memory input) internal {
+        require(bytes(paymentRecords[input.paymentId].paymentId).length == 0, "Payment record already exists");
+        require(input.receiver != address(0), "Invalid receiver address");
+        require(input.amount > 0, "Payment amount must be greater than 0");
         
-        PaymentRecord storage newPayment = paymentRecords[paymentId];
-        newPayment.paymentId = paymentId;
-        newPayment.transactionId = transactionId;
+        PaymentRecord storage newPayment = paymentRecords[input.paymentId];
+        newPayment.paymentId = input.paymentId;
+        newPayment.transactionId = input.transactionId;
         newPayment.payer = msg.sender;
-        newPayment.receiver = receiver;
-        newPayment.amount = amount;
-        newPayment.currency = currency;
-        newPayment.paymentMethod = paymentMethod;
-        newPayment.paymentDate = paymentDate;
+        newPayment.receiver = input.receiver;
+        newPayment.amount = input.amount;
+        newPayment.currency = input.currency;
+        newPayment.paymentMethod = input.paymentMethod;
+        newPayment.paymentDate = input.paymentDate;
         newPayment.createdAt = block.timestamp;
         newPayment.status = "Completed";
-        newPayment.notes = notes;
-        newPayment.imageHash = imageHash;
+        newPayment.notes = input.notes;
+        newPayment.imageHash = input.imageHash;
         newPayment.isVerified = false;
         
-        allPaymentIds.push(paymentId);
-        userPayments[msg.sender].push(paymentId);
-        userReceivedPayments[receiver].push(paymentId);
+        allPaymentIds.push(input.paymentId);
+        userPayments[msg.sender].push(input.paymentId);
+        userReceivedPayments[input.receiver].push(input.paymentId);
+        
+        emit PaymentRecorded(input.paymentId, msg.sender, input.receiver, input.amount);
+    }
+    
+    /**
+     * @dev Anchor the Merkle root of a batch of payment image hashes
+     */
+    function anchorRoot(bytes32 root, uint256 leafCount) public {
+        require(root != bytes32(0), "Invalid root");
+        require(rootAnchors[root].submitter == address(0), "Root already anchored");
+        require(leafCount > 0, "Batch must not be empty");
+        
+        rootAnchors[root] = RootAnchor(msg.sender, uint96(block.timestamp));
         
-        emit PaymentRecorded(paymentId, msg.sender, receiver, amount);
+        emit RootAnchored(root, msg.sender, leafCount);
+    }
+    
+    /**
+     * @dev Check an image hash against a root anchored by the payment's payer.
+     * Leaves are keccak256(0x00 ++ keccak256(paymentId) ++ keccak256(imageHash))
+     * and nodes keccak256(0x01 ++ lower child ++ higher child).
+     */
+    function verifyImageHash(
+        string memory paymentId,
+        string memory imageHash,
+        bytes32[] memory proof,
+        bytes32 root
+    ) public view paymentExists(paymentId) returns (bool) {
+        if (rootAnchors[root].submitter != paymentRecords[paymentId].payer) {
+            return false;
+        }
+        bytes32 node = keccak256(abi.encodePacked(bytes1(0x00), keccak256(bytes(paymentId)), keccak256(bytes(imageHash))));
+        for (uint256 i = 0; i < proof.length; i++) {
+            node = node < proof[i]
+                ? keccak256(abi.encodePacked(bytes1(0x01), node, proof[i]))
+                : keccak256(abi.encodePacked(bytes1(0x01), proof[i], node));
+        }
+        return node == root;
     }
     
     /**
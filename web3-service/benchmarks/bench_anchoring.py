@@ -0,0 +1,128 @@
+"""
+Cost of anchoring payment image hashes as Merkle roots.
+
+By default it times, for each ``--leaves`` size, hashing the (paymentId,
+imageHash) leaves, building the tree, generating and verifying proofs
+for a sample of payments, and reports the proof size.
+
+With ``--gas`` it also compiles smart_contracts/PaymentContract.sol with
+py-solc-x (``pip install py-solc-x`` and ``python -m solcx.install
+0.8.19``), records ``--records`` payments on an in-memory chain (``pip
+install "web3[tester]"``) or ``--rpc-url`` dev node, once with the image
+hash stored in each record and once with it left empty plus one
+anchorRoot call, and compares the gas per payment.
+
+    python web3-service/benchmarks/bench_anchoring.py --leaves 1000 100000
+    python web3-service/benchmarks/bench_anchoring.py --leaves 100000 --gas --records 200
+"""
+import argparse
+import hashlib
+import os
+import random
+import sys
+import time
+
+SERVICE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_ROOT)
+
+from src.services.merkle import build_levels, inclusion_proof, leaf_hash, verify_proof  # noqa: E402
+
+
+def make_payments(count):
+    # Receipt image hashes are hex SHA-256 digests of the uploaded file
+    return [(f'payment-{index}', hashlib.sha256(f'image-{index}'.encode()).hexdigest()) for index in range(count)]
+
+
+def bench_tree(size, samples, rng):
+    payments = make_payments(size)
+
+    started = time.perf_counter()
+    leaves = [leaf_hash(payment_id, image_hash) for payment_id, image_hash in payments]
+    leaf_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    levels = build_levels(leaves)
+    build_seconds = time.perf_counter() - started
+
+    indexes = [rng.randrange(size) for _ in range(samples)]
+    started = time.perf_counter()
+    proofs = [inclusion_proof(levels, index) for index in indexes]
+    proof_seconds = time.perf_counter() - started
+
+    root = levels[-1][0]
+    started = time.perf_counter()
+    for index, proof in zip(indexes, proofs):
+        payment_id, image_hash = payments[index]
+        if not verify_proof(leaf_hash(payment_id, image_hash), proof, root):
+            raise SystemExit(f'Proof for leaf {index} of {size} does not verify')
+    verify_seconds = time.perf_counter() - started
+
+    return {
+        'leaves': size,
+        'leaf_ms': leaf_seconds * 1000,
+        'build_ms': build_seconds * 1000,
+        'proof_us': proof_seconds / samples * 1e6,
+        'verify_us': verify_seconds / samples * 1e6,
+        'proof_bytes': max(len(proof) for proof in proofs) * 32,
+    }
+
+
+def bench_gas(records, rpc_url, solc_version):
+    from bench_batched_writes import compile_contract, connect, deploy, run_calls
+
+    w3 = connect(rpc_url)
+    w3.eth.default_account = w3.eth.accounts[0]
+    payments = deploy(w3, compile_contract('PaymentContract', solc_version))
+    receiver = w3.eth.accounts[1]
+
+    def record_calls(prefix, image_hashes):
+        return [payments.functions.recordPayment(
+            f'{prefix}-{index}', f'tx-{index}', receiver, 100 + index, 'CNY', 'WeChat Pay',
+            1700000000 + index, 'dinner', image_hash
+        ) for index, image_hash in enumerate(image_hashes)]
+
+    image_hashes = [image_hash for _, image_hash in make_payments(records)]
+    stored_gas, _ = run_calls(w3, record_calls('stored', image_hashes))
+    empty_gas, _ = run_calls(w3, record_calls('anchored', [''] * records))
+
+    leaves = [leaf_hash(f'anchored-{index}', image_hash) for index, image_hash in enumerate(image_hashes)]
+    levels = build_levels(leaves)
+    root = levels[-1][0]
+    anchor_gas, _ = run_calls(w3, [payments.functions.anchorRoot(root, records)])
+
+    sample = records // 2
+    proof = inclusion_proof(levels, sample)
+    if not payments.functions.verifyImageHash(f'anchored-{sample}', image_hashes[sample], proof, root).call():
+        raise SystemExit('verifyImageHash rejected a valid proof')
+
+    return stored_gas / records, (empty_gas + anchor_gas) / records, anchor_gas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--leaves', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--samples', type=int, default=10000, help='proofs generated and verified per size')
+    parser.add_argument('--gas', action='store_true', help='also compare gas per payment on a chain')
+    parser.add_argument('--records', type=int, default=200)
+    parser.add_argument('--rpc-url', help='local dev node; defaults to an in-memory eth-tester chain')
+    parser.add_argument('--solc-version', default='0.8.19')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'leaves':>8} {'leaves ms':>10} {'build ms':>9} {'proof us':>9} {'verify us':>10} {'proof B':>8}")
+    for size in args.leaves:
+        result = bench_tree(size, args.samples, rng)
+        print(f"{result['leaves']:>8} {result['leaf_ms']:>10.1f} {result['build_ms']:>9.1f} "
+              f"{result['proof_us']:>9.2f} {result['verify_us']:>10.2f} {result['proof_bytes']:>8}")
+
+    if args.gas:
+        stored, anchored, anchor_gas = bench_gas(args.records, args.rpc_url, args.solc_version)
+        print(f"\n{args.records} payments")
+        print(f"{'image hash':<22} {'gas/payment':>12}")
+        print(f"{'stored per record':<22} {stored:>12.0f}")
+        print(f"{'anchored root':<22} {anchored:>12.0f}  (anchorRoot: {anchor_gas})")
+
+
+if __name__ == '__main__':
+    main()
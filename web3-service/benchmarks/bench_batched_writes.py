@@ -0,0 +1,114 @@
+"""
+Gas per record and records/sec of single vs batched contract writes.
+
+Compiles smart_contracts/*.sol with py-solc-x (``pip install py-solc-x`` and
+``python -m solcx.install 0.8.19``), deploys them and writes ``--records``
+payments and bill transactions, first one call per record and then through
+recordPayments/addTransactions in batches of ``--batch-size``.
+
+By default the contracts run on an in-memory chain (``pip install
+"web3[tester]"``); pass ``--rpc-url`` to use a local dev node such as anvil
+or hardhat whose first account is unlocked.
+
+    python web3-service/benchmarks/bench_batched_writes.py --records 200 --batch-size 25
+"""
+import argparse
+import os
+import time
+
+from web3 import Web3
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+CONTRACTS_DIR = os.path.join(REPO_ROOT, 'smart_contracts')
+
+
+def compile_contract(name, solc_version):
+    import solcx
+
+    with open(os.path.join(CONTRACTS_DIR, f'{name}.sol')) as f:
+        compiled = solcx.compile_source(f.read(), output_values=['abi', 'bin'], solc_version=solc_version)
+    return compiled[f'<stdin>:{name}']
+
+
+def connect(rpc_url):
+    if rpc_url:
+        return Web3(Web3.HTTPProvider(rpc_url))
+    from web3 import EthereumTesterProvider
+    return Web3(EthereumTesterProvider())
+
+
+def deploy(w3, artifact):
+    contract = w3.eth.contract(abi=artifact['abi'], bytecode=artifact['bin'])
+    receipt = w3.eth.wait_for_transaction_receipt(contract.constructor().transact())
+    return w3.eth.contract(address=receipt['contractAddress'], abi=artifact['abi'])
+
+
+def run_calls(w3, calls):
+    """Send every call back to back, then wait for all receipts; returns (gas used, seconds)"""
+    started = time.perf_counter()
+    tx_hashes = [call.transact({'gas': 29_000_000}) for call in calls]
+    receipts = [w3.eth.wait_for_transaction_receipt(tx_hash) for tx_hash in tx_hashes]
+    elapsed = time.perf_counter() - started
+    failed = sum(1 for receipt in receipts if receipt['status'] != 1)
+    if failed:
+        raise SystemExit(f"{failed} of {len(receipts)} transactions reverted")
+    return sum(receipt['gasUsed'] for receipt in receipts), elapsed
+
+
+def chunks(items, size):
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+
+def payment_args(prefix, count, receiver):
+    return [
+        (f'{prefix}-{index}', f'tx-{index}', receiver, 100 + index, 'CNY', 'WeChat Pay',
+         1700000000 + index, 'dinner', f'hash-{index}')
+        for index in range(count)
+    ]
+
+
+def transaction_args(prefix, count, bill_id, beneficiaries):
+    share = 30
+    return [
+        (f'{prefix}-{index}', bill_id, share * len(beneficiaries), 'dinner', 'expense',
+         beneficiaries, [share] * len(beneficiaries))
+        for index in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=25)
+    parser.add_argument('--rpc-url', help='local dev node; defaults to an in-memory eth-tester chain')
+    parser.add_argument('--solc-version', default='0.8.19')
+    args = parser.parse_args()
+
+    w3 = connect(args.rpc_url)
+    w3.eth.default_account = w3.eth.accounts[0]
+    payments = deploy(w3, compile_contract('PaymentContract', args.solc_version))
+    bills = deploy(w3, compile_contract('BillContract', args.solc_version))
+    bills.functions.createBill('bench-bill', 'Group dinner', 'benchmark', 'CNY').transact()
+    receiver, beneficiaries = w3.eth.accounts[1], w3.eth.accounts[1:4]
+
+    runs = {
+        'recordPayment': [payments.functions.recordPayment(*call)
+                          for call in payment_args('single', args.records, receiver)],
+        'recordPayments': [payments.functions.recordPayments(batch)
+                           for batch in chunks(payment_args('batch', args.records, receiver), args.batch_size)],
+        'addTransaction': [bills.functions.addTransaction(*call)
+                           for call in transaction_args('single', args.records, 'bench-bill', beneficiaries)],
+        'addTransactions': [bills.functions.addTransactions(batch)
+                            for batch in chunks(transaction_args('batch', args.records, 'bench-bill', beneficiaries),
+                                                args.batch_size)],
+    }
+
+    print(f"{args.records} records, batch size {args.batch_size}")
+    print(f"{'function':<16} {'txs':>6} {'gas/record':>11} {'records/s':>10}")
+    for name, calls in runs.items():
+        gas_used, elapsed = run_calls(w3, calls)
+        print(f"{name:<16} {len(calls):>6} {gas_used // args.records:>11} {args.records / elapsed:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Settlement plan size and planning time: netted greedy plan vs pairwise.
+
+Builds random bills of ``members`` members and ``transactions`` expenses,
+each paid by one member for a random group of up to ``--group-size``
+members with uneven integer shares. For each bill it reports the number
+of makePayment transfers (and their gas at the makePayment estimate) of
+the pairwise plan, where every debtor pays every creditor they share an
+expense with, and of plan_transfers, which nets all balances first. It
+checks that both plans settle every balance exactly.
+
+    python benchmarks/bench_settlement.py
+    python benchmarks/bench_settlement.py --sizes 300x5000 --group-size 300
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+SERVICE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_ROOT)
+
+from src.services.settlement import net_balances, pairwise_transfers, plan_transfers  # noqa: E402
+
+# GAS_ESTIMATE_FALLBACKS['makePayment'] in src/routes/web3.py
+MAKE_PAYMENT_GAS = 60000
+
+
+def make_bill(members, transactions, group_size, rng):
+    addresses = [f'0x{index:040x}' for index in range(1, members + 1)]
+    bill = []
+    for _ in range(transactions):
+        payer = rng.choice(addresses)
+        group = rng.sample(addresses, rng.randint(1, min(group_size, members)))
+        shares = [rng.randint(1, 10 ** 6) for _ in group]
+        bill.append((payer, sum(shares), group, shares))
+    return bill
+
+
+def settles(balances, transfers):
+    remaining = dict(balances)
+    for debtor, creditor, amount in transfers:
+        if amount <= 0:
+            return False
+        remaining[debtor] = remaining.get(debtor, 0) + amount
+        remaining[creditor] = remaining.get(creditor, 0) - amount
+    return not any(remaining.values())
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', default=['10x50', '50x500', '200x2000', '500x5000'],
+                        help='bills as MEMBERSxTRANSACTIONS')
+    parser.add_argument('--group-size', type=int, default=20, help='most members sharing one expense')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    print(f"{'bill':>10} {'pairwise':>9} {'netted':>7} {'pair gas':>11} {'net gas':>10} "
+          f"{'balance ms':>11} {'plan ms':>8} {'pairwise ms':>12}")
+    for size in args.sizes:
+        members, transactions = (int(part) for part in size.split('x'))
+        bill = make_bill(members, transactions, args.group_size, rng)
+
+        balances, balance_ms = timed(net_balances, bill)
+        transfers, plan_ms = timed(plan_transfers, balances)
+        pairwise, pairwise_ms = timed(pairwise_transfers, bill)
+        if not settles(balances, transfers) or not settles(balances, pairwise):
+            raise SystemExit(f"{size}: a plan does not settle the bill")
+
+        print(f"{size:>10} {len(pairwise):>9} {len(transfers):>7} {len(pairwise) * MAKE_PAYMENT_GAS:>11} "
+              f"{len(transfers) * MAKE_PAYMENT_GAS:>10} {balance_ms:>11.1f} {plan_ms:>8.1f} {pairwise_ms:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""
+Event checks of ConfirmationHub fed by a TransactionPipeline on an in-memory chain or a dev node.
+
+Compiles smart_contracts/PaymentContract.sol with py-solc-x (``pip install
+py-solc-x`` and ``python -m solcx.install 0.8.19``), deploys it, sends
+recordPayment calls through the pipeline and checks that:
+
+- a subscriber to a payment sees it submitted and mined, then counted
+  up to ``--confirmations`` blocks and confirmed;
+- a payment whose call is rejected is reported failed, and never mined;
+- a subscriber that connects after the payment was mined gets the mined
+  event replayed;
+- a hub in another process, which is not fed by the sending pipeline,
+  still reports what it reads from the chain but never the submission.
+
+Exits non-zero on the first check that fails. By default it runs on an
+in-memory chain (``pip install "web3[tester]"``); pass ``--rpc-url`` to
+use a local dev node such as anvil or hardhat whose first account is
+unlocked and which mines each transaction on arrival.
+
+    python benchmarks/check_confirmation_stream.py --confirmations 3
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+from eth_account import Account
+from web3 import Web3
+
+SERVICE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_ROOT = os.path.dirname(SERVICE_ROOT)
+CONTRACTS_DIR = os.path.join(REPO_ROOT, 'smart_contracts')
+sys.path.insert(0, SERVICE_ROOT)
+
+from src.services.confirmation_stream import ConfirmationHub  # noqa: E402
+from src.services.tx_pipeline import TransactionPipeline  # noqa: E402
+
+
+def compile_contract(name, solc_version):
+    import solcx
+
+    with open(os.path.join(CONTRACTS_DIR, f'{name}.sol')) as f:
+        compiled = solcx.compile_source(f.read(), output_values=['abi', 'bin'], solc_version=solc_version)
+    return compiled[f'<stdin>:{name}']
+
+
+def connect(rpc_url):
+    if rpc_url:
+        return Web3(Web3.HTTPProvider(rpc_url))
+    from web3 import EthereumTesterProvider
+
+    class LockedTesterProvider(EthereumTesterProvider):
+        # The in-memory chain is not thread-safe, and the hubs and the pipeline poll it from their own threads
+        lock = threading.RLock()
+
+        def make_request(self, method, params):
+            with self.lock:
+                return super().make_request(method, params)
+
+    return Web3(LockedTesterProvider())
+
+
+def deploy(w3, artifact):
+    contract = w3.eth.contract(abi=artifact['abi'], bytecode=artifact['bin'])
+    receipt = w3.eth.wait_for_transaction_receipt(contract.constructor().transact())
+    return w3.eth.contract(address=receipt['contractAddress'], abi=artifact['abi'])
+
+
+def check(description, condition):
+    if not condition:
+        raise SystemExit(f"FAIL: {description}")
+    print(f"ok   {description}")
+
+
+def fund(w3, address):
+    tx_hash = w3.eth.send_transaction({'to': address, 'value': w3.to_wei(10, 'ether')})
+    w3.eth.wait_for_transaction_receipt(tx_hash)
+
+
+def record_payment(contract, pipeline, payment_id, receiver, amount):
+    calldata = contract.encode_abi('recordPayment', args=[
+        payment_id, f'tx-{payment_id}', receiver, amount, 'CNY', 'WeChat Pay', 1700000000, 'dinner',
+        f'hash-{payment_id}',
+    ])
+    return pipeline.submit({'to': contract.address, 'data': calldata}, 'recordPayment', meta={'paymentId': payment_id})
+
+
+def collect(w3, subscriptions, done, timeout=60):
+    """Mine a block now and then and drain every subscription until ``done`` holds for what was read"""
+    events = {name: [] for name in subscriptions}
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        for name, subscription in subscriptions.items():
+            while True:
+                event = subscription.get(timeout=0.05)
+                if event is None:
+                    break
+                events[name].append(event)
+        if done(events):
+            return events
+        # An empty transfer moves the head so the confirmations count up
+        w3.eth.send_transaction({'to': w3.eth.accounts[1], 'value': 1})
+        time.sleep(0.1)
+    raise SystemExit(f"FAIL: the expected events did not arrive within {timeout}s: {events}")
+
+
+def types(events, payment_id):
+    return [event['type'] for event in events if event['id'] == payment_id]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rpc-url', help='dev node whose first account is unlocked (default: in-memory chain)')
+    parser.add_argument('--solc-version', default='0.8.19')
+    parser.add_argument('--confirmations', type=int, default=3)
+    args = parser.parse_args()
+
+    w3 = connect(args.rpc_url)
+    w3.eth.default_account = w3.eth.accounts[0]
+    payments = deploy(w3, compile_contract('PaymentContract', args.solc_version))
+    account = Account.create()
+    fund(w3, account.address)
+
+    pipeline = TransactionPipeline(lambda: w3, account.key, poll_interval=0.1, receipt_timeout=30)
+    hub = ConfirmationHub(lambda: w3, [payments], confirmations=args.confirmations, interval=0.1)
+    other_hub = ConfirmationHub(lambda: w3, [payments], confirmations=args.confirmations, interval=0.1)
+    pipeline.add_listener(hub.on_transaction)
+    for service in (pipeline, hub, other_hub):
+        service.start()
+    # Let both hubs read the head before anything is sent
+    time.sleep(0.5)
+
+    subscriptions = {
+        'sender': hub.subscribe(payments=['stream-ok', 'stream-rejected']),
+        'other': other_hub.subscribe(payments=['stream-ok']),
+    }
+    receiver = w3.eth.accounts[2]
+    record_payment(payments, pipeline, 'stream-ok', receiver, 100)
+    # The contract rejects a zero amount, so gas estimation fails before anything is sent
+    record_payment(payments, pipeline, 'stream-rejected', receiver, 0)
+    events = collect(w3, subscriptions, lambda events: (
+        'confirmed' in types(events['sender'], 'stream-ok')
+        and 'failed' in types(events['sender'], 'stream-rejected')
+        and 'confirmed' in types(events['other'], 'stream-ok')
+    ))
+
+    received = types(events['sender'], 'stream-ok')
+    counts = [event['confirmations'] for event in events['sender']
+              if event['id'] == 'stream-ok' and event['type'] == 'confirmations']
+    check(f"a payment is reported {' -> '.join(dict.fromkeys(received))}",
+          # The send returns after the node mined it, so the hub may read the log first
+          sorted(received[:2]) == ['mined', 'submitted'] and received[-1] == 'confirmed')
+    check(f"its confirmations count up below {args.confirmations}",
+          counts == sorted(set(counts)) and all(count < args.confirmations for count in counts))
+    check("sequence numbers increase for each subscriber",
+          all([event['seq'] for event in evs] == sorted(event['seq'] for event in evs) for evs in events.values()))
+    mined = next(event for event in events['sender'] if event['id'] == 'stream-ok' and event['type'] == 'mined')
+    check("the mined event carries the transaction and its block",
+          mined['transactionHash'] and mined['blockNumber'] and mined['args']['amount'] == 100)
+
+    rejected = types(events['sender'], 'stream-rejected')
+    check("a rejected payment is reported failed with its error",
+          rejected == ['failed'] and next(event['error'] for event in events['sender']
+                                          if event['id'] == 'stream-rejected'))
+
+    other = types(events['other'], 'stream-ok')
+    check("a hub not fed by the sending pipeline still reports the payment mined and confirmed",
+          'mined' in other and other[-1] == 'confirmed')
+    check("but never its submission, which only the sending process knows", 'submitted' not in other)
+
+    subscribers = hub.stats()['subscribers']
+    late = hub.subscribe(payments=['stream-ok'])
+    replayed = late.get(timeout=1)
+    check("a subscriber connecting after the payment was mined gets the mined event replayed",
+          replayed is not None and replayed['type'] == 'mined' and replayed['replayed'])
+    hub.unsubscribe(late)
+    check("an unsubscribed client is dropped", hub.stats()['subscribers'] == subscribers)
+
+
+if __name__ == '__main__':
+    main()
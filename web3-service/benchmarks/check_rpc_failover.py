@@ -0,0 +1,147 @@
+"""
+Failover and cooldown checks of FailoverHTTPProvider against local mock JSON-RPC nodes.
+
+Starts mock nodes on 127.0.0.1 that answer every call after a fixed
+delay, or fail with HTTP 500 while switched off, and checks that:
+
+- reads fail over from a failing node to a working one;
+- a failed node cools down, and its cooldown doubles on each failure;
+- once its cooldown ends a node that has only failed still ranks below
+  a working one, so a non-idempotent eth_sendRawTransaction, which is
+  sent to the best node only, reaches the working node;
+- a node that failed before is used again when the other one fails.
+
+Exits non-zero on the first check that fails.
+
+    python benchmarks/check_rpc_failover.py
+"""
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SERVICE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_ROOT)
+
+from src.services import rpc_provider  # noqa: E402
+from src.services.rpc_provider import FailoverHTTPProvider, RPCEndpointError  # noqa: E402
+
+
+class MockNode:
+    """A JSON-RPC node answering every call with its name after ``delay`` seconds"""
+
+    def __init__(self, name, delay=0.0):
+        self.name = name
+        self.delay = delay
+        self.up = True
+        self.calls = []
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                requests = payload if isinstance(payload, list) else [payload]
+                node.calls.extend(request['method'] for request in requests)
+                time.sleep(node.delay)
+                if not node.up:
+                    self.send_response(500)
+                    self.end_headers()
+                    return
+                results = [{'jsonrpc': '2.0', 'id': request['id'], 'result': node.name} for request in requests]
+                body = json.dumps(results if isinstance(payload, list) else results[0]).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def call(provider, method):
+    return provider.make_request(method, [])['result']
+
+
+def check(description, condition):
+    if not condition:
+        raise SystemExit(f"FAIL: {description}")
+    print(f"ok   {description}")
+
+
+def expire_cooldowns(provider):
+    time.sleep(max(0.0, max(endpoint.cooldown_until for endpoint in provider.endpoints) - time.monotonic()) + 0.05)
+
+
+def check_failover():
+    healthy, dead = MockNode('healthy', delay=0.01), MockNode('dead')
+    dead.up = False
+    try:
+        # The dead node is listed first, so it is tried before anything is known about either
+        provider = FailoverHTTPProvider([dead.url, healthy.url], timeout=2)
+        check("a read fails over to the working node", call(provider, 'eth_blockNumber') == 'healthy')
+        endpoint = provider.endpoints[0]
+        check("the failing node cools down", provider.stats()[0]['cooling_down'])
+        first_cooldown = endpoint.cooldown_until - time.monotonic()
+
+        expire_cooldowns(provider)
+        check("after its cooldown a node that has only failed ranks below a working one",
+              provider.ranked_endpoints()[0].url == healthy.url)
+        check("eth_sendRawTransaction goes to the working node", call(provider, 'eth_sendRawTransaction') == 'healthy')
+        check("the signed write never reached the failing node", 'eth_sendRawTransaction' not in dead.calls)
+
+        # Only the failing node is left to try, so the read reaches it and it fails again
+        healthy.up = False
+        expire_cooldowns(provider)
+        try:
+            call(provider, 'eth_blockNumber')
+            check("a read fails when every node fails", False)
+        except RPCEndpointError:
+            check("a read fails when every node fails", True)
+        check("the cooldown doubles on each consecutive failure",
+              endpoint.cooldown_until - time.monotonic() > 1.5 * first_cooldown)
+    finally:
+        healthy.stop()
+        dead.stop()
+
+
+def check_switchback():
+    fast, slow = MockNode('fast', delay=0.0), MockNode('slow', delay=0.05)
+    try:
+        provider = FailoverHTTPProvider([fast.url, slow.url], timeout=2)
+        check("reads go to the first node while it works", call(provider, 'eth_blockNumber') == 'fast')
+
+        fast.up = False
+        check("a read fails over to the other node when the first one fails",
+              call(provider, 'eth_getBalance') == 'slow')
+        check("the failed node ranks last while cooling down", provider.ranked_endpoints()[-1].url == fast.url)
+        check("writes go to the working node while the failed one cools down",
+              call(provider, 'eth_sendRawTransaction') == 'slow')
+
+        fast.up, slow.up = True, False
+        expire_cooldowns(provider)
+        check("a node that failed once and answered before is used again when the other fails",
+              call(provider, 'eth_blockNumber') == 'fast')
+    finally:
+        fast.stop()
+        slow.stop()
+
+
+def main():
+    print(f"cooldown {rpc_provider.BASE_COOLDOWN:g}s doubling up to {rpc_provider.MAX_COOLDOWN:g}s\n")
+    check_failover()
+    check_switchback()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+Nonce and status checks of TransactionPipeline on an in-memory chain or a dev node.
+
+Funds a fresh sender key and checks that:
+
+- transactions submitted from many threads at once get consecutive,
+  distinct nonces and are all mined;
+- when a transaction from the same key is sent outside the pipeline,
+  the next send is rejected for its stale nonce, resyncs and is mined;
+- the service limits scripts/serve.py to one worker once PRIVATE_KEY
+  is set, so no second process sends from the same key.
+
+Exits non-zero on the first check that fails. By default it runs on an
+in-memory chain (``pip install "web3[tester]"``); pass ``--rpc-url`` to
+use a local dev node such as anvil or hardhat whose first account is
+unlocked.
+
+    python benchmarks/check_tx_pipeline.py --transactions 50
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+from eth_account import Account
+from web3 import Web3
+
+SERVICE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_ROOT)
+
+from src.services.tx_pipeline import FINAL_STATUSES, TransactionPipeline  # noqa: E402
+
+
+def connect(rpc_url):
+    if rpc_url:
+        return Web3(Web3.HTTPProvider(rpc_url))
+    from web3 import EthereumTesterProvider
+    return Web3(EthereumTesterProvider())
+
+
+def check(description, condition):
+    if not condition:
+        raise SystemExit(f"FAIL: {description}")
+    print(f"ok   {description}")
+
+
+def fund(w3, address):
+    funder = w3.eth.accounts[0]
+    tx_hash = w3.eth.send_transaction({'from': funder, 'to': address, 'value': w3.to_wei(10, 'ether')})
+    w3.eth.wait_for_transaction_receipt(tx_hash)
+
+
+def wait_final(pipeline, tx_ids, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        records = [pipeline.get(tx_id) for tx_id in tx_ids]
+        if all(record['status'] in FINAL_STATUSES for record in records):
+            return records
+        time.sleep(0.1)
+    raise SystemExit(f"FAIL: transactions did not finish within {timeout}s")
+
+
+def transfer(address):
+    return {'to': address, 'data': '0x', 'gas': 21000}
+
+
+def check_concurrent_nonces(w3, pipeline, count):
+    start_nonce = w3.eth.get_transaction_count(pipeline.address, 'pending')
+    tx_ids, lock = [], threading.Lock()
+
+    def submit():
+        record = pipeline.submit(transfer(w3.eth.accounts[1]), 'transfer')
+        with lock:
+            tx_ids.append(record['txId'])
+
+    threads = [threading.Thread(target=submit) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    records = wait_final(pipeline, tx_ids)
+    check(f"{count} concurrent submissions are all mined",
+          all(record['status'] == 'mined' for record in records))
+    check("their nonces are consecutive and distinct",
+          sorted(record['nonce'] for record in records) == list(range(start_nonce, start_nonce + count)))
+
+
+def check_stale_nonce(w3, pipeline, account):
+    # Spend the pipeline's next nonce behind its back
+    nonce = w3.eth.get_transaction_count(account.address, 'pending')
+    outside = account.sign_transaction({
+        'to': w3.eth.accounts[1], 'value': 0, 'gas': 21000, 'gasPrice': w3.eth.gas_price,
+        'nonce': nonce, 'chainId': w3.eth.chain_id,
+    })
+    w3.eth.wait_for_transaction_receipt(w3.eth.send_raw_transaction(outside.raw_transaction))
+
+    resyncs = pipeline.nonces.resyncs
+    record = wait_final(pipeline, [pipeline.submit(transfer(w3.eth.accounts[1]), 'transfer')['txId']])[0]
+    check("a send with a stale nonce resyncs and is mined", record['status'] == 'mined' and record['attempts'] == 2)
+    check("the pipeline re-read the nonce from the node", pipeline.nonces.resyncs > resyncs)
+    check("it used the next nonce after the outside transaction", record['nonce'] == nonce + 1)
+
+
+def check_single_worker(private_key):
+    from flask import Flask
+
+    # As under scripts/serve.py, so the chain services wait for a post_fork that never comes
+    os.environ['SERVICE_PRELOAD_APP'] = '1'
+    os.environ['PRIVATE_KEY'] = private_key
+    from src.routes.web3 import web3_bp
+    app = Flask(__name__)
+    app.register_blueprint(web3_bp)
+    max_workers, reason = app.extensions.get('serving_max_workers', (None, None))
+    check(f"serve.py starts one worker when PRIVATE_KEY is set ({reason})", max_workers == 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rpc-url', help='dev node whose first account is unlocked (default: in-memory chain)')
+    parser.add_argument('--transactions', type=int, default=20)
+    args = parser.parse_args()
+
+    w3 = connect(args.rpc_url)
+    account = Account.create()
+    fund(w3, account.address)
+    pipeline = TransactionPipeline(lambda: w3, account.key, poll_interval=0.1, receipt_timeout=30)
+    pipeline.start()
+
+    check_concurrent_nonces(w3, pipeline, args.transactions)
+    check_stale_nonce(w3, pipeline, account)
+    check_single_worker(account.key.hex())
+
+
+if __name__ == '__main__':
+    main()
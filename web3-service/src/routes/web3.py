@@ -1,29 +1,61 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 from flask_cors import cross_origin
-from web3 import Web3
-from eth_account import Account
 import json
+import logging
 import os
+import threading
+import time
+import uuid
 from datetime import datetime
+from src.services.chain_monitor import ChainMonitor
+from src.services.gas_oracle import FEE_LEVELS, GasOracle
+from src.services.instrumentation import instrument_blueprint, metrics_response, stage
+from src.services.keypair_pool import KeypairPool
+from src.services.serving import add_serving_hook, limit_serving_workers, run_after_fork
+from src.services.settlement import net_balances, pairwise_transfers, plan_transfers
+from src.services.ttl_cache import TTLCache
+from src.services.write_coalescer import WriteCoalescer
+
+logger = logging.getLogger(__name__)
 
 web3_bp = Blueprint('web3', __name__)
+instrument_blueprint(web3_bp)
 
 # Web3 configuration
 # For development, using Ganache or local blockchain
 WEB3_PROVIDER_URL = os.getenv('WEB3_PROVIDER_URL', 'http://localhost:8545')
 PRIVATE_KEY = os.getenv('PRIVATE_KEY', '0x' + '0' * 64)  # Default private key for development
+WEB3_REQUEST_TIMEOUT = float(os.getenv('WEB3_REQUEST_TIMEOUT', '10'))
+# Comma-separated list of RPC nodes; falls back to the single WEB3_PROVIDER_URL
+WEB3_PROVIDER_URLS = [url.strip() for url in os.getenv('WEB3_PROVIDER_URLS', WEB3_PROVIDER_URL).split(',') if url.strip()]
+WEB3_POOL_SIZE = int(os.getenv('WEB3_POOL_SIZE', '10'))
 
-# Initialize Web3
-try:
-    w3 = Web3(Web3.HTTPProvider(WEB3_PROVIDER_URL))
-    if w3.is_connected():
-        print(f"Connected to Web3 provider: {WEB3_PROVIDER_URL}")
-    else:
-        print(f"Failed to connect to Web3 provider: {WEB3_PROVIDER_URL}")
-        w3 = None
-except Exception as e:
-    print(f"Web3 connection error: {e}")
-    w3 = None
+# web3 and eth_account take about a second to import, so they and everything
+# built on them are set up by load_chain_services(): in a background thread at
+# startup, or by the first request that needs them if it arrives sooner
+Web3 = None
+Account = None
+rpc_provider = None
+chain_monitor = None
+gas_oracle = None
+bill_contract = None
+payment_contract = None
+tx_pipeline = None
+payment_writes = None
+transaction_writes = None
+write_coalescers = []
+indexed_contracts = []
+event_indexer = None
+payment_anchorer = None
+confirmation_hub = None
+
+chain_services_loaded = threading.Event()
+chain_services_error = None
+chain_services_lock = threading.Lock()
+
+def connect_web3():
+    """Build a Web3 client over the pooled failover provider"""
+    return Web3(rpc_provider)
 
 # Smart contract ABIs (simplified for demo)
 BILL_CONTRACT_ABI = [
@@ -54,6 +86,27 @@ BILL_CONTRACT_ABI = [
         "stateMutability": "nonpayable",
         "type": "function"
     },
+    {
+        "inputs": [
+            {
+                "components": [
+                    {"name": "transactionId", "type": "string"},
+                    {"name": "billId", "type": "string"},
+                    {"name": "amount", "type": "uint256"},
+                    {"name": "description", "type": "string"},
+                    {"name": "transactionType", "type": "string"},
+                    {"name": "beneficiaries", "type": "address[]"},
+                    {"name": "beneficiaryAmounts", "type": "uint256[]"}
+                ],
+                "name": "inputs",
+                "type": "tuple[]"
+            }
+        ],
+        "name": "addTransactions",
+        "outputs": [],
+        "stateMutability": "nonpayable",
+        "type": "function"
+    },
     {
         "inputs": [{"name": "billId", "type": "string"}],
         "name": "getBill",
@@ -71,6 +124,48 @@ BILL_CONTRACT_ABI = [
         ],
         "stateMutability": "view",
         "type": "function"
+    },
+    {
+        "anonymous": False,
+        "inputs": [
+            {"indexed": True, "name": "billId", "type": "string"},
+            {"indexed": True, "name": "creator", "type": "address"},
+            {"indexed": False, "name": "totalAmount", "type": "uint256"}
+        ],
+        "name": "BillCreated",
+        "type": "event"
+    },
+    {
+        "anonymous": False,
+        "inputs": [
+            {"indexed": True, "name": "transactionId", "type": "string"},
+            {"indexed": True, "name": "billId", "type": "string"},
+            {"indexed": True, "name": "payer", "type": "address"},
+            {"indexed": False, "name": "amount", "type": "uint256"}
+        ],
+        "name": "TransactionAdded",
+        "type": "event"
+    },
+    {
+        "anonymous": False,
+        "inputs": [
+            {"indexed": True, "name": "billId", "type": "string"},
+            {"indexed": False, "name": "totalAmount", "type": "uint256"},
+            {"indexed": False, "name": "settledAmount", "type": "uint256"}
+        ],
+        "name": "BillSettled",
+        "type": "event"
+    },
+    {
+        "anonymous": False,
+        "inputs": [
+            {"indexed": True, "name": "billId", "type": "string"},
+            {"indexed": True, "name": "payer", "type": "address"},
+            {"indexed": True, "name": "receiver", "type": "address"},
+            {"indexed": False, "name": "amount", "type": "uint256"}
+        ],
+        "name": "PaymentMade",
+        "type": "event"
     }
 ]
 
@@ -92,6 +187,61 @@ PAYMENT_CONTRACT_ABI = [
         "stateMutability": "nonpayable",
         "type": "function"
     },
+    {
+        "inputs": [
+            {
+                "components": [
+                    {"name": "paymentId", "type": "string"},
+                    {"name": "transactionId", "type": "string"},
+                    {"name": "receiver", "type": "address"},
+                    {"name": "amount", "type": "uint256"},
+                    {"name": "currency", "type": "string"},
+                    {"name": "paymentMethod", "type": "string"},
+                    {"name": "paymentDate", "type": "uint256"},
+                    {"name": "notes", "type": "string"},
+                    {"name": "imageHash", "type": "string"}
+                ],
+                "name": "payments",
+                "type": "tuple[]"
+            }
+        ],
+        "name": "recordPayments",
+        "outputs": [],
+        "stateMutability": "nonpayable",
+        "type": "function"
+    },
+    {
+        "inputs": [
+            {"name": "root", "type": "bytes32"},
+            {"name": "leafCount", "type": "uint256"}
+        ],
+        "name": "anchorRoot",
+        "outputs": [],
+        "stateMutability": "nonpayable",
+        "type": "function"
+    },
+    {
+        "inputs": [{"name": "", "type": "bytes32"}],
+        "name": "rootAnchors",
+        "outputs": [
+            {"name": "submitter", "type": "address"},
+            {"name": "anchoredAt", "type": "uint96"}
+        ],
+        "stateMutability": "view",
+        "type": "function"
+    },
+    {
+        "inputs": [
+            {"name": "paymentId", "type": "string"},
+            {"name": "imageHash", "type": "string"},
+            {"name": "proof", "type": "bytes32[]"},
+            {"name": "root", "type": "bytes32"}
+        ],
+        "name": "verifyImageHash",
+        "outputs": [{"name": "", "type": "bool"}],
+        "stateMutability": "view",
+        "type": "function"
+    },
     {
         "inputs": [{"name": "paymentId", "type": "string"}],
         "name": "getPaymentRecord",
@@ -114,24 +264,584 @@ PAYMENT_CONTRACT_ABI = [
         ],
         "stateMutability": "view",
         "type": "function"
+    },
+    {
+        "anonymous": False,
+        "inputs": [
+            {"indexed": True, "name": "paymentId", "type": "string"},
+            {"indexed": True, "name": "payer", "type": "address"},
+            {"indexed": True, "name": "receiver", "type": "address"},
+            {"indexed": False, "name": "amount", "type": "uint256"}
+        ],
+        "name": "PaymentRecorded",
+        "type": "event"
+    },
+    {
+        "anonymous": False,
+        "inputs": [
+            {"indexed": True, "name": "paymentId", "type": "string"},
+            {"indexed": True, "name": "verifier", "type": "address"}
+        ],
+        "name": "PaymentVerified",
+        "type": "event"
+    },
+    {
+        "anonymous": False,
+        "inputs": [
+            {"indexed": True, "name": "paymentId", "type": "string"},
+            {"indexed": False, "name": "status", "type": "string"}
+        ],
+        "name": "PaymentStatusUpdated",
+        "type": "event"
+    },
+    {
+        "anonymous": False,
+        "inputs": [
+            {"indexed": True, "name": "root", "type": "bytes32"},
+            {"indexed": True, "name": "submitter", "type": "address"},
+            {"indexed": False, "name": "leafCount", "type": "uint256"}
+        ],
+        "name": "RootAnchored",
+        "type": "event"
     }
 ]
 
 # Contract addresses (would be set after deployment)
 BILL_CONTRACT_ADDRESS = os.getenv('BILL_CONTRACT_ADDRESS', '0x' + '0' * 40)
 PAYMENT_CONTRACT_ADDRESS = os.getenv('PAYMENT_CONTRACT_ADDRESS', '0x' + '0' * 40)
+ZERO_ADDRESS = '0x' + '0' * 40
+
+def contract_writes_enabled(contract_address):
+    return tx_pipeline is not None and contract_address != ZERO_ADDRESS
+
+# recordPayment and addTransaction calls arriving within the window are sent as one
+# recordPayments/addTransactions call; set WEB3_BATCH_WINDOW_MS=0 for contracts without them
+WEB3_BATCH_WINDOW_MS = float(os.getenv('WEB3_BATCH_WINDOW_MS', '200'))
+WEB3_BATCH_MAX_ITEMS = int(os.getenv('WEB3_BATCH_MAX_ITEMS', '50'))
+
+def make_write_coalescer(kind, contract_address, contract, batch_function):
+    if not contract_writes_enabled(contract_address) or WEB3_BATCH_WINDOW_MS <= 0:
+        return None
+    return WriteCoalescer(
+        tx_pipeline,
+        kind,
+        Web3.to_checksum_address(contract_address),
+        lambda items: contract.encode_abi(batch_function, args=[items]),
+        window_ms=WEB3_BATCH_WINDOW_MS,
+        max_items=WEB3_BATCH_MAX_ITEMS,
+    )
+
+# In anchoring mode payment image hashes are not stored per record: they are
+# collected into Merkle batches and only each batch's root goes on chain
+WEB3_PAYMENT_ANCHORING = os.getenv('WEB3_PAYMENT_ANCHORING', 'false').lower() in ('1', 'true', 'yes')
+WEB3_ANCHOR_DB = os.getenv('WEB3_ANCHOR_DB', os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'database', 'payment_anchors.db'
+))
+
+def is_root_anchored(root):
+    """Whether the payment contract has a Merkle root on record"""
+    w3 = chain_monitor.get_web3()
+    if w3 is None:
+        raise ConnectionError('Blockchain node is not reachable')
+    contract = w3.eth.contract(address=Web3.to_checksum_address(PAYMENT_CONTRACT_ADDRESS), abi=PAYMENT_CONTRACT_ABI)
+    submitter, _ = contract.functions.rootAnchors(root).call()
+    return int(submitter, 16) != 0
+
+# Bill and payment reads are served from a local index of contract events
+WEB3_INDEX_DB = os.getenv('WEB3_INDEX_DB', os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'database', 'chain_index.db'
+))
+WEB3_INDEXER_START_BLOCK = int(os.getenv('WEB3_INDEXER_START_BLOCK', '0'))
+
+# Status streams report a record confirmed this many blocks deep; each stream is
+# closed after WEB3_STREAM_MAX_SECONDS and holds a server thread while open
+WEB3_STREAM_CONFIRMATIONS = int(os.getenv('WEB3_STREAM_CONFIRMATIONS', '12'))
+WEB3_STREAM_MAX_SECONDS = float(os.getenv('WEB3_STREAM_MAX_SECONDS', '3600'))
+WEB3_STREAM_KEEPALIVE_SECONDS = float(os.getenv('WEB3_STREAM_KEEPALIVE_SECONDS', '15'))
+MAX_STREAM_TOPICS = 100
+
+def load_chain_services():
+    """
+    Import web3 and build the provider, monitor, contracts, transaction
+    pipeline and indexer on top of it. Safe to call from any thread; only
+    the first successful call does the work. Raises if loading fails.
+    """
+    global Web3, Account, rpc_provider, chain_monitor, gas_oracle, bill_contract, payment_contract
+    global tx_pipeline, payment_writes, transaction_writes, write_coalescers, indexed_contracts, event_indexer
+    global payment_anchorer, confirmation_hub, chain_services_error
+    if chain_services_loaded.is_set():
+        return
+    with chain_services_lock:
+        if chain_services_loaded.is_set():
+            return
+        try:
+            from web3 import Web3
+            from eth_account import Account
+            from src.services.confirmation_stream import ConfirmationHub
+            from src.services.event_indexer import EventIndexer
+            from src.services.payment_anchor import PaymentAnchorer
+            from src.services.rpc_provider import FailoverHTTPProvider
+            from src.services.tx_pipeline import TransactionPipeline
+
+            rpc_provider = FailoverHTTPProvider(WEB3_PROVIDER_URLS, pool_size=WEB3_POOL_SIZE, timeout=WEB3_REQUEST_TIMEOUT)
+
+            # Chain connectivity is checked in the background; handlers read its cached snapshot
+            chain_monitor = ChainMonitor(
+                connect_web3,
+                interval=float(os.getenv('WEB3_MONITOR_INTERVAL', '5')),
+                max_backoff=float(os.getenv('WEB3_MONITOR_MAX_BACKOFF', '60')),
+            )
+
+            # Fee suggestions from eth_feeHistory, shared per block by previews and the sending path
+            gas_oracle = GasOracle(
+                chain_monitor.get_web3,
+                latest_block=lambda: chain_monitor.snapshot()['latest_block'],
+                history_blocks=int(os.getenv('WEB3_FEE_HISTORY_BLOCKS', '20')),
+                estimate_ttl=float(os.getenv('WEB3_GAS_ESTIMATE_TTL', '300')),
+            )
+
+            # Calldata encoders only; they never touch the network
+            bill_contract = Web3().eth.contract(abi=BILL_CONTRACT_ABI)
+            payment_contract = Web3().eth.contract(abi=PAYMENT_CONTRACT_ABI)
+
+            # Contract writes are signed with PRIVATE_KEY and sent in the background;
+            # without a configured key the write endpoints keep their demo responses
+            tx_pipeline = TransactionPipeline(
+                chain_monitor.get_web3,
+                PRIVATE_KEY,
+                latest_block=lambda: chain_monitor.snapshot()['latest_block'],
+                poll_interval=float(os.getenv('WEB3_RECEIPT_POLL_INTERVAL', '2')),
+                receipt_timeout=float(os.getenv('WEB3_RECEIPT_TIMEOUT', '300')),
+                gas_oracle=gas_oracle,
+                fee_level=os.getenv('WEB3_FEE_LEVEL', 'standard'),
+            ) if PRIVATE_KEY != '0x' + '0' * 64 else None
+
+            payment_writes = make_write_coalescer('recordPayment', PAYMENT_CONTRACT_ADDRESS, payment_contract, 'recordPayments')
+            transaction_writes = make_write_coalescer('addTransaction', BILL_CONTRACT_ADDRESS, bill_contract, 'addTransactions')
+            write_coalescers = [coalescer for coalescer in (payment_writes, transaction_writes) if coalescer is not None]
+
+            payment_anchorer = PaymentAnchorer(
+                tx_pipeline,
+                Web3.to_checksum_address(PAYMENT_CONTRACT_ADDRESS),
+                lambda root, leaf_count: payment_contract.encode_abi('anchorRoot', args=[root, leaf_count]),
+                is_root_anchored,
+                window=float(os.getenv('WEB3_ANCHOR_WINDOW_SECONDS', '60')),
+                max_leaves=int(os.getenv('WEB3_ANCHOR_MAX_LEAVES', '10000')),
+            ) if WEB3_PAYMENT_ANCHORING and contract_writes_enabled(PAYMENT_CONTRACT_ADDRESS) else None
+
+            indexed_contracts = [
+                Web3().eth.contract(address=Web3.to_checksum_address(address), abi=abi)
+                for address, abi in ((BILL_CONTRACT_ADDRESS, BILL_CONTRACT_ABI), (PAYMENT_CONTRACT_ADDRESS, PAYMENT_CONTRACT_ABI))
+                if address != ZERO_ADDRESS
+            ]
+            event_indexer = EventIndexer(
+                chain_monitor.get_web3,
+                indexed_contracts,
+                start_block=WEB3_INDEXER_START_BLOCK,
+                confirmations=int(os.getenv('WEB3_INDEXER_CONFIRMATIONS', '0')),
+                page_size=int(os.getenv('WEB3_INDEXER_PAGE_SIZE', '2000')),
+                interval=float(os.getenv('WEB3_INDEXER_INTERVAL', '5')),
+            ) if indexed_contracts else None
+
+            # One shared head/log watcher behind every /stream client
+            confirmation_hub = ConfirmationHub(
+                chain_monitor.get_web3,
+                indexed_contracts,
+                confirmations=WEB3_STREAM_CONFIRMATIONS,
+                interval=float(os.getenv('WEB3_STREAM_INTERVAL', '1')),
+                max_subscribers=int(os.getenv('WEB3_STREAM_MAX_SUBSCRIBERS', '1000')),
+            ) if indexed_contracts else None
+            if confirmation_hub is not None and tx_pipeline is not None:
+                tx_pipeline.add_listener(confirmation_hub.on_transaction)
+        except Exception as e:
+            chain_services_error = str(e)
+            raise
+        chain_services_error = None
+        chain_services_loaded.set()
+
+def start_chain_services():
+    """Load the chain services and start their background threads"""
+    try:
+        load_chain_services()
+    except Exception as e:
+        logger.error(f"Error loading chain services: {str(e)}")
+        return
+    chain_monitor.start()
+    if tx_pipeline is not None:
+        tx_pipeline.start()
+    for coalescer in write_coalescers:
+        coalescer.start()
+    if payment_anchorer is not None:
+        from src.services.payment_anchor import AnchorStore
+        try:
+            if os.path.dirname(WEB3_ANCHOR_DB):
+                os.makedirs(os.path.dirname(WEB3_ANCHOR_DB), exist_ok=True)
+            payment_anchorer.start(AnchorStore(WEB3_ANCHOR_DB))
+        except Exception as e:
+            logger.error(f"Error starting payment anchoring: {str(e)}")
+    if confirmation_hub is not None:
+        confirmation_hub.start()
+    if event_indexer is not None:
+        from src.services.event_indexer import ChainIndexStore
+        try:
+            if os.path.dirname(WEB3_INDEX_DB):
+                os.makedirs(os.path.dirname(WEB3_INDEX_DB), exist_ok=True)
+            event_indexer.start(ChainIndexStore(WEB3_INDEX_DB, start_block=WEB3_INDEXER_START_BLOCK))
+        except Exception as e:
+            logger.error(f"Error starting contract event indexer: {str(e)}")
+
+@web3_bp.record_once
+def setup_single_sender(state):
+    # The transaction pipeline counts nonces in process memory, and its records,
+    # the write coalescers and the stream's transaction events live there too:
+    # a second worker signing with the same key would reuse nonces and replace
+    # the first worker's transactions. Scale with threads instead.
+    if PRIVATE_KEY != '0x' + '0' * 64:
+        limit_serving_workers(state.app, 1, 'contract writes are signed with one PRIVATE_KEY from one process')
+
+@web3_bp.record_once
+def setup_chain_services(state):
+    # Loaded off the main thread so the server starts answering /health right away
+    run_after_fork(state, lambda: threading.Thread(
+        target=start_chain_services, name='chain-services-start', daemon=True
+    ).start())
+
+# Endpoints that answer without waiting for the chain services
+CHAIN_INDEPENDENT_ENDPOINTS = ('web3.health_check', 'web3.readiness_check', 'web3.get_metrics',
+                               'web3.create_accounts_batch')
+
+@web3_bp.before_request
+def require_chain_services():
+    """Wait for the chain services, loading them on this thread if startup has not yet"""
+    if request.endpoint in CHAIN_INDEPENDENT_ENDPOINTS or chain_services_loaded.is_set():
+        return None
+    try:
+        with stage('chain_init'):
+            load_chain_services()
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': 'Chain services unavailable'
+        }), 503
+    return None
+
+def chain_index_unavailable():
+    """Error response for index reads when no contract is configured or the indexer has not started"""
+    return jsonify({
+        'success': False,
+        'error': 'Contract event index is not configured' if event_indexer is None else 'Contract event index is not ready',
+        'message': 'Chain index unavailable'
+    }), 503
+
+def format_bill_transaction(row):
+    return {
+        'transactionId': row['transaction_id'],
+        'payer': row['payer'],
+        'amount': int(row['amount']),
+        'description': row['description'],
+        'transactionType': row['transaction_type'],
+        'timestamp': row['timestamp'],
+        'beneficiaries': json.loads(row['beneficiaries'] or '[]'),
+        'beneficiaryAmounts': [int(value) for value in json.loads(row['beneficiary_amounts'] or '[]')],
+        'blockNumber': row['block_number'],
+        'transactionHash': row['tx_hash']
+    }
+
+def format_bill(row):
+    transactions = [format_bill_transaction(transaction) for transaction in row.get('transactions', [])]
+    # Addresses that created, paid into or benefit from the bill
+    members = [row['creator']]
+    for transaction in transactions:
+        for address in [transaction['payer']] + transaction['beneficiaries']:
+            if address not in members:
+                members.append(address)
+    return {
+        'billId': row['bill_id'],
+        'billName': row['bill_name'],
+        'description': row['description'],
+        'creator': row['creator'],
+        'totalAmount': int(row['total_amount']),
+        'settledAmount': int(row['settled_amount']),
+        'currency': row['currency'],
+        'isSettled': bool(row['is_settled']),
+        'createdAt': row['created_at'],
+        'members': members,
+        'transactions': transactions,
+        'blockNumber': row['block_number'],
+        'transactionHash': row['tx_hash']
+    }
+
+def format_payment(row):
+    return {
+        'paymentId': row['payment_id'],
+        'transactionId': row['transaction_id'],
+        'payer': row['payer'],
+        'receiver': row['receiver'],
+        'amount': int(row['amount']),
+        'currency': row['currency'],
+        'paymentMethod': row['payment_method'],
+        'paymentDate': row['payment_date'],
+        'createdAt': row['created_at'],
+        'status': row['status'],
+        'notes': row['notes'],
+        'imageHash': row['image_hash'],
+        'isVerified': bool(row['is_verified']),
+        'verifiedBy': row['verified_by'],
+        'verifiedAt': row['verified_at'],
+        'blockNumber': row['block_number'],
+        'transactionHash': row['tx_hash']
+    }
+
+def find_tx_record(tx_id):
+    """Look up a tracking id returned by a write endpoint: a transaction or a batched item"""
+    lookups = ([tx_pipeline.get] if tx_pipeline is not None else []) + [coalescer.get for coalescer in write_coalescers]
+    for lookup in lookups:
+        record = lookup(tx_id)
+        if record is not None:
+            return record
+    return None
+
+def to_uint(value, field):
+    """Contract amounts are uint256 in the smallest currency unit"""
+    if isinstance(value, str) and value.isdigit():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        raise ValueError(f'{field} must be a non-negative integer')
+    return value
+
+def queue_contract_call(kind, contract_address, calldata, response_data, message, args=None, coalescer=None):
+    """
+    Hand a contract call to the transaction pipeline, or to ``coalescer`` to be
+    batched with its neighbours, and answer 202 with its status URL
+    """
+    meta = {key: response_data[key] for key in ('billId', 'transactionId', 'paymentId') if key in response_data}
+    if coalescer is not None:
+        record = coalescer.submit(args, calldata, meta=meta)
+        tracking_id = record['itemId']
+    else:
+        record = tx_pipeline.submit({'to': Web3.to_checksum_address(contract_address), 'data': calldata}, kind, meta=meta)
+        tracking_id = record['txId']
+    response_data.update({
+        'txId': tracking_id,
+        'txStatus': record['status'],
+        'batched': coalescer is not None,
+        'statusUrl': f"/api/web3/tx/{tracking_id}",
+        'transactionHash': None,
+        'blockNumber': None,
+        'gasUsed': None
+    })
+    return jsonify({
+        'success': True,
+        'data': response_data,
+        'message': message
+    }), 202
 
 @web3_bp.route('/health', methods=['GET'])
 @cross_origin()
 def health_check():
-    """Health check endpoint"""
+    """Liveness check; answers while the chain services are still loading"""
+    loaded = chain_services_loaded.is_set()
+    chain = chain_monitor.snapshot() if loaded else None
     return jsonify({
         'success': True,
         'message': 'Web3 service is running',
-        'web3_connected': w3 is not None and w3.is_connected() if w3 else False,
-        'provider_url': WEB3_PROVIDER_URL
+        'web3_connected': bool(chain and chain['connected']),
+        'chain_services_loaded': loaded,
+        'provider_url': WEB3_PROVIDER_URL,
+        'provider_urls': WEB3_PROVIDER_URLS,
+        'chain': chain,
+        'transactions': tx_pipeline.stats() if tx_pipeline is not None else None,
+        'write_batches': {coalescer.kind: coalescer.stats() for coalescer in write_coalescers},
+        'indexer': event_indexer.status() if event_indexer is not None else None,
+        'gas_oracle': gas_oracle.stats() if gas_oracle is not None else None,
+        'keypair_pool': keypair_pool.stats(),
+        'payment_anchoring': payment_anchorer.stats() if payment_anchorer is not None else None,
+        'streams': confirmation_hub.stats() if confirmation_hub is not None else None
     })
 
+@web3_bp.route('/ready', methods=['GET'])
+@cross_origin()
+def readiness_check():
+    """Readiness check: 200 once the chain services are loaded and a node is reachable"""
+    loaded = chain_services_loaded.is_set()
+    checks = {
+        'chain_services': loaded,
+        'node': loaded and chain_monitor.connected,
+        'chain_index': event_indexer.store is not None if loaded and event_indexer is not None else None
+    }
+    ready = checks['chain_services'] and checks['node']
+    if ready:
+        return jsonify({
+            'success': True,
+            'data': checks,
+            'message': 'Web3 service is ready'
+        })
+    if chain_services_error:
+        error = f'Chain services failed to load: {chain_services_error}'
+    elif not loaded:
+        error = 'Chain services are loading'
+    else:
+        error = 'Blockchain node is not reachable'
+    return jsonify({
+        'success': False,
+        'data': checks,
+        'error': error,
+        'message': 'Web3 service is not ready'
+    }), 503
+
+@web3_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Request and stage latency metrics in Prometheus text format"""
+    return metrics_response()
+
+@web3_bp.route('/rpc/endpoints', methods=['GET'])
+@cross_origin()
+def get_rpc_endpoints():
+    """Health score, error rate and latency histogram of each RPC endpoint"""
+    return jsonify({
+        'success': True,
+        'data': rpc_provider.stats(),
+        'message': 'RPC endpoint statistics retrieved successfully'
+    })
+
+@web3_bp.route('/tx/<tx_id>', methods=['GET'])
+@cross_origin()
+def get_tx_status(tx_id):
+    """Status, hash, receipt fields and confirmations of a queued contract transaction"""
+    record = find_tx_record(tx_id)
+    if record is None:
+        return jsonify({
+            'success': False,
+            'error': f'Unknown transaction: {tx_id}',
+            'message': 'Transaction not found'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'data': record,
+        'message': 'Transaction status retrieved successfully'
+    })
+
+def stream_snapshot(kind, item_id, latest_block):
+    """Current state of a streamed record, from the event index or the transaction tracker"""
+    snapshot = {'type': 'snapshot', 'topic': kind, 'id': item_id}
+    if kind == 'tx':
+        record = find_tx_record(item_id)
+        snapshot['found'] = record is not None
+        if record is not None:
+            snapshot.update({field: record.get(field) for field in ('status', 'txId', 'transactionHash', 'blockNumber',
+                                                                    'confirmations', 'error')})
+        return snapshot
+    
+    store = event_indexer.store if event_indexer is not None else None
+    row = None
+    if store is not None:
+        row = store.get_payment(item_id) if kind == 'payment' else store.get_bill(item_id)
+    snapshot['found'] = row is not None
+    if row is None:
+        return snapshot
+    if kind == 'payment':
+        snapshot.update({'status': row['status'], 'isVerified': bool(row['is_verified'])})
+    else:
+        snapshot.update({'isSettled': bool(row['is_settled']), 'totalAmount': int(row['total_amount']),
+                         'settledAmount': int(row['settled_amount'])})
+    confirmations = max(0, latest_block - row['block_number'] + 1) if latest_block is not None else None
+    snapshot.update({'transactionHash': row['tx_hash'], 'blockNumber': row['block_number'],
+                     'confirmations': confirmations, 'required': WEB3_STREAM_CONFIRMATIONS})
+    if confirmations is not None and confirmations < WEB3_STREAM_CONFIRMATIONS:
+        confirmation_hub.track(kind, item_id, row['tx_hash'], row['block_number'])
+    return snapshot
+
+def format_sse(event_type, data, event_id=None):
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines += [f'event: {event_type}', f'data: {json.dumps(data)}']
+    return '\n'.join(lines) + '\n\n'
+
+@web3_bp.route('/stream', methods=['GET'])
+@cross_origin()
+def stream_status():
+    """
+    Stream status changes of bills, payments and queued transactions as
+    server-sent events, in place of polling /bill/<id>, /payment/<id> and
+    /tx/<id>.
+
+    ``payment``, ``bill`` and ``tx`` take ids (repeated or comma-separated;
+    ``tx`` is a write endpoint's txId). The stream opens with a ``snapshot``
+    event per record, then sends ``submitted``, ``mined``, ``confirmations``,
+    ``confirmed``, ``verified``, ``status``, ``transaction``, ``payment``,
+    ``settled``, ``reverted``, ``failed``, ``timeout`` or ``reorged`` as they
+    happen. ``timeout`` (seconds, up to WEB3_STREAM_MAX_SECONDS) ends the
+    stream early; clients reconnect and get a fresh snapshot.
+    """
+    ids = {kind: [item_id for value in request.args.getlist(kind) for item_id in value.split(',') if item_id]
+           for kind in ('payment', 'bill', 'tx')}
+    topic_count = sum(len(item_ids) for item_ids in ids.values())
+    try:
+        timeout = min(float(request.args.get('timeout', WEB3_STREAM_MAX_SECONDS)), WEB3_STREAM_MAX_SECONDS)
+    except ValueError:
+        timeout = -1
+    if topic_count == 0 or topic_count > MAX_STREAM_TOPICS or timeout <= 0:
+        return jsonify({
+            'success': False,
+            'error': f'Give 1 to {MAX_STREAM_TOPICS} payment, bill or tx ids and a positive timeout',
+            'message': 'Invalid request data'
+        }), 400
+    if confirmation_hub is None:
+        return jsonify({
+            'success': False,
+            'error': 'No bill or payment contract is configured',
+            'message': 'Status stream unavailable'
+        }), 503
+    
+    # Subscribed before the snapshot is read, so nothing happens unseen in between
+    subscription = confirmation_hub.subscribe(ids['payment'], ids['bill'], ids['tx'])
+    if subscription is None:
+        return jsonify({
+            'success': False,
+            'error': 'Too many open status streams',
+            'message': 'Status stream unavailable'
+        }), 503
+    try:
+        latest_block = chain_monitor.snapshot()['latest_block']
+        with stage('index_query'):
+            snapshots = [stream_snapshot(kind, item_id, latest_block) for kind, item_ids in ids.items()
+                         for item_id in item_ids]
+    except Exception as e:
+        confirmation_hub.unsubscribe(subscription)
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': 'Failed to open status stream'
+        }), 500
+    
+    def stream():
+        deadline = time.monotonic() + timeout
+        try:
+            yield 'retry: 3000\n\n'
+            for snapshot in snapshots:
+                yield format_sse('snapshot', snapshot)
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    yield format_sse('end', {'reason': 'timeout'})
+                    return
+                event = subscription.get(min(remaining, WEB3_STREAM_KEEPALIVE_SECONDS))
+                if subscription.overflowed:
+                    # Events were dropped; the client must reconnect for a fresh snapshot
+                    yield format_sse('end', {'reason': 'overflow'})
+                    return
+                if event is None:
+                    # Keeps proxies from closing an idle stream and notices closed clients
+                    yield ': keepalive\n\n'
+                    continue
+                yield format_sse(event['type'], event, event['seq'])
+        finally:
+            confirmation_hub.unsubscribe(subscription)
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @web3_bp.route('/account/create', methods=['POST'])
 @cross_origin()
 def create_account():
@@ -156,12 +866,117 @@ def create_account():
             'message': 'Failed to create account'
         }), 500
 
+# Bulk key generation runs in worker processes, started on the first batch request
+MAX_KEYPAIRS_PER_REQUEST = int(os.getenv('WEB3_MAX_KEYPAIRS_PER_REQUEST', '1000'))
+WEB3_KEYSTORE_DIR = os.getenv('WEB3_KEYSTORE_DIR', os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'database', 'keystore'
+))
+WEB3_KEYSTORE_PASSWORD = os.getenv('WEB3_KEYSTORE_PASSWORD')
+# Keystore key derivation: 'scrypt' (default) or 'pbkdf2', with optional work factor
+WEB3_KEYSTORE_KDF = os.getenv('WEB3_KEYSTORE_KDF') or None
+WEB3_KEYSTORE_ITERATIONS = int(os.getenv('WEB3_KEYSTORE_ITERATIONS')) if os.getenv('WEB3_KEYSTORE_ITERATIONS') else None
+
+keypair_pool = KeypairPool(
+    int(os.getenv('WEB3_KEYGEN_PROCESSES', str(os.cpu_count() or 1))),
+    chunk_size=int(os.getenv('WEB3_KEYGEN_CHUNK_SIZE', '64')),
+    # Forked children can inherit locks held by the server's threads (an import in progress, a
+    # logging handler) and hang; spawned workers start from a clean interpreter
+    start_method=os.getenv('WEB3_KEYGEN_START_METHOD', 'spawn'),
+)
+
+@web3_bp.record_once
+def setup_keypair_pool(state):
+    add_serving_hook(state.app, 'shutdown', keypair_pool.shutdown)
+
+def open_keystore_file():
+    """Create a new owner-only keystore file; returns (file, name)"""
+    os.makedirs(WEB3_KEYSTORE_DIR, mode=0o700, exist_ok=True)
+    name = f"keypairs-{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}-{uuid.uuid4().hex[:8]}.jsonl"
+    fd = os.open(os.path.join(WEB3_KEYSTORE_DIR, name), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    return os.fdopen(fd, 'w'), name
+
+@web3_bp.route('/account/create-batch', methods=['POST'])
+@cross_origin()
+def create_accounts_batch():
+    """
+    Create ``count`` accounts in parallel and stream them as NDJSON.
+
+    Each line is one account: index, address, public_key and private_key.
+    With ``keystore=true`` private keys are left out of the response and
+    written, encrypted with WEB3_KEYSTORE_PASSWORD, to a new keystore file
+    (one V3 keystore object per line) under WEB3_KEYSTORE_DIR. The last line
+    is ``{"done": true, ...}``, or ``{"done": false, "error": ...}`` if
+    generation stopped early.
+    """
+    try:
+        count = int(request.args.get('count', '1'))
+    except ValueError:
+        count = 0
+    if count < 1 or count > MAX_KEYPAIRS_PER_REQUEST:
+        return jsonify({
+            'success': False,
+            'error': f'count must be an integer from 1 to {MAX_KEYPAIRS_PER_REQUEST}',
+            'message': 'Invalid request data'
+        }), 400
+    
+    to_keystore = request.args.get('keystore', 'false').lower() in ('1', 'true', 'yes')
+    keystore_file = keystore_name = None
+    if to_keystore:
+        if not WEB3_KEYSTORE_PASSWORD:
+            return jsonify({
+                'success': False,
+                'error': 'WEB3_KEYSTORE_PASSWORD is not configured',
+                'message': 'Keystore unavailable'
+            }), 503
+        try:
+            keystore_file, keystore_name = open_keystore_file()
+        except OSError as e:
+            logger.error(f"Error creating keystore file: {str(e)}")
+            return jsonify({
+                'success': False,
+                'error': str(e),
+                'message': 'Keystore unavailable'
+            }), 500
+    
+    def stream():
+        addresses = set()
+        generated = 0
+        try:
+            keypairs = keypair_pool.generate(
+                count,
+                keystore_password=WEB3_KEYSTORE_PASSWORD if to_keystore else None,
+                kdf=WEB3_KEYSTORE_KDF,
+                iterations=WEB3_KEYSTORE_ITERATIONS,
+            )
+            for index, keypair in enumerate(keypairs):
+                # Independent CSPRNG draws never collide; a repeat means broken entropy
+                if keypair['address'] in addresses:
+                    raise RuntimeError('Duplicate key generated, aborting batch')
+                addresses.add(keypair['address'])
+                if to_keystore:
+                    # Persist the key before its address reaches the client
+                    keystore_file.write(json.dumps(keypair.pop('keystore')) + '\n')
+                    keystore_file.flush()
+                generated += 1
+                yield json.dumps(dict(keypair, index=index)) + '\n'
+            yield json.dumps({'done': True, 'count': generated, 'keystore': keystore_name}) + '\n'
+        except Exception as e:
+            logger.error(f"Error generating accounts: {str(e)}")
+            yield json.dumps({'done': False, 'count': generated, 'keystore': keystore_name, 'error': str(e)}) + '\n'
+        finally:
+            if keystore_file is not None:
+                os.fsync(keystore_file.fileno())
+                keystore_file.close()
+    
+    return Response(stream(), mimetype='application/x-ndjson')
+
 @web3_bp.route('/account/balance/<address>', methods=['GET'])
 @cross_origin()
 def get_balance(address):
     """Get account balance"""
     try:
-        if not w3 or not w3.is_connected():
+        w3 = chain_monitor.get_web3()
+        if not w3:
             return jsonify({
                 'success': False,
                 'error': 'Web3 not connected',
@@ -189,6 +1004,123 @@ def get_balance(address):
             'message': 'Failed to get balance'
         }), 500
 
+# Balances keyed by (checksum address, block number); a block's balances never change,
+# the TTL only bounds how long entries for old blocks are kept
+balance_cache = TTLCache(
+    max_entries=int(os.getenv('WEB3_BALANCE_CACHE_SIZE', '4096')),
+    ttl_seconds=float(os.getenv('WEB3_BALANCE_CACHE_TTL', '15')),
+)
+MAX_BALANCE_ADDRESSES = int(os.getenv('WEB3_MAX_BALANCE_ADDRESSES', '100'))
+NAMED_BLOCK_TAGS = ('latest', 'earliest', 'pending', 'safe', 'finalized')
+
+def resolve_block(block, w3):
+    """
+    Turn a block tag into (block_param, block_number).
+    'latest' is pinned to the monitor's latest block so repeated lookups within
+    one block share cache entries; other named tags are not cacheable.
+    """
+    if block is None or block == 'latest':
+        block_number = chain_monitor.snapshot()['latest_block']
+        if block_number is None:
+            block_number = w3.eth.block_number
+        return hex(block_number), block_number
+    if isinstance(block, int) or (isinstance(block, str) and block.isdigit()):
+        return hex(int(block)), int(block)
+    if isinstance(block, str) and block.startswith('0x'):
+        return block, int(block, 16)
+    if block in NAMED_BLOCK_TAGS:
+        return block, None
+    raise ValueError(f'Invalid block tag: {block}')
+
+@web3_bp.route('/account/balances', methods=['POST'])
+@cross_origin()
+def get_balances():
+    """Get balances of many accounts with one JSON-RPC batch request"""
+    try:
+        data = request.get_json(silent=True) or {}
+        addresses = data.get('addresses')
+        if not isinstance(addresses, list) or not addresses:
+            return jsonify({
+                'success': False,
+                'error': 'addresses must be a non-empty list',
+                'message': 'Invalid request data'
+            }), 400
+        if len(addresses) > MAX_BALANCE_ADDRESSES:
+            return jsonify({
+                'success': False,
+                'error': f'At most {MAX_BALANCE_ADDRESSES} addresses per request',
+                'message': 'Invalid request data'
+            }), 400
+        
+        w3 = chain_monitor.get_web3()
+        if not w3:
+            return jsonify({
+                'success': False,
+                'error': 'Web3 not connected',
+                'message': 'Cannot connect to blockchain'
+            }), 500
+        
+        try:
+            block_param, block_number = resolve_block(data.get('block', 'latest'), w3)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e),
+                'message': 'Invalid request data'
+            }), 400
+        
+        # Validate and checksum, answer from cache, and collect the misses
+        results = []
+        lookups = {}
+        for address in addresses:
+            if not isinstance(address, str) or not Web3.is_address(address):
+                results.append({'address': address, 'error': 'Invalid address'})
+                continue
+            checksum_address = Web3.to_checksum_address(address)
+            cached = balance_cache.get((checksum_address, block_number)) if block_number is not None else None
+            results.append({'address': address, 'checksumAddress': checksum_address, 'balance_wei': cached})
+            if cached is None:
+                lookups.setdefault(checksum_address, []).append(results[-1])
+        
+        if lookups:
+            batch = [('eth_getBalance', [checksum_address, block_param]) for checksum_address in lookups]
+            responses = rpc_provider.make_batch_request(batch)
+            if not isinstance(responses, list):
+                # The node rejected the whole batch
+                error = responses.get('error', {}).get('message', 'Batch request failed')
+                responses = [{'error': {'message': error}}] * len(batch)
+            for checksum_address, response in zip(lookups, responses):
+                for entry in lookups[checksum_address]:
+                    if 'error' in response:
+                        entry['error'] = response['error'].get('message', 'RPC error')
+                        entry.pop('balance_wei')
+                    else:
+                        entry['balance_wei'] = int(response['result'], 16)
+                if 'error' not in response and block_number is not None:
+                    balance_cache.set((checksum_address, block_number), int(response['result'], 16))
+        
+        for entry in results:
+            if entry.get('balance_wei') is not None:
+                entry['balance_eth'] = str(Web3.from_wei(entry['balance_wei'], 'ether'))
+                entry['balance_wei'] = str(entry['balance_wei'])
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'block': block_param,
+                'blockNumber': block_number,
+                'balances': results,
+                'rpcLookups': len(lookups)
+            },
+            'message': 'Balances retrieved successfully'
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': 'Failed to get balances'
+        }), 500
+
 @web3_bp.route('/bill/create', methods=['POST'])
 @cross_origin()
 def create_bill():
@@ -206,7 +1138,6 @@ def create_bill():
                     'message': 'Invalid request data'
                 }), 400
         
-        # For demo purposes, simulate blockchain transaction
         bill_data = {
             'billId': data['billId'],
             'billName': data['billName'],
@@ -216,11 +1147,30 @@ def create_bill():
             'totalAmount': 0,
             'settledAmount': 0,
             'isSettled': False,
-            'createdAt': int(datetime.now().timestamp()),
+            'createdAt': int(datetime.now().timestamp())
+        }
+        
+        if contract_writes_enabled(BILL_CONTRACT_ADDRESS):
+            try:
+                calldata = bill_contract.encode_abi('createBill', args=[
+                    data['billId'], data['billName'], data['description'], data['currency']
+                ])
+            except Exception as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e),
+                    'message': 'Invalid request data'
+                }), 400
+            bill_data['creator'] = tx_pipeline.address
+            return queue_contract_call('createBill', BILL_CONTRACT_ADDRESS, calldata, bill_data,
+                                       'Bill creation submitted to blockchain')
+        
+        # For demo purposes, simulate blockchain transaction
+        bill_data.update({
             'transactionHash': '0x' + 'a' * 64,  # Mock transaction hash
             'blockNumber': 12345,
             'gasUsed': 150000
-        }
+        })
         
         return jsonify({
             'success': True,
@@ -240,6 +1190,26 @@ def create_bill():
 def get_bill(bill_id):
     """Get bill information from blockchain"""
     try:
+        if event_indexer is not None:
+            store = event_indexer.store
+            if store is None:
+                return chain_index_unavailable()
+            with stage('index_query'):
+                bill = store.get_bill(bill_id)
+            if bill is None:
+                return jsonify({
+                    'success': False,
+                    'error': f'Bill not found: {bill_id}',
+                    'indexedBlock': store.indexed_block(),
+                    'message': 'Bill not found'
+                }), 404
+            return jsonify({
+                'success': True,
+                'data': format_bill(bill),
+                'indexedBlock': store.indexed_block(),
+                'message': 'Bill retrieved successfully'
+            })
+        
         # For demo purposes, return mock data
         bill_data = {
             'billId': bill_id,
@@ -267,6 +1237,100 @@ def get_bill(bill_id):
             'message': 'Failed to get bill'
         }), 500
 
+@web3_bp.route('/bill/<bill_id>/settlement', methods=['GET'])
+@cross_origin()
+def get_bill_settlement(bill_id):
+    """
+    Net balance of every bill member and the transfers (makePayment calls)
+    that settle them, compared with settling each debtor/creditor pair
+    separately. Settlement payments already made are taken into account.
+    """
+    try:
+        store = event_indexer.store if event_indexer is not None else None
+        if store is None:
+            return chain_index_unavailable()
+        
+        with stage('index_query'):
+            bill = store.get_bill(bill_id)
+            settlement_rows = store.bill_settlements(bill_id) if bill is not None else []
+        if bill is None:
+            return jsonify({
+                'success': False,
+                'error': f'Bill not found: {bill_id}',
+                'indexedBlock': store.indexed_block(),
+                'message': 'Bill not found'
+            }), 404
+        
+        transactions = [format_bill_transaction(row) for row in bill['transactions']]
+        with stage('settlement'):
+            entries = [
+                (transaction['payer'], transaction['amount'], transaction['beneficiaries'],
+                 transaction['beneficiaryAmounts'])
+                for transaction in transactions
+            ]
+            settlements = [(row['payer'], row['receiver'], int(row['amount'])) for row in settlement_rows]
+            balances = net_balances(entries, settlements)
+            transfers = plan_transfers(balances)
+            pairwise = pairwise_transfers(entries, settlements)
+        
+        gas_per_transfer = GAS_ESTIMATE_FALLBACKS['makePayment']
+        return jsonify({
+            'success': True,
+            'data': {
+                'billId': bill['bill_id'],
+                'currency': bill['currency'],
+                'isSettled': not balances,
+                'balances': [
+                    {'address': address, 'balance': balance}
+                    for address, balance in sorted(balances.items(), key=lambda item: (-item[1], item[0]))
+                ],
+                'transfers': [{'from': debtor, 'to': creditor, 'amount': amount}
+                              for debtor, creditor, amount in transfers],
+                'transferCount': len(transfers),
+                'pairwiseTransferCount': len(pairwise),
+                'estimatedGas': len(transfers) * gas_per_transfer,
+                'pairwiseEstimatedGas': len(pairwise) * gas_per_transfer,
+                'settlementsMade': len(settlements)
+            },
+            'indexedBlock': store.indexed_block(),
+            'message': 'Settlement plan computed successfully'
+        })
+    except Exception as e:
+        logger.error(f"Error computing settlement for bill {bill_id}: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': 'Failed to compute settlement'
+        }), 500
+
+@web3_bp.route('/bills', methods=['GET'])
+@cross_origin()
+def list_bills():
+    """List indexed bills, oldest first"""
+    try:
+        store = event_indexer.store if event_indexer is not None else None
+        if store is None:
+            return chain_index_unavailable()
+        limit = min(int(request.args.get('limit', 50)), 500)
+        offset = int(request.args.get('offset', 0))
+        with stage('index_query'):
+            rows = store.list_bills(limit, offset)
+        bills = [format_bill(bill) for bill in rows]
+        
+        return jsonify({
+            'success': True,
+            'data': bills,
+            'indexedBlock': store.indexed_block(),
+            'message': 'Bills retrieved successfully'
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': 'Failed to list bills'
+        }), 500
+
 @web3_bp.route('/transaction/add', methods=['POST'])
 @cross_origin()
 def add_transaction():
@@ -284,7 +1348,6 @@ def add_transaction():
                     'message': 'Invalid request data'
                 }), 400
         
-        # For demo purposes, simulate blockchain transaction
         transaction_data = {
             'transactionId': data['transactionId'],
             'billId': data['billId'],
@@ -294,11 +1357,48 @@ def add_transaction():
             'transactionType': data['transactionType'],
             'timestamp': int(datetime.now().timestamp()),
             'isSettled': False,
-            'beneficiaries': data.get('beneficiaries', []),
+            'beneficiaries': data.get('beneficiaries', [])
+        }
+        
+        if contract_writes_enabled(BILL_CONTRACT_ADDRESS):
+            try:
+                amount = to_uint(data['amount'], 'amount')
+                beneficiaries = [Web3.to_checksum_address(address) for address in transaction_data['beneficiaries']]
+                if 'beneficiaryAmounts' in data:
+                    beneficiary_amounts = [to_uint(value, 'beneficiaryAmounts') for value in data['beneficiaryAmounts']]
+                elif beneficiaries:
+                    # Split evenly; the contract requires the shares to add up to the amount
+                    share, remainder = divmod(amount, len(beneficiaries))
+                    beneficiary_amounts = [share + (1 if index < remainder else 0) for index in range(len(beneficiaries))]
+                else:
+                    beneficiary_amounts = []
+                call_args = [
+                    data['transactionId'], data['billId'], amount, data['description'],
+                    data['transactionType'], beneficiaries, beneficiary_amounts
+                ]
+                calldata = bill_contract.encode_abi('addTransaction', args=call_args)
+            except Exception as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e),
+                    'message': 'Invalid request data'
+                }), 400
+            transaction_data.update({
+                'payer': tx_pipeline.address,
+                'amount': amount,
+                'beneficiaries': beneficiaries,
+                'beneficiaryAmounts': beneficiary_amounts
+            })
+            return queue_contract_call('addTransaction', BILL_CONTRACT_ADDRESS, calldata, transaction_data,
+                                       'Transaction submitted to blockchain',
+                                       args=tuple(call_args), coalescer=transaction_writes)
+        
+        # For demo purposes, simulate blockchain transaction
+        transaction_data.update({
             'transactionHash': '0x' + 'b' * 64,  # Mock transaction hash
             'blockNumber': 12346,
             'gasUsed': 120000
-        }
+        })
         
         return jsonify({
             'success': True,
@@ -330,7 +1430,6 @@ def record_payment():
                     'message': 'Invalid request data'
                 }), 400
         
-        # For demo purposes, simulate blockchain transaction
         payment_data = {
             'paymentId': data['paymentId'],
             'transactionId': data.get('transactionId', ''),
@@ -344,11 +1443,63 @@ def record_payment():
             'status': 'Completed',
             'notes': data.get('notes', ''),
             'imageHash': data.get('imageHash', ''),
-            'isVerified': False,
+            'isVerified': False
+        }
+        
+        if contract_writes_enabled(PAYMENT_CONTRACT_ADDRESS):
+            # The image hash goes into the next Merkle batch instead of the payment record
+            anchored = payment_anchorer is not None and payment_anchorer.store is not None and bool(payment_data['imageHash'])
+            try:
+                receiver = Web3.to_checksum_address(data['receiver'])
+                amount = to_uint(data['amount'], 'amount')
+                payment_date = to_uint(payment_data['paymentDate'], 'paymentDate')
+                if amount == 0:
+                    raise ValueError('amount must be greater than 0')
+                call_args = [
+                    data['paymentId'], payment_data['transactionId'], receiver, amount, data['currency'],
+                    data['paymentMethod'], payment_date, payment_data['notes'],
+                    '' if anchored else payment_data['imageHash']
+                ]
+                calldata = payment_contract.encode_abi('recordPayment', args=call_args)
+            except Exception as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e),
+                    'message': 'Invalid request data'
+                }), 400
+            if anchored:
+                existing = payment_anchorer.image_hash(data['paymentId'])
+                if existing is not None and existing != payment_data['imageHash']:
+                    return jsonify({
+                        'success': False,
+                        'error': f"Payment {data['paymentId']} already has a different anchored image hash",
+                        'message': 'Invalid request data'
+                    }), 409
+                payment_data['imageHashAnchor'] = {
+                    'status': 'pending',
+                    'proofUrl': f"/api/web3/payment/{data['paymentId']}/proof"
+                }
+            payment_data.update({
+                'payer': tx_pipeline.address,
+                'receiver': receiver,
+                'amount': amount,
+                'status': 'Pending'
+            })
+            response = queue_contract_call('recordPayment', PAYMENT_CONTRACT_ADDRESS, calldata, payment_data,
+                                           'Payment submitted to blockchain',
+                                           args=tuple(call_args), coalescer=payment_writes)
+            # Queued only once the write is accepted, so a rejected request leaves nothing to anchor
+            if anchored and payment_anchorer.add(data['paymentId'], payment_data['imageHash']) is None:
+                if payment_anchorer.image_hash(data['paymentId']) != payment_data['imageHash']:
+                    logger.warning(f"Payment {data['paymentId']} got another anchored image hash while submitted")
+            return response
+        
+        # For demo purposes, simulate blockchain transaction
+        payment_data.update({
             'transactionHash': '0x' + 'c' * 64,  # Mock transaction hash
             'blockNumber': 12347,
             'gasUsed': 100000
-        }
+        })
         
         return jsonify({
             'success': True,
@@ -368,6 +1519,29 @@ def record_payment():
 def get_payment(payment_id):
     """Get payment record from blockchain"""
     try:
+        if event_indexer is not None:
+            store = event_indexer.store
+            if store is None:
+                return chain_index_unavailable()
+            with stage('index_query'):
+                payment = store.get_payment(payment_id)
+            if payment is None:
+                return jsonify({
+                    'success': False,
+                    'error': f'Payment record not found: {payment_id}',
+                    'indexedBlock': store.indexed_block(),
+                    'message': 'Payment record not found'
+                }), 404
+            payment_data = format_payment(payment)
+            if not payment_data['imageHash'] and payment_anchorer is not None and payment_anchorer.store is not None:
+                payment_data['imageHash'] = payment_anchorer.image_hash(payment_id) or ''
+            return jsonify({
+                'success': True,
+                'data': payment_data,
+                'indexedBlock': store.indexed_block(),
+                'message': 'Payment record retrieved successfully'
+            })
+        
         # For demo purposes, return mock data
         payment_data = {
             'paymentId': payment_id,
@@ -400,6 +1574,143 @@ def get_payment(payment_id):
             'message': 'Failed to get payment record'
         }), 500
 
+@web3_bp.route('/payment/<payment_id>/proof', methods=['GET'])
+@cross_origin()
+def get_payment_proof(payment_id):
+    """
+    Merkle inclusion proof of a payment's anchored image hash. ``imageHash``
+    checks a claimed hash instead of the recorded one; ``checkChain=true``
+    also runs the contract's verifyImageHash against the anchored root.
+    """
+    try:
+        if payment_anchorer is None or payment_anchorer.store is None:
+            return jsonify({
+                'success': False,
+                'error': 'Payment anchoring is not enabled' if payment_anchorer is None else 'Payment anchoring is not ready',
+                'message': 'Payment anchoring unavailable'
+            }), 503
+        
+        with stage('anchor_proof'):
+            anchor = payment_anchorer.proof(payment_id)
+        if anchor is None:
+            return jsonify({
+                'success': False,
+                'error': f'No anchored image hash for payment: {payment_id}',
+                'message': 'Payment proof not found'
+            }), 404
+        
+        leaf, batch, proof = anchor['leaf'], anchor['batch'], anchor['proof']
+        image_hash = request.args.get('imageHash', leaf['image_hash'])
+        proof_data = {
+            'paymentId': payment_id,
+            'imageHash': image_hash,
+            'leaf': '0x' + leaf['leaf'],
+            'batchId': leaf['batch_id'],
+            'leafIndex': leaf['leaf_index'],
+            'anchorStatus': batch['status'] if batch else 'pending',
+            'root': '0x' + batch['root'] if batch else None,
+            'leafCount': batch['leaf_count'] if batch else None,
+            'proof': ['0x' + sibling.hex() for sibling in proof] if proof is not None else None,
+            'transactionHash': batch['tx_hash'] if batch else None,
+            'blockNumber': batch['block_number'] if batch else None,
+            'verified': None,
+            'verifiedOnChain': None
+        }
+        if batch is not None:
+            root = bytes.fromhex(batch['root'])
+            proof_data['verified'] = payment_anchorer.verify(payment_id, image_hash, proof, root)
+            if request.args.get('checkChain', 'false').lower() in ('1', 'true', 'yes'):
+                w3 = chain_monitor.get_web3()
+                if w3 is None:
+                    return jsonify({
+                        'success': False,
+                        'error': 'Blockchain node is not reachable',
+                        'message': 'Failed to verify payment proof on chain'
+                    }), 503
+                contract = w3.eth.contract(address=Web3.to_checksum_address(PAYMENT_CONTRACT_ADDRESS), abi=PAYMENT_CONTRACT_ABI)
+                with stage('rpc'):
+                    proof_data['verifiedOnChain'] = contract.functions.verifyImageHash(
+                        payment_id, image_hash, proof, root
+                    ).call()
+        
+        return jsonify({
+            'success': True,
+            'data': proof_data,
+            'message': 'Payment proof retrieved successfully' if batch else 'Image hash is waiting for its batch'
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': 'Failed to get payment proof'
+        }), 500
+
+@web3_bp.route('/transaction/<transaction_id>/payments', methods=['GET'])
+@cross_origin()
+def get_transaction_payments(transaction_id):
+    """Payment records linked to a bill transaction"""
+    try:
+        store = event_indexer.store if event_indexer is not None else None
+        if store is None:
+            return chain_index_unavailable()
+        with stage('index_query'):
+            rows = store.payments_by_transaction(transaction_id)
+        payments = [format_payment(payment) for payment in rows]
+        
+        return jsonify({
+            'success': True,
+            'data': payments,
+            'indexedBlock': store.indexed_block(),
+            'message': 'Payment records retrieved successfully'
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': 'Failed to get payment records'
+        }), 500
+
+@web3_bp.route('/user/<address>/summary', methods=['GET'])
+@cross_origin()
+def get_user_summary(address):
+    """Total paid and received by an address, with its bill and payment ids"""
+    try:
+        if not Web3.is_address(address):
+            return jsonify({
+                'success': False,
+                'error': 'Invalid address',
+                'message': 'Invalid request data'
+            }), 400
+        store = event_indexer.store if event_indexer is not None else None
+        if store is None:
+            return chain_index_unavailable()
+        address = Web3.to_checksum_address(address)
+        with stage('index_query'):
+            summary = store.user_summary(address)
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'address': address,
+                'totalPaid': int(summary['totals']['total_paid']),
+                'totalReceived': int(summary['totals']['total_received']),
+                'billsCreated': [row['bill_id'] for row in summary['bills']],
+                'paymentsMade': [row['payment_id'] for row in summary['paid']],
+                'paymentsReceived': [row['payment_id'] for row in summary['received']]
+            },
+            'indexedBlock': store.indexed_block(),
+            'message': 'User summary retrieved successfully'
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': 'Failed to get user summary'
+        }), 500
+
 @web3_bp.route('/contract/deploy', methods=['POST'])
 @cross_origin()
 def deploy_contract():
@@ -431,25 +1742,62 @@ def deploy_contract():
             'message': 'Failed to deploy contract'
         }), 500
 
+# Typical gas of each operation, used when it cannot be estimated on the node
+GAS_ESTIMATE_FALLBACKS = {
+    'createBill': 150000,
+    'addTransaction': 120000,
+    'recordPayment': 100000,
+    'verifyPayment': 50000,
+    'settleBill': 80000,
+    'makePayment': 60000,
+    'anchorRoot': 50000
+}
+FALLBACK_GAS_PRICE = 20000000000  # 20 Gwei
+
+def deployed_contract_for(function_name):
+    """The configured contract whose ABI declares the function, or None"""
+    for contract in indexed_contracts:
+        if any(item.get('type') == 'function' and item['name'] == function_name for item in contract.abi):
+            return contract
+    return None
+
 @web3_bp.route('/gas/estimate', methods=['POST'])
 @cross_origin()
 def estimate_gas():
-    """Estimate gas for a transaction"""
+    """
+    Estimate gas and cost for a contract operation.
+    With ``args`` (the call's ABI arguments in order) the call is estimated on
+    the node; fees come from the gas oracle at the requested ``level``.
+    """
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True) or {}
         operation = data.get('operation', 'createBill')
+        level = data.get('level', 'standard')
+        if level not in FEE_LEVELS:
+            return jsonify({
+                'success': False,
+                'error': f"level must be one of: {', '.join(FEE_LEVELS)}",
+                'message': 'Invalid request data'
+            }), 400
         
-        # Mock gas estimates for different operations
-        gas_estimates = {
-            'createBill': 150000,
-            'addTransaction': 120000,
-            'recordPayment': 100000,
-            'verifyPayment': 50000,
-            'settleBill': 80000
-        }
+        estimated_gas = GAS_ESTIMATE_FALLBACKS.get(operation, 100000)
+        estimate_source, estimate_error = 'static', None
+        contract = deployed_contract_for(operation)
+        if contract is not None and 'args' in data:
+            sender = data.get('from') or (tx_pipeline.address if tx_pipeline is not None else ZERO_ADDRESS)
+            try:
+                estimated_gas, cached = gas_oracle.estimate_call(contract, operation, data['args'], sender)
+                estimate_source = 'cache' if cached else 'node'
+            except Exception as e:
+                estimate_error = str(e)
         
-        estimated_gas = gas_estimates.get(operation, 100000)
-        gas_price = 20000000000  # 20 Gwei
+        fees, gas_price, fee_source = None, FALLBACK_GAS_PRICE, 'static'
+        try:
+            fees = gas_oracle.suggestions()
+            gas_price = gas_oracle.expected_gas_price(level)
+            fee_source = 'feeHistory' if fees['type'] == 'eip1559' else 'gasPrice'
+        except Exception as e:
+            logger.warning(f"Gas oracle unavailable, using static gas price: {str(e)}")
         estimated_cost = estimated_gas * gas_price
         
         return jsonify({
@@ -457,9 +1805,16 @@ def estimate_gas():
             'data': {
                 'operation': operation,
                 'estimatedGas': estimated_gas,
+                'estimateSource': estimate_source,
+                'estimateError': estimate_error,
                 'gasPrice': gas_price,
+                'feeSource': fee_source,
+                'level': level,
+                'fees': fees['levels'] if fees else None,
+                'baseFeePerGas': fees['baseFeePerGas'] if fees else None,
+                'blockNumber': fees['blockNumber'] if fees else None,
                 'estimatedCostWei': estimated_cost,
-                'estimatedCostEth': str(w3.from_wei(estimated_cost, 'ether')) if w3 else '0'
+                'estimatedCostEth': str(Web3.from_wei(estimated_cost, 'ether'))
             },
             'message': 'Gas estimation completed'
         })
@@ -470,4 +1825,3 @@ def estimate_gas():
             'error': str(e),
             'message': 'Failed to estimate gas'
         }), 500
-
@@ -0,0 +1,117 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ChainMonitor:
+    """
+    Background monitor of blockchain connectivity.
+
+    A daemon thread polls the node every ``interval`` seconds and keeps a
+    snapshot of the connection state (connected, latest block, chain id and
+    RPC latency) that request handlers read without touching the network.
+    While the node is unreachable the poll interval backs off exponentially
+    up to ``max_backoff`` seconds, and the Web3 client is rebuilt by
+    ``connect()`` on every retry.
+    """
+
+    def __init__(self, connect, interval=5.0, max_backoff=60.0):
+        self.connect = connect
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.w3 = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._snapshot = {
+            'connected': False,
+            'checked': False,
+            'latest_block': None,
+            'chain_id': None,
+            'latency_ms': None,
+            'last_checked': None,
+            'last_connected': None,
+            'last_error': None,
+            'consecutive_failures': 0,
+        }
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name='chain-monitor', daemon=True)
+        self._thread.start()
+
+    def refresh(self):
+        """Ask the monitor thread to check the node now"""
+        self._wake.set()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._snapshot)
+
+    @property
+    def connected(self):
+        with self._lock:
+            return self._snapshot['connected']
+
+    def get_web3(self):
+        """The Web3 client if the node answered the last check, otherwise None"""
+        return self.w3 if self.connected else None
+
+    def check(self):
+        """Poll the node once and update the snapshot"""
+        try:
+            if self.w3 is None:
+                self.w3 = self.connect()
+            started = time.perf_counter()
+            latest_block = self.w3.eth.block_number
+            latency_ms = (time.perf_counter() - started) * 1000
+            chain_id = self._snapshot['chain_id']
+            if chain_id is None:
+                chain_id = self.w3.eth.chain_id
+        except Exception as e:
+            with self._lock:
+                was_connected = self._snapshot['connected']
+                self._snapshot.update({
+                    'connected': False,
+                    'checked': True,
+                    'last_checked': time.time(),
+                    'last_error': str(e),
+                    'consecutive_failures': self._snapshot['consecutive_failures'] + 1,
+                })
+            # Drop the client so the next attempt starts from a fresh session
+            self.w3 = None
+            if was_connected:
+                logger.warning(f"Lost connection to blockchain node: {str(e)}")
+            return False
+
+        with self._lock:
+            if not self._snapshot['connected']:
+                logger.info(f"Connected to blockchain node, chain id {chain_id}, block {latest_block}")
+            now = time.time()
+            self._snapshot.update({
+                'connected': True,
+                'checked': True,
+                'latest_block': latest_block,
+                'chain_id': chain_id,
+                'latency_ms': round(latency_ms, 2),
+                'last_checked': now,
+                'last_connected': now,
+                'last_error': None,
+                'consecutive_failures': 0,
+            })
+        return True
+
+    def next_delay(self):
+        failures = self.snapshot()['consecutive_failures']
+        if failures == 0:
+            return self.interval
+        return min(self.max_backoff, self.interval * (2 ** (failures - 1)))
+
+    def _run(self):
+        while True:
+            self.check()
+            self._wake.wait(self.next_delay())
+            self._wake.clear()
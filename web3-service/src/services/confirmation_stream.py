@@ -0,0 +1,283 @@
+import itertools
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+from web3 import Web3
+
+from src.services.event_indexer import EVENT_ID_FIELDS, event_topic, id_hash
+
+logger = logging.getLogger(__name__)
+
+# Contract events pushed to subscribers: (topic kind, event type, argument holding
+# the record's id hash, or None when it is the first indexed topic)
+STREAM_EVENTS = {
+    'BillCreated': ('bill', 'mined', None),
+    'TransactionAdded': ('bill', 'transaction', 'billId'),
+    'PaymentMade': ('bill', 'payment', None),
+    'BillSettled': ('bill', 'settled', None),
+    'PaymentRecorded': ('payment', 'mined', None),
+    'PaymentVerified': ('payment', 'verified', None),
+    'PaymentStatusUpdated': ('payment', 'status', None),
+}
+
+# Pipeline statuses pushed for bills and payments; their mining is reported from the logs
+PIPELINE_EVENTS = ('submitted', 'reverted', 'failed', 'timeout')
+
+
+def topic_key(kind, item_id):
+    """Bills and payments are keyed by the id hash their events carry, transactions by tracking id"""
+    return (kind, item_id if kind == 'tx' else id_hash(item_id))
+
+
+class Subscription:
+    """
+    Events for one stream client. Its queue is bounded: a client that
+    stops reading is marked ``overflowed`` instead of holding events for it.
+    """
+
+    def __init__(self, topics, max_queue):
+        self.topics = topics
+        self.overflowed = False
+        self._events = queue.Queue(max_queue)
+
+    def put(self, event):
+        try:
+            self._events.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        """Next event, or None if none arrives within ``timeout`` seconds"""
+        try:
+            return self._events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class ConfirmationHub:
+    """
+    Pushes bill, payment and transaction status changes to subscribers.
+
+    One watcher thread follows the chain for every subscriber: each
+    ``interval`` seconds it reads the head block number and, when the head
+    moved, the new bill and payment contract logs in one ``eth_getLogs``
+    call, and hands each event to the subscribers of its record. Events of
+    the last ``keep_blocks`` blocks are replayed to new subscribers, which
+    covers what the event index has not caught up with yet. Mined records
+    are followed for ``confirmations`` blocks, re-reading the receipt once
+    before reporting them confirmed; a receipt that is gone or moved is
+    reported as ``reorged`` and its blocks are scanned again. Submissions
+    and failures come from the transaction pipeline through
+    ``on_transaction``.
+
+    Chain events reach the hub of every worker, but the pipeline events
+    (``submitted``, ``reverted``, ``failed``, ``timeout``) only reach the
+    hub in the process whose pipeline sent the transaction. That holds for
+    all of them because the service runs a single worker once PRIVATE_KEY
+    is set (see ``setup_single_sender``); another process serving streams
+    would only report what it reads from the chain.
+    """
+
+    def __init__(self, get_web3, contracts, confirmations=12, interval=1.0, keep_blocks=128, max_queue=256,
+                 max_subscribers=1000, page_size=2000):
+        self.get_web3 = get_web3
+        self.contracts = {contract.address: contract for contract in contracts}
+        self.confirmations = confirmations
+        self.interval = interval
+        self.keep_blocks = keep_blocks
+        self.max_queue = max_queue
+        self.max_subscribers = max_subscribers
+        self.page_size = page_size
+        self._events = {}
+        for contract in contracts:
+            for item in contract.abi:
+                if item.get('type') == 'event' and item['name'] in STREAM_EVENTS:
+                    self._events[event_topic(item)] = item['name']
+        self._subscribers = {}
+        self._subscriptions = set()
+        self._recent = deque()
+        self._tracked = {}
+        self._lock = threading.Lock()
+        self._sequence = itertools.count(1)
+        self._head = None
+        self._scanned = None
+        self._thread = None
+        self.events_published = 0
+        self.reorgs = 0
+        self.last_error = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name='confirmation-stream', daemon=True)
+        self._thread.start()
+
+    def subscribe(self, payments=(), bills=(), transactions=()):
+        """Subscribe to records by id; None when the subscriber limit is reached"""
+        topics = {}
+        for kind, ids in (('payment', payments), ('bill', bills), ('tx', transactions)):
+            for item_id in ids:
+                topics[topic_key(kind, item_id)] = item_id
+        subscription = Subscription(topics, self.max_queue)
+        with self._lock:
+            if len(self._subscriptions) >= self.max_subscribers:
+                return None
+            self._subscriptions.add(subscription)
+            for topic in topics:
+                self._subscribers.setdefault(topic, set()).add(subscription)
+            # Replayed under the lock so no event is both replayed and published
+            for _, topic, event in self._recent:
+                if topic in topics:
+                    subscription.put(dict(event, topic=topic[0], id=topics[topic], seq=next(self._sequence),
+                                          replayed=True))
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+            for topic in subscription.topics:
+                subscribers = self._subscribers.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[topic]
+
+    def track(self, kind, item_id, tx_hash, block_number):
+        """Follow the confirmations of a record mined before its subscriber connected"""
+        with self._lock:
+            self._tracked.setdefault((topic_key(kind, item_id), tx_hash), {'blockNumber': block_number,
+                                                                           'confirmations': None})
+
+    def on_transaction(self, record):
+        """
+        Transaction pipeline listener: push status changes to the records the
+        transaction carries. Only called in the process that sent it.
+        """
+        event = {field: record.get(field) for field in ('txId', 'transactionHash', 'blockNumber', 'error')}
+        for entry in [record['meta']] + record['meta'].get('records', []):
+            if 'itemId' in entry:
+                self.publish(('tx', entry['itemId']), dict(event, type=record['status']))
+            if record['status'] not in PIPELINE_EVENTS:
+                continue
+            kind = 'payment' if 'paymentId' in entry else 'bill' if 'billId' in entry else None
+            if kind is not None:
+                self.publish(topic_key(kind, entry[f'{kind}Id']), dict(event, type=record['status']))
+        self.publish(('tx', record['txId']), dict(event, type=record['status']))
+
+    def publish(self, topic, event, keep_block=None):
+        """Hand an event to the subscribers of ``topic``; with ``keep_block`` it is also kept for replay"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(topic, ()))
+            for subscription in subscribers:
+                subscription.put(dict(event, topic=topic[0], id=subscription.topics[topic], seq=next(self._sequence)))
+            if keep_block is not None:
+                self._recent.append((keep_block, topic, event))
+            self.events_published += len(subscribers)
+        return len(subscribers)
+
+    def stats(self):
+        with self._lock:
+            subscribers, topics, tracked = len(self._subscriptions), len(self._subscribers), len(self._tracked)
+        return {
+            'subscribers': subscribers,
+            'topics': topics,
+            'tracked': tracked,
+            'head': self._head,
+            'scanned_block': self._scanned,
+            'confirmations': self.confirmations,
+            'events_published': self.events_published,
+            'reorgs': self.reorgs,
+            'last_error': self.last_error,
+        }
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.poll()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Error watching chain for stream subscribers: {str(e)}")
+
+    def poll(self):
+        """Read the head and any new logs, then update confirmations"""
+        w3 = self.get_web3()
+        if w3 is None:
+            return
+        head = w3.eth.block_number
+        if self._scanned is None:
+            self._scanned = head
+        while self._scanned < head:
+            to_block = min(head, self._scanned + self.page_size)
+            logs = w3.eth.get_logs({
+                'fromBlock': self._scanned + 1,
+                'toBlock': to_block,
+                'address': list(self.contracts),
+                'topics': [list(self._events)],
+            })
+            for log in logs:
+                self._publish_log(log)
+            self._scanned = to_block
+        self._head = head
+        with self._lock:
+            while self._recent and self._recent[0][0] <= head - self.keep_blocks:
+                self._recent.popleft()
+        self._update_confirmations(w3, head)
+
+    def _publish_log(self, log):
+        name = self._events.get(Web3.to_hex(log['topics'][0]))
+        contract = self.contracts.get(Web3.to_checksum_address(log['address']))
+        if name is None or contract is None:
+            return
+        kind, event_type, id_argument = STREAM_EVENTS[name]
+        args = dict(contract.events[name]().process_log(log)['args'])
+        for key, value in args.items():
+            if isinstance(value, bytes):
+                # Indexed strings decode to their topic hash
+                args[key] = Web3.to_hex(value)
+        topic = (kind, args[id_argument] if id_argument else Web3.to_hex(log['topics'][1]))
+        tx_hash = Web3.to_hex(log['transactionHash'])
+        event = {
+            'type': event_type,
+            'event': name,
+            'transactionHash': tx_hash,
+            'blockNumber': log['blockNumber'],
+            'args': {key: value for key, value in args.items() if key not in (EVENT_ID_FIELDS[name], id_argument)},
+        }
+        self.publish(topic, event, keep_block=log['blockNumber'])
+        if event_type == 'mined':
+            with self._lock:
+                self._tracked[(topic, tx_hash)] = {'blockNumber': log['blockNumber'], 'confirmations': None}
+
+    def _update_confirmations(self, w3, head):
+        with self._lock:
+            tracked = list(self._tracked.items())
+        for (topic, tx_hash), entry in tracked:
+            confirmations = max(0, head - entry['blockNumber'] + 1)
+            if confirmations == entry['confirmations']:
+                continue
+            entry['confirmations'] = confirmations
+            event = {'transactionHash': tx_hash, 'blockNumber': entry['blockNumber'],
+                     'confirmations': confirmations, 'required': self.confirmations}
+            if confirmations < self.confirmations:
+                self.publish(topic, dict(event, type='confirmations'))
+                continue
+            with self._lock:
+                self._tracked.pop((topic, tx_hash), None)
+                if topic not in self._subscribers:
+                    continue
+            try:
+                receipt = w3.eth.get_transaction_receipt(tx_hash)
+            except Exception:
+                receipt = None
+            if receipt is not None and receipt['blockNumber'] == entry['blockNumber'] and receipt['status'] == 1:
+                self.publish(topic, dict(event, type='confirmed'))
+                continue
+            self.reorgs += 1
+            logger.warning(f"Transaction {tx_hash} left block {entry['blockNumber']}, rescanning from there")
+            self.publish(topic, dict(event, type='reorged'))
+            self._scanned = min(self._scanned, entry['blockNumber'] - 1)
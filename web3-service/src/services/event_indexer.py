@@ -0,0 +1,488 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from web3 import Web3
+
+logger = logging.getLogger(__name__)
+
+# Indexed event and the id field whose keccak hash is its first topic
+EVENT_ID_FIELDS = {
+    'BillCreated': 'billId',
+    'TransactionAdded': 'transactionId',
+    'BillSettled': 'billId',
+    'PaymentMade': 'billId',
+    'PaymentRecorded': 'paymentId',
+    'PaymentVerified': 'paymentId',
+    'PaymentStatusUpdated': 'paymentId',
+}
+
+# Events whose full record is decoded from the calldata of the emitting transaction
+RECORD_EVENTS = ('BillCreated', 'TransactionAdded', 'PaymentRecorded')
+
+# Contract functions that emit record events: (id field, batch argument or None)
+RECORD_FUNCTIONS = {
+    'createBill': ('billId', None),
+    'addTransaction': ('transactionId', None),
+    'addTransactions': ('transactionId', 'inputs'),
+    'recordPayment': ('paymentId', None),
+    'recordPayments': ('paymentId', 'payments'),
+}
+
+COMPLETED = 'Completed'
+
+
+def id_hash(value):
+    """Topic of an indexed string argument"""
+    return Web3.to_hex(Web3.keccak(text=value))
+
+
+def event_topic(event_abi):
+    signature = f"{event_abi['name']}({','.join(item['type'] for item in event_abi['inputs'])})"
+    return Web3.to_hex(Web3.keccak(text=signature))
+
+
+def add_amount(total, amount):
+    return str(int(total or 0) + int(amount))
+
+
+class ChainIndexStore:
+    """
+    SQLite index of bill and payment contract events.
+
+    Raw events are kept in ``chain_events``; the bill, transaction, payment,
+    bill settlement and per-user total tables are updated from them as
+    pages are appended.
+    Records are keyed by the keccak hash of their string id, which is what
+    the indexed event topics carry. Several processes may share the file:
+    every page is applied in one transaction that only succeeds if the
+    indexed height is still the one the page was fetched for.
+    """
+
+    def __init__(self, db_path=':memory:', start_block=0):
+        self.db_path = db_path
+        self.start_block = start_block
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            if db_path != ':memory:':
+                self._conn.execute('PRAGMA journal_mode=WAL')
+            tables = {row['name'] for row in self._conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS indexer_state (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+                CREATE TABLE IF NOT EXISTS indexer_blocks (number INTEGER PRIMARY KEY, hash TEXT NOT NULL);
+                CREATE TABLE IF NOT EXISTS chain_events (
+                    block_number INTEGER NOT NULL, log_index INTEGER NOT NULL, tx_hash TEXT NOT NULL,
+                    event TEXT NOT NULL, payload TEXT NOT NULL, PRIMARY KEY (block_number, log_index));
+                CREATE TABLE IF NOT EXISTS bills (
+                    id_hash TEXT PRIMARY KEY, bill_id TEXT, bill_name TEXT, description TEXT, currency TEXT,
+                    creator TEXT, total_amount TEXT NOT NULL DEFAULT '0', settled_amount TEXT NOT NULL DEFAULT '0',
+                    is_settled INTEGER NOT NULL DEFAULT 0, created_at INTEGER, block_number INTEGER, tx_hash TEXT);
+                CREATE INDEX IF NOT EXISTS ix_bills_creator ON bills (creator);
+                CREATE TABLE IF NOT EXISTS bill_transactions (
+                    id_hash TEXT PRIMARY KEY, transaction_id TEXT, bill_hash TEXT NOT NULL, payer TEXT,
+                    amount TEXT NOT NULL, description TEXT, transaction_type TEXT, beneficiaries TEXT,
+                    beneficiary_amounts TEXT, timestamp INTEGER, block_number INTEGER, tx_hash TEXT);
+                CREATE INDEX IF NOT EXISTS ix_bill_transactions_bill ON bill_transactions (bill_hash);
+                CREATE INDEX IF NOT EXISTS ix_bill_transactions_payer ON bill_transactions (payer);
+                CREATE TABLE IF NOT EXISTS payments (
+                    id_hash TEXT PRIMARY KEY, payment_id TEXT, transaction_id TEXT, payer TEXT, receiver TEXT,
+                    amount TEXT NOT NULL, currency TEXT, payment_method TEXT, payment_date INTEGER,
+                    created_at INTEGER, status TEXT NOT NULL, notes TEXT, image_hash TEXT,
+                    is_verified INTEGER NOT NULL DEFAULT 0, verified_by TEXT, verified_at INTEGER,
+                    block_number INTEGER, tx_hash TEXT);
+                CREATE INDEX IF NOT EXISTS ix_payments_transaction ON payments (transaction_id);
+                CREATE INDEX IF NOT EXISTS ix_payments_payer ON payments (payer);
+                CREATE INDEX IF NOT EXISTS ix_payments_receiver ON payments (receiver);
+                CREATE TABLE IF NOT EXISTS user_totals (
+                    address TEXT PRIMARY KEY, total_paid TEXT NOT NULL DEFAULT '0',
+                    total_received TEXT NOT NULL DEFAULT '0');
+                CREATE TABLE IF NOT EXISTS bill_settlements (
+                    block_number INTEGER NOT NULL, log_index INTEGER NOT NULL, bill_hash TEXT NOT NULL,
+                    payer TEXT, receiver TEXT, amount TEXT NOT NULL, tx_hash TEXT,
+                    PRIMARY KEY (block_number, log_index));
+                CREATE INDEX IF NOT EXISTS ix_bill_settlements_bill ON bill_settlements (bill_hash);
+            """)
+        if 'chain_events' in tables and 'bill_settlements' not in tables:
+            # Index files from before bill_settlements existed: derive it from the stored events
+            with self._transaction() as conn:
+                self._rebuild(conn)
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._conn
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    def _indexed_block(self, conn):
+        row = conn.execute("SELECT value FROM indexer_state WHERE key = 'indexed_block'").fetchone()
+        return int(row['value']) if row else self.start_block - 1
+
+    def indexed_block(self):
+        with self._lock:
+            return self._indexed_block(self._conn)
+
+    def block_hashes(self):
+        """Stored (number, hash) pairs, newest first"""
+        with self._lock:
+            rows = self._conn.execute('SELECT number, hash FROM indexer_blocks ORDER BY number DESC').fetchall()
+        return [(row['number'], row['hash']) for row in rows]
+
+    def append(self, expected_block, to_block, events, block_hashes, keep_blocks=128):
+        """
+        Apply the events of blocks ``expected_block + 1 .. to_block``.
+        Returns False, changing nothing, if another process got there first.
+        """
+        with self._transaction() as conn:
+            if self._indexed_block(conn) != expected_block:
+                return False
+            for event in events:
+                conn.execute(
+                    'INSERT INTO chain_events (block_number, log_index, tx_hash, event, payload) VALUES (?, ?, ?, ?, ?)',
+                    (event['blockNumber'], event['logIndex'], event['transactionHash'], event['event'],
+                     json.dumps(event['payload'])),
+                )
+                self._apply(conn, event)
+            conn.executemany('INSERT OR REPLACE INTO indexer_blocks (number, hash) VALUES (?, ?)',
+                             sorted(block_hashes.items()))
+            conn.execute(
+                'DELETE FROM indexer_blocks WHERE number NOT IN '
+                '(SELECT number FROM indexer_blocks ORDER BY number DESC LIMIT ?)', (keep_blocks,)
+            )
+            conn.execute("INSERT OR REPLACE INTO indexer_state (key, value) VALUES ('indexed_block', ?)",
+                         (str(to_block),))
+        return True
+
+    def rollback(self, block_number):
+        """Drop events after ``block_number`` and rebuild the tables from the remaining ones"""
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM chain_events WHERE block_number > ?', (block_number,))
+            conn.execute('DELETE FROM indexer_blocks WHERE number > ?', (block_number,))
+            self._rebuild(conn)
+            conn.execute("INSERT OR REPLACE INTO indexer_state (key, value) VALUES ('indexed_block', ?)",
+                         (str(block_number),))
+
+    def _rebuild(self, conn):
+        """Recompute every derived table from the stored events"""
+        for table in ('bills', 'bill_transactions', 'payments', 'user_totals', 'bill_settlements'):
+            conn.execute(f'DELETE FROM {table}')
+        rows = conn.execute(
+            'SELECT block_number, log_index, tx_hash, event, payload FROM chain_events '
+            'ORDER BY block_number, log_index'
+        ).fetchall()
+        for row in rows:
+            self._apply(conn, {
+                'blockNumber': row['block_number'],
+                'logIndex': row['log_index'],
+                'transactionHash': row['tx_hash'],
+                'event': row['event'],
+                'payload': json.loads(row['payload']),
+            })
+
+    def _apply(self, conn, event):
+        payload = event['payload']
+        args, call = payload['args'], payload.get('call') or {}
+        name = event['event']
+        if name == 'BillCreated':
+            conn.execute(
+                'INSERT OR REPLACE INTO bills (id_hash, bill_id, bill_name, description, currency, creator, '
+                'created_at, block_number, tx_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (payload['idHash'], call.get('billId'), call.get('billName'), call.get('description'),
+                 call.get('currency'), args['creator'], payload['timestamp'], event['blockNumber'],
+                 event['transactionHash']),
+            )
+        elif name == 'TransactionAdded':
+            conn.execute(
+                'INSERT OR REPLACE INTO bill_transactions (id_hash, transaction_id, bill_hash, payer, amount, '
+                'description, transaction_type, beneficiaries, beneficiary_amounts, timestamp, block_number, '
+                'tx_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (payload['idHash'], call.get('transactionId'), args['billId'], args['payer'], str(args['amount']),
+                 call.get('description'), call.get('transactionType'), json.dumps(call.get('beneficiaries', [])),
+                 json.dumps([str(value) for value in call.get('beneficiaryAmounts', [])]), payload['timestamp'],
+                 event['blockNumber'], event['transactionHash']),
+            )
+            self._add_to_bill(conn, args['billId'], 'total_amount', args['amount'])
+        elif name == 'PaymentMade':
+            conn.execute(
+                'INSERT OR REPLACE INTO bill_settlements (block_number, log_index, bill_hash, payer, receiver, '
+                'amount, tx_hash) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (event['blockNumber'], event['logIndex'], payload['idHash'], args['payer'], args['receiver'],
+                 str(args['amount']), event['transactionHash']),
+            )
+            self._add_to_bill(conn, payload['idHash'], 'settled_amount', args['amount'])
+        elif name == 'BillSettled':
+            conn.execute(
+                'UPDATE bills SET is_settled = 1, total_amount = ?, settled_amount = ? WHERE id_hash = ?',
+                (str(args['totalAmount']), str(args['settledAmount']), payload['idHash']),
+            )
+        elif name == 'PaymentRecorded':
+            conn.execute(
+                'INSERT OR REPLACE INTO payments (id_hash, payment_id, transaction_id, payer, receiver, amount, '
+                'currency, payment_method, payment_date, created_at, status, notes, image_hash, block_number, '
+                'tx_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (payload['idHash'], call.get('paymentId'), call.get('transactionId'), args['payer'],
+                 args['receiver'], str(args['amount']), call.get('currency'), call.get('paymentMethod'),
+                 call.get('paymentDate'), payload['timestamp'], COMPLETED, call.get('notes'),
+                 call.get('imageHash'), event['blockNumber'], event['transactionHash']),
+            )
+            self._add_to_totals(conn, args['payer'], args['receiver'], args['amount'])
+        elif name == 'PaymentVerified':
+            conn.execute(
+                'UPDATE payments SET is_verified = 1, verified_by = ?, verified_at = ? WHERE id_hash = ?',
+                (args['verifier'], payload['timestamp'], payload['idHash']),
+            )
+        elif name == 'PaymentStatusUpdated':
+            row = conn.execute('SELECT payer, receiver, amount, status FROM payments WHERE id_hash = ?',
+                               (payload['idHash'],)).fetchone()
+            if row is None:
+                return
+            # The contract's user totals only count completed payments
+            was_completed, is_completed = row['status'] == COMPLETED, args['status'] == COMPLETED
+            if was_completed != is_completed:
+                amount = int(row['amount']) if is_completed else -int(row['amount'])
+                self._add_to_totals(conn, row['payer'], row['receiver'], amount)
+            conn.execute('UPDATE payments SET status = ? WHERE id_hash = ?', (args['status'], payload['idHash']))
+
+    def _add_to_bill(self, conn, bill_hash, column, amount):
+        row = conn.execute(f'SELECT {column} FROM bills WHERE id_hash = ?', (bill_hash,)).fetchone()
+        if row is not None:
+            conn.execute(f'UPDATE bills SET {column} = ? WHERE id_hash = ?', (add_amount(row[column], amount), bill_hash))
+
+    def _add_to_totals(self, conn, payer, receiver, amount):
+        for address, column in ((payer, 'total_paid'), (receiver, 'total_received')):
+            conn.execute('INSERT OR IGNORE INTO user_totals (address) VALUES (?)', (address,))
+            row = conn.execute(f'SELECT {column} FROM user_totals WHERE address = ?', (address,)).fetchone()
+            conn.execute(f'UPDATE user_totals SET {column} = ? WHERE address = ?',
+                         (add_amount(row[column], amount), address))
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params).fetchall()]
+
+    def get_bill(self, bill_id):
+        rows = self._query('SELECT * FROM bills WHERE id_hash = ?', (id_hash(bill_id),))
+        if not rows:
+            return None
+        bill = rows[0]
+        bill['transactions'] = self._query(
+            'SELECT * FROM bill_transactions WHERE bill_hash = ? ORDER BY block_number, timestamp', (bill['id_hash'],)
+        )
+        return bill
+
+    def bill_settlements(self, bill_id):
+        """Settlement payments (makePayment calls) made against a bill, oldest first"""
+        return self._query('SELECT * FROM bill_settlements WHERE bill_hash = ? ORDER BY block_number, log_index',
+                           (id_hash(bill_id),))
+
+    def list_bills(self, limit=50, offset=0):
+        return self._query('SELECT * FROM bills ORDER BY block_number, created_at LIMIT ? OFFSET ?', (limit, offset))
+
+    def get_payment(self, payment_id):
+        rows = self._query('SELECT * FROM payments WHERE id_hash = ?', (id_hash(payment_id),))
+        return rows[0] if rows else None
+
+    def payments_by_transaction(self, transaction_id):
+        return self._query('SELECT * FROM payments WHERE transaction_id = ? ORDER BY block_number, created_at',
+                           (transaction_id,))
+
+    def user_summary(self, address):
+        totals = self._query('SELECT total_paid, total_received FROM user_totals WHERE address = ?', (address,))
+        return {
+            'totals': totals[0] if totals else {'total_paid': '0', 'total_received': '0'},
+            'bills': self._query('SELECT bill_id FROM bills WHERE creator = ? ORDER BY block_number', (address,)),
+            'paid': self._query('SELECT payment_id FROM payments WHERE payer = ? ORDER BY block_number', (address,)),
+            'received': self._query('SELECT payment_id FROM payments WHERE receiver = ? ORDER BY block_number',
+                                    (address,)),
+        }
+
+    def counts(self):
+        counts = {}
+        for table in ('chain_events', 'bills', 'bill_transactions', 'payments'):
+            counts[table] = self._query(f'SELECT COUNT(*) AS n FROM {table}')[0]['n']
+        return counts
+
+
+class EventIndexer:
+    """
+    Follows bill and payment contract events into a ChainIndexStore.
+
+    A daemon thread pages through ``eth_getLogs`` from the last indexed block
+    to ``confirmations`` blocks behind the chain head, ``page_size`` blocks
+    per call (halved while the node rejects the range). Indexed string ids
+    only appear as hashes in the logs, so the full records are decoded from
+    the calldata of the emitting transaction, including batch calls. Before
+    each pass the hash of the last indexed block is compared with the chain;
+    on a mismatch the index is rolled back to the newest stored block that
+    is still canonical.
+    """
+
+    def __init__(self, get_web3, contracts, start_block=0, confirmations=0, page_size=2000, interval=5.0,
+                 keep_blocks=128):
+        self.get_web3 = get_web3
+        self.contracts = {contract.address: contract for contract in contracts}
+        self.start_block = start_block
+        self.confirmations = confirmations
+        self.page_size = page_size
+        self.interval = interval
+        self.keep_blocks = keep_blocks
+        self.store = None
+        self.chain_block = None
+        self.reorgs = 0
+        self.last_error = None
+        self._events = {}
+        for contract in contracts:
+            for item in contract.abi:
+                if item.get('type') == 'event' and item['name'] in EVENT_ID_FIELDS:
+                    self._events[event_topic(item)] = item['name']
+        self._thread = None
+
+    def start(self, store):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self.store = store
+        self._thread = threading.Thread(target=self._run, name='event-indexer', daemon=True)
+        self._thread.start()
+
+    def status(self):
+        indexed_block = self.store.indexed_block() if self.store is not None else None
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'indexed_block': indexed_block,
+            'chain_block': self.chain_block,
+            'lag': self.chain_block - indexed_block if self.chain_block is not None and indexed_block is not None
+            else None,
+            'reorgs': self.reorgs,
+            'last_error': self.last_error,
+        }
+
+    def _run(self):
+        while True:
+            try:
+                self.sync()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Error indexing contract events: {str(e)}")
+            time.sleep(self.interval)
+
+    def sync(self):
+        """Index up to the current head; returns the indexed block number"""
+        w3 = self.get_web3()
+        if w3 is None:
+            return self.store.indexed_block()
+        self.chain_block = w3.eth.block_number
+        target = self.chain_block - self.confirmations
+        self._check_reorg(w3)
+
+        indexed = self.store.indexed_block()
+        while indexed < target:
+            to_block = min(target, indexed + self.page_size)
+            try:
+                logs = w3.eth.get_logs({
+                    'fromBlock': indexed + 1,
+                    'toBlock': to_block,
+                    'address': list(self.contracts),
+                    'topics': [list(self._events)],
+                })
+            except Exception as e:
+                if to_block == indexed + 1:
+                    raise
+                # Providers cap the block range or result size of eth_getLogs
+                self.page_size = max(1, (to_block - indexed) // 2)
+                logger.warning(f"eth_getLogs over {to_block - indexed} blocks failed, "
+                               f"retrying with {self.page_size}: {str(e)}")
+                continue
+
+            events, block_hashes = self._decode_logs(w3, logs)
+            block_hashes[to_block] = Web3.to_hex(w3.eth.get_block(to_block)['hash'])
+            if not self.store.append(indexed, to_block, events, block_hashes, self.keep_blocks):
+                # Another worker indexed this range already
+                logger.info(f"Blocks {indexed + 1}-{to_block} were indexed by another process")
+            indexed = self.store.indexed_block()
+        return indexed
+
+    def _check_reorg(self, w3):
+        stored = self.store.block_hashes()
+        if not stored or Web3.to_hex(w3.eth.get_block(stored[0][0])['hash']) == stored[0][1]:
+            return
+        ancestor = self.start_block - 1
+        for number, block_hash in stored[1:]:
+            if Web3.to_hex(w3.eth.get_block(number)['hash']) == block_hash:
+                ancestor = number
+                break
+        self.reorgs += 1
+        logger.warning(f"Chain reorganisation below block {stored[0][0]}, rolling index back to {ancestor}")
+        self.store.rollback(ancestor)
+
+    def _decode_logs(self, w3, logs):
+        events, blocks, calls = [], {}, {}
+        for log in logs:
+            name = self._events.get(Web3.to_hex(log['topics'][0]))
+            contract = self.contracts.get(Web3.to_checksum_address(log['address']))
+            if name is None or contract is None:
+                continue
+            block_number = log['blockNumber']
+            if block_number not in blocks:
+                block = w3.eth.get_block(block_number)
+                blocks[block_number] = (Web3.to_hex(block['hash']), block['timestamp'])
+            tx_hash = Web3.to_hex(log['transactionHash'])
+
+            args = dict(contract.events[name]().process_log(log)['args'])
+            for key, value in args.items():
+                if isinstance(value, bytes):
+                    # Indexed strings decode to their topic hash
+                    args[key] = Web3.to_hex(value)
+            payload = {
+                'idHash': Web3.to_hex(log['topics'][1]),
+                'args': args,
+                'timestamp': blocks[block_number][1],
+            }
+            if name in RECORD_EVENTS:
+                if tx_hash not in calls:
+                    calls[tx_hash] = self._decode_calls(w3, contract, tx_hash)
+                payload['call'] = calls[tx_hash].get((EVENT_ID_FIELDS[name], payload['idHash']))
+                if payload['call'] is None:
+                    logger.warning(f"{name} in {tx_hash} was not emitted by a known call, storing event fields only")
+            events.append({
+                'blockNumber': block_number,
+                'logIndex': log['logIndex'],
+                'transactionHash': tx_hash,
+                'event': name,
+                'payload': payload,
+            })
+        return events, {number: block_hash for number, (block_hash, _) in blocks.items()}
+
+    def _decode_calls(self, w3, contract, tx_hash):
+        """Map (id field, id hash) to the call arguments of every record written by a transaction"""
+        try:
+            function, params = contract.decode_function_input(w3.eth.get_transaction(tx_hash)['input'])
+        except Exception:
+            # Not a direct call to the contract, e.g. sent through a wallet contract
+            return {}
+        spec = RECORD_FUNCTIONS.get(function.fn_name)
+        if spec is None:
+            return {}
+        id_field, batch_argument = spec
+        entries = [params] if batch_argument is None else params[batch_argument]
+        if batch_argument is not None:
+            names = [component['name'] for component in function.abi['inputs'][0]['components']]
+            entries = [entry if isinstance(entry, dict) else dict(zip(names, entry)) for entry in entries]
+        return {(id_field, id_hash(entry[id_field])): {key: self._plain(value) for key, value in entry.items()}
+                for entry in entries}
+
+    @staticmethod
+    def _plain(value):
+        if isinstance(value, (list, tuple)):
+            return [EventIndexer._plain(item) for item in value]
+        if isinstance(value, bytes):
+            return Web3.to_hex(value)
+        return value
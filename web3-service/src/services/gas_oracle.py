@@ -0,0 +1,153 @@
+import logging
+import threading
+import time
+
+from src.services.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Priority fee percentile of recent blocks used for each speed level
+FEE_LEVELS = {'slow': 10, 'standard': 50, 'fast': 90}
+
+
+def argument_shape(value):
+    """
+    Summary of a call argument that determines its gas cost: strings and
+    bytes by their number of 32-byte words, arrays by their items, integers
+    by whether they are zero (zero and non-zero storage writes cost differently).
+    """
+    if isinstance(value, str):
+        value = value.encode()
+    if isinstance(value, bytes):
+        return ('words', (len(value) + 31) // 32)
+    if isinstance(value, dict):
+        return tuple((key, argument_shape(item)) for key, item in sorted(value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(argument_shape(item) for item in value)
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, int):
+        return 'zero' if value == 0 else 'int'
+    return type(value).__name__
+
+
+class GasOracle:
+    """
+    Fee suggestions and gas estimates for contract calls.
+
+    EIP-1559 fees are computed from ``eth_feeHistory`` over the last
+    ``history_blocks`` blocks: the next block's base fee plus, for each
+    level in FEE_LEVELS, the median of that percentile's priority fees.
+    Suggestions are cached per block, so concurrent callers in the same
+    block share one RPC. Chains without a base fee fall back to
+    ``eth_gasPrice``. Call estimates are memoized for ``estimate_ttl``
+    seconds by (contract, function, sender, argument shape).
+    """
+
+    def __init__(self, get_web3, latest_block=None, history_blocks=20, estimate_ttl=300, estimate_cache_size=1024):
+        self.get_web3 = get_web3
+        self.latest_block = latest_block
+        self.history_blocks = history_blocks
+        self.estimates = TTLCache(max_entries=estimate_cache_size, ttl_seconds=estimate_ttl)
+        self._suggestions = None
+        self._lock = threading.Lock()
+        self.fee_rpcs = 0
+
+    def _web3(self):
+        w3 = self.get_web3()
+        if w3 is None:
+            raise ConnectionError("Web3 not connected")
+        return w3
+
+    def suggestions(self):
+        """Fee levels for the current block"""
+        w3 = self._web3()
+        block_number = self.latest_block() if self.latest_block else None
+        if block_number is None:
+            block_number = w3.eth.block_number
+        cached = self._suggestions
+        if cached is not None and cached['blockNumber'] >= block_number:
+            return cached
+        with self._lock:
+            # Another caller may have refreshed while we waited
+            cached = self._suggestions
+            if cached is not None and cached['blockNumber'] >= block_number:
+                return cached
+            self._suggestions = self._compute(w3, block_number)
+            return self._suggestions
+
+    def _compute(self, w3, block_number):
+        self.fee_rpcs += 1
+        percentiles = sorted(set(FEE_LEVELS.values()))
+        try:
+            history = w3.eth.fee_history(self.history_blocks, 'latest', percentiles)
+        except Exception as e:
+            logger.warning(f"eth_feeHistory failed, falling back to eth_gasPrice: {str(e)}")
+            history = None
+
+        if not history or not history.get('baseFeePerGas') or not history['baseFeePerGas'][-1]:
+            gas_price = w3.eth.gas_price
+            return {
+                'blockNumber': block_number,
+                'type': 'legacy',
+                'baseFeePerGas': None,
+                'levels': {level: {'gasPrice': gas_price} for level in FEE_LEVELS},
+                'computedAt': time.time(),
+            }
+
+        # The last base fee is the one the next block will charge
+        next_base_fee = history['baseFeePerGas'][-1]
+        rewards = [row for row in history.get('reward') or [] if any(row)]
+        levels = {}
+        for level, percentile in FEE_LEVELS.items():
+            column = percentiles.index(percentile)
+            samples = sorted(row[column] for row in rewards)
+            priority_fee = samples[len(samples) // 2] if samples else w3.eth.max_priority_fee
+            levels[level] = {
+                'maxPriorityFeePerGas': priority_fee,
+                # Headroom for the base fee to rise for a few full blocks before the transaction is mined
+                'maxFeePerGas': 2 * next_base_fee + priority_fee,
+            }
+        oldest_block = history['oldestBlock']
+        return {
+            'blockNumber': max(block_number, oldest_block + len(history['baseFeePerGas']) - 2),
+            'type': 'eip1559',
+            'baseFeePerGas': next_base_fee,
+            'levels': levels,
+            'computedAt': time.time(),
+        }
+
+    def fee_fields(self, level='standard'):
+        """Fee fields to put in a transaction for the given speed level"""
+        return dict(self.suggestions()['levels'][level])
+
+    def expected_gas_price(self, level='standard'):
+        """Price per gas a transaction is expected to pay, for cost previews"""
+        suggestions = self.suggestions()
+        fees = suggestions['levels'][level]
+        if suggestions['type'] == 'legacy':
+            return fees['gasPrice']
+        return suggestions['baseFeePerGas'] + fees['maxPriorityFeePerGas']
+
+    def estimate_call(self, contract, function_name, args, sender):
+        """Gas for a contract call and whether it came from the memo: (gas, cached)"""
+        key = (contract.address, function_name, sender, argument_shape(args))
+        gas = self.estimates.get(key)
+        if gas is not None:
+            return gas, True
+        w3 = self._web3()
+        gas = w3.eth.estimate_gas({
+            'from': sender,
+            'to': contract.address,
+            'data': contract.encode_abi(function_name, args=args),
+        })
+        self.estimates.set(key, gas)
+        return gas, False
+
+    def stats(self):
+        suggestions = self._suggestions
+        return {
+            'block_number': suggestions['blockNumber'] if suggestions else None,
+            'fee_rpcs': self.fee_rpcs,
+            'estimates': self.estimates.stats(),
+        }
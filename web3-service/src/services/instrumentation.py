@@ -0,0 +1,218 @@
+# Vendored by donut-receipt-service and web3-service: keep both copies of this
+# file byte-identical (python scripts/check_vendored.py compares them).
+import contextvars
+import logging
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from flask import Response, g, request
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+# Caller ids are reused only when short and header-safe; anything else gets a fresh id
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._:-]{1,128}$')
+
+# Per-request state; request threads are reused, so both are reset when a request ends
+_request_id = contextvars.ContextVar('request_id', default=None)
+_stage_timings = contextvars.ContextVar('stage_timings', default=None)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels, extra=None):
+    pairs = list(labels) + (list(extra) if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{escape_label(value)}"' for key, value in pairs) + '}'
+
+
+class Histogram:
+    """Bucket counts, sum and count of observed values"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{format_labels(labels, [("le", repr(float(bound)))])} {cumulative}')
+        lines.append(f'{name}_bucket{format_labels(labels, [("le", "+Inf")])} {self.count}')
+        lines.append(f'{name}_sum{format_labels(labels)} {self.sum:.6f}')
+        lines.append(f'{name}_count{format_labels(labels)} {self.count}')
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Counters, gauges and histograms kept in process memory and rendered in
+    the Prometheus text exposition format.
+
+    Every server process keeps its own registry: with several gunicorn
+    workers each scrape sees the worker that answered it, so run one worker
+    per scraped instance or aggregate the instances in Prometheus.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def describe(self, name, kind, help_text):
+        with self._lock:
+            self._metrics.setdefault(name, {'kind': kind, 'help': help_text, 'series': {}})
+
+    def _series(self, name, labels, default):
+        series = self._metrics[name]['series']
+        key = tuple(sorted(labels.items()))
+        if key not in series:
+            series[key] = default()
+        return series, key
+
+    def inc(self, name, labels, amount=1):
+        """Add to a counter, or to a gauge with a negative ``amount`` to decrease it"""
+        with self._lock:
+            series, key = self._series(name, labels, float)
+            series[key] += amount
+
+    def observe(self, name, labels, value):
+        with self._lock:
+            series, key = self._series(name, labels, Histogram)
+            series[key].observe(value)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, metric in sorted(self._metrics.items()):
+                lines.append(f'# HELP {name} {metric["help"]}')
+                lines.append(f'# TYPE {name} {metric["kind"]}')
+                for labels, value in sorted(metric['series'].items()):
+                    if metric['kind'] == 'histogram':
+                        lines.extend(value.render(name, labels))
+                    else:
+                        lines.append(f'{name}{format_labels(labels)} {value:g}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+metrics.describe('http_requests_total', 'counter', 'HTTP requests by route, method and status code')
+metrics.describe('http_request_duration_seconds', 'histogram', 'Time from routing a request to its response headers')
+metrics.describe('http_requests_in_flight', 'gauge', 'Requests currently being handled')
+metrics.describe('stage_duration_seconds', 'histogram', 'Time spent in each named processing stage')
+metrics.describe('stage_errors_total', 'counter', 'Processing stages that ended in an exception')
+
+
+def current_request_id():
+    """X-Request-ID of the request being handled on this thread, or None"""
+    return _request_id.get()
+
+
+@contextmanager
+def stage(name):
+    """
+    Time a block as processing stage ``name``: it feeds the stage histogram
+    and, inside a request, that request's Server-Timing header. Repeated
+    stages within one request add up.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        metrics.inc('stage_errors_total', {'stage': name})
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.observe('stage_duration_seconds', {'stage': name}, elapsed)
+        timings = _stage_timings.get()
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + elapsed
+
+
+def server_timing(timings, total):
+    entries = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in timings.items()]
+    entries.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(entries)
+
+
+def metrics_response():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+def instrument_blueprint(blueprint):
+    """
+    Instrument every route of ``blueprint``: request counts, latency and
+    in-flight gauges, a Server-Timing header with the stages timed while
+    handling the request, and an X-Request-ID header, taken from the caller
+    when it sends one so a request can be followed across services.
+
+    Register before the blueprint's other request hooks so their time is
+    included.
+    """
+
+    @blueprint.before_request
+    def start_request_instrumentation():
+        request_id = request.headers.get(REQUEST_ID_HEADER, '')
+        if not REQUEST_ID_PATTERN.match(request_id):
+            request_id = uuid.uuid4().hex
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        g.instrumentation = {
+            'started': time.perf_counter(),
+            'route': route,
+            'tokens': (_request_id.set(request_id), _stage_timings.set({})),
+        }
+        metrics.inc('http_requests_in_flight', {'route': route})
+
+    @blueprint.after_request
+    def finish_request_instrumentation(response):
+        state = g.get('instrumentation')
+        if state is None:
+            return response
+        elapsed = time.perf_counter() - state['started']
+        labels = {'route': state['route'], 'method': request.method}
+        metrics.observe('http_request_duration_seconds', labels, elapsed)
+        metrics.inc('http_requests_total', dict(labels, status=str(response.status_code)))
+        response.headers['Server-Timing'] = server_timing(_stage_timings.get() or {}, elapsed)
+        response.headers[REQUEST_ID_HEADER] = _request_id.get()
+        return response
+
+    @blueprint.teardown_request
+    def end_request_instrumentation(exc):
+        state = g.pop('instrumentation', None)
+        if state is None:
+            return
+        metrics.inc('http_requests_in_flight', {'route': state['route']}, -1)
+        request_id_token, timings_token = state['tokens']
+        _stage_timings.reset(timings_token)
+        _request_id.reset(request_id_token)
+
+
+_default_record_factory = logging.getLogRecordFactory()
+
+
+def record_with_request_id(*args, **kwargs):
+    record = _default_record_factory(*args, **kwargs)
+    record.request_id = _request_id.get() or '-'
+    return record
+
+
+# Log records carry ``request_id`` for formats that include %(request_id)s
+if getattr(logging.getLogRecordFactory(), '__name__', None) != 'record_with_request_id':
+    logging.setLogRecordFactory(record_with_request_id)
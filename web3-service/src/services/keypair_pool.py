@@ -0,0 +1,115 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+# Order of the secp256k1 group; valid private keys are 1 .. n-1
+SECP256K1_N = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
+
+
+def new_private_key():
+    """
+    32 random bytes from the operating system CSPRNG, redrawn in the
+    (astronomically unlikely) case they fall outside the curve order.
+
+    Every key is read fresh from os.urandom, which keeps no state in the
+    process, so forked workers cannot replay each other's output the way
+    copies of one seeded user-space generator (``random``, a DRBG) would.
+    """
+    while True:
+        candidate = os.urandom(32)
+        if 0 < int.from_bytes(candidate, 'big') < SECP256K1_N:
+            return candidate
+
+
+def generate_keypairs(count, keystore_password=None, kdf=None, iterations=None):
+    """
+    Worker task: ``count`` new keypairs. Each has ``address`` and
+    ``public_key`` plus either ``private_key`` or, when a keystore password
+    is given, ``keystore``: the key encrypted as a V3 keystore object.
+    """
+    from eth_keys import keys
+
+    keypairs = []
+    for _ in range(count):
+        private_key = new_private_key()
+        public_key = keys.PrivateKey(private_key).public_key
+        keypair = {'address': public_key.to_checksum_address(), 'public_key': public_key.to_hex()}
+        if keystore_password is None:
+            keypair['private_key'] = private_key.hex()
+        else:
+            from eth_account import Account
+            keypair['keystore'] = Account.encrypt(private_key, keystore_password, kdf=kdf, iterations=iterations)
+        keypairs.append(keypair)
+    return keypairs
+
+
+class KeypairPool:
+    """
+    Generates keypairs in a pool of worker processes.
+
+    A request for ``count`` keys is split into chunks of at most
+    ``chunk_size`` (smaller when that spreads the work over more processes)
+    and the chunks run in parallel. The processes are started on first use
+    and reused; a pool broken by a dead worker is replaced on the next call.
+    """
+
+    def __init__(self, processes, chunk_size=64, start_method=None):
+        self.processes = max(1, processes)
+        self.chunk_size = chunk_size
+        self.start_method = start_method
+        self._pool = None
+        self._lock = threading.Lock()
+        self.generated = 0
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                context = multiprocessing.get_context(self.start_method) if self.start_method else None
+                self._pool = ProcessPoolExecutor(max_workers=self.processes, mp_context=context)
+            return self._pool
+
+    def _discard(self, pool):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def generate(self, count, keystore_password=None, kdf=None, iterations=None):
+        """Yield ``count`` keypairs, in chunk order, as soon as each chunk is done"""
+        chunk_size = max(1, min(self.chunk_size, -(-count // self.processes)))
+        pool = self._executor()
+        futures = [
+            pool.submit(generate_keypairs, min(chunk_size, count - start), keystore_password, kdf, iterations)
+            for start in range(0, count, chunk_size)
+        ]
+        try:
+            for future in futures:
+                for keypair in future.result():
+                    self.generated += 1
+                    yield keypair
+        except BrokenProcessPool:
+            logger.error("Keypair worker process died, restarting the pool")
+            self._discard(pool)
+            raise
+        finally:
+            # The client went away or a chunk failed; drop the work not yet started
+            for future in futures:
+                future.cancel()
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        return {
+            'processes': self.processes,
+            'started': self._pool is not None,
+            'generated': self.generated,
+        }
@@ -0,0 +1,61 @@
+try:
+    # pysha3's C keccak is about ten times faster per call than eth_hash's default backend
+    from sha3 import keccak_256
+
+    def keccak(data):
+        return keccak_256(data).digest()
+except ImportError:
+    from eth_hash.auto import keccak
+
+# Leaves and inner nodes hash under different prefixes, so a node can never
+# pass for a leaf; pairs are hashed in sorted order, so proofs need no
+# left/right flags. PaymentContract.verifyImageHash hashes the same way.
+LEAF_PREFIX = b'\x00'
+NODE_PREFIX = b'\x01'
+
+
+def leaf_hash(payment_id, image_hash):
+    """keccak256(0x00 ++ keccak256(paymentId) ++ keccak256(imageHash))"""
+    return keccak(LEAF_PREFIX + keccak(payment_id.encode()) + keccak(image_hash.encode()))
+
+
+def node_hash(first, second):
+    if second < first:
+        first, second = second, first
+    return keccak(NODE_PREFIX + first + second)
+
+
+def build_levels(leaves):
+    """
+    Every level of the Merkle tree over ``leaves``, from the leaves up to
+    the one-element root level. A node without a sibling is carried up a
+    level unchanged rather than paired with a copy of itself.
+    """
+    if not leaves:
+        raise ValueError('A Merkle tree needs at least one leaf')
+    levels = [list(leaves)]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        parents = [node_hash(level[index], level[index + 1]) for index in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            parents.append(level[-1])
+        levels.append(parents)
+    return levels
+
+
+def inclusion_proof(levels, index):
+    """Sibling hashes from leaf ``index`` up to the root; one per level where the node has a sibling"""
+    proof = []
+    for level in levels[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append(level[sibling])
+        index //= 2
+    return proof
+
+
+def verify_proof(leaf, proof, root):
+    node = leaf
+    for sibling in proof:
+        node = node_hash(node, sibling)
+    return node == root
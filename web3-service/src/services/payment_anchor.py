@@ -0,0 +1,296 @@
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from src.services.merkle import build_levels, inclusion_proof, leaf_hash, verify_proof
+
+logger = logging.getLogger(__name__)
+
+# Batch statuses: sealed (root fixed, not yet sent), submitted, anchored, failed
+
+
+class AnchorStore:
+    """
+    SQLite table of payment image hashes waiting for or included in an
+    anchored Merkle batch.
+
+    Leaves without a batch are the queue: sealing a batch claims all of
+    them (up to the batch size) in one transaction, so several processes
+    can share the file and every leaf lands in exactly one batch.
+    """
+
+    def __init__(self, db_path=':memory:'):
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            if db_path != ':memory:':
+                self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS anchor_batches (
+                    batch_id INTEGER PRIMARY KEY AUTOINCREMENT, root TEXT, leaf_count INTEGER NOT NULL,
+                    status TEXT NOT NULL, tx_id TEXT, tx_hash TEXT, block_number INTEGER, gas_used INTEGER,
+                    error TEXT, sealed_at REAL NOT NULL, submitted_at REAL, anchored_at REAL);
+                CREATE INDEX IF NOT EXISTS ix_anchor_batches_status ON anchor_batches (status);
+                CREATE TABLE IF NOT EXISTS anchor_leaves (
+                    payment_id TEXT PRIMARY KEY, image_hash TEXT NOT NULL, leaf TEXT NOT NULL,
+                    batch_id INTEGER, leaf_index INTEGER, created_at REAL NOT NULL);
+                CREATE INDEX IF NOT EXISTS ix_anchor_leaves_batch ON anchor_leaves (batch_id, leaf_index);
+            """)
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._conn
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    def add_leaf(self, payment_id, image_hash, leaf):
+        """Queue a leaf; False if the payment already has one"""
+        with self._lock:
+            cursor = self._conn.execute(
+                'INSERT OR IGNORE INTO anchor_leaves (payment_id, image_hash, leaf, created_at) VALUES (?, ?, ?, ?)',
+                (payment_id, image_hash, leaf.hex(), time.time())
+            )
+            return cursor.rowcount == 1
+
+    def pending_count(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM anchor_leaves WHERE batch_id IS NULL').fetchone()[0]
+
+    def seal_batch(self, max_leaves):
+        """
+        Claim up to ``max_leaves`` queued leaves, oldest first, as a new batch
+        and fix its root. Returns (batch_id, root, leaf_count), or None when
+        nothing is queued.
+        """
+        with self._transaction() as conn:
+            rows = conn.execute(
+                'SELECT payment_id, leaf FROM anchor_leaves WHERE batch_id IS NULL ORDER BY rowid LIMIT ?',
+                (max_leaves,)
+            ).fetchall()
+            if not rows:
+                return None
+            root = build_levels([bytes.fromhex(row['leaf']) for row in rows])[-1][0]
+            batch_id = conn.execute(
+                'INSERT INTO anchor_batches (root, leaf_count, status, sealed_at) VALUES (?, ?, ?, ?)',
+                (root.hex(), len(rows), 'sealed', time.time())
+            ).lastrowid
+            conn.executemany(
+                'UPDATE anchor_leaves SET batch_id = ?, leaf_index = ? WHERE payment_id = ?',
+                [(batch_id, index, row['payment_id']) for index, row in enumerate(rows)]
+            )
+        return batch_id, root, len(rows)
+
+    def update_batch(self, batch_id, **fields):
+        columns = ', '.join(f'{column} = ?' for column in fields)
+        with self._lock:
+            self._conn.execute(f'UPDATE anchor_batches SET {columns} WHERE batch_id = ?',
+                               list(fields.values()) + [batch_id])
+
+    def get_batch(self, batch_id):
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM anchor_batches WHERE batch_id = ?', (batch_id,)).fetchone()
+        return dict(row) if row else None
+
+    def batches_to_recheck(self, stale_before):
+        """Failed batches, and sealed or submitted ones that have not been anchored since ``stale_before``"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM anchor_batches WHERE status = 'failed' "
+                "OR (status = 'sealed' AND sealed_at < ?) OR (status = 'submitted' AND submitted_at < ?)",
+                (stale_before, stale_before)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_leaf(self, payment_id):
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM anchor_leaves WHERE payment_id = ?', (payment_id,)).fetchone()
+        return dict(row) if row else None
+
+    def batch_leaves(self, batch_id):
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT leaf FROM anchor_leaves WHERE batch_id = ? ORDER BY leaf_index', (batch_id,)
+            ).fetchall()
+        return [bytes.fromhex(row['leaf']) for row in rows]
+
+    def status_counts(self):
+        with self._lock:
+            rows = self._conn.execute('SELECT status, COUNT(*) AS count FROM anchor_batches GROUP BY status').fetchall()
+        return {row['status']: row['count'] for row in rows}
+
+
+class PaymentAnchorer:
+    """
+    Anchors payment image hashes on chain as Merkle roots.
+
+    Each (paymentId, imageHash) becomes a leaf in the AnchorStore queue.
+    Once ``window`` seconds have passed since the first queued leaf, or
+    ``max_leaves`` are queued, the queue is sealed into a batch and its root
+    is sent through the transaction pipeline in one ``anchorRoot`` call
+    built by ``encode_anchor(root, leaf_count)``. Proofs are served for
+    any sealed batch. Batches that fail, or are not anchored within
+    ``stale_after`` seconds (say after a restart), are checked with
+    ``is_anchored(root)`` and resent if the root is not on chain.
+    """
+
+    def __init__(self, pipeline, contract_address, encode_anchor, is_anchored, window=60.0, max_leaves=10000,
+                 stale_after=900.0, tree_cache_size=4):
+        self.pipeline = pipeline
+        self.contract_address = contract_address
+        self.encode_anchor = encode_anchor
+        self.is_anchored = is_anchored
+        self.window = window
+        self.max_leaves = max_leaves
+        self.stale_after = stale_after
+        self.store = None
+        self._trees = OrderedDict()
+        self._tree_cache_size = tree_cache_size
+        self._cond = threading.Condition()
+        self._first_pending = None
+        self._pending = 0
+        self._thread = None
+        self.batches_sent = 0
+        self.leaves_anchored = 0
+        self.resends = 0
+
+    def start(self, store):
+        self.store = store
+        queued = store.pending_count()
+        with self._cond:
+            if queued:
+                self._pending, self._first_pending = queued, time.monotonic()
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='payment-anchor', daemon=True)
+            self._thread.start()
+
+    def add(self, payment_id, image_hash):
+        """Queue a payment's image hash; returns its leaf hash, or None if the payment already has one"""
+        leaf = leaf_hash(payment_id, image_hash)
+        if not self.store.add_leaf(payment_id, image_hash, leaf):
+            return None
+        with self._cond:
+            if self._first_pending is None:
+                self._first_pending = time.monotonic()
+            self._pending += 1
+            self._cond.notify()
+        return leaf
+
+    def image_hash(self, payment_id):
+        """Image hash recorded for a payment in anchoring mode, or None"""
+        leaf = self.store.get_leaf(payment_id) if self.store is not None else None
+        return leaf['image_hash'] if leaf else None
+
+    def proof(self, payment_id):
+        """
+        Leaf, batch and inclusion proof of a payment's image hash; the proof
+        is None while the leaf waits for its batch. None for unknown payments.
+        """
+        leaf = self.store.get_leaf(payment_id)
+        if leaf is None:
+            return None
+        batch = self.store.get_batch(leaf['batch_id']) if leaf['batch_id'] is not None else None
+        proof = None
+        if batch is not None:
+            proof = inclusion_proof(self._levels(batch['batch_id']), leaf['leaf_index'])
+        return {'leaf': leaf, 'batch': batch, 'proof': proof}
+
+    @staticmethod
+    def verify(payment_id, image_hash, proof, root):
+        return verify_proof(leaf_hash(payment_id, image_hash), proof, root)
+
+    def stats(self):
+        with self._cond:
+            pending = self._pending
+        return {
+            'pending_leaves': pending,
+            'batches': self.store.status_counts() if self.store is not None else {},
+            'batches_sent': self.batches_sent,
+            'leaves_anchored': self.leaves_anchored,
+            'resends': self.resends,
+        }
+
+    def _levels(self, batch_id):
+        with self._cond:
+            if batch_id in self._trees:
+                self._trees.move_to_end(batch_id)
+                return self._trees[batch_id]
+        levels = build_levels(self.store.batch_leaves(batch_id))
+        with self._cond:
+            self._trees[batch_id] = levels
+            while len(self._trees) > self._tree_cache_size:
+                self._trees.popitem(last=False)
+        return levels
+
+    def _due(self):
+        return self._first_pending is not None and (
+            self._pending >= self.max_leaves or time.monotonic() - self._first_pending >= self.window)
+
+    def _run(self):
+        next_recheck = time.monotonic()
+        while True:
+            with self._cond:
+                while not self._due() and time.monotonic() < next_recheck:
+                    wake = next_recheck if self._first_pending is None else min(next_recheck, self._first_pending + self.window)
+                    self._cond.wait(max(0.0, wake - time.monotonic()))
+                flush = self._due()
+            try:
+                if flush:
+                    self._flush()
+                if time.monotonic() >= next_recheck:
+                    next_recheck = time.monotonic() + self.stale_after / 2
+                    self._recheck()
+            except Exception as e:
+                logger.error(f"Error anchoring payment image hashes: {str(e)}")
+                time.sleep(min(self.window, 5))
+
+    def _flush(self):
+        sealed = self.store.seal_batch(self.max_leaves)
+        remaining = self.store.pending_count()
+        with self._cond:
+            self._pending = remaining
+            self._first_pending = time.monotonic() if remaining else None
+        if sealed is not None:
+            self._send(*sealed)
+
+    def _send(self, batch_id, root, leaf_count):
+        # Marked before submitting so an early on_done is not overwritten
+        self.store.update_batch(batch_id, status='submitted', submitted_at=time.time())
+        record = self.pipeline.submit(
+            {'to': self.contract_address, 'data': self.encode_anchor(root, leaf_count)},
+            'anchorRoot',
+            meta={'batchId': batch_id, 'leaves': leaf_count},
+            on_done=lambda record: self._on_done(batch_id, leaf_count, record),
+        )
+        self.batches_sent += 1
+        self.store.update_batch(batch_id, tx_id=record['txId'])
+
+    def _on_done(self, batch_id, leaf_count, record):
+        if record['status'] == 'mined':
+            self.leaves_anchored += leaf_count
+            self.store.update_batch(batch_id, status='anchored', tx_hash=record['transactionHash'],
+                                    block_number=record['blockNumber'], gas_used=record['gasUsed'],
+                                    anchored_at=time.time(), error=None)
+        else:
+            # Rechecked against the chain before resending: a timed out transaction may still be mined
+            self.store.update_batch(batch_id, status='failed', tx_hash=record['transactionHash'],
+                                    error=record['error'] or record['status'])
+
+    def _recheck(self):
+        for batch in self.store.batches_to_recheck(time.time() - self.stale_after):
+            root = bytes.fromhex(batch['root'])
+            if self.is_anchored(root):
+                self.store.update_batch(batch['batch_id'], status='anchored', anchored_at=time.time(), error=None)
+                continue
+            logger.warning(f"Payment anchor batch {batch['batch_id']} is not on chain, resending")
+            self.resends += 1
+            self._send(batch['batch_id'], root, batch['leaf_count'])
@@ -0,0 +1,213 @@
+import logging
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from web3.providers.base import JSONBaseProvider
+
+from src.services.instrumentation import stage
+
+logger = logging.getLogger(__name__)
+
+# Read-only JSON-RPC methods that are safe to retry on another node
+IDEMPOTENT_METHODS = {
+    'web3_clientVersion', 'net_version', 'net_peerCount', 'net_listening',
+    'eth_chainId', 'eth_blockNumber', 'eth_syncing', 'eth_gasPrice', 'eth_maxPriorityFeePerGas',
+    'eth_feeHistory', 'eth_getBalance', 'eth_getCode', 'eth_getStorageAt', 'eth_getTransactionCount',
+    'eth_getBlockByNumber', 'eth_getBlockByHash', 'eth_getBlockTransactionCountByNumber',
+    'eth_getTransactionByHash', 'eth_getTransactionReceipt', 'eth_getLogs', 'eth_call', 'eth_estimateGas',
+}
+
+# Latency histogram bucket upper bounds in milliseconds
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+EWMA_ALPHA = 0.2
+# Cost of an error in request timeouts: a failed call is as slow as a timeout before it moves on
+ERROR_PENALTY = 1.0
+# Added to endpoints that have failed and never answered, so they rank below any that work
+UNPROVEN_PENALTY = 1e6
+BASE_COOLDOWN = 1.0
+MAX_COOLDOWN = 60.0
+
+
+class RPCEndpointError(Exception):
+    """Raised when an RPC endpoint fails at the transport or HTTP level"""
+
+
+class RPCEndpoint:
+    """One RPC URL with its pooled session, health score and latency histogram"""
+
+    def __init__(self, url, pool_size, timeout=10):
+        self.url = url
+        self.pool_size = pool_size
+        self.timeout_ms = timeout * 1000
+        self.latency_ewma = None
+        self.error_ewma = 0.0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.latency_sum_ms = 0.0
+        self._session = None
+        self._session_pid = None
+
+    @property
+    def session(self):
+        # Sessions hold sockets, so each forked worker builds its own
+        if self._session is None or self._session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._session = session
+            self._session_pid = os.getpid()
+        return self._session
+
+    def score(self, now):
+        """
+        Expected milliseconds per call, lower is better: latency EWMA plus
+        the recent error rate times the timeout. An endpoint that has not
+        answered yet counts as timing out; one that has only failed sorts
+        below every endpoint that works, and cooling down sorts last.
+        """
+        if self.latency_ewma is None:
+            latency = self.timeout_ms
+            penalty = UNPROVEN_PENALTY if self.errors else 0.0
+        else:
+            latency = self.latency_ewma
+            penalty = 0.0
+        if now < self.cooldown_until:
+            penalty += 1e9
+        return penalty + latency + ERROR_PENALTY * self.error_ewma * self.timeout_ms
+
+    def record_success(self, latency_ms):
+        self.requests += 1
+        self.latency_ewma = latency_ms if self.latency_ewma is None else (
+            EWMA_ALPHA * latency_ms + (1 - EWMA_ALPHA) * self.latency_ewma
+        )
+        self.error_ewma *= (1 - EWMA_ALPHA)
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.latency_sum_ms += latency_ms
+        for index, bound in enumerate(LATENCY_BUCKETS_MS):
+            if latency_ms <= bound:
+                self.bucket_counts[index] += 1
+                break
+        else:
+            self.bucket_counts[-1] += 1
+
+    def record_failure(self, now):
+        self.requests += 1
+        self.errors += 1
+        self.error_ewma = EWMA_ALPHA + (1 - EWMA_ALPHA) * self.error_ewma
+        self.consecutive_failures += 1
+        self.cooldown_until = now + min(MAX_COOLDOWN, BASE_COOLDOWN * (2 ** (self.consecutive_failures - 1)))
+
+    def stats(self, now):
+        cumulative, histogram = 0, []
+        for bound, count in zip(list(LATENCY_BUCKETS_MS) + ['+Inf'], self.bucket_counts):
+            cumulative += count
+            histogram.append({'le': bound, 'count': cumulative})
+        successes = self.requests - self.errors
+        return {
+            'url': self.url,
+            'requests': self.requests,
+            'errors': self.errors,
+            'error_rate': round(self.error_ewma, 4),
+            'latency_ewma_ms': round(self.latency_ewma, 2) if self.latency_ewma is not None else None,
+            'latency_avg_ms': round(self.latency_sum_ms / successes, 2) if successes else None,
+            'cooling_down': now < self.cooldown_until,
+            'score': round(self.score(now), 2),
+            'latency_histogram_ms': histogram,
+        }
+
+
+class FailoverHTTPProvider(JSONBaseProvider):
+    """
+    Web3 HTTP provider spread over several RPC nodes.
+
+    Every endpoint keeps a pooled keep-alive session of ``pool_size``
+    connections. Calls go to the endpoint with the best health score
+    (latency EWMA plus a penalty for recent errors); idempotent reads that hit
+    a transport or HTTP error are retried on the next best endpoint.
+    """
+
+    def __init__(self, urls, pool_size=10, timeout=10):
+        super().__init__()
+        if not urls:
+            raise ValueError("At least one RPC URL is required")
+        self.endpoints = [RPCEndpoint(url, pool_size, timeout) for url in urls]
+        self.timeout = timeout
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return f"FailoverHTTPProvider({', '.join(endpoint.url for endpoint in self.endpoints)})"
+
+    def ranked_endpoints(self):
+        now = time.monotonic()
+        with self._lock:
+            return sorted(self.endpoints, key=lambda endpoint: endpoint.score(now))
+
+    def make_request(self, method, params):
+        request_data = self.encode_rpc_request(method, params)
+        with stage('rpc'):
+            response = self._post(request_data, method in IDEMPOTENT_METHODS)
+        return self.decode_rpc_response(response)
+
+    def make_batch_request(self, batch_requests):
+        request_data = self.encode_batch_rpc_request(batch_requests)
+        idempotent = all(method in IDEMPOTENT_METHODS for method, _ in batch_requests)
+        with stage('rpc'):
+            response = self._post(request_data, idempotent)
+        response = self.decode_rpc_response(response)
+        if isinstance(response, list):
+            response.sort(key=lambda item: item.get('id', 0))
+        return response
+
+    def is_connected(self, show_traceback=False):
+        try:
+            response = self.make_request('web3_clientVersion', [])
+        except Exception:
+            if show_traceback:
+                raise
+            return False
+        return 'error' not in response
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return [endpoint.stats(now) for endpoint in self.endpoints]
+
+    def _post(self, request_data, retry):
+        candidates = self.ranked_endpoints()
+        if not retry:
+            candidates = candidates[:1]
+
+        last_error = None
+        for endpoint in candidates:
+            started = time.perf_counter()
+            try:
+                response = endpoint.session.post(
+                    endpoint.url,
+                    data=request_data,
+                    headers={'Content-Type': 'application/json'},
+                    timeout=self.timeout,
+                )
+                if response.status_code >= 500 or response.status_code == 429:
+                    raise RPCEndpointError(f"HTTP {response.status_code} from {endpoint.url}")
+                response.raise_for_status()
+            except (requests.RequestException, RPCEndpointError) as e:
+                with self._lock:
+                    endpoint.record_failure(time.monotonic())
+                logger.warning(f"RPC request to {endpoint.url} failed: {str(e)}")
+                last_error = e
+                continue
+
+            with self._lock:
+                endpoint.record_success((time.perf_counter() - started) * 1000)
+            return response.content
+
+        raise RPCEndpointError(f"All RPC endpoints failed: {last_error}")
@@ -0,0 +1,103 @@
+import heapq
+from collections import defaultdict
+
+# Bill transactions are (payer, amount, beneficiaries, beneficiary_amounts) and
+# settlement payments (payer, receiver, amount); amounts are ints in the
+# smallest currency unit and are never converted, so uint256 values stay exact
+
+
+def net_balances(transactions, settlements=()):
+    """
+    Net position of every bill member: what they paid for the group minus
+    their share of it, adjusted for settlement payments already made.
+    Positive balances are owed money, negative ones owe it; members who
+    are even are left out.
+    """
+    balances = defaultdict(int)
+    for payer, amount, beneficiaries, shares in transactions:
+        if len(beneficiaries) != len(shares):
+            raise ValueError('Every beneficiary needs exactly one amount')
+        balances[payer] += amount
+        for beneficiary, share in zip(beneficiaries, shares):
+            balances[beneficiary] -= share
+    for payer, receiver, amount in settlements:
+        balances[payer] += amount
+        balances[receiver] -= amount
+    if sum(balances.values()) != 0:
+        raise ValueError('Beneficiary amounts do not add up to the transaction amounts')
+    return {address: balance for address, balance in balances.items() if balance != 0}
+
+
+def plan_transfers(balances):
+    """
+    Transfers that bring every balance to zero, as (debtor, creditor, amount).
+
+    A debtor who owes exactly what some creditor is owed pays that creditor
+    directly, closing two balances with one transfer. The remaining balances
+    are settled greedily: the largest debt pays the largest credit, and
+    whichever is smaller is closed, so the plan has at most one transfer
+    fewer than there are members with a balance. (A guaranteed minimum
+    needs the largest split of members into zero-sum groups, which is
+    NP-hard.)
+    """
+    transfers = []
+    creditors_by_amount = defaultdict(list)
+    for address, balance in sorted(balances.items(), reverse=True):
+        if balance > 0:
+            creditors_by_amount[balance].append(address)
+
+    debtors = []
+    for address, balance in sorted(balances.items()):
+        if balance >= 0:
+            continue
+        matches = creditors_by_amount.get(-balance)
+        if matches:
+            transfers.append((address, matches.pop(), -balance))
+        else:
+            debtors.append((balance, address))
+
+    # Heaps of negated amounts, so the largest debt and credit come first
+    creditors = [(-amount, address) for amount, addresses in creditors_by_amount.items() for address in addresses]
+    heapq.heapify(creditors)
+    heapq.heapify(debtors)
+    while debtors:
+        debt, debtor = heapq.heappop(debtors)
+        credit, creditor = heapq.heappop(creditors)
+        amount = min(-debt, -credit)
+        transfers.append((debtor, creditor, amount))
+        if -debt > amount:
+            heapq.heappush(debtors, (debt + amount, debtor))
+        if -credit > amount:
+            heapq.heappush(creditors, (credit + amount, creditor))
+    return transfers
+
+
+def pairwise_transfers(transactions, settlements=()):
+    """
+    The plan without netting across members: every beneficiary pays each
+    payer their share directly, netted only within each pair of members.
+    This is one makePayment per debtor/creditor pair.
+    """
+    # Keyed by the address pair in sorted order; positive means the first owes the second
+    owed = defaultdict(int)
+    for payer, _, beneficiaries, shares in transactions:
+        for beneficiary, share in zip(beneficiaries, shares):
+            if beneficiary == payer:
+                continue
+            if beneficiary < payer:
+                owed[(beneficiary, payer)] += share
+            else:
+                owed[(payer, beneficiary)] -= share
+    for payer, receiver, amount in settlements:
+        if payer < receiver:
+            owed[(payer, receiver)] -= amount
+        else:
+            owed[(receiver, payer)] += amount
+
+    transfers = []
+    for (first, second), amount in sorted(owed.items()):
+        if amount > 0:
+            transfers.append((first, second, amount))
+        elif amount < 0:
+            transfers.append((second, first, -amount))
+    return transfers
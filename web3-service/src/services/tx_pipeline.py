@@ -0,0 +1,307 @@
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from eth_account import Account
+
+logger = logging.getLogger(__name__)
+
+# Node error messages that mean our local nonce no longer matches the chain
+NONCE_ERRORS = ('nonce too low', 'nonce too high', 'invalid nonce', 'invalid transaction nonce',
+                'already known', 'known transaction', 'replacement transaction underpriced')
+
+# Gas estimates are padded so small state changes between estimate and mining do not run out of gas
+GAS_MULTIPLIER = 1.2
+
+FINAL_STATUSES = ('mined', 'reverted', 'failed', 'timeout')
+
+
+def to_int(value):
+    """Receipt fields are hex strings in raw JSON-RPC responses and ints from web3"""
+    if isinstance(value, str):
+        return int(value, 16)
+    return value
+
+
+def is_nonce_error(error):
+    message = str(error).lower()
+    return any(marker in message for marker in NONCE_ERRORS)
+
+
+class NonceManager:
+    """
+    Hands out consecutive nonces for one sender address.
+
+    The pending transaction count is read from the node once and then
+    incremented locally, so concurrent sends never reuse a nonce. After a
+    send error the counter is dropped and re-read on the next allocation.
+    The counter lives in this process: only one process may send from an
+    address, or both hand out the same nonces and replace each other's
+    transactions.
+    """
+
+    def __init__(self, address):
+        self.address = address
+        self._next = None
+        self._lock = threading.Lock()
+        self.resyncs = 0
+
+    def next_nonce(self, w3):
+        with self._lock:
+            if self._next is None:
+                self._next = w3.eth.get_transaction_count(self.address, 'pending')
+            nonce = self._next
+            self._next += 1
+            return nonce
+
+    def resync(self):
+        with self._lock:
+            self._next = None
+            self.resyncs += 1
+
+    def stats(self):
+        with self._lock:
+            return {'address': self.address, 'next_nonce': self._next, 'resyncs': self.resyncs}
+
+
+class TransactionPipeline:
+    """
+    Signs and submits contract transactions off the request thread.
+
+    ``submit`` records the transaction as ``queued`` and returns at once. A
+    sender thread fills in chain id, gas, fees (from ``gas_oracle`` when
+    given) and the nonce, signs locally with the configured key and
+    broadcasts the raw transaction. A tracker
+    thread polls receipts of submitted transactions every ``poll_interval``
+    seconds and moves them to ``mined``, ``reverted`` or, after
+    ``receipt_timeout`` seconds without a receipt, ``timeout``. Transactions
+    that cannot be built or sent end as ``failed``.
+    """
+
+    def __init__(self, get_web3, private_key, latest_block=None, poll_interval=2.0,
+                 receipt_timeout=300.0, max_records=10000, send_retries=3, gas_oracle=None, fee_level='standard'):
+        self.get_web3 = get_web3
+        self.gas_oracle = gas_oracle
+        self.fee_level = fee_level
+        self.account = Account.from_key(private_key)
+        self.latest_block = latest_block
+        self.poll_interval = poll_interval
+        self.receipt_timeout = receipt_timeout
+        self.max_records = max_records
+        self.send_retries = send_retries
+        self.nonces = NonceManager(self.account.address)
+        self._records = OrderedDict()
+        self._callbacks = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._chain_id = None
+        self._threads = []
+
+    @property
+    def address(self):
+        return self.account.address
+
+    def start(self):
+        if any(thread.is_alive() for thread in self._threads):
+            return
+        self._threads = [
+            threading.Thread(target=self._send_loop, name='tx-sender', daemon=True),
+            threading.Thread(target=self._track_loop, name='tx-tracker', daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, tx, kind, meta=None, on_done=None):
+        """
+        Queue a transaction dict (``to``, ``data``, optional ``value``/``gas``)
+        and return its record. ``on_done`` is called with the final record once
+        the transaction is mined, reverted, failed or timed out.
+        """
+        record = {
+            'txId': uuid.uuid4().hex,
+            'kind': kind,
+            'status': 'queued',
+            'from': self.address,
+            'to': tx.get('to'),
+            'nonce': None,
+            'transactionHash': None,
+            'blockNumber': None,
+            'gasUsed': None,
+            'effectiveGasPrice': None,
+            'error': None,
+            'attempts': 0,
+            'createdAt': int(time.time()),
+            'submittedAt': None,
+            'minedAt': None,
+            'meta': meta or {},
+        }
+        with self._lock:
+            self._records[record['txId']] = record
+            if on_done is not None:
+                self._callbacks[record['txId']] = on_done
+            while len(self._records) > self.max_records:
+                evicted_id, _ = self._records.popitem(last=False)
+                self._callbacks.pop(evicted_id, None)
+            snapshot = dict(record)
+        self._queue.put((record['txId'], dict(tx)))
+        return snapshot
+
+    def add_listener(self, listener):
+        """Call ``listener`` with a copy of any transaction record whose status changes"""
+        self._listeners.append(listener)
+
+    def get(self, tx_id):
+        with self._lock:
+            record = self._records.get(tx_id)
+            record = dict(record) if record is not None else None
+        if record is None:
+            return None
+        latest = self.latest_block() if self.latest_block else None
+        if record['blockNumber'] is not None and latest is not None:
+            record['confirmations'] = max(0, latest - record['blockNumber'] + 1)
+        else:
+            record['confirmations'] = 0
+        return record
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for record in self._records.values():
+                counts[record['status']] = counts.get(record['status'], 0) + 1
+        return {
+            'sender': self.nonces.stats(),
+            'queue_depth': self._queue.qsize(),
+            'statuses': counts,
+        }
+
+    def _update(self, tx_id, **fields):
+        callback = None
+        changed = False
+        with self._lock:
+            record = self._records.get(tx_id)
+            if record is not None:
+                changed = 'status' in fields and fields['status'] != record['status']
+                record.update(fields)
+                if record['status'] in FINAL_STATUSES:
+                    callback = self._callbacks.pop(tx_id, None)
+                record = dict(record)
+        if callback is not None:
+            try:
+                callback(record)
+            except Exception as e:
+                logger.error(f"Error in completion callback of transaction {tx_id}: {str(e)}")
+        if changed:
+            for listener in self._listeners:
+                try:
+                    listener(record)
+                except Exception as e:
+                    logger.error(f"Error in status listener of transaction {tx_id}: {str(e)}")
+
+    def _wait_for_web3(self):
+        while True:
+            w3 = self.get_web3()
+            if w3 is not None:
+                return w3
+            time.sleep(self.poll_interval)
+
+    def _send_loop(self):
+        while True:
+            tx_id, tx = self._queue.get()
+            try:
+                self._send(tx_id, tx, self._wait_for_web3())
+            except Exception as e:
+                logger.error(f"Error sending transaction {tx_id}: {str(e)}")
+                self._update(tx_id, status='failed', error=str(e))
+
+    def _fee_fields(self, w3):
+        if self.gas_oracle is not None:
+            return self.gas_oracle.fee_fields(self.fee_level)
+        base_fee = w3.eth.get_block('latest').get('baseFeePerGas')
+        if base_fee is None:
+            return {'gasPrice': w3.eth.gas_price}
+        priority_fee = w3.eth.max_priority_fee
+        return {'maxPriorityFeePerGas': priority_fee, 'maxFeePerGas': 2 * base_fee + priority_fee}
+
+    def _send(self, tx_id, tx, w3):
+        if self._chain_id is None:
+            self._chain_id = w3.eth.chain_id
+        tx.setdefault('value', 0)
+        tx.update({'from': self.address, 'chainId': self._chain_id})
+        if 'gas' not in tx:
+            # Reverting calls fail here, before a nonce is spent
+            tx['gas'] = int(w3.eth.estimate_gas(tx) * GAS_MULTIPLIER)
+
+        for attempt in range(1, self.send_retries + 1):
+            tx.update(self._fee_fields(w3))
+            tx['nonce'] = self.nonces.next_nonce(w3)
+            signed = self.account.sign_transaction(tx)
+            self._update(tx_id, attempts=attempt, nonce=tx['nonce'])
+            try:
+                tx_hash = w3.eth.send_raw_transaction(signed.raw_transaction)
+            except Exception as e:
+                # The nonce was not consumed, or our counter is stale; re-read it either way
+                self.nonces.resync()
+                if is_nonce_error(e) and attempt < self.send_retries:
+                    logger.warning(f"Nonce {tx['nonce']} rejected for transaction {tx_id}, resyncing: {str(e)}")
+                    continue
+                raise
+            self._update(tx_id, status='submitted', transactionHash=w3.to_hex(tx_hash),
+                         submittedAt=int(time.time()), error=None)
+            return
+
+    def _track_loop(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self._poll_receipts()
+            except Exception as e:
+                logger.error(f"Error polling transaction receipts: {str(e)}")
+
+    def _fetch_receipts(self, w3, tx_hashes):
+        make_batch_request = getattr(w3.provider, 'make_batch_request', None)
+        if make_batch_request is not None:
+            responses = make_batch_request([('eth_getTransactionReceipt', [tx_hash]) for tx_hash in tx_hashes])
+            if not isinstance(responses, list):
+                raise RuntimeError(responses.get('error', {}).get('message', 'Batch request failed'))
+            return [response.get('result') for response in responses]
+        receipts = []
+        for tx_hash in tx_hashes:
+            try:
+                receipts.append(w3.eth.get_transaction_receipt(tx_hash))
+            except Exception:
+                receipts.append(None)
+        return receipts
+
+    def _poll_receipts(self):
+        with self._lock:
+            pending = [(tx_id, record['transactionHash'], record['submittedAt'])
+                       for tx_id, record in self._records.items() if record['status'] == 'submitted']
+        if not pending:
+            return
+        w3 = self.get_web3()
+        if w3 is None:
+            return
+
+        receipts = self._fetch_receipts(w3, [tx_hash for _, tx_hash, _ in pending])
+        now = int(time.time())
+        for (tx_id, tx_hash, submitted_at), receipt in zip(pending, receipts):
+            if receipt is None:
+                if now - submitted_at > self.receipt_timeout:
+                    # A dropped transaction leaves a gap in our nonces; start again from the node's count
+                    self.nonces.resync()
+                    self._update(tx_id, status='timeout', error='No receipt before timeout')
+                continue
+            succeeded = to_int(receipt['status']) == 1
+            self._update(
+                tx_id,
+                status='mined' if succeeded else 'reverted',
+                blockNumber=to_int(receipt['blockNumber']),
+                gasUsed=to_int(receipt['gasUsed']),
+                effectiveGasPrice=to_int(receipt.get('effectiveGasPrice')),
+                minedAt=now,
+                error=None if succeeded else 'Transaction reverted',
+            )
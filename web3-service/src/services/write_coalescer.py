@@ -0,0 +1,170 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Transaction record fields copied onto the items it carries
+TX_FIELDS = ('status', 'transactionHash', 'blockNumber', 'gasUsed', 'effectiveGasPrice',
+             'confirmations', 'nonce', 'error')
+
+
+class WriteCoalescer:
+    """
+    Coalesces contract writes of one kind into batch calls.
+
+    Items submitted within ``window_ms`` of the first pending item, up to
+    ``max_items``, go out as one transaction whose calldata is built by
+    ``encode_batch`` from the items' call arguments; a lone item is sent with
+    its own single-call calldata. Batch functions are all-or-nothing, so when
+    a batch fails or reverts its items are resubmitted one by one and only
+    the invalid ones end up failed.
+    """
+
+    def __init__(self, pipeline, kind, contract_address, encode_batch, window_ms=200, max_items=50,
+                 max_records=10000):
+        self.pipeline = pipeline
+        self.kind = kind
+        self.contract_address = contract_address
+        self.encode_batch = encode_batch
+        self.window = window_ms / 1000.0
+        self.max_items = max_items
+        self.max_records = max_records
+        self._items = OrderedDict()
+        self._pending = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self.batches = 0
+        self.batched_items = 0
+        self.single_sends = 0
+        self.fallbacks = 0
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name=f'{self.kind}-coalescer', daemon=True)
+        self._thread.start()
+
+    def submit(self, args, calldata, meta=None):
+        """Queue one call given both as ABI arguments and as its single-call calldata"""
+        item = {
+            'itemId': uuid.uuid4().hex,
+            'kind': self.kind,
+            'status': 'pending',
+            'txId': None,
+            'batchSize': None,
+            'batchIndex': None,
+            'createdAt': int(time.time()),
+            'meta': meta or {},
+        }
+        with self._cond:
+            self._items[item['itemId']] = item
+            while len(self._items) > self.max_records:
+                self._items.popitem(last=False)
+            self._pending.append((item['itemId'], args, calldata))
+            self._cond.notify()
+            return dict(item)
+
+    def get(self, item_id):
+        with self._cond:
+            item = self._items.get(item_id)
+            item = dict(item) if item is not None else None
+        if item is None:
+            return None
+        tx = self.pipeline.get(item['txId']) if item['txId'] else None
+        if tx is not None:
+            item.update({field: tx[field] for field in TX_FIELDS})
+            if tx['gasUsed'] is not None:
+                item['gasPerRecord'] = tx['gasUsed'] // item['batchSize']
+        return item
+
+    def stats(self):
+        with self._cond:
+            pending = len(self._pending)
+        return {
+            'pending': pending,
+            'batches': self.batches,
+            'batched_items': self.batched_items,
+            'average_batch_size': round(self.batched_items / self.batches, 2) if self.batches else None,
+            'single_sends': self.single_sends,
+            'fallbacks': self.fallbacks,
+        }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                deadline = time.monotonic() + self.window
+                while len(self._pending) < self.max_items:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[:self.max_items]
+                del self._pending[:self.max_items]
+            try:
+                self._flush(batch)
+            except Exception as e:
+                logger.error(f"Error submitting {self.kind} batch: {str(e)}")
+                self._link(batch, {'txId': None, 'status': 'failed'}, error=str(e))
+
+    def _link(self, batch, record, error=None, replace=False):
+        """
+        Point the items of ``batch`` at the transaction record carrying them.
+        Without ``replace``, items already linked are left alone: a batch
+        can fail, and its items be resubmitted one by one, before the call
+        that submitted it links them.
+        """
+        with self._cond:
+            for index, (item_id, _, _) in enumerate(batch):
+                item = self._items.get(item_id)
+                if item is None or (item['txId'] is not None and not replace):
+                    continue
+                item.update({
+                    'txId': record['txId'],
+                    'status': record['status'],
+                    'batchSize': len(batch),
+                    'batchIndex': index if len(batch) > 1 else None,
+                })
+                if error is not None:
+                    item['error'] = error
+
+    def _flush(self, batch):
+        if len(batch) == 1:
+            self._send_single(batch[0])
+            return
+        calldata = self.encode_batch([args for _, args, _ in batch])
+        with self._cond:
+            records = [dict(self._items[item_id]['meta'], itemId=item_id)
+                       for item_id, _, _ in batch if item_id in self._items]
+        record = self.pipeline.submit(
+            {'to': self.contract_address, 'data': calldata},
+            f'{self.kind}Batch',
+            meta={'items': len(batch), 'records': records},
+            on_done=lambda record: self._on_batch_done(batch, record),
+        )
+        self.batches += 1
+        self.batched_items += len(batch)
+        self._link(batch, record)
+
+    def _send_single(self, entry):
+        item_id, _, calldata = entry
+        with self._cond:
+            meta = self._items[item_id]['meta'] if item_id in self._items else {}
+        record = self.pipeline.submit({'to': self.contract_address, 'data': calldata}, self.kind,
+                                      meta=dict(meta, itemId=item_id))
+        self.single_sends += 1
+        self._link([entry], record, replace=True)
+
+    def _on_batch_done(self, batch, record):
+        if record['status'] not in ('failed', 'reverted'):
+            return
+        # A timed out batch may still be mined, so only definite failures are retried
+        logger.warning(f"{self.kind} batch of {len(batch)} {record['status']}, resubmitting items one by one: "
+                       f"{record['error']}")
+        self.fallbacks += 1
+        for entry in batch:
+            self._send_single(entry)